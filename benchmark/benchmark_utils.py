@@ -430,3 +430,28 @@ def get_result_file_path(file_name: str) -> str:
         str: The path to the result file
     """
     return f"benchmark/results/{file_name}.csv"
+
+
+def write_performance_results_to_file(task: str, row: dict):
+    """Appends the measurements of a performance benchmark case to the result
+    file of the task, creating the file if it does not exist. Unlike the LLM
+    benchmarks, performance cases are not skipped if already run, since the
+    measurements depend on the machine; every run adds a row.
+
+    Args:
+        task (str): The benchmark task, e.g.
+            "vectorstore_retrieval_performance"
+        row (dict): The parameters and measurements of the case, by column
+    """
+    file_path = get_result_file_path(task)
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    bc_version = importlib_metadata.version("biochatter")
+    new_row = pd.DataFrame(
+        [{**row, "datetime": now, "biochatter_version": bc_version}]
+    )
+    try:
+        results = pd.read_csv(file_path, header=0)
+        results = pd.concat([results, new_row], ignore_index=True)
+    except (pd.errors.EmptyDataError, FileNotFoundError):
+        results = new_row
+    results.to_csv(file_path, index=False)
@@ -0,0 +1,254 @@
+"""
+Offline retrieval performance benchmark of the local vector store. Unlike the
+other benchmarks, it does not call any model or server: texts are embedded by a
+deterministic hashing embedding, and the corpus is generated from the
+vocabulary of a test document. Per corpus size, chunk size and index
+configuration, it measures
+
+- ingestion throughput (chunks per second, embedding included),
+- index build time,
+- query latency (p50 and p99),
+- recall@k against exact (FLAT) search over the same store,
+- memory per million vectors (vectors, ids and HNSW graph).
+
+Every run appends its measurements to
+`benchmark/results/vectorstore_retrieval_performance.csv`.
+"""
+
+import os
+import re
+import time
+import hashlib
+
+from langchain.schema import Document
+import pytest
+
+import numpy as np
+
+from biochatter.vectorstore import create_text_splitter
+from biochatter.vectorstore_local import VectorDatabaseAgentLocal
+from .benchmark_utils import write_performance_results_to_file
+
+TASK = "vectorstore_retrieval_performance"
+
+VOCABULARY_SOURCE = "test/bc_summary.txt"
+EMBEDDING_DIM = 256
+DOCUMENT_LENGTH = 4000  # characters per generated document
+N_QUERIES = 100
+QUERY_LENGTH = 8  # words per query
+K = 10
+
+CORPUS_SIZES = [100, 1000]  # documents
+CHUNK_SIZES = [250, 1000]  # characters
+INDEX_CONFIGS = [
+    {"index_type": "FLAT", "index_params": None},
+    {"index_type": "HNSW", "index_params": {"M": 8, "efConstruction": 100}},
+    {"index_type": "HNSW", "index_params": {"M": 16, "efConstruction": 200}},
+]
+HNSW_SEARCH_PARAMS = [{"ef": 16}, {"ef": 64}, {"ef": 256}]
+
+
+class HashingEmbeddings:
+    """
+    Deterministic dense embeddings without a model: every word is mapped to a
+    fixed random unit vector seeded by its hash, and a text is embedded as the
+    normalised sum of its word vectors. Texts sharing words are close, which
+    is enough to exercise the index like real embeddings.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self._word_vectors: dict[str, np.ndarray] = {}
+
+    def _word_vector(self, word: str) -> np.ndarray:
+        vector = self._word_vectors.get(word)
+        if vector is None:
+            seed = int(hashlib.md5(word.encode()).hexdigest()[:8], 16)
+            vector = np.random.default_rng(seed).standard_normal(self.dim)
+            vector = (vector / np.linalg.norm(vector)).astype(np.float32)
+            self._word_vectors[word] = vector
+        return vector
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            vector += self._word_vector(word)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+
+def generate_corpus(n_documents: int, seed: int = 42) -> list[str]:
+    """
+    Generate documents of Zipf-distributed words from the vocabulary of a
+    test document, which roughly mimics the word frequencies of real text.
+    """
+    with open(VOCABULARY_SOURCE) as f:
+        vocabulary = sorted(set(re.findall(r"[a-z]{3,}", f.read().lower())))
+    rng = np.random.default_rng(seed)
+    # rank-frequency weights of the shuffled vocabulary
+    weights = 1.0 / np.arange(1, len(vocabulary) + 1)
+    weights = rng.permutation(weights / weights.sum())
+    words_per_document = DOCUMENT_LENGTH // 8
+    documents = []
+    for _ in range(n_documents):
+        words = rng.choice(vocabulary, size=words_per_document, p=weights)
+        sentences = [
+            " ".join(words[i : i + 12]).capitalize() + "."
+            for i in range(0, len(words), 12)
+        ]
+        documents.append(" ".join(sentences))
+    return documents
+
+
+def generate_queries(chunks: list[str], seed: int = 7) -> list[str]:
+    """
+    Sample queries as word spans of random chunks.
+    """
+    rng = np.random.default_rng(seed)
+    queries = []
+    for i in rng.choice(len(chunks), size=N_QUERIES):
+        words = chunks[i].split()
+        start = rng.integers(0, max(len(words) - QUERY_LENGTH, 0) + 1)
+        queries.append(" ".join(words[start : start + QUERY_LENGTH]))
+    return queries
+
+
+def store_size_bytes(store: VectorDatabaseAgentLocal, path: str) -> int:
+    """
+    Size of the vectors and ids on disk, which are memory-mapped when
+    searching, plus the size of the HNSW graph, if any.
+    """
+    size = sum(
+        os.path.getsize(os.path.join(path, name))
+        for name in os.listdir(path)
+        if name.endswith((".vec", ".ids", ".del"))
+    )
+    if store._hnsw is not None:
+        size += store._hnsw.index_file_size()
+    return size
+
+
+def result_keys(results: list[Document]) -> set[tuple]:
+    return {(doc.metadata.get("id"), doc.page_content) for doc in results}
+
+
+_corpora = {}
+
+
+@pytest.fixture
+def ingested_corpus(tmp_path_factory, corpus_size, chunk_size):
+    """
+    Generate, chunk and ingest a corpus into a persisted FLAT store, once per
+    corpus and chunk size, and compute the exact top k of each query.
+    """
+    key = (corpus_size, chunk_size)
+    if key in _corpora:
+        return _corpora[key]
+
+    path = str(tmp_path_factory.mktemp(f"store_{corpus_size}_{chunk_size}"))
+    splitter = create_text_splitter(chunk_size=chunk_size)
+    documents_list = [
+        splitter.split_documents(
+            [Document(page_content=text, metadata={"source": f"doc{i}"})]
+        )
+        for i, text in enumerate(generate_corpus(corpus_size))
+    ]
+    n_chunks = sum(len(documents) for documents in documents_list)
+
+    store = VectorDatabaseAgentLocal(
+        embedding_func=HashingEmbeddings(), connection_args={"path": path}
+    )
+    store.connect()
+    start = time.perf_counter()
+    store.store_embeddings_batch(documents_list)
+    ingestion_s = time.perf_counter() - start
+
+    queries = generate_queries(
+        [doc.page_content for documents in documents_list for doc in documents]
+    )
+    exact = [result_keys(store.similarity_search(q, k=K)) for q in queries]
+
+    _corpora[key] = {
+        "path": path,
+        "n_chunks": n_chunks,
+        "ingestion_chunks_per_s": n_chunks / ingestion_s,
+        "queries": queries,
+        "exact": exact,
+    }
+    return _corpora[key]
+
+
+@pytest.mark.parametrize("corpus_size", CORPUS_SIZES)
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+@pytest.mark.parametrize(
+    "index_config",
+    INDEX_CONFIGS,
+    ids=lambda c: "-".join(
+        [c["index_type"]]
+        + [f"{k}{v}" for k, v in (c["index_params"] or {}).items()]
+    ),
+)
+def test_vectorstore_retrieval_performance(
+    corpus_size, chunk_size, index_config, ingested_corpus
+):
+    corpus = ingested_corpus
+    store = VectorDatabaseAgentLocal(
+        embedding_func=HashingEmbeddings(),
+        connection_args={"path": corpus["path"], "read_only": True},
+        index_type=index_config["index_type"],
+        index_params=index_config["index_params"],
+    )
+    start = time.perf_counter()
+    store.connect()
+    index_build_s = time.perf_counter() - start
+    bytes_per_million = (
+        store_size_bytes(store, corpus["path"]) / corpus["n_chunks"] * 1e6
+    )
+
+    search_params_list = (
+        HNSW_SEARCH_PARAMS if index_config["index_type"] == "HNSW" else [None]
+    )
+    for search_params in search_params_list:
+        latencies = []
+        recalls = []
+        for query, expected in zip(corpus["queries"], corpus["exact"]):
+            start = time.perf_counter()
+            found = store.similarity_search(
+                query, k=K, search_params=search_params
+            )
+            latencies.append(1000 * (time.perf_counter() - start))
+            recalls.append(len(result_keys(found) & expected) / len(expected))
+
+        recall = float(np.mean(recalls))
+        if index_config["index_type"] == "FLAT":
+            assert recall == 1.0
+
+        write_performance_results_to_file(
+            TASK,
+            {
+                "backend": "local",
+                "index_type": index_config["index_type"],
+                "index_params": index_config["index_params"] or {},
+                "search_params": search_params or {},
+                "corpus_size": corpus_size,
+                "chunk_size": chunk_size,
+                "n_chunks": corpus["n_chunks"],
+                "k": K,
+                "ingestion_chunks_per_s": round(
+                    corpus["ingestion_chunks_per_s"], 1
+                ),
+                "index_build_s": round(index_build_s, 3),
+                "p50_latency_ms": round(float(np.percentile(latencies, 50)), 3),
+                "p99_latency_ms": round(float(np.percentile(latencies, 99)), 3),
+                "recall_at_k": round(recall, 4),
+                "bytes_per_million_vectors": int(bytes_per_million),
+            },
+        )
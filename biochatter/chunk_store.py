@@ -0,0 +1,301 @@
+"""
+Stores for the text of embedded fragments (chunks) outside the vector
+database. With a chunk store, the embedding collection only holds the vectors,
+integer chunk ids and document ids; the text of a chunk is only needed for the
+top-k hits of a search, which are fetched from the chunk store by id. This
+keeps the text out of the memory of the vector database, whose segments shrink
+to the vectors for text-heavy corpora.
+"""
+
+from abc import ABC, abstractmethod
+from typing import Tuple, Optional
+import os
+import json
+import zlib
+import sqlite3
+import logging
+import threading
+
+from .metadata_store import sqlite_in_batches
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_TYPES = ["zstd", "zlib", "none"]
+# characters of text of the chunks compressed together in one page
+DEFAULT_PAGE_SIZE = 64 * 1024
+
+
+class ChunkStore(ABC):
+    """
+    Abstract base class of chunk stores. Chunks are identified by integer ids
+    assigned by the store on insertion, which are used as primary keys of the
+    embedding collection.
+    """
+
+    @abstractmethod
+    def connect(self) -> None:
+        """
+        Open or create the store.
+        """
+
+    @abstractmethod
+    def put(
+        self, texts: list[str], metadatas: Optional[list[dict]] = None
+    ) -> list[int]:
+        """
+        Insert chunks.
+
+        Args:
+            texts (List[str]): text of each chunk
+
+            metadatas (Optional[List[Dict]]): JSON-serialisable metadata of
+                each chunk
+
+        Returns:
+            List[int]: the ids of the chunks
+        """
+
+    @abstractmethod
+    def get(self, chunk_ids: list[int]) -> dict[int, Tuple[str, dict]]:
+        """
+        Get chunks by id.
+
+        Args:
+            chunk_ids (List[int]): chunk ids
+
+        Returns:
+            Dict[int, Tuple[str, Dict]]: text and metadata by chunk id, for
+                the ids of stored chunks
+        """
+
+    @abstractmethod
+    def delete(self, chunk_ids: list[int]) -> int:
+        """
+        Delete chunks by id.
+
+        Returns:
+            int: the number of deleted chunks
+        """
+
+    @abstractmethod
+    def flush(self) -> None:
+        """
+        Make the preceding write operations durable.
+        """
+
+    def compact(self) -> None:
+        """
+        Reclaim the storage of deleted chunks. No-op by default.
+        """
+
+
+def _compressor(compression: str):
+    """
+    Get the compression and decompression functions of a compression type.
+    """
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(
+                "Could not import zstandard python package. "
+                "Please install it with `pip install zstandard`, or use "
+                'compression="zlib".'
+            )
+        return (
+            zstandard.ZstdCompressor(level=3).compress,
+            zstandard.ZstdDecompressor().decompress,
+        )
+    if compression == "zlib":
+        return zlib.compress, zlib.decompress
+    if compression == "none":
+        return bytes, bytes
+    raise ValueError(
+        f"Invalid compression {compression}. Choose from {COMPRESSION_TYPES}."
+    )
+
+
+class SQLiteChunkStore(ChunkStore):
+    """
+    Chunk store in an embedded SQLite database. The chunks of one `put()` are
+    grouped into pages of about `page_size` characters, and each page is
+    compressed as a whole, which compresses much better than single chunks. A
+    lookup decompresses each page of the requested chunks once. Pages are
+    removed with their last chunk, i.e. the space of deleted chunks in
+    partially deleted pages is only reclaimed when the last chunk of the page
+    is deleted. Write operations are committed by `flush()`.
+    """
+
+    def __init__(
+        self,
+        path: str = ":memory:",
+        table: str = "chunks",
+        compression: str = "zstd",
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ):
+        """
+        Args:
+            path (str): path of the database file; ":memory:" keeps the store
+                in memory
+
+            table (str): name of the chunk table; the pages are stored in the
+                table `<table>_pages`
+
+            compression (str): compression of new pages, "zstd" (requires the
+                zstandard package), "zlib" or "none". Pages are decompressed
+                with the compression they were written with.
+
+            page_size (int): number of text characters up to which chunks are
+                compressed together
+        """
+        self._compress, _ = _compressor(compression)
+        self._path = path
+        self._table = table
+        self._compression = compression
+        self._page_size = page_size
+        self._decompressors = {}
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def connect(self) -> None:
+        if self._path != ":memory:":
+            os.makedirs(
+                os.path.dirname(os.path.abspath(self._path)), exist_ok=True
+            )
+        self._connection = sqlite3.connect(self._path, check_same_thread=False)
+        with self._lock:
+            self._connection.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {self._table}_pages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    compression TEXT NOT NULL,
+                    data BLOB NOT NULL
+                )
+                """
+            )
+            self._connection.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {self._table} (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    page_id INTEGER NOT NULL,
+                    position INTEGER NOT NULL
+                )
+                """
+            )
+            self._connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {self._table}_page_id "
+                f"ON {self._table} (page_id)"
+            )
+            self._connection.commit()
+
+    def _decompress(self, compression: str, data: bytes) -> bytes:
+        if compression not in self._decompressors:
+            self._decompressors[compression] = _compressor(compression)[1]
+        return self._decompressors[compression](data)
+
+    def _pages(self, chunks: list[list]) -> list[list[list]]:
+        """
+        Split chunks into pages of about `page_size` characters.
+        """
+        pages = [[]]
+        size = 0
+        for chunk in chunks:
+            if size > 0 and size + len(chunk[0]) > self._page_size:
+                pages.append([])
+                size = 0
+            pages[-1].append(chunk)
+            size += len(chunk[0])
+        return pages
+
+    def put(
+        self, texts: list[str], metadatas: Optional[list[dict]] = None
+    ) -> list[int]:
+        if len(texts) == 0:
+            return []
+        if metadatas is None:
+            metadatas = [{} for _ in texts]
+        chunk_ids = []
+        with self._lock:
+            for page in self._pages(
+                [[text, metadata] for text, metadata in zip(texts, metadatas)]
+            ):
+                data = self._compress(json.dumps(page).encode("utf-8"))
+                page_id = self._connection.execute(
+                    f"INSERT INTO {self._table}_pages (compression, data) "
+                    "VALUES (?, ?)",
+                    [self._compression, data],
+                ).lastrowid
+                for position in range(len(page)):
+                    chunk_ids.append(
+                        self._connection.execute(
+                            f"INSERT INTO {self._table} (page_id, position) "
+                            "VALUES (?, ?)",
+                            [page_id, position],
+                        ).lastrowid
+                    )
+        return chunk_ids
+
+    def get(self, chunk_ids: list[int]) -> dict[int, Tuple[str, dict]]:
+        if len(chunk_ids) == 0:
+            return {}
+        chunk_ids = sorted({int(chunk_id) for chunk_id in chunk_ids})
+        chunks = {}
+        pages = {}
+        for placeholders, batch in sqlite_in_batches(chunk_ids):
+            with self._lock:
+                rows = self._connection.execute(
+                    f"SELECT c.id, c.position, p.id, p.compression, p.data "
+                    f"FROM {self._table} c JOIN {self._table}_pages p "
+                    f"ON c.page_id = p.id WHERE c.id IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                # the decompressors are not thread-safe
+                for _, _, page_id, compression, data in rows:
+                    if page_id not in pages:
+                        pages[page_id] = json.loads(
+                            self._decompress(compression, data)
+                        )
+            for chunk_id, position, page_id, _, _ in rows:
+                text, metadata = pages[page_id][position]
+                chunks[chunk_id] = (text, metadata)
+        return chunks
+
+    def delete(self, chunk_ids: list[int]) -> int:
+        if len(chunk_ids) == 0:
+            return 0
+        chunk_ids = sorted({int(chunk_id) for chunk_id in chunk_ids})
+        deleted = 0
+        with self._lock:
+            page_ids = set()
+            for placeholders, batch in sqlite_in_batches(chunk_ids):
+                page_ids.update(
+                    row[0]
+                    for row in self._connection.execute(
+                        f"SELECT DISTINCT page_id FROM {self._table} "
+                        f"WHERE id IN ({placeholders})",
+                        batch,
+                    )
+                )
+                deleted += self._connection.execute(
+                    f"DELETE FROM {self._table} WHERE id IN ({placeholders})",
+                    batch,
+                ).rowcount
+            # remove pages without chunks
+            for placeholders, batch in sqlite_in_batches(sorted(page_ids)):
+                self._connection.execute(
+                    f"DELETE FROM {self._table}_pages WHERE id IN "
+                    f"({placeholders}) AND NOT EXISTS "
+                    f"(SELECT 1 FROM {self._table} c "
+                    f"WHERE c.page_id = {self._table}_pages.id)",
+                    batch,
+                )
+        return deleted
+
+    def flush(self) -> None:
+        with self._lock:
+            self._connection.commit()
+
+    def compact(self) -> None:
+        with self._lock:
+            self._connection.commit()
+            self._connection.execute("VACUUM")
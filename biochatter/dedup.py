@@ -0,0 +1,563 @@
+"""
+Near-duplicate detection of chunks at ingest time, using MinHash signatures
+and locality-sensitive hashing (LSH). Scientific corpora repeat a lot of text,
+e.g. boilerplate, licence text, figure legends, or preprint and published
+versions of a paper. With a `NearDuplicateIndex`, `DocumentEmbedder` embeds
+only the first chunk of a group of near-duplicates (the canonical chunk) and
+links the other chunks to it, which shrinks the vector index, saves embedding
+calls and keeps duplicates from crowding the top-k results of a search.
+
+Chunks are compared by the Jaccard similarity of their sets of word n-grams
+(shingles), which MinHash signatures estimate. LSH selects candidate chunks
+whose signatures agree in at least one band of rows; the candidates are then
+verified against the similarity threshold.
+"""
+
+from typing import Tuple, Optional
+from collections.abc import Iterable
+import os
+import json
+import sqlite3
+import hashlib
+import logging
+import threading
+
+from langchain.schema import Document
+
+import numpy as np
+
+from .vectorstore_agent import fingerprint_text
+
+logger = logging.getLogger(__name__)
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+# probability with which LSH selects a pair of chunks with the threshold
+# similarity as candidates, see `lsh_bands()`
+LSH_RECALL = 0.99
+
+
+def shingles(text: str, size: int = 3) -> set[str]:
+    """
+    Word n-grams of a text, ignoring case and whitespace. Texts of fewer than
+    `size` words have a single shingle.
+    """
+    words = text.lower().split()
+    if len(words) <= size:
+        return {" ".join(words)} if len(words) > 0 else set()
+    return {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+def lsh_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    Choose the number of bands and of rows per band of an LSH index. Pairs of
+    similarity s share a band with probability 1 - (1 - s^rows)^bands; the
+    largest number of rows is chosen for which pairs of the threshold
+    similarity are selected with probability `LSH_RECALL`, which keeps the
+    number of candidates below the threshold small.
+
+    Returns:
+        Tuple[int, int]: the number of bands and of rows per band
+    """
+    for rows in range(num_perm, 0, -1):
+        bands = num_perm // rows
+        if 1 - (1 - threshold**rows) ** bands >= LSH_RECALL:
+            return bands, rows
+    return num_perm, 1
+
+
+class MinHash:
+    """
+    MinHash signatures of the shingles of texts, using `num_perm` universal
+    hash functions.
+    """
+
+    def __init__(
+        self, num_perm: int = 128, shingle_size: int = 3, seed: int = 1
+    ):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._a = rng.randint(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """
+        Get the signature of a text.
+
+        Returns:
+            Optional[np.ndarray]: the signature, None for texts without words
+        """
+        grams = shingles(text, self.shingle_size)
+        if len(grams) == 0:
+            return None
+        hashes = np.array(
+            [
+                int.from_bytes(
+                    hashlib.sha1(gram.encode("utf-8")).digest()[:4], "little"
+                )
+                for gram in grams
+            ],
+            dtype=np.uint64,
+        )
+        # the products wrap around modulo 2^64, which keeps them universal
+        permuted = (hashes[:, None] * self._a + self._b) % MERSENNE_PRIME
+        return (permuted & MAX_HASH).min(axis=0)
+
+
+class MinHashLSH:
+    """
+    LSH index of MinHash signatures by key, returning the most similar indexed
+    signature with at least the threshold similarity.
+    """
+
+    def __init__(self, threshold: float, bands: int, rows: int):
+        self.threshold = threshold
+        self._rows = rows
+        self._buckets: list[dict[bytes, set[str]]] = [{} for _ in range(bands)]
+        self._signatures: dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._signatures
+
+    def _band_keys(self, signature: np.ndarray) -> list[bytes]:
+        return [
+            signature[i * self._rows : (i + 1) * self._rows].tobytes()
+            for i in range(len(self._buckets))
+        ]
+
+    def add(self, key: str, signature: np.ndarray) -> None:
+        if key in self._signatures:
+            return
+        self._signatures[key] = signature
+        for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+            bucket.setdefault(band_key, set()).add(key)
+
+    def remove(self, key: str) -> None:
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+            bucket[band_key].discard(key)
+            if len(bucket[band_key]) == 0:
+                del bucket[band_key]
+
+    def query(
+        self, signature: np.ndarray, exclude: Iterable[str] = ()
+    ) -> Optional[Tuple[str, float]]:
+        """
+        Find the most similar indexed signature.
+
+        Args:
+            signature (np.ndarray): the signature to look up
+
+            exclude (Iterable[str]): keys that are not returned
+
+        Returns:
+            Optional[Tuple[str, float]]: the key and the estimated similarity
+                of the most similar signature with at least the threshold
+                similarity, None if there is none
+        """
+        candidates = set()
+        for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(bucket.get(band_key, ()))
+        candidates.difference_update(exclude)
+        best = None
+        for key in candidates:
+            similarity = float(np.mean(self._signatures[key] == signature))
+            if similarity >= self.threshold and (
+                best is None or similarity > best[1]
+            ):
+                best = (key, similarity)
+        return best
+
+
+class NearDuplicateIndex:
+    """
+    Index of the canonical chunks of the stored documents, by chunk
+    fingerprint (see `vectorstore_agent.fingerprint_text()`), which finds the
+    canonical chunk of which a new chunk is a near-duplicate. The canonical
+    chunks are kept in memory; `add_fragments()` indexes the fragments of an
+    existing vector store, e.g. when an ingestion process starts.
+
+    The links of the chunks that were not embedded to their canonical chunks
+    are kept in an SQLite database, with the text and metadata of the linked
+    chunks, such that they can be embedded when their canonical chunk is
+    removed (see `remove()`). Write operations are committed immediately.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        num_perm: int = 128,
+        shingle_size: int = 3,
+        seed: int = 1,
+        path: str = ":memory:",
+        table: str = "near_duplicate_links",
+    ):
+        """
+        Args:
+            threshold (float): estimated Jaccard similarity of the shingles
+                from which a chunk is a near-duplicate of a canonical chunk;
+                1.0 only suppresses chunks with the same shingles
+
+            num_perm (int): number of hash functions of the MinHash
+                signatures; more are more accurate and slower
+
+            shingle_size (int): number of words per shingle
+
+            seed (int): seed of the hash functions
+
+            path (str): path of the database file of the links; ":memory:"
+                keeps the links in memory, i.e. they are lost when the process
+                exits
+
+            table (str): name of the link table
+        """
+        if not 0 < threshold <= 1:
+            raise ValueError(
+                f"Invalid threshold {threshold}, must be in (0, 1]."
+            )
+        self.threshold = threshold
+        self._minhash = MinHash(num_perm, shingle_size, seed)
+        self._bands, self._rows = lsh_bands(threshold, num_perm)
+        self._lsh = self._new_lsh()
+        # document id of each canonical chunk, and the canonical chunks of
+        # each document
+        self._documents: dict[str, str] = {}
+        self._chunks: dict[str, set[str]] = {}
+        self._path = path
+        self._table = table
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def connect(self) -> None:
+        """
+        Open the database of the links, creating the link table if needed.
+        """
+        if self._connection is not None:
+            return
+        if self._path != ":memory:":
+            os.makedirs(
+                os.path.dirname(os.path.abspath(self._path)), exist_ok=True
+            )
+        self._connection = sqlite3.connect(self._path, check_same_thread=False)
+        with self._lock:
+            self._connection.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {self._table} (
+                    doc_id TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    canonical TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    metadata TEXT NOT NULL,
+                    PRIMARY KEY (doc_id, fingerprint)
+                )
+                """
+            )
+            self._connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {self._table}_canonical "
+                f"ON {self._table} (canonical)"
+            )
+            self._connection.commit()
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __len__(self) -> int:
+        """
+        Number of canonical chunks.
+        """
+        return len(self._lsh)
+
+    def _new_lsh(self) -> MinHashLSH:
+        return MinHashLSH(self.threshold, self._bands, self._rows)
+
+    def find(
+        self, text: str, doc_id: Optional[str] = None
+    ) -> Optional[Tuple[str, str, float]]:
+        """
+        Find the canonical chunk of which a text is a near-duplicate.
+
+        Args:
+            text (str): the text of a chunk
+
+            doc_id (Optional[str]): document whose canonical chunks are not
+                considered
+
+        Returns:
+            Optional[Tuple[str, str, float]]: the document id and fingerprint
+                of the canonical chunk and the estimated similarity, None if
+                the text is not a near-duplicate
+        """
+        signature = self._minhash.signature(text)
+        if signature is None:
+            return None
+        with self._lock:
+            match = self._lsh.query(signature, self._chunks.get(doc_id, ()))
+            if match is None:
+                return None
+            return self._documents[match[0]], match[0], match[1]
+
+    def filter_batch(
+        self,
+        documents_list: list[list[Document]],
+        doc_ids: Optional[list[Optional[str]]] = None,
+    ) -> list[dict[int, str]]:
+        """
+        Find the chunks of several documents that are near-duplicates of
+        canonical chunks. Chunks are also compared to the chunks to embed of
+        the preceding documents of the batch, and to the preceding chunks of
+        their own document. The index is not changed; add the stored documents
+        with `add()`.
+
+        Args:
+            documents_list (List[List[Document]]): the chunks of each document
+
+            doc_ids (Optional[List[Optional[str]]]): for each document, the id
+                of a stored document that it revises, whose canonical chunks
+                are not considered
+
+        Returns:
+            List[Dict[int, str]]: for each document, the fingerprint of the
+                canonical chunk by position of each near-duplicate chunk; the
+                other chunks are to be embedded
+        """
+        if doc_ids is None:
+            doc_ids = [None] * len(documents_list)
+        batch = self._new_lsh()
+        duplicates_list = []
+        for documents, doc_id in zip(documents_list, doc_ids):
+            duplicates = {}
+            for position, doc in enumerate(documents):
+                signature = self._minhash.signature(doc.page_content)
+                if signature is None:
+                    continue
+                with self._lock:
+                    match = self._lsh.query(
+                        signature, self._chunks.get(doc_id, ())
+                    )
+                match = match or batch.query(signature)
+                if match is None:
+                    batch.add(fingerprint_text(doc.page_content), signature)
+                else:
+                    duplicates[position] = match[0]
+            duplicates_list.append(duplicates)
+        return duplicates_list
+
+    def filter(
+        self, documents: list[Document], doc_id: Optional[str] = None
+    ) -> dict[int, str]:
+        """
+        Find the chunks of a document that are near-duplicates of canonical
+        chunks, see `filter_batch()`.
+        """
+        return self.filter_batch([documents], [doc_id])[0]
+
+    def add(
+        self,
+        doc_id: str,
+        documents: list[Document],
+        duplicates: Optional[list[Tuple[Document, str]]] = None,
+    ) -> None:
+        """
+        Add the embedded chunks of a stored document as canonical chunks, and
+        record the links of its near-duplicate chunks.
+
+        Args:
+            doc_id (str): the id of the stored document
+
+            documents (List[Document]): the embedded chunks of the document
+
+            duplicates (Optional[List[Tuple[Document, str]]]): the chunks that
+                were not embedded, with the fingerprint of their canonical
+                chunk
+        """
+        doc_id = str(doc_id)
+        signatures = [
+            (
+                fingerprint_text(doc.page_content),
+                self._minhash.signature(doc.page_content),
+            )
+            for doc in documents
+        ]
+        with self._lock:
+            for fingerprint, signature in signatures:
+                if signature is None or fingerprint in self._lsh:
+                    continue
+                self._lsh.add(fingerprint, signature)
+                self._documents[fingerprint] = doc_id
+                self._chunks.setdefault(doc_id, set()).add(fingerprint)
+            # chunks linked to canonical chunks of their own document, e.g. of
+            # a document that was stored already, are removed with them
+            links = [
+                (
+                    doc_id,
+                    fingerprint_text(doc.page_content),
+                    canonical,
+                    doc.page_content,
+                    json.dumps(doc.metadata, default=str),
+                )
+                for doc, canonical in duplicates or []
+                if self._documents.get(canonical) != doc_id
+            ]
+            if len(links) > 0:
+                self._connection.executemany(
+                    f"INSERT OR REPLACE INTO {self._table} "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    links,
+                )
+                self._connection.commit()
+
+    def _pop_links(self, where: str, params: list) -> dict[str, list[Document]]:
+        """
+        Delete links and return the linked chunks by document id.
+        """
+        rows = self._connection.execute(
+            f"SELECT doc_id, text, metadata FROM {self._table} WHERE {where}",
+            params,
+        ).fetchall()
+        self._connection.execute(
+            f"DELETE FROM {self._table} WHERE {where}", params
+        )
+        self._connection.commit()
+        chunks = {}
+        for doc_id, text, metadata in rows:
+            chunks.setdefault(doc_id, []).append(
+                Document(page_content=text, metadata=json.loads(metadata))
+            )
+        return chunks
+
+    def remove(self, doc_id: str) -> dict[str, list[Document]]:
+        """
+        Remove the canonical chunks and links of a document, e.g. when it is
+        removed from the vector store. The links of the chunks of other
+        documents to its canonical chunks are removed as well, and these
+        chunks are returned, such that they can be embedded or linked to
+        another canonical chunk (see `DocumentEmbedder.remove_document()`).
+
+        Returns:
+            Dict[str, List[Document]]: the chunks that were linked to the
+                canonical chunks of the document, by document id
+        """
+        doc_id = str(doc_id)
+        with self._lock:
+            fingerprints = self._chunks.pop(doc_id, set())
+            for fingerprint in fingerprints:
+                self._lsh.remove(fingerprint)
+                del self._documents[fingerprint]
+            self._connection.execute(
+                f"DELETE FROM {self._table} WHERE doc_id = ?", [doc_id]
+            )
+            orphans = {}
+            fingerprints = list(fingerprints)
+            # SQLite limits the number of parameters of a statement
+            for i in range(0, len(fingerprints), 500):
+                batch = fingerprints[i : i + 500]
+                for other_id, chunks in self._pop_links(
+                    f"canonical IN ({', '.join('?' * len(batch))})", batch
+                ).items():
+                    orphans.setdefault(other_id, []).extend(chunks)
+            self._connection.commit()
+            return orphans
+
+    def pop_orphaned_links(
+        self, canonicals: Optional[Iterable[str]] = None
+    ) -> dict[str, list[Document]]:
+        """
+        Remove the links to chunks that are not indexed as canonical chunks,
+        e.g. because their document was removed from the vector store
+        without removing it from the index, and return the linked chunks.
+
+        Args:
+            canonicals (Optional[Iterable[str]]): fingerprints of the
+                canonical chunks to check; defaults to all linked chunks
+
+        Returns:
+            Dict[str, List[Document]]: the chunks whose canonical chunk is
+                not indexed, by document id
+        """
+        with self._lock:
+            if canonicals is None:
+                canonicals = [
+                    row[0]
+                    for row in self._connection.execute(
+                        f"SELECT DISTINCT canonical FROM {self._table}"
+                    )
+                ]
+            canonicals = [
+                fingerprint
+                for fingerprint in set(canonicals)
+                if fingerprint not in self._documents
+            ]
+            orphans = {}
+            for i in range(0, len(canonicals), 500):
+                batch = canonicals[i : i + 500]
+                for doc_id, chunks in self._pop_links(
+                    f"canonical IN ({', '.join('?' * len(batch))})", batch
+                ).items():
+                    orphans.setdefault(doc_id, []).extend(chunks)
+        if len(orphans) > 0:
+            logger.warning(
+                f"Found {sum(map(len, orphans.values()))} near-duplicate "
+                "chunks whose canonical chunk is not indexed."
+            )
+        return orphans
+
+    def document_of(self, fingerprint: str) -> Optional[str]:
+        """
+        Get the id of the document of a canonical chunk.
+        """
+        with self._lock:
+            return self._documents.get(fingerprint)
+
+    def links(self, doc_id: str) -> dict[str, str]:
+        """
+        Get the near-duplicate chunks of a document that were not embedded.
+
+        Returns:
+            Dict[str, str]: fingerprint of the canonical chunk by fingerprint
+                of the near-duplicate chunk
+        """
+        with self._lock:
+            return dict(
+                self._connection.execute(
+                    f"SELECT fingerprint, canonical FROM {self._table} "
+                    "WHERE doc_id = ?",
+                    [str(doc_id)],
+                )
+            )
+
+    def add_fragments(self, agent, batch_size: int = 1000) -> int:
+        """
+        Add the fragments stored in a vector store as canonical chunks. The
+        links are not changed; see `pop_orphaned_links()` for links whose
+        canonical chunk is no longer stored.
+
+        Args:
+            agent: the vector store agent, which implements
+                `iter_fragments()`
+
+            batch_size (int): number of fragments read at a time
+
+        Returns:
+            int: the number of indexed fragments
+        """
+        n_fragments = 0
+        for page in agent.iter_fragments(batch_size=batch_size):
+            documents = {}
+            for fragment in page:
+                documents.setdefault(fragment["doc_id"], []).append(
+                    Document(page_content=fragment["text"])
+                )
+            for doc_id, chunks in documents.items():
+                self.add(doc_id, chunks)
+            n_fragments += len(page)
+        logger.info(f"Indexed {n_fragments} fragments for near-duplicates.")
+        return n_fragments
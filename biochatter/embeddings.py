@@ -0,0 +1,461 @@
+"""
+Embedding backends and wrappers. `LocalEmbeddings` runs sentence-embedding
+models from the HuggingFace hub on the CPU, without an embedding service.
+Concurrent `embed_query()` and `embed_documents()` calls are coalesced into
+batches by a `DynamicBatcher`, such that many concurrent queries cost about as
+much as one forward pass of a batch. For example:
+
+    embeddings = LocalEmbeddings("sentence-transformers/all-MiniLM-L6-v2")
+    vector = embeddings.embed_query("What is a ribosome?")
+
+`CoalescingEmbeddings` applies the same batching to the queries sent to a
+remote embedding service.
+"""
+
+from typing import Callable, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+import time
+import queue
+import logging
+import threading
+
+from langchain_core.embeddings import Embeddings
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCAL_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+BACKENDS = ["torch", "onnx"]
+POOLING_STRATEGIES = ["mean", "cls"]
+
+
+class DynamicBatcher:
+    """
+    Micro-batching queue in front of a batch function. A dispatcher thread
+    collects the submitted requests until `max_batch_size` texts are pending
+    or the oldest request has waited `max_latency_ms`, and hands the batch to
+    one of `num_workers` worker threads. While all workers are busy, pending
+    requests keep accumulating, such that batches grow with the load. Each
+    request receives the results of its own texts, in order.
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[list[str]], list[list[float]]],
+        max_batch_size: int = 32,
+        max_latency_ms: float = 5.0,
+        num_workers: int = 1,
+    ):
+        """
+        Args:
+            embed_batch (Callable[[list[str]], list[list[float]]]): function
+                embedding a batch of at most `max_batch_size` texts; called
+                from the worker threads
+
+            max_batch_size (int): maximum number of texts per batch
+
+            max_latency_ms (float): maximum time a request waits for other
+                requests to join its batch
+
+            num_workers (int): number of batches processed concurrently; more
+                than one only helps if `embed_batch` releases the GIL, e.g.
+                while waiting for a remote service
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1.")
+        self._embed_batch = embed_batch
+        self.max_batch_size = max_batch_size
+        self.max_latency_ms = max_latency_ms
+        self._queue: queue.Queue = queue.Queue()
+        self._closed = False
+        self._free_workers = threading.Semaphore(num_workers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=num_workers, thread_name_prefix="DynamicBatcher"
+        )
+        self._dispatcher = threading.Thread(
+            target=self._dispatch, name="DynamicBatcher-dispatch", daemon=True
+        )
+        self._dispatcher.start()
+
+    def submit(self, texts: list[str]) -> Future:
+        """
+        Queue texts for embedding.
+
+        Returns:
+            Future: resolves to the embeddings of the texts
+        """
+        if self._closed:
+            raise RuntimeError("The batcher is closed.")
+        future = Future()
+        if len(texts) == 0:
+            future.set_result([])
+        else:
+            self._queue.put((list(texts), future))
+        return future
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embed texts, waiting for the result.
+        """
+        return self.submit(texts).result()
+
+    def close(self) -> None:
+        """
+        Stop the threads after the pending requests are processed.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._dispatcher.join()
+        self._executor.shutdown(wait=True)
+
+    def _collect(self, first: tuple, deadline: float) -> tuple[list, bool]:
+        """
+        Collect requests joining the batch of the first one.
+
+        Returns:
+            tuple[list[tuple], bool]: the requests, and whether the batcher is
+                closing
+        """
+        requests = [first]
+        size = len(first[0])
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    request = self._queue.get(timeout=timeout)
+                else:
+                    request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                return requests, True
+            requests.append(request)
+            size += len(request[0])
+        return requests, False
+
+    def _dispatch(self) -> None:
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+            deadline = time.monotonic() + self.max_latency_ms / 1000
+            self._free_workers.acquire()
+            requests, closing = self._collect(request, deadline)
+            self._executor.submit(self._process, requests)
+            if closing:
+                return
+
+    def _process(self, requests: list[tuple]) -> None:
+        texts = [
+            text for request_texts, _ in requests for text in request_texts
+        ]
+        try:
+            vectors = []
+            for start in range(0, len(texts), self.max_batch_size):
+                vectors.extend(
+                    self._embed_batch(
+                        texts[start : start + self.max_batch_size]
+                    )
+                )
+        except Exception as e:
+            for _, future in requests:
+                future.set_exception(e)
+            return
+        finally:
+            self._free_workers.release()
+        offset = 0
+        for request_texts, future in requests:
+            future.set_result(vectors[offset : offset + len(request_texts)])
+            offset += len(request_texts)
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    Sentence embeddings computed in process on the CPU by a HuggingFace
+    transformer model, with mean or CLS pooling. The model runs in PyTorch
+    (requires `torch`) or, with `backend="onnx"`, in ONNX Runtime (requires
+    `optimum[onnxruntime]`); `quantize=True` executes it with int8 weights.
+    Requests are coalesced into batches by a `DynamicBatcher`.
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_LOCAL_EMBEDDING_MODEL,
+        backend: str = "torch",
+        quantize: bool = False,
+        pooling: str = "mean",
+        normalize: bool = True,
+        max_length: int = 512,
+        max_batch_size: int = 32,
+        max_latency_ms: float = 5.0,
+        num_workers: int = 1,
+        num_threads: Optional[int] = None,
+        cache_dir: Optional[str] = None,
+    ):
+        """
+        Args:
+            model_name (str): name of the model on the HuggingFace hub, or path
+                of a local model directory (for air-gapped deployments)
+
+            backend (str): "torch" or "onnx"
+
+            quantize (bool): execute the model with int8 weights (dynamic
+                quantisation of the linear layers)
+
+            pooling (str): "mean" (average of the token embeddings) or "cls"
+                (embedding of the first token), depending on how the model was
+                trained
+
+            normalize (bool): scale the embeddings to unit length
+
+            max_length (int): maximum number of tokens per text; longer texts
+                are truncated
+
+            max_batch_size (int): maximum number of texts per forward pass
+
+            max_latency_ms (float): maximum time a request waits for other
+                requests to join its batch
+
+            num_workers (int): number of forward passes run concurrently
+
+            num_threads (Optional[int]): number of intra-op threads of the
+                model runtime; defaults to the runtime's choice
+
+            cache_dir (Optional[str]): directory of the exported (and
+                quantised) ONNX model; defaults to a directory next to the
+                HuggingFace cache
+        """
+        if backend not in BACKENDS:
+            raise ValueError(
+                f"Invalid backend {backend}. Choose from {BACKENDS}."
+            )
+        if pooling not in POOLING_STRATEGIES:
+            raise ValueError(
+                f"Invalid pooling {pooling}. Choose from {POOLING_STRATEGIES}."
+            )
+        self.model_name = model_name
+        self.backend = backend
+        self.quantize = quantize
+        self.pooling = pooling
+        self.normalize = normalize
+        self.max_length = max_length
+        self._num_threads = num_threads
+        self._cache_dir = cache_dir
+        self._tokenizer, self._model = self._load_model()
+        self._batcher = DynamicBatcher(
+            self._embed_batch,
+            max_batch_size=max_batch_size,
+            max_latency_ms=max_latency_ms,
+            num_workers=num_workers,
+        )
+
+    def _load_model(self) -> tuple:
+        try:
+            import torch
+        except ImportError:
+            raise ImportError(
+                "Local embeddings require PyTorch. Please install it with "
+                "`pip install torch`."
+            )
+        from transformers import AutoModel, AutoTokenizer
+
+        if self._num_threads is not None:
+            torch.set_num_threads(self._num_threads)
+        tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        if self.backend == "onnx":
+            return tokenizer, self._load_onnx_model()
+
+        model = AutoModel.from_pretrained(self.model_name).eval()
+        if self.quantize:
+            model = torch.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        return tokenizer, model
+
+    def _load_onnx_model(self) -> object:
+        """
+        Export the model to ONNX, quantise it if requested, and load it into
+        ONNX Runtime. The exported model is cached in `cache_dir`.
+        """
+        try:
+            from optimum.onnxruntime import ORTModelForFeatureExtraction
+        except ImportError:
+            raise ImportError(
+                "The ONNX backend of local embeddings requires optimum. "
+                "Please install it with `pip install optimum[onnxruntime]`."
+            )
+        directory = self._cache_dir or os.path.join(
+            os.path.expanduser("~"),
+            ".cache",
+            "biochatter",
+            "onnx",
+            self.model_name.replace("/", "--"),
+        )
+        file_name = "model_quantized.onnx" if self.quantize else "model.onnx"
+        if not os.path.exists(os.path.join(directory, file_name)):
+            logger.info(f"Exporting {self.model_name} to ONNX in {directory}.")
+            model = ORTModelForFeatureExtraction.from_pretrained(
+                self.model_name, export=True
+            )
+            model.save_pretrained(directory)
+            if self.quantize:
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+
+                quantize_dynamic(
+                    os.path.join(directory, "model.onnx"),
+                    os.path.join(directory, file_name),
+                    weight_type=QuantType.QInt8,
+                )
+        session_options = None
+        if self._num_threads is not None:
+            from onnxruntime import SessionOptions
+
+            session_options = SessionOptions()
+            session_options.intra_op_num_threads = self._num_threads
+        return ORTModelForFeatureExtraction.from_pretrained(
+            directory, file_name=file_name, session_options=session_options
+        )
+
+    def _embed_batch(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embed a batch of texts in one forward pass. Texts are sorted by length
+        so that similar lengths are padded together.
+        """
+        import torch
+
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        inputs = self._tokenizer(
+            [texts[i] for i in order],
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors="pt",
+        )
+        with torch.inference_mode():
+            hidden = self._model(**inputs).last_hidden_state
+        hidden = np.asarray(hidden, dtype=np.float32)
+        if self.pooling == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = inputs["attention_mask"].numpy()[:, :, None]
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(
+                mask.sum(axis=1), 1
+            )
+        if self.normalize:
+            pooled /= np.maximum(
+                np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12
+            )
+        vectors = [None] * len(texts)
+        for position, i in enumerate(order):
+            vectors[i] = pooled[position].tolist()
+        return vectors
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._batcher.embed(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._batcher.embed([text])[0]
+
+    def close(self) -> None:
+        """
+        Stop the batching workers.
+        """
+        self._batcher.close()
+
+
+class CoalescingEmbeddings(Embeddings):
+    """
+    Wrapper around the embeddings of a remote embedding service that reduces
+    the number of requests under concurrent traffic. Queries arriving within
+    `max_latency_ms` of each other are sent as one `embed_documents()`
+    request, and concurrent queries for the same text share one embedding
+    (singleflight). Duplicate texts within one `embed_documents()` call are
+    embedded once.
+
+    Batching queries requires that the wrapped embeddings embed queries and
+    documents identically, which holds for OpenAI and Xinference but not, for
+    example, for Ollama, which prefixes queries with an instruction. With
+    `batch_queries=False`, queries are only de-duplicated.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        max_batch_size: int = 64,
+        max_latency_ms: float = 5.0,
+        num_workers: int = 4,
+        batch_queries: bool = True,
+    ):
+        """
+        Args:
+            embeddings (Embeddings): the wrapped embeddings, e.g.
+                OpenAIEmbeddings or XinferenceEmbeddings
+
+            max_batch_size (int): maximum number of queries per request
+
+            max_latency_ms (float): maximum time a query waits for other
+                queries to join its request
+
+            num_workers (int): maximum number of concurrent batched requests
+
+            batch_queries (bool): send concurrent queries as one
+                `embed_documents()` request; otherwise, every distinct query
+                is sent by `embed_query()`
+        """
+        self.embeddings = embeddings
+        self.batch_queries = batch_queries
+        self._in_flight: dict[str, Future] = {}
+        # reentrant, since the done callback runs immediately in the calling
+        # thread if the batch completed before it was added
+        self._lock = threading.RLock()
+        self._batcher = (
+            DynamicBatcher(
+                self.embeddings.embed_documents,
+                max_batch_size=max_batch_size,
+                max_latency_ms=max_latency_ms,
+                num_workers=num_workers,
+            )
+            if batch_queries
+            else None
+        )
+
+    def embed_query(self, text: str) -> list[float]:
+        with self._lock:
+            future = self._in_flight.get(text)
+            owner = future is None
+            if owner:
+                future = (
+                    self._batcher.submit([text])
+                    if self._batcher is not None
+                    else Future()
+                )
+                self._in_flight[text] = future
+                future.add_done_callback(lambda _: self._forget(text))
+        if owner and self._batcher is None:
+            try:
+                future.set_result([self.embeddings.embed_query(text)])
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()[0]
+
+    def _forget(self, text: str) -> None:
+        with self._lock:
+            self._in_flight.pop(text, None)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        unique = list(dict.fromkeys(texts))
+        if len(unique) == len(texts):
+            return self.embeddings.embed_documents(texts)
+        vectors = dict(zip(unique, self.embeddings.embed_documents(unique)))
+        return [vectors[text] for text in texts]
+
+    def close(self) -> None:
+        """
+        Stop the batching workers.
+        """
+        if self._batcher is not None:
+            self._batcher.close()
@@ -0,0 +1,141 @@
+"""
+Recall-vs-latency sweep over the search parameters of an ANN index, to choose
+the settings of a deployment. Recall is measured against reference results,
+usually those of exhaustive or high-effort search. For example:
+
+    results = sweep_search_params(
+        embedder.database_host,
+        queries,
+        [{"ef": 16}, {"ef": 32}, {"ef": 64}, {"ef": 128}],
+        k=10,
+        reference_search_params={"ef": 1024},
+    )
+    print(format_sweep(results))
+    params = select_search_params(results, min_recall=0.95)
+"""
+
+from typing import Optional
+import time
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _result_keys(results: list) -> set[tuple]:
+    return {(doc.metadata.get("id"), doc.page_content) for doc in results}
+
+
+def sweep_search_params(
+    agent: object,
+    queries: list[str],
+    search_params_list: list[dict],
+    k: int = 10,
+    reference_search_params: Optional[dict] = None,
+    doc_ids: Optional[list[str]] = None,
+) -> list[dict]:
+    """
+    Run each query with each set of search parameters and measure the recall
+    of the top k results against the reference results, as well as the search
+    latency.
+
+    Args:
+        agent (object): vector database agent, e.g. VectorDatabaseAgentMilvus
+            or VectorDatabaseAgentLocal; needs to implement
+            `similarity_search(query, k, doc_ids, search_params)`
+
+        queries (list[str]): query strings, ideally representative of the
+            deployment
+
+        search_params_list (list[dict]): search parameters to compare, e.g.
+            `[{"ef": 16}, {"ef": 64}]` (HNSW) or `[{"nprobe": 8}, {"nprobe":
+            32}]` (IVF)
+
+        k (int): number of results per query
+
+        reference_search_params (Optional[dict]): search parameters of the
+            reference results; defaults to the last entry of
+            `search_params_list`, which should then be the most accurate one
+
+        doc_ids (Optional[list[str]]): document scope of the searches
+
+    Returns:
+        list[dict]: per set of search parameters, "search_params", "recall"
+            (mean over queries), "mean_latency_ms" and "p95_latency_ms"
+    """
+    if len(search_params_list) == 0:
+        return []
+    reference_search_params = reference_search_params or search_params_list[-1]
+    reference = [
+        _result_keys(
+            agent.similarity_search(
+                query,
+                k=k,
+                doc_ids=doc_ids,
+                search_params=reference_search_params,
+            )
+        )
+        for query in queries
+    ]
+
+    results = []
+    for search_params in search_params_list:
+        recalls = []
+        latencies = []
+        for query, expected in zip(queries, reference):
+            start = time.perf_counter()
+            found = agent.similarity_search(
+                query, k=k, doc_ids=doc_ids, search_params=search_params
+            )
+            latencies.append(1000 * (time.perf_counter() - start))
+            if len(expected) > 0:
+                recalls.append(
+                    len(_result_keys(found) & expected) / len(expected)
+                )
+        result = {
+            "search_params": search_params,
+            "recall": float(np.mean(recalls)) if recalls else 1.0,
+            "mean_latency_ms": float(np.mean(latencies)),
+            "p95_latency_ms": float(np.percentile(latencies, 95)),
+        }
+        logger.info(f"Search parameter sweep: {result}")
+        results.append(result)
+    return results
+
+
+def select_search_params(
+    results: list[dict], min_recall: float = 0.95
+) -> Optional[dict]:
+    """
+    Select the search parameters with the lowest mean latency among those
+    reaching the given recall.
+
+    Args:
+        results (list[dict]): output of `sweep_search_params()`
+
+        min_recall (float): required recall
+
+    Returns:
+        Optional[dict]: search parameters, None if no parameters reach the
+            recall
+    """
+    candidates = [r for r in results if r["recall"] >= min_recall]
+    if len(candidates) == 0:
+        return None
+    return min(candidates, key=lambda r: r["mean_latency_ms"])["search_params"]
+
+
+def format_sweep(results: list[dict]) -> str:
+    """
+    Format sweep results as a table.
+    """
+    lines = [
+        f"{'search params':<30} {'recall':>8} {'mean ms':>9} {'p95 ms':>9}"
+    ]
+    for r in results:
+        lines.append(
+            f"{str(r['search_params']):<30} {r['recall']:>8.3f} "
+            f"{r['mean_latency_ms']:>9.2f} {r['p95_latency_ms']:>9.2f}"
+        )
+    return "\n".join(lines)
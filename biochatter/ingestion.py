@@ -0,0 +1,533 @@
+"""
+Bulk ingestion of document collections into a vector store. Files are parsed
+and split in a process pool, while a consumer thread embeds and stores the
+resulting chunks, such that CPU-bound parsing overlaps with network-bound
+embedding. Progress is recorded in a checkpoint file, which allows resuming an
+interrupted ingestion.
+
+Can be run from the command line, e.g.:
+
+    biochatter-ingest papers/ --vector-db-vendor local --store-path store/
+"""
+
+from typing import Optional
+from collections.abc import Iterable
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    wait,
+)
+import os
+import json
+import time
+import queue
+import logging
+import argparse
+import threading
+import multiprocessing
+
+from langchain.schema import Document
+
+from .dedup import NearDuplicateIndex
+from .embeddings import LocalEmbeddings
+from .chunk_store import SQLiteChunkStore
+from .metadata_store import SQLiteMetadataStore
+from .vectorstore import DocumentReader, DocumentEmbedder, create_text_splitter
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = (".pdf", ".txt")
+
+
+def _load_and_split(path: str, splitter_args: dict) -> list[Document]:
+    """
+    Parse a file and split it into chunks; runs in the worker processes.
+    """
+    if path.lower().endswith(".pdf"):
+        # split page by page, keeping the page numbers of each chunk
+        documents = DocumentReader().iter_pdf_pages(path)
+    else:
+        documents = DocumentReader().load_document(path)
+    if documents is None:
+        raise ValueError(f"Unsupported file type: {path}")
+    splitter = create_text_splitter(**splitter_args)
+    return [
+        chunk for doc in documents for chunk in splitter.split_documents([doc])
+    ]
+
+
+def find_documents(
+    path: str,
+    recursive: bool = True,
+    extensions: Iterable[str] = SUPPORTED_EXTENSIONS,
+) -> list[str]:
+    """
+    Find all files with supported extensions in a directory.
+
+    Args:
+        path (str): directory to search
+
+        recursive (bool): whether to descend into subdirectories
+
+        extensions (Iterable[str]): file extensions to include
+
+    Returns:
+        List[str]: sorted file paths
+    """
+    extensions = tuple(extensions)
+    if recursive:
+        files = [
+            os.path.join(root, name)
+            for root, _, names in os.walk(path)
+            for name in names
+        ]
+    else:
+        files = [
+            os.path.join(path, name)
+            for name in os.listdir(path)
+            if os.path.isfile(os.path.join(path, name))
+        ]
+    return sorted(f for f in files if f.lower().endswith(extensions))
+
+
+class IngestionCheckpoint:
+    """
+    Records which files have been ingested (with their document id, size and
+    modification time) and which have failed. Files are considered done only
+    if they have not changed since their ingestion.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path (Optional[str]): checkpoint file; None to keep the progress in
+                memory only
+        """
+        self.path = path
+        self.done: dict[str, dict] = {}
+        self.failed: dict[str, str] = {}
+        if path is not None and os.path.exists(path):
+            with open(path, "r") as f:
+                stored = json.load(f)
+            self.done = stored.get("done", {})
+            self.failed = stored.get("failed", {})
+
+    @staticmethod
+    def _stamp(file: str) -> dict:
+        stat = os.stat(file)
+        return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    def is_done(self, file: str) -> bool:
+        entry = self.done.get(file)
+        if entry is None:
+            return False
+        stamp = IngestionCheckpoint._stamp(file)
+        return (
+            entry["size"] == stamp["size"] and entry["mtime"] == stamp["mtime"]
+        )
+
+    def mark_done(self, file: str, doc_id: str) -> None:
+        self.done[file] = {"doc_id": doc_id, **IngestionCheckpoint._stamp(file)}
+        self.failed.pop(file, None)
+
+    def mark_failed(self, file: str, error: str) -> None:
+        self.failed[file] = error
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"done": self.done, "failed": self.failed}, f, indent=1)
+        os.replace(tmp, self.path)
+
+
+class IngestionReport:
+    """
+    Outcome of `BulkIngestor.ingest_files()`: the document ids of the ingested
+    files, the files skipped as already ingested, the errors of the failed
+    files, the number of stored chunks and the duration in seconds.
+    """
+
+    def __init__(self):
+        self.ingested: dict[str, str] = {}
+        self.skipped: list[str] = []
+        self.failed: dict[str, str] = {}
+        self.n_chunks = 0
+        self.seconds = 0.0
+
+    def __repr__(self) -> str:
+        return (
+            f"IngestionReport(ingested={len(self.ingested)}, "
+            f"skipped={len(self.skipped)}, failed={len(self.failed)}, "
+            f"chunks={self.n_chunks}, seconds={self.seconds:.1f})"
+        )
+
+
+class BulkIngestor:
+    def __init__(
+        self,
+        embedder: DocumentEmbedder,
+        n_workers: Optional[int] = None,
+        queue_size: int = 32,
+        batch_size: int = 256,
+        checkpoint_path: Optional[str] = None,
+    ):
+        """
+        Ingest many files into the vector store of a DocumentEmbedder. Files
+        are parsed and split in a process pool and streamed through a bounded
+        queue to a consumer thread, which embeds and stores them in batches.
+        A failing file is recorded and skipped without affecting the others.
+
+        Args:
+            embedder (DocumentEmbedder): connected embedder; its splitting
+                settings and vector store are used
+
+            n_workers (Optional[int]): number of parsing processes; defaults to
+                the number of CPUs. 0 parses in a thread of the calling
+                process.
+
+            queue_size (int): maximum number of parsed files waiting to be
+                embedded; bounds memory use if embedding is the bottleneck
+
+            batch_size (int): number of chunks collected before they are
+                embedded and stored
+
+            checkpoint_path (Optional[str]): file recording the progress, used
+                to resume an interrupted ingestion
+        """
+        self.embedder = embedder
+        self.n_workers = (
+            (os.cpu_count() or 1) if n_workers is None else max(n_workers, 0)
+        )
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.checkpoint = IngestionCheckpoint(checkpoint_path)
+
+    def ingest_directory(
+        self,
+        path: str,
+        recursive: bool = True,
+        extensions: Iterable[str] = SUPPORTED_EXTENSIONS,
+    ) -> IngestionReport:
+        """
+        Ingest all supported files in a directory.
+
+        Args:
+            path (str): directory
+
+            recursive (bool): whether to descend into subdirectories
+
+            extensions (Iterable[str]): file extensions to include
+
+        Returns:
+            IngestionReport: ingested, skipped and failed files
+        """
+        return self.ingest_files(find_documents(path, recursive, extensions))
+
+    def ingest_files(self, files: Iterable[str]) -> IngestionReport:
+        """
+        Ingest the given files, skipping those recorded as done in the
+        checkpoint.
+
+        Args:
+            files (Iterable[str]): file paths
+
+        Returns:
+            IngestionReport: ingested, skipped and failed files
+        """
+        start = time.perf_counter()
+        report = IngestionReport()
+        todo = []
+        for file in files:
+            if self.checkpoint.is_done(file):
+                report.skipped.append(file)
+            else:
+                todo.append(file)
+
+        parsed: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        consumer_errors: list[Exception] = []
+        consumer = threading.Thread(
+            target=self._consume,
+            args=(parsed, report, consumer_errors),
+            daemon=True,
+        )
+        consumer.start()
+        try:
+            self._produce(todo, parsed, consumer_errors)
+        finally:
+            parsed.put(None)
+            consumer.join()
+            self.checkpoint.save()
+        report.seconds = time.perf_counter() - start
+        if consumer_errors:
+            raise consumer_errors[0]
+        return report
+
+    def _produce(
+        self,
+        files: list[str],
+        parsed: queue.Queue,
+        consumer_errors: list[Exception],
+    ) -> None:
+        """
+        Parse and split files, putting (file, chunks, error) tuples into the
+        queue as they complete. Blocks when the queue is full, and stops early
+        if the consumer failed.
+        """
+        splitter_args = self.embedder.splitter_args
+        if self.n_workers == 0:
+            for file in files:
+                if consumer_errors:
+                    return
+                try:
+                    parsed.put(
+                        (file, _load_and_split(file, splitter_args), None)
+                    )
+                except Exception as e:
+                    parsed.put((file, None, e))
+            return
+
+        # spawn, as forking while the consumer thread holds locks is unsafe
+        with ProcessPoolExecutor(
+            max_workers=self.n_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as pool:
+            pending: dict[Future, str] = {}
+            remaining = iter(files)
+            max_in_flight = 2 * self.n_workers
+            while True:
+                for file in remaining:
+                    pending[
+                        pool.submit(_load_and_split, file, splitter_args)
+                    ] = file
+                    if len(pending) >= max_in_flight:
+                        break
+                if not pending or consumer_errors:
+                    for future in pending:
+                        future.cancel()
+                    return
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file = pending.pop(future)
+                    error = future.exception()
+                    parsed.put(
+                        (file, None if error else future.result(), error)
+                    )
+
+    def _consume(
+        self,
+        parsed: queue.Queue,
+        report: IngestionReport,
+        errors: list[Exception],
+    ) -> None:
+        """
+        Collect parsed files into batches of chunks and store them. Keeps
+        draining the queue after an unexpected error, so that the producer
+        never blocks on a full queue.
+        """
+        batch: list[tuple[str, list[Document]]] = []
+        n_batch_chunks = 0
+        while True:
+            item = parsed.get()
+            if item is None:
+                break
+            if errors:
+                continue
+            file, chunks, error = item
+            try:
+                if error is not None:
+                    self._record_failure(report, file, error)
+                    continue
+                batch.append((file, chunks))
+                n_batch_chunks += len(chunks)
+                if n_batch_chunks >= self.batch_size:
+                    self._store_batch(batch, report)
+                    batch, n_batch_chunks = [], 0
+            except Exception as e:
+                errors.append(e)
+        if batch and not errors:
+            try:
+                self._store_batch(batch, report)
+            except Exception as e:
+                errors.append(e)
+
+    def _store_batch(
+        self, batch: list[tuple[str, list[Document]]], report: IngestionReport
+    ) -> None:
+        host = self.embedder.database_host
+        try:
+            doc_ids = self.embedder.save_chunks_batch(
+                [chunks for _, chunks in batch]
+            )
+        except Exception as e:
+            # store file by file to isolate the failing ones; the store has
+            # rolled back the documents of the failed batch, so the retries
+            # do not find them by fingerprint without their fragments
+            logger.warning(f"Failed to store batch, retrying by file: {e}")
+            doc_ids = []
+            for file, chunks in batch:
+                try:
+                    doc_ids.append(self.embedder.save_chunks_batch([chunks])[0])
+                except Exception as e:
+                    self._record_failure(report, file, e)
+                    doc_ids.append(None)
+        # the checkpoint must not get ahead of the store
+        host.commit()
+        for (file, chunks), doc_id in zip(batch, doc_ids):
+            if file in report.failed:
+                continue
+            if doc_id is None:
+                self._record_failure(report, file, ValueError("No text found"))
+                continue
+            if not self._has_fragments(doc_id):
+                self._record_failure(
+                    report,
+                    file,
+                    ValueError(f"No fragments stored for document {doc_id}"),
+                )
+                continue
+            report.ingested[file] = doc_id
+            report.n_chunks += len(chunks)
+            self.checkpoint.mark_done(file, doc_id)
+        self.checkpoint.save()
+        logger.info(
+            f"Stored {len(report.ingested)} files ({report.n_chunks} chunks)."
+        )
+
+    def _has_fragments(self, doc_id: str) -> bool:
+        """
+        Check that the document has embedded fragments, such that a file is
+        only marked as done once it can be found by search.
+        """
+        host = self.embedder.database_host
+        return any(len(page) > 0 for page in host.iter_fragments([doc_id], 1))
+
+    def _record_failure(
+        self, report: IngestionReport, file: str, error: Exception
+    ) -> None:
+        logger.error(f"Failed to ingest {file}: {error}")
+        report.failed[file] = str(error)
+        self.checkpoint.mark_failed(file, str(error))
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Ingest a directory of PDF and text files into a vector "
+        "store."
+    )
+    parser.add_argument("directory", help="directory containing the documents")
+    parser.add_argument(
+        "--no-recursive",
+        action="store_true",
+        help="do not descend into subdirectories",
+    )
+    parser.add_argument(
+        "--vector-db-vendor", default="milvus", choices=["milvus", "local"]
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Milvus host")
+    parser.add_argument("--port", default="19530", help="Milvus port")
+    parser.add_argument(
+        "--store-path", help="directory of the local vector store"
+    )
+    parser.add_argument("--embedding-collection-name")
+    parser.add_argument("--metadata-collection-name")
+    parser.add_argument(
+        "--metadata-db",
+        help="SQLite file for the document metadata (Milvus only); by default "
+        "the metadata is stored in a Milvus collection",
+    )
+    parser.add_argument(
+        "--chunk-db",
+        help="SQLite file for the text of the embedded fragments (Milvus "
+        "only), such that Milvus only holds vectors and ids; by default the "
+        "text is stored in the Milvus collection",
+    )
+    parser.add_argument("--model", default="text-embedding-ada-002")
+    parser.add_argument(
+        "--local-model",
+        help="sentence-embedding model (HuggingFace name or directory) to run "
+        "on the CPU instead of an embedding service",
+    )
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=0)
+    parser.add_argument(
+        "--split-by-tokens",
+        action="store_true",
+        help="measure chunk size in tokens instead of characters",
+    )
+    parser.add_argument(
+        "--near-duplicate-threshold",
+        type=float,
+        help="link chunks whose estimated similarity to a stored chunk is at "
+        "least this value (e.g. 0.9) instead of embedding them",
+    )
+    parser.add_argument(
+        "--near-duplicate-db",
+        help="SQLite file for the links of near-duplicate chunks; required "
+        "with --near-duplicate-threshold",
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument(
+        "--checkpoint",
+        help="progress file; an interrupted run resumes from it",
+    )
+    args = parser.parse_args(argv)
+    if args.vector_db_vendor == "local" and not args.store_path:
+        parser.error("--vector-db-vendor local requires --store-path")
+    if args.near_duplicate_threshold and not args.near_duplicate_db:
+        parser.error("--near-duplicate-threshold requires --near-duplicate-db")
+    logging.basicConfig(level=logging.INFO)
+
+    connection_args = (
+        {"path": args.store_path}
+        if args.vector_db_vendor == "local"
+        else {"host": args.host, "port": args.port}
+    )
+    embedder = DocumentEmbedder(
+        model=args.model,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        split_by_characters=not args.split_by_tokens,
+        vector_db_vendor=args.vector_db_vendor,
+        connection_args=connection_args,
+        embedding_collection_name=args.embedding_collection_name,
+        metadata_collection_name=args.metadata_collection_name,
+        metadata_store=(
+            SQLiteMetadataStore(args.metadata_db) if args.metadata_db else None
+        ),
+        chunk_store=(
+            SQLiteChunkStore(args.chunk_db) if args.chunk_db else None
+        ),
+        embeddings=(
+            LocalEmbeddings(args.local_model) if args.local_model else None
+        ),
+        near_duplicates=(
+            NearDuplicateIndex(
+                args.near_duplicate_threshold, path=args.near_duplicate_db
+            )
+            if args.near_duplicate_threshold
+            else None
+        ),
+    )
+    embedder.connect()
+    if embedder.near_duplicates is not None:
+        embedder.index_near_duplicates()
+    ingestor = BulkIngestor(
+        embedder,
+        n_workers=args.workers,
+        batch_size=args.batch_size,
+        checkpoint_path=args.checkpoint,
+    )
+    report = ingestor.ingest_directory(
+        args.directory, recursive=not args.no_recursive
+    )
+    print(report)
+    for file, error in report.failed.items():
+        print(f"failed: {file}: {error}")
+
+
+if __name__ == "__main__":
+    main()
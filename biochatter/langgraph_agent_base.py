@@ -74,6 +74,12 @@ class ReflexionAgentLogger:
     def logs(self):
         return self._logs
 
+    def clear(self) -> None:
+        """
+        Discard the saved log messages
+        """
+        self._logs = ""
+
 
 class ResponderWithRetries:
     """
@@ -92,6 +92,7 @@ class Conversation(ABC):
         self.ca_messages = []
         self.current_statements = []
         self._use_ragagent_selector = use_ragagent_selector
+        self._ragagent_selector: Optional[RagAgentSelector] = None
 
     @property
     def use_ragagent_selector(self):
@@ -324,6 +325,26 @@ class Conversation(ABC):
     def _correct_response(self, msg: str):
         pass
 
+    def _get_ragagent_selector(
+        self, rag_agents: list[RagAgent]
+    ) -> RagAgentSelector:
+        """
+        Get the RagAgentSelector for the given rag agents, reusing the selector
+        of previous queries if the agents did not change.
+        """
+        selector = self._ragagent_selector
+        if (
+            selector is None
+            or len(selector.rag_agents) != len(rag_agents)
+            or any(a is not b for a, b in zip(selector.rag_agents, rag_agents))
+        ):
+            selector = RagAgentSelector(
+                rag_agents=rag_agents,
+                conversation_factory=lambda: self,
+            )
+            self._ragagent_selector = selector
+        return selector
+
     def _inject_context_by_ragagent_selector(self, text: str):
         """
         Inject the context generated by RagAgentSelector, which will choose appropriate
@@ -334,10 +355,7 @@ class Conversation(ABC):
         rag_agents: list[RagAgent] = [
             agent for agent in self.rag_agents if agent.use_prompt
         ]
-        decider_agent = RagAgentSelector(
-            rag_agents=rag_agents,
-            conversation_factory=lambda: self,
-        )
+        decider_agent = self._get_ragagent_selector(rag_agents)
         result = decider_agent.execute(text)
         if result.tool_result is not None and len(result.tool_result) > 0:
             return result.tool_result
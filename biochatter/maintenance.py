@@ -0,0 +1,221 @@
+"""
+Maintenance of a Milvus vector store: removal of soft-deleted documents and of
+orphaned embeddings (fragments whose document no longer exists), followed by
+compaction of the collections. Run it once, periodically in the background
+with `MaintenanceTask`, or from the command line:
+
+    biochatter-maintain --host 127.0.0.1 --port 19530 --dry-run
+"""
+
+from typing import Optional
+import time
+import logging
+import argparse
+import threading
+
+from .chunk_store import SQLiteChunkStore
+from .metadata_store import SQLiteMetadataStore
+from .vectorstore_agent import VectorDatabaseAgentMilvus
+
+logger = logging.getLogger(__name__)
+
+
+class MaintenanceReport:
+    def __init__(self):
+        self.purged_documents: list[str] = []
+        self.scanned_embeddings = 0
+        self.orphaned_embeddings = 0
+        self.compacted = False
+        self.dry_run = False
+        self.seconds = 0.0
+
+    def __repr__(self) -> str:
+        return (
+            f"MaintenanceReport(purged_documents="
+            f"{len(self.purged_documents)}, scanned_embeddings="
+            f"{self.scanned_embeddings}, orphaned_embeddings="
+            f"{self.orphaned_embeddings}, compacted={self.compacted}, "
+            f"dry_run={self.dry_run}, seconds={self.seconds:.1f})"
+        )
+
+
+def run_maintenance(
+    agent: VectorDatabaseAgentMilvus,
+    batch_size: int = 1000,
+    grace_seconds: float = 0.0,
+    dry_run: bool = False,
+    compact: bool = True,
+) -> MaintenanceReport:
+    """
+    Purge soft-deleted documents, remove orphaned embeddings, and compact the
+    collections if anything was removed.
+
+    Args:
+        agent (VectorDatabaseAgentMilvus): connected agent of the store
+
+        batch_size (int): number of documents or fragments per query and
+            delete operation
+
+        grace_seconds (float): delay before orphans are checked again, see
+            `VectorDatabaseAgentMilvus.remove_orphaned_embeddings()`
+
+        dry_run (bool): only report what would be removed
+
+        compact (bool): compact the collections after removing entities
+
+    Returns:
+        MaintenanceReport: the removed (or, in a dry run, removable) rows
+    """
+    report = MaintenanceReport()
+    report.dry_run = dry_run
+    start = time.monotonic()
+    # purge first, such that the embeddings of purged documents are found as
+    # orphans in the same run
+    report.purged_documents = agent.purge_deleted_documents(
+        batch_size=batch_size, dry_run=dry_run
+    )
+    (
+        report.scanned_embeddings,
+        report.orphaned_embeddings,
+    ) = agent.remove_orphaned_embeddings(
+        batch_size=batch_size, grace_seconds=grace_seconds, dry_run=dry_run
+    )
+    removed = len(report.purged_documents) + report.orphaned_embeddings
+    if compact and not dry_run and removed > 0:
+        agent.compact()
+        report.compacted = True
+    report.seconds = time.monotonic() - start
+    logger.info(f"Vector store maintenance: {report}")
+    return report
+
+
+class MaintenanceTask:
+    def __init__(
+        self,
+        agent: VectorDatabaseAgentMilvus,
+        interval: float = 3600.0,
+        **kwargs,
+    ):
+        """
+        Run `run_maintenance()` periodically in a daemon thread. A failing
+        run is logged and retried at the next interval.
+
+        Args:
+            agent (VectorDatabaseAgentMilvus): connected agent of the store
+
+            interval (float): seconds between the start of two runs
+
+            **kwargs: arguments of `run_maintenance()`
+        """
+        self.agent = agent
+        self.interval = interval
+        self.kwargs = kwargs
+        self.last_report: Optional[MaintenanceReport] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="VectorStoreMaintenance", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Stop the task; a running maintenance run is completed first.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            start = time.monotonic()
+            try:
+                self.last_report = run_maintenance(self.agent, **self.kwargs)
+            except Exception as e:
+                logger.error(f"Vector store maintenance failed: {e}")
+            self._stop.wait(max(self.interval - (time.monotonic() - start), 0))
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Remove soft-deleted documents and orphaned embeddings "
+        "from a Milvus vector store and compact its collections."
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Milvus host")
+    parser.add_argument("--port", default="19530", help="Milvus port")
+    parser.add_argument("--embedding-collection-name")
+    parser.add_argument("--metadata-collection-name")
+    parser.add_argument(
+        "--metadata-db",
+        help="SQLite file of the document metadata, if the store uses one",
+    )
+    parser.add_argument(
+        "--chunk-db",
+        help="SQLite file of the fragment texts, if the store uses one",
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--grace-seconds",
+        type=float,
+        default=10.0,
+        help="delay before orphans are checked again and removed",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="only report what would be removed",
+    )
+    parser.add_argument(
+        "--no-compact",
+        action="store_true",
+        help="do not compact the collections",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        help="repeat every INTERVAL seconds until interrupted",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    agent = VectorDatabaseAgentMilvus(
+        embedding_func=None,
+        connection_args={"host": args.host, "port": args.port},
+        embedding_collection_name=args.embedding_collection_name,
+        metadata_collection_name=args.metadata_collection_name,
+        metadata_store=(
+            SQLiteMetadataStore(args.metadata_db) if args.metadata_db else None
+        ),
+        chunk_store=(
+            SQLiteChunkStore(args.chunk_db) if args.chunk_db else None
+        ),
+    )
+    agent.connect()
+    kwargs = {
+        "batch_size": args.batch_size,
+        "grace_seconds": args.grace_seconds,
+        "dry_run": args.dry_run,
+        "compact": not args.no_compact,
+    }
+    try:
+        if args.interval is None:
+            print(run_maintenance(agent, **kwargs))
+            return
+        task = MaintenanceTask(agent, interval=args.interval, **kwargs)
+        task.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            task.stop()
+    finally:
+        agent.close()
+
+
+if __name__ == "__main__":
+    main()
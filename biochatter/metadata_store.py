@@ -0,0 +1,449 @@
+"""
+Stores for the per-document metadata of a vector database. The embedded text
+fragments live in the vector database and refer to their document by id; the
+document metadata (title, author, source, ...) only needs scalar lookups by
+id, fingerprint or source, which do not require a vector database.
+"""
+
+from abc import ABC, abstractmethod
+from typing import Optional
+from collections.abc import Iterator
+import os
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# maximum number of values of one SQL "IN (...)" list, below the limit of
+# host parameters of older SQLite versions (999)
+SQLITE_MAX_IN_VALUES = 500
+
+
+def sqlite_in_batches(values: list) -> Iterator[tuple[str, list]]:
+    """
+    Split values into batches of at most `SQLITE_MAX_IN_VALUES`, each with the
+    placeholders of its "IN (...)" list.
+    """
+    for start in range(0, len(values), SQLITE_MAX_IN_VALUES):
+        batch = values[start : start + SQLITE_MAX_IN_VALUES]
+        yield ", ".join("?" for _ in batch), batch
+
+
+METADATA_FIELDS = [
+    "id",
+    "name",
+    "author",
+    "title",
+    "format",
+    "subject",
+    "creator",
+    "producer",
+    "creationDate",
+    "modDate",
+    "source",
+]
+
+
+def output_fields_with_id(output_fields: Optional[list[str]]) -> list[str]:
+    """
+    Validate selected metadata fields and make sure "id" is among them, as
+    pages are addressed by id.
+    """
+    if output_fields is None:
+        return list(METADATA_FIELDS)
+    invalid = [field for field in output_fields if field not in METADATA_FIELDS]
+    if len(invalid) > 0:
+        raise ValueError(
+            f"Invalid output fields {invalid}. Choose from {METADATA_FIELDS}."
+        )
+    return ["id"] + [field for field in output_fields if field != "id"]
+
+
+class MetadataStore(ABC):
+    """
+    Abstract base class of document metadata stores. Documents are identified
+    by ids assigned by the store on insertion; deleted documents are not
+    returned by any lookup. Documents may belong to a workspace; lookups with a
+    workspace only consider the documents of that workspace.
+    """
+
+    @abstractmethod
+    def connect(self) -> None:
+        """
+        Open or create the store.
+        """
+
+    @property
+    @abstractmethod
+    def has_fingerprints(self) -> bool:
+        """
+        Whether the store keeps document fingerprints, see
+        `vectorstore_agent.fingerprint_document()`.
+        """
+
+    @abstractmethod
+    def insert(
+        self, metadata: list[dict], workspace: Optional[str] = None
+    ) -> list[str]:
+        """
+        Insert the metadata of documents. Missing fields are filled with
+        "unknown".
+
+        Args:
+            metadata (List[Dict]): metadata of each document, optionally with
+                a "fingerprint"
+
+            workspace (Optional[str]): workspace of the documents
+
+        Returns:
+            List[str]: the ids of the documents
+        """
+
+    @abstractmethod
+    def get(
+        self,
+        doc_ids: Optional[list[str]] = None,
+        workspace: Optional[str] = None,
+    ) -> list[dict]:
+        """
+        Get the metadata of all documents, or of the given documents.
+
+        Args:
+            doc_ids (Optional[List[str]]): document ids; None for all documents
+
+            workspace (Optional[str]): workspace of the documents; None for
+                all workspaces
+
+        Returns:
+            List[Dict]: metadata with the fields in METADATA_FIELDS
+        """
+
+    @abstractmethod
+    def get_page(
+        self,
+        after_id: Optional[str] = None,
+        limit: int = 100,
+        doc_ids: Optional[list[str]] = None,
+        workspace: Optional[str] = None,
+        output_fields: Optional[list[str]] = None,
+    ) -> list[dict]:
+        """
+        Get one page of documents in ascending id order. Pages are addressed
+        by the id of the last document of the previous page rather than by an
+        offset, such that each page costs the same regardless of its position
+        and concurrent insertions or deletions do not shift pages.
+
+        Args:
+            after_id (Optional[str]): id of the last document of the previous
+                page; None for the first page
+
+            limit (int): maximum number of documents of the page
+
+            doc_ids (Optional[List[str]]): document ids; None for all documents
+
+            workspace (Optional[str]): workspace of the documents; None for
+                all workspaces
+
+            output_fields (Optional[List[str]]): fields of METADATA_FIELDS to
+                return; "id" is always returned. Defaults to all fields.
+
+        Returns:
+            List[Dict]: metadata of at most `limit` documents
+        """
+
+    def iter_documents(
+        self,
+        doc_ids: Optional[list[str]] = None,
+        workspace: Optional[str] = None,
+        output_fields: Optional[list[str]] = None,
+        batch_size: int = 1000,
+    ) -> Iterator[dict]:
+        """
+        Iterate over the metadata of all documents, or of the given documents,
+        fetching `batch_size` documents at a time, see `get_page()`.
+        """
+        after_id = None
+        while True:
+            page = self.get_page(
+                after_id, batch_size, doc_ids, workspace, output_fields
+            )
+            yield from page
+            if len(page) < batch_size:
+                return
+            after_id = str(page[-1]["id"])
+
+    @abstractmethod
+    def find_by_fingerprint(
+        self, fingerprints: list[str], workspace: Optional[str] = None
+    ) -> dict[str, str]:
+        """
+        Find documents by fingerprint, within a workspace if given.
+
+        Returns:
+            Dict[str, str]: document id by fingerprint, for the fingerprints
+                of stored documents
+        """
+
+    @abstractmethod
+    def delete(
+        self, doc_ids: list[str], workspace: Optional[str] = None
+    ) -> list[str]:
+        """
+        Delete documents, only those of a workspace if given.
+
+        Returns:
+            List[str]: the ids of the documents that were deleted
+        """
+
+    @abstractmethod
+    def flush(self) -> None:
+        """
+        Make the preceding write operations durable.
+        """
+
+    def purge_deleted(
+        self, batch_size: int = SQLITE_MAX_IN_VALUES, dry_run: bool = False
+    ) -> list[str]:
+        """
+        Permanently remove soft-deleted documents, i.e. those with `isDeleted`
+        set, e.g. by older versions or external tools. `delete()` removes
+        documents permanently. Stores without soft deletion return an empty
+        list.
+
+        Args:
+            batch_size (int): number of documents removed per operation; at
+                most `SQLITE_MAX_IN_VALUES` for SQLite stores
+
+            dry_run (bool): only find the documents, do not remove them
+
+        Returns:
+            List[str]: the ids of the (to be) removed documents
+        """
+        return []
+
+    def compact(self) -> None:
+        """
+        Reclaim the storage of removed documents. No-op by default.
+        """
+
+
+class SQLiteMetadataStore(MetadataStore):
+    """
+    Metadata store in an embedded SQLite database, with indexes on the
+    `isDeleted`, `source`, `fingerprint` and `workspace` columns. Write
+    operations are committed by `flush()`. Lookups of many ids or fingerprints
+    are split into queries of `SQLITE_MAX_IN_VALUES` values.
+    """
+
+    def __init__(self, path: str = ":memory:", table: str = "documents"):
+        """
+        Args:
+            path (str): path of the database file; ":memory:" keeps the store
+                in memory
+
+            table (str): name of the metadata table, e.g. to keep several
+                stores in one database file
+        """
+        self._path = path
+        self._table = table
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def connect(self) -> None:
+        if self._path != ":memory:":
+            os.makedirs(
+                os.path.dirname(os.path.abspath(self._path)), exist_ok=True
+            )
+        self._connection = sqlite3.connect(self._path, check_same_thread=False)
+        columns = ", ".join(f'"{field}" TEXT' for field in METADATA_FIELDS[1:])
+        with self._lock:
+            self._connection.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {self._table} (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    {columns},
+                    isDeleted INTEGER NOT NULL DEFAULT 0,
+                    fingerprint TEXT,
+                    workspace TEXT
+                )
+                """
+            )
+            existing = [
+                row[1]
+                for row in self._connection.execute(
+                    f"PRAGMA table_info({self._table})"
+                )
+            ]
+            if "workspace" not in existing:
+                # tables created before workspaces
+                self._connection.execute(
+                    f"ALTER TABLE {self._table} ADD COLUMN workspace TEXT"
+                )
+            for column in ["isDeleted", "source", "fingerprint", "workspace"]:
+                self._connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS {self._table}_{column} "
+                    f"ON {self._table} ({column})"
+                )
+            self._connection.commit()
+
+    def _scope(self, workspace: Optional[str]) -> tuple[str, list]:
+        """
+        Build the condition selecting the non-deleted documents of a workspace.
+        """
+        if workspace is None:
+            return "isDeleted = 0", []
+        return "isDeleted = 0 AND workspace = ?", [workspace]
+
+    @property
+    def has_fingerprints(self) -> bool:
+        return True
+
+    def insert(
+        self, metadata: list[dict], workspace: Optional[str] = None
+    ) -> list[str]:
+        fields = METADATA_FIELDS[1:] + ["fingerprint", "workspace"]
+        columns = ", ".join(f'"{field}"' for field in fields)
+        placeholders = ", ".join("?" for _ in fields)
+        ids = []
+        with self._lock:
+            for item in metadata:
+                cursor = self._connection.execute(
+                    f"INSERT INTO {self._table} ({columns}) "
+                    f"VALUES ({placeholders})",
+                    [
+                        str(item[field]) if field in item else "unknown"
+                        for field in METADATA_FIELDS[1:]
+                    ]
+                    + [item.get("fingerprint"), workspace],
+                )
+                ids.append(str(cursor.lastrowid))
+        return ids
+
+    def _select(self, query: str, params: list) -> list[tuple]:
+        with self._lock:
+            return self._connection.execute(query, params).fetchall()
+
+    def get(
+        self,
+        doc_ids: Optional[list[str]] = None,
+        workspace: Optional[str] = None,
+    ) -> list[dict]:
+        columns = ", ".join(f'"{field}"' for field in METADATA_FIELDS)
+        condition, params = self._scope(workspace)
+        query = f"SELECT {columns} FROM {self._table} WHERE {condition}"
+        if doc_ids is None:
+            rows = self._select(query + " ORDER BY id", params)
+        else:
+            ids = sorted({int(doc_id) for doc_id in doc_ids})
+            rows = [
+                row
+                for placeholders, batch in sqlite_in_batches(ids)
+                for row in self._select(
+                    query + f" AND id IN ({placeholders}) ORDER BY id",
+                    params + batch,
+                )
+            ]
+        return [dict(zip(METADATA_FIELDS, row)) for row in rows]
+
+    def get_page(
+        self,
+        after_id: Optional[str] = None,
+        limit: int = 100,
+        doc_ids: Optional[list[str]] = None,
+        workspace: Optional[str] = None,
+        output_fields: Optional[list[str]] = None,
+    ) -> list[dict]:
+        fields = output_fields_with_id(output_fields)
+        columns = ", ".join(f'"{field}"' for field in fields)
+        condition, params = self._scope(workspace)
+        query = f"SELECT {columns} FROM {self._table} WHERE {condition}"
+        if after_id is not None:
+            query += " AND id > ?"
+            params.append(int(after_id))
+        if doc_ids is None:
+            rows = self._select(
+                query + " ORDER BY id LIMIT ?", params + [limit]
+            )
+            return [dict(zip(fields, row)) for row in rows]
+        # batches of ascending ids, read until the page is full
+        ids = sorted({int(doc_id) for doc_id in doc_ids})
+        if after_id is not None:
+            ids = [doc_id for doc_id in ids if doc_id > int(after_id)]
+        rows = []
+        for placeholders, batch in sqlite_in_batches(ids):
+            if len(rows) >= limit:
+                break
+            rows += self._select(
+                query + f" AND id IN ({placeholders}) ORDER BY id LIMIT ?",
+                params + batch + [limit - len(rows)],
+            )
+        return [dict(zip(fields, row)) for row in rows]
+
+    def find_by_fingerprint(
+        self, fingerprints: list[str], workspace: Optional[str] = None
+    ) -> dict[str, str]:
+        condition, params = self._scope(workspace)
+        found = {}
+        for placeholders, batch in sqlite_in_batches(list(fingerprints)):
+            rows = self._select(
+                f"SELECT fingerprint, id FROM {self._table} WHERE {condition} "
+                f"AND fingerprint IN ({placeholders})",
+                params + batch,
+            )
+            found.update((fingerprint, str(id)) for fingerprint, id in rows)
+        return found
+
+    def delete(
+        self, doc_ids: list[str], workspace: Optional[str] = None
+    ) -> list[str]:
+        condition, params = self._scope(workspace)
+        deleted = []
+        with self._lock:
+            for placeholders, batch in sqlite_in_batches(
+                sorted({int(doc_id) for doc_id in doc_ids})
+            ):
+                rows = self._connection.execute(
+                    f"SELECT id FROM {self._table} WHERE {condition} "
+                    f"AND id IN ({placeholders})",
+                    params + batch,
+                ).fetchall()
+                found = [row[0] for row in rows]
+                self._connection.execute(
+                    f"DELETE FROM {self._table} WHERE id IN "
+                    f"({', '.join('?' for _ in found)})",
+                    found,
+                )
+                deleted += found
+        return [str(id) for id in deleted]
+
+    def flush(self) -> None:
+        with self._lock:
+            self._connection.commit()
+
+    def purge_deleted(
+        self, batch_size: int = SQLITE_MAX_IN_VALUES, dry_run: bool = False
+    ) -> list[str]:
+        rows = self._select(
+            f"SELECT id FROM {self._table} WHERE isDeleted != 0 ORDER BY id",
+            [],
+        )
+        ids = [row[0] for row in rows]
+        # larger batches exceed the host parameters of one query
+        batch_size = min(batch_size, SQLITE_MAX_IN_VALUES)
+        if not dry_run:
+            for start in range(0, len(ids), batch_size):
+                batch = ids[start : start + batch_size]
+                with self._lock:
+                    self._connection.execute(
+                        f"DELETE FROM {self._table} WHERE id IN "
+                        f"({', '.join('?' for _ in batch)})",
+                        batch,
+                    )
+                    self._connection.commit()
+        return [str(id) for id in ids]
+
+    def compact(self) -> None:
+        with self._lock:
+            self._connection.commit()
+            self._connection.execute("VACUUM")
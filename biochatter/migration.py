@@ -0,0 +1,189 @@
+"""
+Migration of embeddings collections to the current schema version, see
+`vectorstore_agent.EMBEDDINGS_SCHEMA_VERSION`. Collections of schema version 1
+store the document ids (`meta_id`) as strings, such that filtering by
+document compares strings and removing a document requires a query for the
+primary keys of its fragments. The migration copies the collection in batches
+into a collection with INT64 document ids and a scalar index on them, and
+swaps the collections. Run it while no documents are stored or removed:
+
+    biochatter-migrate --host 127.0.0.1 --port 19530
+"""
+
+from typing import Tuple, Optional
+import logging
+import argparse
+
+from pymilvus import DataType, Collection, MilvusException, utility
+
+from .milvus_connections import connection_registry
+from .vectorstore_agent import (
+    EMBEDDINGS_SCHEMA_VERSION,
+    DOCUMENT_EMBEDDINGS_COLLECTION_NAME,
+    milvus_server_version,
+    iter_collection_pages,
+    embeddings_schema_version,
+    create_embeddings_collection,
+)
+
+logger = logging.getLogger(__name__)
+
+# index of the vectors if the source collection has none (LangChain default)
+DEFAULT_VECTOR_INDEX = {
+    "metric_type": "L2",
+    "index_type": "HNSW",
+    "params": {"M": 8, "efConstruction": 64},
+}
+
+
+def _vector_index_params(collection: Collection) -> dict:
+    for index in collection.indexes:
+        if index.field_name == "vector":
+            return index.params
+    return DEFAULT_VECTOR_INDEX
+
+
+def migrate_embeddings_collection(
+    name: str,
+    using: str = "default",
+    batch_size: int = 1000,
+    keep_backup: bool = True,
+) -> Tuple[int, int]:
+    """
+    Migrate an embeddings collection to the current schema version. The
+    fragments are copied, partition by partition, into a new collection
+    `<name>_v<version>`, which then replaces the collection; the original
+    collection is kept as `<name>_v1_backup` if `keep_backup` is set.
+    Fragments whose document id is not a number cannot refer to a document
+    and are not copied. Primary keys are copied if they are not assigned by
+    Milvus, i.e. the chunk ids of collections with a chunk store.
+
+    Args:
+        name (str): name of the embeddings collection
+
+        using (str): connection alias
+
+        batch_size (int): number of fragments per query and insert
+
+        keep_backup (bool): keep the original collection
+
+    Returns:
+        Tuple[int, int]: the number of copied and of skipped fragments
+    """
+    source = Collection(name, using=using)
+    version = embeddings_schema_version(source)
+    if version == EMBEDDINGS_SCHEMA_VERSION:
+        logger.info(f"Collection {name} has the current schema version.")
+        return 0, 0
+
+    target_name = f"{name}_v{EMBEDDINGS_SCHEMA_VERSION}"
+    backup_name = f"{name}_v{version}_backup"
+    for existing in [target_name, backup_name]:
+        if utility.has_collection(existing, using=using):
+            raise ValueError(
+                f"Collection {existing} exists, e.g. from an interrupted "
+                "migration. Drop or rename it first."
+            )
+    fields = {field.name: field for field in source.schema.fields}
+    with_text = "text" in fields
+    primary = source.schema.primary_field
+    keep_pk = primary.dtype == DataType.INT64 and not primary.auto_id
+    target = create_embeddings_collection(
+        target_name,
+        fields["vector"].params["dim"],
+        using=using,
+        with_text=with_text,
+        auto_id=not keep_pk,
+    )
+    copied = skipped = 0
+    try:
+        target.create_index("vector", index_params=_vector_index_params(source))
+        source.load()
+        output_fields = ["pk", "vector", "meta_id"] + (
+            ["text"] if with_text else []
+        )
+        ordered = milvus_server_version(using) >= (2, 3)
+        for partition in source.partitions:
+            if not target.has_partition(partition.name):
+                target.create_partition(partition.name)
+            for page in iter_collection_pages(
+                source,
+                batch_size,
+                output_fields,
+                [partition.name],
+                ordered=ordered,
+            ):
+                valid = [
+                    item for item in page if str(item["meta_id"]).isdigit()
+                ]
+                skipped += len(page) - len(valid)
+                page = valid
+                data = {
+                    "pk": [item["pk"] for item in page],
+                    "text": [item.get("text") for item in page],
+                    "vector": [item["vector"] for item in page],
+                    "meta_id": [int(item["meta_id"]) for item in page],
+                }
+                columns = [
+                    data[field.name]
+                    for field in target.schema.fields
+                    if not (field.is_primary and field.auto_id)
+                ]
+                if len(page) > 0:
+                    target.insert(columns, partition_name=partition.name)
+                copied += len(page)
+        target.flush()
+    except MilvusException as e:
+        logger.error(f"Failed to migrate collection {name}.")
+        target.drop()
+        raise e
+
+    source.release()
+    utility.rename_collection(name, backup_name, using=using)
+    utility.rename_collection(target_name, name, using=using)
+    if not keep_backup:
+        utility.drop_collection(backup_name, using=using)
+    Collection(name, using=using).load()
+    logger.info(
+        f"Migrated collection {name} to schema version "
+        f"{EMBEDDINGS_SCHEMA_VERSION}: copied {copied}, skipped {skipped} "
+        "fragments."
+    )
+    return copied, skipped
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Migrate a Milvus embeddings collection to the current "
+        "schema version."
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Milvus host")
+    parser.add_argument("--port", default="19530", help="Milvus port")
+    parser.add_argument(
+        "--embedding-collection-name",
+        default=DOCUMENT_EMBEDDINGS_COLLECTION_NAME,
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--drop-backup",
+        action="store_true",
+        help="drop the original collection after the migration",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    alias = connection_registry.acquire(args.host, args.port)
+    try:
+        copied, skipped = migrate_embeddings_collection(
+            args.embedding_collection_name,
+            using=alias,
+            batch_size=args.batch_size,
+            keep_backup=not args.drop_backup,
+        )
+        print(f"Copied {copied} fragments, skipped {skipped}.")
+    finally:
+        connection_registry.release(alias)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Process-wide registry of Milvus connections. Agents connecting to the same
+server with the same credentials share one connection alias, and thereby one
+gRPC channel, instead of opening a new channel per agent. LangChain's `Milvus`
+wrapper reuses existing connections to the same address and user, hence it
+shares the channel as well.
+"""
+
+from typing import Optional
+import time
+import uuid
+import hashlib
+import logging
+import threading
+
+from pymilvus import MilvusException, utility, connections
+
+logger = logging.getLogger(__name__)
+
+# seconds after which an idle connection is checked before it is reused
+HEALTH_CHECK_INTERVAL = 60.0
+
+
+class _Connection:
+    def __init__(self, alias: str):
+        self.alias = alias
+        self.ref_count = 0
+        self.last_used = time.monotonic()
+
+
+class MilvusConnectionRegistry:
+    """
+    Reference-counted Milvus connections, keyed by host, port and a hash of
+    the credentials (user, password and token), such that agents with other
+    credentials, e.g. after a password change, do not share a connection
+    authenticated with the old ones. `acquire()` returns the alias of an open
+    connection, creating it if needed; `release()` gives it back. Released
+    connections stay open for reuse until they are closed with
+    `close_idle()`, `close()` or `close_all()`.
+    """
+
+    def __init__(self, health_check_interval: float = HEALTH_CHECK_INTERVAL):
+        """
+        Args:
+            health_check_interval (float): seconds of inactivity after which
+                a connection is checked, and reconnected if broken, before it
+                is handed out again
+        """
+        self._health_check_interval = health_check_interval
+        self._connections: dict[tuple, _Connection] = {}
+        self._keys: dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def acquire(
+        self,
+        host: str,
+        port: str,
+        user: str = "",
+        password: str = "",
+        token: str = "",
+    ) -> str:
+        """
+        Get a connection to a Milvus server.
+
+        Args:
+            host (str): host ip address
+
+            port (str): host port
+
+            user (str): user name
+
+            password (str): password
+
+            token (str): API key or "user:password" token, e.g. for Zilliz
+                Cloud
+
+        Returns:
+            str: connection alias
+        """
+        credentials = hashlib.sha256(
+            "\0".join([user, password, token]).encode("utf-8")
+        ).hexdigest()
+        key = (str(host), str(port), credentials)
+        with self._lock:
+            connection = self._connections.get(key)
+            if connection is None:
+                connection = _Connection(uuid.uuid4().hex)
+                self._connect(
+                    connection.alias, host, port, user, password, token
+                )
+                self._connections[key] = connection
+                self._keys[connection.alias] = key
+            elif (
+                time.monotonic() - connection.last_used
+                > self._health_check_interval
+                and not self._is_healthy(connection.alias)
+            ):
+                logger.warning(
+                    f"Reconnecting broken Milvus connection {connection.alias}."
+                )
+                connections.disconnect(connection.alias)
+                self._connect(
+                    connection.alias, host, port, user, password, token
+                )
+            connection.ref_count += 1
+            connection.last_used = time.monotonic()
+            return connection.alias
+
+    def release(self, alias: str) -> None:
+        """
+        Give back a connection obtained from `acquire()`.
+        """
+        with self._lock:
+            key = self._keys.get(alias)
+            if key is None:
+                return
+            connection = self._connections[key]
+            connection.ref_count = max(connection.ref_count - 1, 0)
+            connection.last_used = time.monotonic()
+
+    def close(self, alias: str) -> None:
+        """
+        Disconnect a connection, regardless of its references.
+        """
+        with self._lock:
+            self._close(alias)
+
+    def close_idle(self) -> list[str]:
+        """
+        Disconnect all connections without references.
+
+        Returns:
+            List[str]: the aliases of the closed connections
+        """
+        with self._lock:
+            idle = [
+                connection.alias
+                for connection in self._connections.values()
+                if connection.ref_count == 0
+            ]
+            for alias in idle:
+                self._close(alias)
+            return idle
+
+    def close_all(self) -> None:
+        """
+        Disconnect all connections.
+        """
+        with self._lock:
+            for alias in list(self._keys):
+                self._close(alias)
+
+    def ref_count(self, alias: str) -> int:
+        """
+        Number of references of a connection; 0 for unknown aliases.
+        """
+        with self._lock:
+            key = self._keys.get(alias)
+            return 0 if key is None else self._connections[key].ref_count
+
+    def _connect(
+        self,
+        alias: str,
+        host: str,
+        port: str,
+        user: str,
+        password: str,
+        token: str = "",
+    ) -> None:
+        # older pymilvus versions do not accept a token
+        credentials = {"token": token} if token else {}
+        try:
+            connections.connect(
+                host=host,
+                port=port,
+                user=user,
+                password=password,
+                alias=alias,
+                **credentials,
+            )
+            logger.debug(f"Created new connection using: {alias}")
+        except MilvusException as e:
+            logger.error(f"Failed to create new connection using: {alias}")
+            raise e
+
+    def _is_healthy(self, alias: str) -> bool:
+        try:
+            utility.get_server_version(using=alias)
+            return True
+        except Exception as e:
+            logger.debug(f"Health check of connection {alias} failed: {e}")
+            return False
+
+    def _close(self, alias: str) -> None:
+        key = self._keys.pop(alias, None)
+        if key is None:
+            return
+        self._connections.pop(key)
+        connections.disconnect(alias)
+        logger.debug(f"Closed connection {alias}")
+
+
+# registry shared by all agents of the process
+connection_registry = MilvusConnectionRegistry()
@@ -1,5 +1,48 @@
 from typing import Optional
 from collections.abc import Callable
+import time
+
+# seconds for which agent descriptions are cached
+DESCRIPTION_TTL = 300.0
+
+
+def select_relevant_results(
+    results: list[tuple[object, float]],
+    max_distance: Optional[float] = None,
+    distance_gap: Optional[float] = None,
+) -> list[tuple[object, float]]:
+    """
+    Select the relevant results of a scored similarity search, e.g. of
+    `VectorDatabaseAgentMilvus.similarity_search_with_score()`: the results
+    are taken in order of distance until one is farther from the query than
+    `max_distance`, or farther than the previous result by more than
+    `distance_gap`, where the relevance drops sharply.
+
+    Args:
+        results (List[Tuple[object, float]]): results and their distances
+            (lower is closer), ordered by distance
+
+        max_distance (Optional[float]): the largest distance of a relevant
+            result
+
+        distance_gap (Optional[float]): the largest increase of the distance
+            between consecutive relevant results
+
+    Returns:
+        List[Tuple[object, float]]: the relevant results
+    """
+    selected = []
+    for result, distance in results:
+        if max_distance is not None and distance > max_distance:
+            break
+        if (
+            distance_gap is not None
+            and len(selected) > 0
+            and distance - selected[-1][1] > distance_gap
+        ):
+            break
+        selected.append((result, distance))
+    return selected
 
 
 class RagAgentModeEnum:
@@ -23,6 +66,10 @@ class RagAgent:
         documentids_workspace: Optional[list[str]] = None,
         agent_desc: Optional[str] = None,
         use_reflexion: Optional[bool] = False,
+        workspace: Optional[str] = None,
+        description_ttl: Optional[float] = DESCRIPTION_TTL,
+        max_distance: Optional[float] = None,
+        distance_gap: Optional[float] = None,
     ) -> None:
         ######
         ##TO DO
@@ -69,6 +116,32 @@ class RagAgent:
 
             use_reflexion (bool): Whether to use the ReflexionAgent to generate
                 the query.
+
+            workspace (Optional[str]): the vector store workspace within which
+                similarity search occurs, see `VectorDatabaseAgentMilvus`.
+
+            description_ttl (Optional[float]): seconds for which the
+                description obtained from the database or vector store is
+                cached; None caches it until it is invalidated, 0 disables
+                caching. The cached description of a vector store is also
+                invalidated when documents are stored or removed through any
+                agent of the process connected to the same server and
+                metadata collection, e.g. that of a `DocumentEmbedder`;
+                changes made by other processes are only seen once the
+                description expires.
+
+            max_distance (Optional[float]): in vectorstore mode, the largest
+                distance to the question of a returned fragment, in units of
+                the metric of the vector store (squared L2 distance, or one
+                minus the inner product). If no fragment is close enough,
+                no results are returned and no context is injected. Defaults
+                to None, i.e. no threshold.
+
+            distance_gap (Optional[float]): in vectorstore mode, return fewer
+                than n_results fragments if the distance of the next fragment
+                is larger than that of the previous one by more than this
+                value, see `select_relevant_results()`. Defaults to None,
+                i.e. n_results fragments are returned.
         """
         self.mode = mode
         self.model_name = model_name
@@ -77,6 +150,10 @@ class RagAgent:
         self.documentids_workspace = documentids_workspace
         self.last_response = []
         self._agent_desc = agent_desc
+        self.description_ttl = description_ttl
+        self.max_distance = max_distance
+        self.distance_gap = distance_gap
+        self._description_cache: Optional[tuple[str, float, object]] = None
         if self.mode == RagAgentModeEnum.KG:
             from .database_agent import DatabaseAgent
 
@@ -115,6 +192,7 @@ class RagAgent:
             self.agent = VectorDatabaseAgentMilvus(
                 embedding_func=embedding_func,
                 connection_args=connection_args,
+                workspace=workspace,
             )
 
             self.agent.connect()
@@ -192,11 +270,25 @@ class RagAgent:
                 for result in results
             ]
         elif self.mode == RagAgentModeEnum.VectorStore:
-            results = self.query_func(
-                user_question,
-                self.n_results,
-                doc_ids=self.documentids_workspace,
-            )
+            if self.max_distance is None and self.distance_gap is None:
+                results = self.query_func(
+                    user_question,
+                    self.n_results,
+                    doc_ids=self.documentids_workspace,
+                )
+            else:
+                results = [
+                    result
+                    for result, _ in select_relevant_results(
+                        self.agent.similarity_search_with_score(
+                            user_question,
+                            self.n_results,
+                            doc_ids=self.documentids_workspace,
+                        ),
+                        self.max_distance,
+                        self.distance_gap,
+                    )
+                ]
             response = [
                 (
                     result.page_content,
@@ -225,6 +317,25 @@ class RagAgent:
     def get_description(self):
         if self.agent_description is not None:
             return self.agent_description
+        version = getattr(self.agent, "documents_version", None)
+        if self._description_cache is not None:
+            description, created, cached_version = self._description_cache
+            if cached_version == version and (
+                self.description_ttl is None
+                or time.monotonic() - created < self.description_ttl
+            ):
+                return description
+        description = self._get_description()
+        self._description_cache = (description, time.monotonic(), version)
+        return description
+
+    def invalidate_description(self) -> None:
+        """
+        Discard the cached description, e.g. after the database changed.
+        """
+        self._description_cache = None
+
+    def _get_description(self):
         if self.mode == RagAgentModeEnum.KG:
             return self.agent.get_description()
         elif self.mode == RagAgentModeEnum.VectorStore:
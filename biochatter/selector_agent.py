@@ -1,4 +1,4 @@
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 from datetime import datetime
 from collections.abc import Callable
 import json
@@ -85,18 +85,18 @@ class RagAgentSelector(ReflexionAgent):
     ):
         """
         The class RagAgentSelector uses an LLM to choose the appropriate rag agent
-        for a given user question.
+        for a given user question. A selector can be reused for many questions:
+        the agent descriptions are obtained when the prompt is formatted (see
+        `RagAgent.get_description()`, which caches them), and the graph is
+        built once per chat model.
         """
         super().__init__(
             conversation_factory=conversation_factory,
             agent_logger=RagAgentSelectLogger(),
         )
         self.rag_agents = rag_agents
-        agent_desc = [
-            f"{ix}. {rag_agents[ix].mode}: {rag_agents[ix].get_description()}"
-            for ix in range(len(rag_agents))
-        ]
-        rag_agents_desc = "\n\n".join(agent_desc)
+        self._graph = None
+        self._graph_chat_id: Optional[int] = None
         self.actor_prompt_template = ChatPromptTemplate.from_messages(
             [
                 (
@@ -118,10 +118,40 @@ class RagAgentSelector(ReflexionAgent):
             ]
         ).partial(
             time=lambda: datetime.now().isoformat(),
-            rag_agents_desc=rag_agents_desc,
+            rag_agents_desc=self._describe_rag_agents,
         )
         self.parser = JsonOutputToolsParser(return_id=True)
 
+    def execute(
+        self, question: str, prompt: Optional[str] = None
+    ) -> ReflexionAgentResult:
+        """
+        Choose the rag agent for a question, see `ReflexionAgent.execute()`.
+        The logs of the previous question are discarded.
+        """
+        self.agent_logger.clear()
+        return super().execute(question, prompt)
+
+    def _describe_rag_agents(self) -> str:
+        agent_desc = [
+            f"{ix}. {agent.mode}: {agent.get_description()}"
+            for ix, agent in enumerate(self.rag_agents)
+        ]
+        return "\n\n".join(agent_desc)
+
+    def _build_graph(self, prompt: Optional[str] = None):
+        """
+        Build the graph once and reuse it for subsequent questions, unless the
+        chat model of the conversation changed.
+        """
+        if prompt is not None:
+            return super()._build_graph(prompt)
+        chat_id = id(getattr(self.conversation, "chat", None))
+        if self._graph is None or self._graph_chat_id != chat_id:
+            self._graph = super()._build_graph()
+            self._graph_chat_id = chat_id
+        return self._graph
+
     def _create_initial_responder(
         self, prompt: str | None = None
     ) -> ResponderWithRetries:
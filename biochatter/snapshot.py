@@ -0,0 +1,405 @@
+"""
+Snapshots of a vector store: export of the documents of a store, or of the
+workspace of an agent, with the texts and vectors of their fragments to
+columnar files, and restore of a snapshot into a store without calling the
+embedding function, e.g. to clone an environment, for disaster recovery or to
+set up benchmark fixtures. A snapshot is a directory with two tables in
+Parquet (default) or Arrow IPC format:
+
+- `documents`: the document id ("id") and the metadata fields
+- `fragments`: the document id ("doc_id"), text, vector (fixed-size list of
+    float32) and chunk-level metadata (JSON) of each fragment, grouped by
+    document
+
+Requires the pyarrow package. Snapshots of Milvus vector stores can be
+exported and restored from the command line:
+
+    biochatter-snapshot export snapshots/main --host 127.0.0.1 --port 19530
+    biochatter-snapshot import snapshots/main --host 10.0.0.2 --port 19530
+"""
+
+from typing import Tuple, Optional
+from collections.abc import Iterator
+import os
+import json
+import logging
+import argparse
+
+from langchain.schema import Document
+
+import numpy as np
+
+from .chunk_store import SQLiteChunkStore
+from .metadata_store import METADATA_FIELDS, SQLiteMetadataStore
+from .vectorstore_agent import VectorDatabaseAgentMilvus
+
+logger = logging.getLogger(__name__)
+
+# file suffix of each snapshot format
+SNAPSHOT_FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+SNAPSHOT_VERSION = "1"
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(
+            "Could not import pyarrow python package. "
+            "Please install it with `pip install pyarrow`."
+        )
+    return pyarrow
+
+
+def _table_path(path: str, name: str, format: str) -> str:
+    return os.path.join(path, f"{name}{SNAPSHOT_FORMATS[format]}")
+
+
+def _snapshot_format(path: str) -> str:
+    for format in SNAPSHOT_FORMATS:
+        if os.path.exists(_table_path(path, "documents", format)):
+            return format
+    raise FileNotFoundError(f"No snapshot found at {path}.")
+
+
+def _open_writer(pa, path: str, schema, format: str):
+    """
+    Open a writer of a table, with `write_table()` and `close()`.
+    """
+    if format == "parquet":
+        return pa.parquet.ParquetWriter(path, schema)
+    return pa.ipc.new_file(path, schema)
+
+
+def _iter_batches(pa, path: str, format: str, batch_size: int) -> Iterator:
+    """
+    Iterate over the record batches of a table. Arrow IPC files are memory
+    mapped and read in the batches they were written in.
+    """
+    if format == "parquet":
+        yield from pa.parquet.ParquetFile(path).iter_batches(batch_size)
+        return
+    reader = pa.ipc.open_file(pa.memory_map(path))
+    for i in range(reader.num_record_batches):
+        yield reader.get_batch(i)
+
+
+def _documents_schema(pa):
+    return pa.schema(
+        [(field, pa.string()) for field in METADATA_FIELDS],
+        metadata={"biochatter.snapshot": SNAPSHOT_VERSION},
+    )
+
+
+def _fragments_schema(pa, dim: int):
+    return pa.schema(
+        [
+            ("doc_id", pa.string()),
+            ("text", pa.string()),
+            ("vector", pa.list_(pa.float32(), dim)),
+            ("metadata", pa.string()),
+        ],
+        metadata={"biochatter.snapshot": SNAPSHOT_VERSION},
+    )
+
+
+def _fragments_table(pa, fragments: list[dict], schema):
+    dim = schema.field("vector").type.list_size
+    vectors = np.asarray(
+        [fragment["vector"] for fragment in fragments], dtype=np.float32
+    )
+    return pa.Table.from_arrays(
+        [
+            pa.array([fragment["doc_id"] for fragment in fragments]),
+            pa.array([fragment["text"] for fragment in fragments]),
+            pa.FixedSizeListArray.from_arrays(
+                pa.array(vectors.reshape(-1)), dim
+            ),
+            pa.array(
+                [json.dumps(fragment["metadata"]) for fragment in fragments]
+            ),
+        ],
+        schema=schema,
+    )
+
+
+def export_snapshot(
+    agent,
+    path: str,
+    doc_ids: Optional[list[str]] = None,
+    format: str = "parquet",
+    batch_size: int = 100,
+) -> Tuple[int, int]:
+    """
+    Export the documents of a vector store with their fragments to a snapshot
+    directory. The documents are read in pages of `batch_size` documents, and
+    the fragments of each page are written grouped by document, in the order
+    in which they are stored.
+
+    Args:
+        agent: the vector store agent, e.g. a `VectorDatabaseAgentMilvus`; an
+            agent with a workspace exports the documents of its workspace
+
+        path (str): the snapshot directory; existing tables are replaced
+
+        doc_ids (Optional[list[str]]): the documents to export; defaults to
+            all documents
+
+        format (str): "parquet" or "arrow" (Arrow IPC)
+
+        batch_size (int): number of documents read and written at a time
+
+    Returns:
+        Tuple[int, int]: the number of exported documents and fragments
+    """
+    pa = _import_pyarrow()
+    if format not in SNAPSHOT_FORMATS:
+        raise ValueError(
+            f"Invalid format {format}. Choose from {list(SNAPSHOT_FORMATS)}."
+        )
+    os.makedirs(path, exist_ok=True)
+    for other in SNAPSHOT_FORMATS:
+        for name in ["documents", "fragments"]:
+            if os.path.exists(_table_path(path, name, other)):
+                os.remove(_table_path(path, name, other))
+
+    documents_schema = _documents_schema(pa)
+    documents_writer = _open_writer(
+        pa, _table_path(path, "documents", format), documents_schema, format
+    )
+    fragments_writer = fragments_schema = None
+    n_documents = n_fragments = 0
+    try:
+        cursor = None
+        while True:
+            page, cursor = agent.get_documents_page(cursor, batch_size, doc_ids)
+            if len(page) > 0:
+                documents_writer.write_table(
+                    pa.Table.from_pylist(
+                        [
+                            {
+                                field: (
+                                    None
+                                    if meta.get(field) is None
+                                    else str(meta[field])
+                                )
+                                for field in METADATA_FIELDS
+                            }
+                            for meta in page
+                        ],
+                        schema=documents_schema,
+                    )
+                )
+                page_ids = [str(meta["id"]) for meta in page]
+                fragments = {doc_id: [] for doc_id in page_ids}
+                for fragment_page in agent.iter_fragments(page_ids, batch_size):
+                    for fragment in fragment_page:
+                        fragments[fragment["doc_id"]].append(fragment)
+                fragments = [
+                    fragment
+                    for doc_id in page_ids
+                    for fragment in fragments[doc_id]
+                ]
+                if len(fragments) > 0:
+                    if fragments_writer is None:
+                        fragments_schema = _fragments_schema(
+                            pa, len(fragments[0]["vector"])
+                        )
+                        fragments_writer = _open_writer(
+                            pa,
+                            _table_path(path, "fragments", format),
+                            fragments_schema,
+                            format,
+                        )
+                    fragments_writer.write_table(
+                        _fragments_table(pa, fragments, fragments_schema)
+                    )
+                n_documents += len(page)
+                n_fragments += len(fragments)
+            if cursor is None:
+                break
+        if fragments_writer is None:
+            # a store without fragments
+            fragments_writer = _open_writer(
+                pa,
+                _table_path(path, "fragments", format),
+                _fragments_schema(pa, 0),
+                format,
+            )
+    finally:
+        documents_writer.close()
+        if fragments_writer is not None:
+            fragments_writer.close()
+    logger.info(
+        f"Exported {n_documents} documents and {n_fragments} fragments to "
+        f"{path}."
+    )
+    return n_documents, n_fragments
+
+
+def import_snapshot(
+    agent, path: str, batch_size: int = 100
+) -> dict[str, Optional[str]]:
+    """
+    Restore a snapshot into a vector store. The fragments are stored with
+    their vectors from the snapshot, in batches of `batch_size` documents,
+    without calling the embedding function of the agent. Documents identical
+    to stored documents are not stored again, see `store_embeddings_batch()`.
+    The vectors must have the dimension of the vectors of the store.
+    Documents without fragments, e.g. documents whose chunks were all
+    near-duplicates of other chunks, cannot be stored again, as documents are
+    stored by their chunks; they are reported as not restored.
+
+    Args:
+        agent: the vector store agent, e.g. a `VectorDatabaseAgentMilvus`; an
+            agent with a workspace restores into its workspace
+
+        path (str): the snapshot directory
+
+        batch_size (int): number of documents stored at a time
+
+    Returns:
+        Dict[str, Optional[str]]: the id of each document in the store, by
+            its id in the snapshot; None for documents that were not restored
+    """
+    pa = _import_pyarrow()
+    format = _snapshot_format(path)
+    documents = {}
+    for batch in _iter_batches(
+        pa, _table_path(path, "documents", format), format, 10_000
+    ):
+        for row in batch.to_pylist():
+            documents[row.pop("id")] = {
+                field: value
+                for field, value in row.items()
+                if value is not None
+            }
+
+    ids = {}
+    pending_ids, pending_documents, pending_vectors = [], [], []
+
+    def store_pending() -> None:
+        stored_ids = agent.store_embeddings_batch(
+            pending_documents, pending_vectors
+        )
+        ids.update(zip(pending_ids, stored_ids))
+        pending_ids.clear()
+        pending_documents.clear()
+        pending_vectors.clear()
+
+    for batch in _iter_batches(
+        pa, _table_path(path, "fragments", format), format, 10_000
+    ):
+        doc_ids = batch.column("doc_id").to_pylist()
+        texts = batch.column("text").to_pylist()
+        metadata = batch.column("metadata").to_pylist()
+        vectors = (
+            batch.column("vector")
+            .flatten()
+            .to_numpy()
+            .reshape(len(doc_ids), -1)
+        )
+        for doc_id, text, chunk_metadata, vector in zip(
+            doc_ids, texts, metadata, vectors
+        ):
+            if len(pending_ids) == 0 or pending_ids[-1] != doc_id:
+                if len(pending_ids) >= batch_size:
+                    store_pending()
+                pending_ids.append(doc_id)
+                pending_documents.append([])
+                pending_vectors.append([])
+            pending_documents[-1].append(
+                Document(
+                    page_content=text,
+                    metadata={
+                        **documents.get(doc_id, {}),
+                        **json.loads(chunk_metadata),
+                    },
+                )
+            )
+            pending_vectors[-1].append(vector.tolist())
+    if len(pending_ids) > 0:
+        store_pending()
+    agent.commit()
+    without_fragments = [doc_id for doc_id in documents if doc_id not in ids]
+    if len(without_fragments) > 0:
+        logger.warning(
+            f"{len(without_fragments)} documents of {path} have no fragments "
+            f"and were not restored: {without_fragments[:10]}"
+        )
+        ids.update((doc_id, None) for doc_id in without_fragments)
+    n_restored = sum(stored_id is not None for stored_id in ids.values())
+    logger.info(f"Restored {n_restored} documents from {path}.")
+    return ids
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Export a snapshot of a Milvus vector store, or restore "
+        "a snapshot into a Milvus vector store without embedding."
+    )
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path", help="snapshot directory")
+    parser.add_argument("--host", default="127.0.0.1", help="Milvus host")
+    parser.add_argument("--port", default="19530", help="Milvus port")
+    parser.add_argument("--embedding-collection-name")
+    parser.add_argument("--metadata-collection-name")
+    parser.add_argument(
+        "--metadata-db",
+        help="SQLite file of the document metadata, if the store uses one",
+    )
+    parser.add_argument(
+        "--chunk-db",
+        help="SQLite file of the fragment texts, if the store uses one",
+    )
+    parser.add_argument("--workspace", help="workspace to export or restore")
+    parser.add_argument(
+        "--format",
+        choices=list(SNAPSHOT_FORMATS),
+        default="parquet",
+        help="format of exported snapshots",
+    )
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    agent = VectorDatabaseAgentMilvus(
+        embedding_func=None,
+        connection_args={"host": args.host, "port": args.port},
+        embedding_collection_name=args.embedding_collection_name,
+        metadata_collection_name=args.metadata_collection_name,
+        auto_flush=False,
+        metadata_store=(
+            SQLiteMetadataStore(args.metadata_db) if args.metadata_db else None
+        ),
+        workspace=args.workspace,
+        chunk_store=(
+            SQLiteChunkStore(args.chunk_db) if args.chunk_db else None
+        ),
+    )
+    agent.connect()
+    try:
+        if args.command == "export":
+            n_documents, n_fragments = export_snapshot(
+                agent,
+                args.path,
+                format=args.format,
+                batch_size=args.batch_size,
+            )
+            print(
+                f"Exported {n_documents} documents and {n_fragments} "
+                "fragments."
+            )
+        else:
+            ids = import_snapshot(agent, args.path, batch_size=args.batch_size)
+            missing = [doc_id for doc_id, stored in ids.items() if not stored]
+            print(f"Restored {len(ids) - len(missing)} documents.")
+            if len(missing) > 0:
+                print(f"Not restored (no fragments): {', '.join(missing)}")
+    finally:
+        agent.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Token-aware text splitting. In contrast to the tokenizer-based variants of
+langchain's `RecursiveCharacterTextSplitter`, which re-encode text fragments
+while merging them into chunks, each text is tokenized once; chunk boundaries
+are found by walking the token offsets.
+"""
+
+from typing import Optional
+from bisect import bisect_left
+from functools import lru_cache
+from collections.abc import Callable
+
+from transformers import GPT2TokenizerFast
+from langchain.text_splitter import TextSplitter
+import tiktoken
+
+DEFAULT_OPENAI_MODEL = "gpt-3.5-turbo"
+HUGGINGFACE_MODELS = ["bigscience/bloom"]
+
+
+@lru_cache(maxsize=None)
+def _tiktoken_encoding(model_name: str) -> tiktoken.Encoding:
+    return tiktoken.encoding_for_model(model_name)
+
+
+@lru_cache(maxsize=None)
+def _huggingface_tokenizer(model_name: str) -> GPT2TokenizerFast:
+    # the GPT-2 tokenizer approximates the token counts of the supported
+    # Hugging Face models
+    return GPT2TokenizerFast.from_pretrained("gpt2")
+
+
+def _tiktoken_offsets(model_name: str, text: str) -> list[tuple[int, int]]:
+    encoding = _tiktoken_encoding(model_name)
+    _, starts = encoding.decode_with_offsets(encoding.encode(text))
+    ends = starts[1:] + [len(text)]
+    return list(zip(starts, ends))
+
+
+def _huggingface_offsets(model_name: str, text: str) -> list[tuple[int, int]]:
+    tokenizer = _huggingface_tokenizer(model_name)
+    encoded = tokenizer(
+        text,
+        add_special_tokens=False,
+        return_offsets_mapping=True,
+        verbose=False,
+    )
+    return [tuple(offset) for offset in encoded["offset_mapping"]]
+
+
+def token_offsets_func(
+    model_name: Optional[str] = None,
+) -> Callable[[str], list[tuple[int, int]]]:
+    """
+    Return a function computing the character offsets of the tokens of a text
+    with the tokenizer of the given model. Tokenizers are loaded once per
+    model and process.
+
+    Args:
+        model_name (Optional[str]): model name; Hugging Face models listed in
+            `HUGGINGFACE_MODELS` use a Hugging Face tokenizer, all other models
+            a tiktoken encoding. Defaults to gpt-3.5-turbo.
+
+    Returns:
+        Callable[[str], List[Tuple[int, int]]]: function returning the (start,
+            end) character offsets of each token
+    """
+    model_name = model_name or DEFAULT_OPENAI_MODEL
+    if model_name in HUGGINGFACE_MODELS:
+        return lambda text: _huggingface_offsets(model_name, text)
+    return lambda text: _tiktoken_offsets(model_name, text)
+
+
+class TokenTextSplitter(TextSplitter):
+    """
+    Split text into chunks of at most `chunk_size` tokens, overlapping by
+    `chunk_overlap` tokens. The text is tokenized once; each chunk ends at the
+    last occurrence of a separator (tried in the given order) within the
+    token window, or at the window end if there is none. Use
+    `create_text_splitter()` of the vectorstore module to create a splitter
+    for a model.
+    """
+
+    def __init__(
+        self,
+        offsets_func: Callable[[str], list[tuple[int, int]]],
+        separators: Optional[list[str]] = None,
+        **kwargs,
+    ):
+        """
+        Args:
+            offsets_func (Callable[[str], List[Tuple[int, int]]]): function
+                returning the character offsets of the tokens of a text, see
+                `token_offsets_func()`
+
+            separators (Optional[list[str]]): separators to snap chunk
+                boundaries to
+
+            **kwargs: arguments of langchain's `TextSplitter`, e.g.
+                `chunk_size` and `chunk_overlap`
+        """
+        super().__init__(**kwargs)
+        self._offsets_func = offsets_func
+        self._separators = separators or [" ", ",", "\n"]
+
+    def _snap(self, text: str, start: int, limit: int) -> Optional[int]:
+        """
+        Find the position of the last separator starting in
+        text[start:limit + 1], trying the separators in order. As in
+        langchain's splitters, the separator starts the next chunk.
+        """
+        for separator in self._separators:
+            if not separator:
+                continue
+            position = text.rfind(separator, start, limit + len(separator))
+            if position > start:
+                return position
+        return None
+
+    def split_text(self, text: str) -> list[str]:
+        offsets = self._offsets_func(text)
+        n_tokens = len(offsets)
+        starts = [start for start, _ in offsets]
+        chunks = []
+        first = 0
+        previous_end = 0
+        while first < n_tokens:
+            last = min(first + self._chunk_size, n_tokens)
+            if last < n_tokens:
+                # cut after the end of the previous chunk, such that the
+                # overlap does not end at the same separator
+                cut = self._snap(
+                    text,
+                    max(offsets[first][0], previous_end),
+                    offsets[last][0],
+                )
+                if cut is not None:
+                    # first token starting at or after the cut
+                    last = max(bisect_left(starts, cut, first, last), first + 1)
+            chunk = text[offsets[first][0] : offsets[last - 1][1]]
+            if self._strip_whitespace:
+                chunk = chunk.strip()
+            if chunk:
+                chunks.append(chunk)
+            if last >= n_tokens:
+                break
+            previous_end = offsets[last][0]
+            first = max(last - self._chunk_overlap, first + 1)
+        return chunks
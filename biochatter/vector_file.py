@@ -0,0 +1,413 @@
+from typing import Optional
+import os
+import json
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VECTOR_FILE_VERSION = 1
+VECTOR_DTYPES = {
+    "float32": np.float32,
+    "float16": np.float16,
+    "int8": np.int8,
+}
+ID_DTYPE = np.dtype([("id", "<i8"), ("meta_id", "<i8"), ("offset", "<i8")])
+
+# number of rows scanned at once during search, bounds the memory used for
+# dequantised vectors
+SEARCH_BLOCK_SIZE = 65536
+
+
+class VectorFile:
+    """
+    Append-only, memory-mapped vector storage for local retrieval. Vectors are
+    kept in a set of files sharing a common path prefix:
+
+    - `<path>.json`: header with format version, dimension and dtype
+    - `<path>.vec`: fixed-size vector rows, optionally quantised to float16 or
+        int8
+    - `<path>.scales`: one float32 scale per row of int8 quantisation, such
+        that each vector uses the full int8 range without clipping
+    - `<path>.ids`: ID/offset table with chunk id, metadata id and byte offset
+        of each row in the vector file
+    - `<path>.del`: one tombstone byte per row, set by `delete()`
+
+    All files are opened as memory maps, such that several processes reading
+    the same files share one page-cached copy. There should be only one writing
+    process; readers pick up appended rows and tombstones with `refresh()`.
+    Without a path, the same structure is kept in memory.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        dtype: str = "float32",
+        read_only: bool = False,
+    ):
+        """
+        Args:
+            path (Optional[str]): path prefix of the files; None to keep the
+                vectors in memory
+
+            dtype (str): storage type of the vectors, "float32", "float16" or
+                "int8". Ignored when opening existing files, whose header
+                determines the type.
+
+            read_only (bool): open the files read-only, for processes that only
+                search
+        """
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(
+                f"Invalid vector dtype {dtype}. Choose from "
+                f"{list(VECTOR_DTYPES)}."
+            )
+        self.path = path
+        self.dtype = dtype
+        self.read_only = read_only
+        self.dim: Optional[int] = None
+        self._scales = np.zeros(0, dtype=np.float32)
+        self._vectors = np.zeros((0, 0), dtype=VECTOR_DTYPES[dtype])
+        self._ids = np.zeros(0, dtype=ID_DTYPE)
+        self._deleted = np.zeros(0, dtype=np.uint8)
+        if self.path is not None:
+            self._read_header()
+            self.refresh()
+
+    # files
+
+    def _file(self, suffix: str) -> str:
+        return f"{self.path}{suffix}"
+
+    def _read_header(self) -> None:
+        if not os.path.exists(self._file(".json")):
+            return
+        with open(self._file(".json"), "r") as f:
+            header = json.load(f)
+        if header["version"] != VECTOR_FILE_VERSION:
+            raise ValueError(
+                f"Unsupported vector file version {header['version']}."
+            )
+        self.dim = header["dim"]
+        self.dtype = header["dtype"]
+
+    def _write_header(self) -> None:
+        with open(self._file(".json"), "w") as f:
+            json.dump(
+                {
+                    "version": VECTOR_FILE_VERSION,
+                    "dim": self.dim,
+                    "dtype": self.dtype,
+                },
+                f,
+            )
+        suffixes = [".vec", ".ids", ".del"]
+        if self.dtype == "int8":
+            suffixes.append(".scales")
+        for suffix in suffixes:
+            open(self._file(suffix), "ab").close()
+
+    def _row_bytes(self) -> int:
+        return self.dim * np.dtype(VECTOR_DTYPES[self.dtype]).itemsize
+
+    def refresh(self) -> None:
+        """
+        (Re-)map the files, picking up rows appended and tombstones set since
+        the last call, possibly by another process.
+        """
+        if self.path is None or self.dim is None:
+            return
+        # the ID table is written last on append, hence it defines the number
+        # of complete rows
+        count = min(
+            os.path.getsize(self._file(".ids")) // ID_DTYPE.itemsize,
+            os.path.getsize(self._file(".vec")) // self._row_bytes(),
+            os.path.getsize(self._file(".del")),
+        )
+        if self.dtype == "int8":
+            count = min(
+                count,
+                os.path.getsize(self._file(".scales"))
+                // np.dtype(np.float32).itemsize,
+            )
+        if count == 0:
+            self._vectors = np.zeros(
+                (0, self.dim), dtype=VECTOR_DTYPES[self.dtype]
+            )
+            self._ids = np.zeros(0, dtype=ID_DTYPE)
+            self._deleted = np.zeros(0, dtype=np.uint8)
+            self._scales = np.zeros(0, dtype=np.float32)
+            return
+        self._vectors = np.memmap(
+            self._file(".vec"),
+            dtype=VECTOR_DTYPES[self.dtype],
+            mode="r",
+            shape=(count, self.dim),
+        )
+        self._ids = np.memmap(
+            self._file(".ids"), dtype=ID_DTYPE, mode="r", shape=(count,)
+        )
+        self._deleted = np.memmap(
+            self._file(".del"),
+            dtype=np.uint8,
+            mode="r" if self.read_only else "r+",
+            shape=(count,),
+        )
+        if self.dtype == "int8":
+            self._scales = np.memmap(
+                self._file(".scales"),
+                dtype=np.float32,
+                mode="r",
+                shape=(count,),
+            )
+
+    # quantisation
+
+    def _scale(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        Determine the int8 scale of each vector from its largest absolute
+        value, such that no value is clipped.
+        """
+        max_abs = np.abs(vectors).max(axis=1)
+        return np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+
+    def _quantise(self, vectors: np.ndarray, scales: np.ndarray) -> np.ndarray:
+        if self.dtype == "int8":
+            return np.clip(
+                np.rint(vectors / scales[:, None]), -127, 127
+            ).astype(np.int8)
+        return vectors.astype(VECTOR_DTYPES[self.dtype])
+
+    def _dequantise(
+        self, vectors: np.ndarray, scales: np.ndarray
+    ) -> np.ndarray:
+        if self.dtype == "int8":
+            return vectors.astype(np.float32) * scales[:, None]
+        return vectors.astype(np.float32)
+
+    # access
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids["id"]
+
+    @property
+    def meta_ids(self) -> np.ndarray:
+        return self._ids["meta_id"]
+
+    @property
+    def alive(self) -> np.ndarray:
+        return self._deleted == 0
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Size of the stored vectors in bytes.
+        """
+        return 0 if self.dim is None else len(self) * self._row_bytes()
+
+    def vectors(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Return the (dequantised) float32 vectors of the given rows, or of all
+        rows.
+        """
+        if self.dim is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        if rows is None:
+            return self._dequantise(
+                np.asarray(self._vectors), np.asarray(self._scales)
+            )
+        return self._dequantise(
+            self._vectors[rows],
+            self._scales[rows] if self.dtype == "int8" else self._scales,
+        )
+
+    # write operations
+
+    def append(self, vectors: np.ndarray, meta_ids: np.ndarray) -> np.ndarray:
+        """
+        Append vectors belonging to the given metadata ids.
+
+        Args:
+            vectors (np.ndarray): float vectors, shape (n, dim)
+
+            meta_ids (np.ndarray): metadata (document) id of each vector
+
+        Returns:
+            np.ndarray: row numbers of the appended vectors
+        """
+        if self.read_only:
+            raise PermissionError("Vector file is opened read-only.")
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) == 0:
+            return np.zeros(0, dtype=np.int64)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            if self.path is not None:
+                self._write_header()
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(
+                f"Vector dimension {vectors.shape[1]} does not match the "
+                f"dimension {self.dim} of the vector file."
+            )
+        first = len(self)
+        rows = np.arange(first, first + len(vectors), dtype=np.int64)
+        ids = np.zeros(len(vectors), dtype=ID_DTYPE)
+        ids["id"] = rows
+        ids["meta_id"] = meta_ids
+        ids["offset"] = rows * self._row_bytes()
+        scales = (
+            self._scale(vectors)
+            if self.dtype == "int8"
+            else np.zeros(0, dtype=np.float32)
+        )
+        quantised = self._quantise(vectors, scales)
+        if self.path is None:
+            self._vectors = (
+                quantised
+                if first == 0
+                else np.concatenate([self._vectors, quantised])
+            )
+            self._ids = np.concatenate([self._ids, ids])
+            self._deleted = np.concatenate(
+                [self._deleted, np.zeros(len(vectors), dtype=np.uint8)]
+            )
+            self._scales = np.concatenate([self._scales, scales])
+            return rows
+        with open(self._file(".vec"), "ab") as f:
+            f.write(quantised.tobytes())
+        if self.dtype == "int8":
+            with open(self._file(".scales"), "ab") as f:
+                f.write(scales.tobytes())
+        with open(self._file(".del"), "ab") as f:
+            f.write(bytes(len(vectors)))
+        with open(self._file(".ids"), "ab") as f:
+            f.write(ids.tobytes())
+        self.refresh()
+        return rows
+
+    def delete(self, rows: np.ndarray) -> None:
+        """
+        Set the tombstones of the given rows. The vectors stay in the file
+        until it is compacted.
+        """
+        if self.read_only:
+            raise PermissionError("Vector file is opened read-only.")
+        if len(rows) == 0:
+            return
+        self._deleted[rows] = 1
+        if isinstance(self._deleted, np.memmap):
+            self._deleted.flush()
+
+    # search
+
+    def search(
+        self,
+        query: np.ndarray,
+        rows: np.ndarray,
+        k: int,
+        metric_type: str = "L2",
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Exact search of the query vector among the given rows, scanning the
+        (memory-mapped) vectors block-wise.
+
+        Args:
+            query (np.ndarray): query vector
+
+            rows (np.ndarray): candidate rows, sorted
+
+            k (int): number of results
+
+            metric_type (str): "L2" or "IP"
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: rows and distances of the k nearest
+                neighbours, ordered by distance
+        """
+        query = np.asarray(query, dtype=np.float32)
+        k = min(k, len(rows))
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        best_rows = np.zeros(0, dtype=np.int64)
+        best_distances = np.zeros(0, dtype=np.float32)
+        for start in range(0, len(rows), SEARCH_BLOCK_SIZE):
+            block = rows[start : start + SEARCH_BLOCK_SIZE]
+            candidates = self.vectors(block)
+            if metric_type == "L2":
+                diff = candidates - query
+                distances = np.einsum("ij,ij->i", diff, diff)
+            else:
+                distances = 1.0 - candidates @ query
+            block_rows = np.concatenate([best_rows, block])
+            distances = np.concatenate([best_distances, distances])
+            top = np.argpartition(distances, min(k, len(distances)) - 1)[:k]
+            best_rows, best_distances = block_rows[top], distances[top]
+        order = np.argsort(best_distances, kind="stable")
+        return best_rows[order], best_distances[order]
+
+    def search_batch(
+        self,
+        queries: np.ndarray,
+        rows: np.ndarray,
+        k: int,
+        metric_type: str = "L2",
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Exact search of several query vectors among the given rows, scanning
+        the (memory-mapped) vectors once for all queries.
+
+        Args:
+            queries (np.ndarray): query vectors, one per row
+
+            rows (np.ndarray): candidate rows, sorted
+
+            k (int): number of results per query
+
+            metric_type (str): "L2" or "IP"
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: rows and distances of the k nearest
+                neighbours of each query, ordered by distance, with one row per
+                query
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        n_queries = len(queries)
+        k = min(k, len(rows))
+        best_rows = np.zeros((n_queries, 0), dtype=np.int64)
+        best_distances = np.zeros((n_queries, 0), dtype=np.float32)
+        if k <= 0:
+            return best_rows, best_distances
+        squared_norms = np.einsum("ij,ij->i", queries, queries)[:, None]
+        for start in range(0, len(rows), SEARCH_BLOCK_SIZE):
+            block = rows[start : start + SEARCH_BLOCK_SIZE]
+            candidates = self.vectors(block)
+            products = queries @ candidates.T
+            if metric_type == "L2":
+                distances = np.maximum(
+                    squared_norms
+                    - 2 * products
+                    + np.einsum("ij,ij->i", candidates, candidates)[None, :],
+                    0,
+                )
+            else:
+                distances = 1.0 - products
+            block_rows = np.concatenate(
+                [best_rows, np.broadcast_to(block, (n_queries, len(block)))],
+                axis=1,
+            )
+            distances = np.concatenate([best_distances, distances], axis=1)
+            top = np.argpartition(
+                distances, min(k, distances.shape[1]) - 1, axis=1
+            )[:, :k]
+            best_rows = np.take_along_axis(block_rows, top, axis=1)
+            best_distances = np.take_along_axis(distances, top, axis=1)
+        order = np.argsort(best_distances, axis=1, kind="stable")
+        return (
+            np.take_along_axis(best_rows, order, axis=1),
+            np.take_along_axis(best_distances, order, axis=1),
+        )
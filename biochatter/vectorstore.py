@@ -1,8 +1,11 @@
 from typing import Optional
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+import logging
 
-from transformers import GPT2TokenizerFast
 from langchain.schema import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.text_splitter import TextSplitter, RecursiveCharacterTextSplitter
 from langchain_community.embeddings import (
     OllamaEmbeddings,
     XinferenceEmbeddings,
@@ -14,7 +17,65 @@ from langchain_community.embeddings.azure_openai import AzureOpenAIEmbeddings
 import fitz  # this is PyMuPDF (PyPI pymupdf package, not fitz)
 import openai
 
+from biochatter.dedup import NearDuplicateIndex
+from biochatter.embeddings import (
+    LocalEmbeddings,
+    CoalescingEmbeddings,
+    DEFAULT_LOCAL_EMBEDDING_MODEL,
+)
 from biochatter.vectorstore_agent import VectorDatabaseAgentMilvus
+from biochatter.text_splitter import TokenTextSplitter, token_offsets_func
+from biochatter.chunk_store import ChunkStore
+from biochatter.metadata_store import MetadataStore
+from biochatter.vectorstore_local import VectorDatabaseAgentLocal
+
+logger = logging.getLogger(__name__)
+
+
+def create_text_splitter(
+    chunk_size: int = 1000,
+    chunk_overlap: int = 0,
+    separators: Optional[list] = None,
+    split_by_characters: bool = True,
+    model_name: Optional[str] = None,
+) -> TextSplitter:
+    """
+    Create the text splitter used to chunk documents before embedding. This is
+    a module-level function (rather than a DocumentEmbedder method) so that
+    worker processes can create the splitter from plain arguments, see
+    `DocumentEmbedder.splitter_args`.
+
+    Args:
+        chunk_size (int): size of chunks, in characters or tokens
+
+        chunk_overlap (int): overlap between chunks
+
+        separators (Optional[list]): separators to split at
+
+        split_by_characters (bool): whether to measure chunks in characters
+            or tokens
+
+        model_name (Optional[str]): model whose tokenizer measures chunks when
+            splitting by tokens
+
+    Returns:
+        TextSplitter: the text splitter, a `TokenTextSplitter` when splitting
+            by tokens
+    """
+    separators = separators or [" ", ",", "\n"]
+    if split_by_characters:
+        return RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            separators=separators,
+        )
+
+    return TokenTextSplitter(
+        token_offsets_func(model_name),
+        separators=separators,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+    )
 
 
 class DocumentEmbedder:
@@ -38,9 +99,19 @@ class DocumentEmbedder:
         azure_endpoint: Optional[str] = None,
         base_url: Optional[str] = None,
         embeddings: Optional[
-            OpenAIEmbeddings | XinferenceEmbeddings | OllamaEmbeddings
+            OpenAIEmbeddings
+            | XinferenceEmbeddings
+            | OllamaEmbeddings
+            | LocalEmbeddings
         ] = None,
         documentids_workspace: Optional[list[str]] = None,
+        index_params: Optional[dict] = None,
+        search_params: Optional[dict] = None,
+        metadata_store: Optional[MetadataStore] = None,
+        workspace: Optional[str] = None,
+        coalesce_queries: bool = False,
+        chunk_store: Optional[ChunkStore] = None,
+        near_duplicates: Optional[NearDuplicateIndex] = None,
     ) -> None:
         """
         Class that handles the retrieval-augmented generation (RAG) functionality
@@ -74,10 +145,12 @@ class DocumentEmbedder:
                 Defaults to 'text-embedding-ada-002'.
 
             vector_db_vendor (Optional[str], optional): name of vector database
-                to use. Defaults to Milvus.
+                to use, "milvus" or "local" (in-process store, see
+                VectorDatabaseAgentLocal). Defaults to Milvus.
 
             connection_args (Optional[dict], optional): arguments to pass to
-                vector database connection. Defaults to None.
+                vector database connection. For the local store, `{"path":
+                <directory>}` persists the store. Defaults to None.
 
             api_key (Optional[str], optional): OpenAI API key. Defaults to None.
 
@@ -97,6 +170,42 @@ class DocumentEmbedder:
             azure_endpoint (Optional[str], optional): Azure endpoint, should work with
                 azure_deployment when is_azure is True
 
+            index_params (Optional[dict], optional): ANN index of the embedded
+                fragments in pymilvus format, e.g. `{"index_type": "HNSW",
+                "metric_type": "L2", "params": {"M": 16, "efConstruction":
+                200}}`. The local store supports "FLAT" and "HNSW". Defaults to
+                the default index of the vector database.
+
+            search_params (Optional[dict], optional): default search parameters
+                of the index, e.g. `{"ef": 64}` or `{"nprobe": 16}`.
+
+            metadata_store (Optional[MetadataStore], optional): store of the
+                document metadata for Milvus, e.g. a `SQLiteMetadataStore`.
+                Defaults to a Milvus collection.
+
+            workspace (Optional[str], optional): workspace within which
+                documents are stored, searched and removed (Milvus only). In
+                contrast to `documentids_workspace`, the scope is a partition
+                of the vector database rather than a filter on document ids.
+
+            coalesce_queries (bool, optional): wrap the embeddings in
+                `CoalescingEmbeddings`, such that concurrent similarity
+                searches share embedding requests. Defaults to False.
+
+            chunk_store (Optional[ChunkStore], optional): store of the text of
+                the embedded fragments for Milvus, e.g. a `SQLiteChunkStore`,
+                such that Milvus only holds vectors and ids. Defaults to None,
+                i.e. the text is stored in Milvus.
+
+            near_duplicates (Optional[NearDuplicateIndex], optional): index of
+                the canonical chunks of the stored documents. Chunks that are
+                near-duplicates of a canonical chunk (or of an earlier chunk
+                of the same batch) are linked to it instead of being embedded;
+                the documents are stored with their metadata and their other
+                chunks. Linked chunks are embedded when the document of their
+                canonical chunk is removed. Defaults to None, i.e. all chunks
+                are embedded.
+
         """
         self.used = used
         self.online = online
@@ -127,6 +236,13 @@ class DocumentEmbedder:
                 )
             else:
                 self.embeddings = None
+        if coalesce_queries and self.embeddings is not None:
+            # Ollama embeds queries differently from documents, hence its
+            # queries can only be de-duplicated
+            self.embeddings = CoalescingEmbeddings(
+                self.embeddings,
+                batch_queries=not isinstance(self.embeddings, OllamaEmbeddings),
+            )
 
         # connection arguments
         self.connection_args = connection_args or {
@@ -136,6 +252,12 @@ class DocumentEmbedder:
         self.embedding_collection_name = embedding_collection_name
         self.metadata_collection_name = metadata_collection_name
         self.documentids_workspace = documentids_workspace
+        self.index_params = index_params
+        self.search_params = search_params
+        self.metadata_store = metadata_store
+        self.workspace = workspace
+        self.chunk_store = chunk_store
+        self.near_duplicates = near_duplicates
 
         # TODO: vector db selection
         self.vector_db_vendor = vector_db_vendor or "milvus"
@@ -154,6 +276,31 @@ class DocumentEmbedder:
                 connection_args=self.connection_args,
                 embedding_collection_name=self.embedding_collection_name,
                 metadata_collection_name=self.metadata_collection_name,
+                index_params=self.index_params,
+                search_params=self.search_params,
+                metadata_store=self.metadata_store,
+                workspace=self.workspace,
+                chunk_store=self.chunk_store,
+            )
+        elif self.vector_db_vendor == "local":
+            if self.workspace is not None:
+                raise NotImplementedError(
+                    "Workspaces are not supported by the local vector store."
+                )
+            if self.chunk_store is not None:
+                raise NotImplementedError(
+                    "Chunk stores are not supported by the local vector store."
+                )
+            index_params = self.index_params or {}
+            self.database_host = VectorDatabaseAgentLocal(
+                embedding_func=self.embeddings,
+                connection_args=self.connection_args,
+                embedding_collection_name=self.embedding_collection_name,
+                metadata_collection_name=self.metadata_collection_name,
+                index_type=index_params.get("index_type", "FLAT"),
+                metric_type=index_params.get("metric_type", "L2"),
+                index_params=index_params.get("params"),
+                search_params=self.search_params,
             )
         else:
             raise NotImplementedError(self.vector_db_vendor)
@@ -167,75 +314,245 @@ class DocumentEmbedder:
     def set_separators(self, separators: list) -> None:
         self.separators = separators
 
-    def _characters_splitter(self) -> RecursiveCharacterTextSplitter:
-        return RecursiveCharacterTextSplitter(
-            chunk_size=self.chunk_size,
-            chunk_overlap=self.chunk_overlap,
-            separators=self.separators,
-        )
-
-    def _tokens_splitter(self) -> RecursiveCharacterTextSplitter:
-        DEFAULT_OPENAI_MODEL = "gpt-3.5-turbo"
-        HUGGINGFACE_MODELS = ["bigscience/bloom"]
-        if self.model_name and self.model_name in HUGGINGFACE_MODELS:
-            tokenizer = GPT2TokenizerFast.from_pretrained("gpt2")
-            return RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
-                tokenizer,
-                chunk_size=self.chunk_size,
-                chunk_overlap=self.chunk_overlap,
-                separators=self.separators,
-            )
-        else:
-            return RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-                encoding_name="",
-                model_name=(
-                    DEFAULT_OPENAI_MODEL
-                    if not self.model_name
-                    else self.model_name
-                ),
-                chunk_size=self.chunk_size,
-                chunk_overlap=self.chunk_overlap,
-                separators=self.separators,
-            )
+    @property
+    def splitter_args(self) -> dict:
+        """
+        Arguments of `create_text_splitter` corresponding to the splitting
+        settings of this embedder.
+        """
+        return {
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "separators": self.separators,
+            "split_by_characters": self.split_by_characters,
+            "model_name": self.model_name,
+        }
 
-    def _text_splitter(self) -> RecursiveCharacterTextSplitter:
-        return (
-            self._characters_splitter()
-            if self.split_by_characters
-            else self._tokens_splitter()
-        )
+    def _text_splitter(self) -> TextSplitter:
+        return create_text_splitter(**self.splitter_args)
 
-    def save_document(self, doc: list[Document]) -> str:
+    def save_document(
+        self, doc: list[Document], doc_id: Optional[str] = None
+    ) -> str:
         """
-        This function saves document to the vector database
+        This function saves document to the vector database. Documents are
+        fingerprinted: saving a document identical to a stored one returns the
+        id of the stored document without embedding it again.
         Args:
             doc List[Document]: document content, read with DocumentReader load_document(),
                 or document_from_pdf(), document_from_txt()
+            doc_id Optional[str]: id of a stored document that doc is a revision
+                of; only new or changed chunks are embedded, and stale chunks
+                of the stored document are removed. The Milvus backend stores
+                the revision under a new id.
         Returns:
             str: document id, which can be used to remove an uploaded document with remove_document()
         """
         splitted = self._split_document(doc)
-        return self._store_embeddings(splitted)
+        return self._store_embeddings(splitted, doc_id)
 
-    def _split_document(self, document: list[Document]) -> list[Document]:
+    def _split_document(self, document: Iterable[Document]) -> list[Document]:
+        return list(self._iter_split_document(document))
+
+    def _iter_split_document(
+        self, document: Iterable[Document]
+    ) -> Iterator[Document]:
+        """
+        Split documents one by one, such that streamed documents (e.g., the
+        pages from `DocumentReader.iter_pdf_pages`) are split as they arrive.
+        """
         text_splitter = self._text_splitter()
-        return text_splitter.split_documents(document)
+        for doc in document:
+            yield from text_splitter.split_documents([doc])
+
+    def _store_embeddings(
+        self, doc: list[Document], doc_id: Optional[str] = None
+    ) -> str:
+        if self.near_duplicates is None:
+            return self.database_host.store_embeddings(
+                documents=doc, doc_id=doc_id
+            )
+        duplicates = self.near_duplicates.filter(doc, doc_id)
+        stored_id = self.database_host.store_embeddings(
+            documents=doc, doc_id=doc_id, exclude=set(duplicates)
+        )
+        if doc_id is not None and stored_id is not None:
+            # the canonical chunks of the revised document are replaced by
+            # those of the revision, whether or not it keeps the id
+            orphans = self.near_duplicates.remove(doc_id)
+            self._index_near_duplicates([doc], [duplicates], [stored_id])
+            self._embed_orphans(orphans)
+        else:
+            self._index_near_duplicates([doc], [duplicates], [stored_id])
+        return stored_id
 
-    def _store_embeddings(self, doc: list[Document]) -> str:
-        return self.database_host.store_embeddings(documents=doc)
+    def save_chunks_batch(
+        self, chunks_list: list[list[Document]]
+    ) -> list[Optional[str]]:
+        """
+        Store several split documents in one batch, see
+        `store_embeddings_batch()` of the vector store agents. With a
+        near-duplicate index, near-duplicate chunks are linked instead of
+        embedded, across the documents of the batch as well.
+
+        Args:
+            chunks_list (List[List[Document]]): the chunks of each document
+
+        Returns:
+            List[Optional[str]]: document id of each document, None for
+                documents without chunks
+        """
+        if self.near_duplicates is None:
+            return self.database_host.store_embeddings_batch(chunks_list)
+        duplicates_list = self.near_duplicates.filter_batch(chunks_list)
+        stored_ids = self.database_host.store_embeddings_batch(
+            chunks_list,
+            exclude_list=[set(duplicates) for duplicates in duplicates_list],
+        )
+        self._index_near_duplicates(chunks_list, duplicates_list, stored_ids)
+        return stored_ids
+
+    def _index_near_duplicates(
+        self,
+        chunks_list: list[list[Document]],
+        duplicates_list: list[dict[int, str]],
+        stored_ids: list[Optional[str]],
+    ) -> None:
+        """
+        Add the embedded chunks of stored documents to the near-duplicate
+        index and link their near-duplicate chunks. Chunks linked to a chunk
+        of the batch that was not stored, e.g. of a document identical to a
+        stored one, are embedded after all.
+        """
+        for chunks, duplicates, stored_id in zip(
+            chunks_list, duplicates_list, stored_ids
+        ):
+            if stored_id is None:
+                continue
+            self.near_duplicates.add(
+                stored_id,
+                [
+                    chunk
+                    for position, chunk in enumerate(chunks)
+                    if position not in duplicates
+                ],
+                [
+                    (chunks[position], canonical)
+                    for position, canonical in duplicates.items()
+                ],
+            )
+        self._embed_orphans(
+            self.near_duplicates.pop_orphaned_links(
+                canonical
+                for duplicates in duplicates_list
+                for canonical in duplicates.values()
+            )
+        )
+
+    def _embed_orphans(self, orphans: dict[str, list[Document]]) -> None:
+        """
+        Link chunks whose canonical chunk was removed to another canonical
+        chunk, or embed them and add them to the fragments of their document.
+        """
+        pending = list(orphans.items())
+        while len(pending) > 0:
+            doc_id, chunks = pending.pop()
+            duplicates = self.near_duplicates.filter(chunks)
+            kept = [
+                chunk
+                for position, chunk in enumerate(chunks)
+                if position not in duplicates
+            ]
+            if len(kept) > 0 and not self.database_host.append_fragments(
+                doc_id, kept
+            ):
+                # the document was removed from the store, but not from the
+                # index
+                pending.extend(self.near_duplicates.remove(doc_id).items())
+                continue
+            self.near_duplicates.add(
+                doc_id,
+                kept,
+                [
+                    (chunks[position], canonical)
+                    for position, canonical in duplicates.items()
+                ],
+            )
+            logger.info(
+                f"Embedded {len(kept)} of {len(chunks)} near-duplicate chunks "
+                f"of document {doc_id} whose canonical chunk was removed."
+            )
+
+    def index_near_duplicates(self, batch_size: int = 1000) -> int:
+        """
+        Index the fragments of the vector store for near-duplicate detection,
+        e.g. when an ingestion process starts, and embed the linked chunks
+        whose canonical chunk is no longer stored.
+
+        Args:
+            batch_size (int): number of fragments read at a time
+
+        Returns:
+            int: the number of indexed fragments
+        """
+        n_fragments = self.near_duplicates.add_fragments(
+            self.database_host, batch_size
+        )
+        self._embed_orphans(self.near_duplicates.pop_orphaned_links())
+        return n_fragments
 
     def connect(self) -> None:
         self.database_host.connect()
+        if self.near_duplicates is not None:
+            self.near_duplicates.connect()
+
+    def build_index(self) -> None:
+        """
+        (Re-)build the ANN index of the embedded fragments with the configured
+        index parameters, e.g. after bulk ingestion.
+        """
+        self.database_host.build_index()
 
     def get_all_documents(self) -> list[dict]:
         return self.database_host.get_all_documents(
             doc_ids=self.documentids_workspace
         )
 
-    def remove_document(self, doc_id: str) -> None:
-        return self.database_host.remove_document(
+    def get_documents_page(
+        self,
+        after_id: Optional[str] = None,
+        limit: int = 100,
+        output_fields: Optional[list[str]] = None,
+    ) -> tuple[list[dict], Optional[str]]:
+        """
+        Get one page of the stored documents, e.g. for a document list of a
+        large corpus. Pass the returned cursor as `after_id` to get the next
+        page; it is None after the last page.
+        """
+        return self.database_host.get_documents_page(
+            after_id, limit, self.documentids_workspace, output_fields
+        )
+
+    def iter_all_documents(
+        self,
+        output_fields: Optional[list[str]] = None,
+        batch_size: int = 1000,
+    ) -> Iterator[dict]:
+        """
+        Iterate over the stored documents, fetching `batch_size` documents at
+        a time.
+        """
+        return self.database_host.iter_all_documents(
+            self.documentids_workspace, output_fields, batch_size
+        )
+
+    def remove_document(self, doc_id: str) -> bool:
+        removed = self.database_host.remove_document(
             doc_id, self.documentids_workspace
         )
+        if removed and self.near_duplicates is not None:
+            self._embed_orphans(self.near_duplicates.remove(doc_id))
+        return removed
 
 
 class XinferenceDocumentEmbedder(DocumentEmbedder):
@@ -255,6 +572,8 @@ class XinferenceDocumentEmbedder(DocumentEmbedder):
         api_key: Optional[str] = "none",
         base_url: Optional[str] = None,
         documentids_workspace: Optional[list[str]] = None,
+        workspace: Optional[str] = None,
+        coalesce_queries: bool = False,
     ):
         """
         Extension of the DocumentEmbedder class that uses Xinference for
@@ -301,6 +620,12 @@ class XinferenceDocumentEmbedder(DocumentEmbedder):
             and get all) occur. Defaults to None, which means the operations will be
             performed across all documents in the database.
 
+            workspace (Optional[str], optional): workspace within which
+            documents are stored, searched and removed (Milvus only).
+
+            coalesce_queries (bool, optional): let concurrent similarity
+            searches share embedding requests, see `CoalescingEmbeddings`.
+
         """
         from xinference.client import Client
 
@@ -332,6 +657,8 @@ class XinferenceDocumentEmbedder(DocumentEmbedder):
                 server_url=base_url, model_uid=self.model_uid
             ),
             documentids_workspace=documentids_workspace,
+            workspace=workspace,
+            coalesce_queries=coalesce_queries,
         )
 
     def load_models(self) -> None:
@@ -381,6 +708,8 @@ class OllamaDocumentEmbedder(DocumentEmbedder):
         api_key: Optional[str] = "none",
         base_url: Optional[str] = None,
         documentids_workspace: Optional[list[str]] = None,
+        workspace: Optional[str] = None,
+        coalesce_queries: bool = False,
     ):
         """
         Extension of the DocumentEmbedder class that uses Ollama for
@@ -427,6 +756,12 @@ class OllamaDocumentEmbedder(DocumentEmbedder):
             and get all) occur. Defaults to None, which means the operations will be
             performed across all documents in the database.
 
+            workspace (Optional[str], optional): workspace within which
+            documents are stored, searched and removed (Milvus only).
+
+            coalesce_queries (bool, optional): let concurrent similarity
+            searches share embedding requests, see `CoalescingEmbeddings`.
+
         """
         from langchain_community.embeddings import OllamaEmbeddings
 
@@ -451,9 +786,147 @@ class OllamaDocumentEmbedder(DocumentEmbedder):
                 base_url=base_url, model=self.model_name
             ),
             documentids_workspace=documentids_workspace,
+            workspace=workspace,
+            coalesce_queries=coalesce_queries,
         )
 
 
+class LocalDocumentEmbedder(DocumentEmbedder):
+    def __init__(
+        self,
+        used: bool = False,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 0,
+        split_by_characters: bool = True,
+        separators: Optional[list] = None,
+        n_results: int = 3,
+        model: Optional[str] = DEFAULT_LOCAL_EMBEDDING_MODEL,
+        vector_db_vendor: Optional[str] = None,
+        connection_args: Optional[dict] = None,
+        embedding_collection_name: Optional[str] = None,
+        metadata_collection_name: Optional[str] = None,
+        documentids_workspace: Optional[list[str]] = None,
+        workspace: Optional[str] = None,
+        backend: str = "torch",
+        quantize: bool = False,
+        max_batch_size: int = 32,
+        max_latency_ms: float = 5.0,
+        num_workers: int = 1,
+    ):
+        """
+        Extension of the DocumentEmbedder class that computes embeddings in
+        process on the CPU, see `LocalEmbeddings`. No embedding service or
+        network access is needed if the model is available locally.
+
+        Args:
+
+            used (bool, optional): whether RAG has been used (frontend setting).
+
+            chunk_size (int, optional): size of chunks to split text into.
+
+            chunk_overlap (int, optional): overlap between chunks.
+
+            split_by_characters (bool, optional): whether to split by characters
+            or tokens.
+
+            separators (Optional[list], optional): list of separators to use when
+            splitting by characters.
+
+            n_results (int, optional): number of results to return from
+            similarity search.
+
+            model (Optional[str], optional): name of the sentence-embedding
+            model on the HuggingFace hub, or path of a local model directory.
+
+            vector_db_vendor (Optional[str], optional): name of vector database
+            to use.
+
+            connection_args (Optional[dict], optional): arguments to pass to
+            vector database connection.
+
+            embedding_collection_name (Optional[str], optional): name of
+            collection to store embeddings in.
+
+            metadata_collection_name (Optional[str], optional): name of
+            collection to store metadata in.
+
+            documentids_workspace (Optional[List[str]], optional): a list of document IDs
+            that defines the scope within which rag operations (remove, similarity search,
+            and get all) occur. Defaults to None, which means the operations will be
+            performed across all documents in the database.
+
+            workspace (Optional[str], optional): workspace within which
+            documents are stored, searched and removed (Milvus only).
+
+            backend (str, optional): "torch" or "onnx".
+
+            quantize (bool, optional): execute the model with int8 weights.
+
+            max_batch_size (int, optional): maximum number of texts per
+            forward pass.
+
+            max_latency_ms (float, optional): maximum time a request waits for
+            concurrent requests to join its batch.
+
+            num_workers (int, optional): number of threads running forward
+            passes.
+
+        """
+        super().__init__(
+            used=used,
+            online=True,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            split_by_characters=split_by_characters,
+            separators=separators,
+            n_results=n_results,
+            model=model,
+            vector_db_vendor=vector_db_vendor,
+            connection_args=connection_args,
+            embedding_collection_name=embedding_collection_name,
+            metadata_collection_name=metadata_collection_name,
+            embeddings=LocalEmbeddings(
+                model_name=model,
+                backend=backend,
+                quantize=quantize,
+                max_batch_size=max_batch_size,
+                max_latency_ms=max_latency_ms,
+                num_workers=num_workers,
+            ),
+            documentids_workspace=documentids_workspace,
+            workspace=workspace,
+        )
+
+
+def _pdf_metadata(doc: fitz.Document, source: str) -> dict:
+    meta = {k: v for k, v in doc.metadata.items() if v}
+    meta.update({"source": source})
+    return meta
+
+
+def _open_pdf(pdf: str | bytes) -> fitz.Document:
+    if isinstance(pdf, str):
+        return fitz.open(pdf)
+    return fitz.open(stream=pdf, filetype="pdf")
+
+
+# pdf opened once per worker process of `DocumentReader.iter_pdf_pages`
+_worker_pdf: Optional[fitz.Document] = None
+
+
+def _init_pdf_worker(pdf: str | bytes) -> None:
+    global _worker_pdf
+    _worker_pdf = _open_pdf(pdf)
+
+
+def _extract_pdf_pages(start: int, end: int) -> list[str]:
+    """
+    Extract the text of pages [start, end) of the pdf of a worker process of
+    `DocumentReader.iter_pdf_pages`.
+    """
+    return [_worker_pdf[i].get_text() for i in range(start, end)]
+
+
 class DocumentReader:
     def load_document(self, path: str) -> list[Document]:
         """
@@ -472,17 +945,12 @@ class DocumentReader:
 
         elif path.endswith(".pdf"):
             doc = fitz.open(path)
-            text = ""
-            for page in doc:
-                text += page.get_text()
-
-            meta = {k: v for k, v in doc.metadata.items() if v}
-            meta.update({"source": path})
+            text = "".join(page.get_text() for page in doc)
 
             return [
                 Document(
                     page_content=text,
-                    metadata=meta,
+                    metadata=_pdf_metadata(doc, path),
                 )
             ]
 
@@ -498,20 +966,89 @@ class DocumentReader:
             List[Document]: list of documents
         """
         doc = fitz.open(stream=pdf, filetype="pdf")
-        text = ""
-        for page in doc:
-            text += page.get_text()
-
-        meta = {k: v for k, v in doc.metadata.items() if v}
-        meta.update({"source": "pdf"})
+        text = "".join(page.get_text() for page in doc)
 
         return [
             Document(
                 page_content=text,
-                metadata=meta,
+                metadata=_pdf_metadata(doc, "pdf"),
             )
         ]
 
+    def iter_pdf_pages(
+        self,
+        pdf: str | bytes,
+        pages_per_document: int = 1,
+        n_workers: int = 0,
+    ) -> Iterator[Document]:
+        """
+        Stream a pdf file as one Document per page, or per window of
+        consecutive pages. In contrast to `load_document` and
+        `document_from_pdf`, the full text is never held in memory, and the
+        first pages can be split and embedded while later pages are still
+        being extracted. The page numbers (1-based, inclusive) are added to
+        the metadata as `page_start` and `page_end`, along with `total_pages`.
+
+        Args:
+            pdf (str | bytes): path to, or byte representation of, a pdf file
+
+            pages_per_document (int): number of pages per Document
+
+            n_workers (int): number of processes extracting pages in parallel;
+                0 extracts in the calling process. Each worker opens the pdf
+                once, and at most `n_workers` windows are extracted ahead of
+                consumption.
+
+        Yields:
+            Document: text of a page window with metadata
+        """
+        doc = _open_pdf(pdf)
+        meta = _pdf_metadata(doc, pdf if isinstance(pdf, str) else "pdf")
+        n_pages = doc.page_count
+        windows = [
+            (start, min(start + pages_per_document, n_pages))
+            for start in range(0, n_pages, pages_per_document)
+        ]
+
+        def _document(window: tuple[int, int], texts: list[str]) -> Document:
+            return Document(
+                page_content="".join(texts),
+                metadata={
+                    **meta,
+                    "page_start": window[0] + 1,
+                    "page_end": window[1],
+                    "total_pages": n_pages,
+                },
+            )
+
+        if n_workers == 0:
+            try:
+                for window in windows:
+                    texts = [doc[i].get_text() for i in range(*window)]
+                    yield _document(window, texts)
+            finally:
+                doc.close()
+            return
+
+        doc.close()
+        with ProcessPoolExecutor(
+            max_workers=n_workers,
+            initializer=_init_pdf_worker,
+            initargs=(pdf,),
+        ) as pool:
+            # windows in page order, at most n_workers in flight
+            pending = deque()
+            for window in windows:
+                pending.append(
+                    (window, pool.submit(_extract_pdf_pages, *window))
+                )
+                if len(pending) >= n_workers:
+                    done, future = pending.popleft()
+                    yield _document(done, future.result())
+            while len(pending) > 0:
+                done, future = pending.popleft()
+                yield _document(done, future.result())
+
     def document_from_txt(self, txt: bytes) -> list[Document]:
         """
         Receive a byte representation of a txt file and return a list of Documents
@@ -1,22 +1,35 @@
 from typing import Tuple, Optional
-import uuid
+from collections.abc import Iterable, Iterator
+import re
+import time
 import random
+import hashlib
 import logging
+import threading
 
 from pymilvus import (
+    Index,
     DataType,
     Collection,
     FieldSchema,
     MilvusException,
     CollectionSchema,
     utility,
-    connections,
 )
 from langchain.schema import Document
 from langchain_community.embeddings import OpenAIEmbeddings
 from langchain_community.vectorstores import Milvus
 
+import numpy as np
+
 from .constants import MAX_AGENT_DESC_LENGTH
+from .chunk_store import ChunkStore
+from .milvus_connections import connection_registry
+from .metadata_store import (
+    METADATA_FIELDS,
+    MetadataStore,
+    output_fields_with_id,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -24,23 +37,28 @@ DOCUMENT_METADATA_COLLECTION_NAME = "DocumentMetadata1"
 DOCUMENT_EMBEDDINGS_COLLECTION_NAME = "DocumentEmbeddings1"
 
 METADATA_VECTOR_DIM = 2
-METADATA_FIELDS = [
-    "id",
-    "name",
-    "author",
-    "title",
-    "format",
-    "subject",
-    "creator",
-    "producer",
-    "creationDate",
-    "modDate",
-    "source",
-]
+
+# maximum number of entities of one Milvus query with a limit
+MILVUS_QUERY_MAX_LIMIT = 16384
+
+# metadata fields that build_description() reads
+DESCRIPTION_FIELDS = ["title", "name", "subject", "source"]
+
+# chunk-level metadata kept next to the text of each fragment, e.g. the page
+# provenance from `DocumentReader.iter_pdf_pages`; Milvus agents keep it in
+# their chunk store
+CHUNK_METADATA_FIELDS = ["page_start", "page_end"]
+
+# versions of the documents by server and metadata collection, shared by all
+# agents of the process, see `VectorDatabaseAgentMilvus.documents_version`
+_documents_versions: dict[tuple, int] = {}
+_documents_versions_lock = threading.Lock()
 
 
 def align_metadata(
-    metadata: list[dict], isDeleted: Optional[bool] = False
+    metadata: list[dict],
+    isDeleted: Optional[bool] = False,
+    with_fingerprint: bool = False,
 ) -> list[list]:
     """
 
@@ -54,6 +72,9 @@ def align_metadata(
         isDeleted (Optional[bool], optional): Whether the document is deleted.
             Defaults to False.
 
+        with_fingerprint (bool): Whether to add the "fingerprint" field of the
+            metadata items, for collections that have this field.
+
     Returns:
         List[List]: List of metadata items, with each item being a list of
             metadata fields.
@@ -71,6 +92,8 @@ def align_metadata(
         ]
     )
     ret.append([isDeleted for _ in metadata])
+    if with_fingerprint:
+        ret.append([item.get("fingerprint", "") for item in metadata])
     return ret
 
 
@@ -85,194 +108,554 @@ def align_embeddings(docs: list[Document], meta_id: int) -> list[Document]:
 
     Returns:
         List[Document]: List of documents, with each document having a metadata
-            id.
+            id and the chunk-level metadata of the document, see
+            `CHUNK_METADATA_FIELDS`.
     """
     ret = []
     for doc in docs:
         ret.append(
             Document(
                 page_content=doc.page_content,
-                metadata={"meta_id": meta_id},
+                metadata={
+                    "meta_id": meta_id,
+                    **{
+                        field: doc.metadata[field]
+                        for field in CHUNK_METADATA_FIELDS
+                        if field in doc.metadata
+                    },
+                },
             )
         )
     return ret
 
 
-def validate_connection_args(connection_args: Optional[dict] = None):
-    if connection_args is None:
-        return {
-            "host": "127.0.0.1",
-            "port": "19530",
-            "user": "",
-            "password": "",
-        }
+def fingerprint_text(text: str) -> str:
+    """
+    Fingerprint of a text fragment, used to recognise unchanged chunks when a
+    document is re-ingested.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
-    connection_args["user"] = connection_args.get("user", "")
-    connection_args["password"] = connection_args.get("password", "")
-    return connection_args
 
+def exclude_chunks(
+    items: Optional[list], exclude: Optional[set[int]] = None
+) -> Optional[list]:
+    """
+    Get the chunks, or their vectors, that are not at the excluded positions.
+    """
+    if items is None or not exclude:
+        return items
+    return [item for i, item in enumerate(items) if i not in exclude]
 
-class VectorDatabaseAgentMilvus:
+
+def embed_queries(embedding_func, queries: list[str]) -> list[list[float]]:
     """
-    The VectorDatabaseAgentMilvus class manages vector databases in a connected
-    host database. It manages an embedding collection
-    `_col_embeddings:langchain.vectorstores.Milvus`, which is the main
-    information on the embedded text fragments and the basis for similarity
-    search, and a metadata collection `_col_metadata:pymilvus.Collection`, which
-    stores the metadata of the embedded text fragments. A typical workflow
-    includes the following operations:
+    Embed search queries one by one with `embed_query()`, as some embeddings
+    embed queries differently from documents, e.g. with an instruction
+    prefix. Wrap the embeddings in `CoalescingEmbeddings` to batch concurrent
+    queries.
+    """
+    return [embedding_func.embed_query(query) for query in queries]
 
-    1. connect to a host using `connect()`
-    2. get all documents in the active database using `get_all_documents()`
-    3. save a number of fragments, usually from a specific document, using
-        `store_embeddings()`
-    4. do similarity search among all fragments of the currently active database
-        using `similarity_search()`
-    5. remove a document from the currently active database using
-        `remove_document()`
+
+def fingerprint_document(docs: list[Document]) -> str:
     """
+    Fingerprint of a split document, derived from the fingerprints of its
+    chunks in order. Identical documents split with identical settings have
+    identical fingerprints.
 
-    def __init__(
-        self,
-        embedding_func: OpenAIEmbeddings,
-        connection_args: Optional[dict] = None,
-        embedding_collection_name: Optional[str] = None,
-        metadata_collection_name: Optional[str] = None,
-    ):
-        """
-        Args:
-            embedding_func OpenAIEmbeddings: Function used to embed the text
+    Args:
+        docs (List[Document]): the chunks of the document
 
-            connection_args Optional dict: args to connect Vector Database
+    Returns:
+        str: hex digest
+    """
+    digest = hashlib.sha256()
+    for doc in docs:
+        digest.update(fingerprint_text(doc.page_content).encode("ascii"))
+    return digest.hexdigest()
 
-            embedding_collection_name Optional str: exposed for test
 
-            metadata_collection_name Optional str: exposed for test
-        """
-        self._embedding_func = embedding_func
-        self._col_embeddings: Optional[Milvus] = None
-        self._col_metadata: Optional[Collection] = None
-        self._connection_args = validate_connection_args(connection_args)
-        self._embedding_name = (
-            embedding_collection_name or DOCUMENT_EMBEDDINGS_COLLECTION_NAME
+def maximal_marginal_relevance(
+    query_vector: list[float],
+    vectors: list[list[float]],
+    k: int,
+    lambda_mult: float = 0.5,
+) -> list[int]:
+    """
+    Select k of the candidate vectors by maximal marginal relevance (MMR).
+    Each step selects the candidate with the highest score
+
+        lambda_mult * sim(query, c) - (1 - lambda_mult) * max sim(c, s)
+
+    over the selected candidates s, using cosine similarities. The relevance
+    of all candidates is one matrix-vector product, and the redundancy of the
+    candidates is updated with one product per selected candidate.
+
+    Args:
+        query_vector (List[float]): the query vector
+
+        vectors (List[List[float]]): the candidate vectors
+
+        k (int): the number of candidates to select
+
+        lambda_mult (float): weight of the relevance to the query between 0
+            (maximal diversity) and 1 (ranking by relevance only)
+
+    Returns:
+        List[int]: indices of the selected candidates, in order of selection
+    """
+    if not 0 <= lambda_mult <= 1:
+        raise ValueError(
+            f"Invalid lambda_mult {lambda_mult}, must be between 0 and 1."
         )
-        self._metadata_name = (
-            metadata_collection_name or DOCUMENT_METADATA_COLLECTION_NAME
+    if k <= 0 or len(vectors) == 0:
+        return []
+    # normalised copies, float32 arrays of the caller are left unchanged
+    candidates = np.asarray(vectors, dtype=np.float32)
+    candidates = candidates / np.maximum(
+        np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12
+    )
+    query = np.asarray(query_vector, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+    relevance = candidates @ query
+    selected = [int(np.argmax(relevance))]
+    redundancy = candidates @ candidates[selected[0]]
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        np.maximum(redundancy, candidates @ candidates[best], out=redundancy)
+    return selected
+
+
+def build_description(metadata: Iterable[dict]) -> str:
+    """
+    Build the agent description from the metadata of the documents in a vector
+    store, listing the names of the stored articles. The metadata is consumed
+    only until the description is long enough, so an iterator over a large
+    store is not exhausted.
+
+    Args:
+        metadata (Iterable[Dict]): metadata of the documents in the store,
+            with the fields in DESCRIPTION_FIELDS
+
+    Returns:
+        str: description, clipped to MAX_AGENT_DESC_LENGTH
+    """
+
+    def get_name(meta: dict[str, str]):
+        for col in DESCRIPTION_FIELDS:
+            if meta[col] is not None and len(meta[col]) > 0:
+                return meta[col]
+        return ""
+
+    names_set = set()
+    length = 0
+    for meta in metadata:
+        name = get_name(meta)
+        if name not in names_set:
+            names_set.add(name)
+            # quotes, comma and space around each name
+            length += len(name) + 4
+            if length > MAX_AGENT_DESC_LENGTH:
+                break
+    desc = f"This vector store contains the following articles: {names_set}"
+    return desc[:MAX_AGENT_DESC_LENGTH]
+
+
+def build_metadata_query_expr(doc_ids: Optional[list[str]] = None) -> str:
+    """
+    Build the metadata collection query expression to obtain all non-deleted
+    documents, or the non-deleted documents among doc_ids.
+    """
+    expr = (
+        f"id in {doc_ids} and isDeleted == false"
+        if doc_ids is not None
+        else "isDeleted == false"
+    )
+    return expr.replace('"', "").replace("'", "")
+
+
+def compact_collection(collection: Collection) -> None:
+    """
+    Compact a Milvus collection, removing deleted entities from its segments,
+    and wait for the compaction to finish.
+    """
+    try:
+        collection.compact()
+        collection.wait_for_compaction_completed()
+    except MilvusException as e:
+        logger.error(f"Failed to compact collection {collection.name}.")
+        raise e
+
+
+# version of the embeddings collection schema: 1 with VARCHAR document ids
+# (`meta_id`), as created by LangChain; 2 with INT64 document ids and a scalar
+# index on them, see `create_embeddings_collection()`
+EMBEDDINGS_SCHEMA_VERSION = 2
+META_ID_INDEX_NAME = "meta_id_index"
+
+
+def embeddings_schema_version(collection: Optional[Collection]) -> int:
+    """
+    Get the schema version of an embeddings collection; collections that do
+    not exist yet are created with the current version.
+    """
+    if not isinstance(collection, Collection):
+        return EMBEDDINGS_SCHEMA_VERSION
+    for field in collection.schema.fields:
+        if field.name == "meta_id":
+            return 2 if field.dtype == DataType.INT64 else 1
+    raise ValueError(
+        f"Collection {collection.name} has no meta_id field, it is not an "
+        "embeddings collection."
+    )
+
+
+def find_vector_index(collection: Collection) -> Optional[Index]:
+    """
+    Get the index of the "vector" field of an embeddings collection, which
+    may have further indexes, e.g. on "meta_id"; None without vector index.
+    """
+    for index in collection.indexes:
+        if index.field_name == "vector":
+            return index
+    return None
+
+
+def create_embeddings_collection(
+    name: str,
+    dim: int,
+    using: str = "default",
+    with_text: bool = True,
+    auto_id: bool = True,
+) -> Collection:
+    """
+    Create an embeddings collection of the current schema version: INT64
+    primary keys "pk", the fragment "text" (unless it is kept in a chunk
+    store), the "vector" and the INT64 document id "meta_id" with a scalar
+    (STL_SORT) index, which speeds up filtering by document. The vector index
+    is not created.
+
+    Args:
+        name (str): collection name
+
+        dim (int): dimension of the vectors
+
+        using (str): connection alias
+
+        with_text (bool): whether the collection has a "text" field
+
+        auto_id (bool): whether Milvus assigns the primary keys; otherwise
+            they are inserted, e.g. the chunk ids of a chunk store
+
+    Returns:
+        Collection: the new collection
+    """
+    fields = [
+        FieldSchema(
+            name="pk", dtype=DataType.INT64, is_primary=True, auto_id=auto_id
+        )
+    ]
+    if with_text:
+        fields.append(
+            FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=65_535)
         )
+    fields += [
+        FieldSchema(name="vector", dtype=DataType.FLOAT_VECTOR, dim=dim),
+        FieldSchema(name="meta_id", dtype=DataType.INT64),
+    ]
+    try:
+        collection = Collection(
+            name=name, schema=CollectionSchema(fields=fields), using=using
+        )
+        # numeric fields get a STL_SORT index
+        collection.create_index("meta_id", index_name=META_ID_INDEX_NAME)
+    except MilvusException as e:
+        logger.error(f"Failed to create embeddings collection {name}")
+        raise e
+    return collection
 
-    def connect(self) -> None:
-        """
-        Connect to a host and read two document collections (the default names
-        are `DocumentEmbeddings` and `DocumentMetadata`) in the currently active
-        database (default database name is `default`); if those document
-        collections don't exist, create the two collections.
-        """
-        self._connect(**self._connection_args)
-        self._init_host()
 
-    def _connect(self, host: str, port: str, user: str, password: str) -> None:
-        self.alias = self._create_connection_alias(host, port, user, password)
+def milvus_server_version(alias: str) -> Tuple[int, int]:
+    """
+    Major and minor version of the Milvus server of a connection, e.g. (2, 2).
+    """
+    version = utility.get_server_version(using=alias)
+    match = re.search(r"(\d+)\.(\d+)", version)
+    return (int(match[1]), int(match[2])) if match else (0, 0)
+
+
+def query_ordered_page(
+    collection: Collection,
+    key: str,
+    after,
+    batch_size: int,
+    output_fields: list[str],
+    partition_names: Optional[list[str]] = None,
+    expr: Optional[str] = None,
+    ordered: bool = False,
+) -> list[dict]:
+    """
+    Query the `batch_size` entities with the smallest primary keys greater
+    than `after`, in ascending primary key order. Milvus returns the
+    smallest primary keys matching a query with a limit from version 2.3
+    on (`ordered`); older servers may return any matching entities, hence
+    the primary key range of the page is narrowed until a query returns all
+    entities of the range.
 
-    def _init_host(self) -> None:
-        """
-        Initialize host. Will read/create document collection inside currently
-        active database.
-        """
-        self._create_collections()
+    Args:
+        collection (Collection): the collection
 
-    def _create_connection_alias(
-        self, host: str, port: str, user: str, password: str
-    ) -> str:
-        """
-        Connect to host and create a connection alias for metadata collection
-        using a random uuid.
+        key (str): name of the INT64 or VARCHAR primary key field
 
-        Args:
-            host (str): host ip address
-            port (str): host port
+        after: the primary key after which the page starts; None for the
+            first page
 
-        Returns:
-            str: connection alias
-        """
-        alias = uuid.uuid4().hex
-        try:
-            connections.connect(
-                host=host, port=port, user=user, password=password, alias=alias
-            )
-            logger.debug(f"Created new connection using: {alias}")
-            return alias
-        except MilvusException as e:
-            logger.error(f"Failed to create  new connection using: {alias}")
-            raise e
+        batch_size (int): number of entities of the page, less than
+            `MILVUS_QUERY_MAX_LIMIT`
 
-    def _create_collections(self) -> None:
-        """
-        Create or load the embedding and metadata collections from the currently
-        active database.
-        """
-        embedding_exists = utility.has_collection(
-            self._embedding_name, using=self.alias
+        output_fields (List[str]): fields to return, including `key`
+
+        partition_names (Optional[List[str]]): partitions to read; None for
+            all partitions
+
+        expr (Optional[str]): expression selecting the entities to read
+
+        ordered (bool): whether the server returns the smallest primary
+            keys of a query with a limit
+
+    Returns:
+        List[Dict]: the entities, fewer than `batch_size` on the last page
+    """
+    if batch_size >= MILVUS_QUERY_MAX_LIMIT:
+        raise ValueError(
+            f"Milvus queries return at most {MILVUS_QUERY_MAX_LIMIT} "
+            "entities; use a smaller batch size."
         )
-        meta_exists = utility.has_collection(
-            self._metadata_name,
-            using=self.alias,
+
+    def bound(operator: str, value) -> str:
+        if isinstance(value, str):
+            return f'{key} {operator} "{value}"'
+        return f"{key} {operator} {value}"
+
+    upper = None
+    while True:
+        conditions = [] if expr is None else [f"({expr})"]
+        if after is not None:
+            conditions.append(bound(">", after))
+        if upper is not None:
+            conditions.append(bound("<=", upper))
+        # one entity more than the page tells whether the range is complete
+        page = collection.query(
+            expr=" and ".join(conditions),
+            output_fields=output_fields,
+            partition_names=partition_names,
+            limit=batch_size + 1,
+        )
+        page = sorted(page, key=lambda item: item[key])
+        if len(page) <= batch_size:
+            return page
+        if ordered:
+            return page[:batch_size]
+        upper = page[batch_size - 1][key]
+
+
+def iter_collection_pages(
+    collection: Collection,
+    batch_size: int,
+    output_fields: list[str],
+    partition_names: Optional[list[str]] = None,
+    expr: Optional[str] = None,
+    ordered: bool = False,
+) -> Iterator[list[dict]]:
+    """
+    Iterate over the entities of a collection with the primary key "pk",
+    `batch_size` at a time, in ascending primary key order. Pages are
+    addressed by the last primary key of the previous page, as offsets are
+    limited to `MILVUS_QUERY_MAX_LIMIT` entities, see
+    `query_ordered_page()`.
+
+    Args:
+        collection (Collection): the collection
+
+        batch_size (int): number of entities per page
+
+        output_fields (List[str]): fields to return, including "pk"
+
+        partition_names (Optional[List[str]]): partitions to read; None for
+            all partitions
+
+        expr (Optional[str]): expression selecting the entities to read
+
+        ordered (bool): whether the server returns the smallest primary
+            keys of a query with a limit, i.e. Milvus 2.3 or later
+    """
+    # LangChain creates INT64 (auto id) or VARCHAR primary keys
+    int_pk = collection.schema.primary_field.dtype == DataType.INT64
+    cursor = -(2**63) if int_pk else ""
+    while True:
+        page = query_ordered_page(
+            collection,
+            "pk",
+            cursor,
+            batch_size,
+            output_fields,
+            partition_names,
+            expr,
+            ordered,
         )
+        if len(page) == 0:
+            return
+        yield page
+        if len(page) < batch_size:
+            return
+        cursor = page[-1]["pk"]
 
-        if embedding_exists:
-            self._load_embeddings_collection()
-        else:
-            self._create_embeddings_collection()
 
-        if meta_exists:
-            self._load_metadata_collection()
-        else:
-            self._create_metadata_collection()
+def workspace_partition_name(workspace: str) -> str:
+    """
+    Name of the partition holding the entities of a workspace. Workspace names
+    consist of letters, digits and underscores.
+    """
+    if not re.fullmatch(r"[A-Za-z0-9_]{1,200}", workspace):
+        raise ValueError(
+            f"Invalid workspace name {workspace!r}: use letters, digits and "
+            "underscores."
+        )
+    return f"workspace_{workspace}"
 
-        self._create_metadata_collection_index()
-        self._col_metadata.load()
 
-    def _load_embeddings_collection(self) -> None:
+def ensure_workspace_partition(collection: Collection, workspace: str) -> str:
+    """
+    Create the partition of a workspace if it does not exist.
+
+    Returns:
+        str: the partition name
+    """
+    name = workspace_partition_name(workspace)
+    if not collection.has_partition(name):
+        collection.create_partition(name)
+        # load the new partition along with the loaded collection
+        collection.load()
+    return name
+
+
+# index types of the embeddings collection and their required build parameters
+EMBEDDING_INDEX_TYPES = {
+    "FLAT": [],
+    "IVF_FLAT": ["nlist"],
+    "IVF_SQ8": ["nlist"],
+    "IVF_PQ": ["nlist", "m"],
+    "HNSW": ["M", "efConstruction"],
+    "DISKANN": [],
+}
+METRIC_TYPES = ["L2", "IP"]
+
+
+def validate_index_params(index_params: dict) -> dict:
+    """
+    Check the index parameters of the embeddings collection, in the format
+    of pymilvus, e.g. `{"index_type": "IVF_PQ", "metric_type": "L2", "params":
+    {"nlist": 1024, "m": 16}}`.
+
+    Args:
+        index_params (dict): index parameters; "metric_type" defaults to "L2"
+
+    Returns:
+        dict: the index parameters including the metric type
+    """
+    index_type = index_params.get("index_type")
+    if index_type not in EMBEDDING_INDEX_TYPES:
+        raise ValueError(
+            f"Invalid index type {index_type}. Choose from "
+            f"{list(EMBEDDING_INDEX_TYPES)}."
+        )
+    metric_type = index_params.get("metric_type", "L2")
+    if metric_type not in METRIC_TYPES:
+        raise ValueError(
+            f"Invalid metric type {metric_type}. Choose from {METRIC_TYPES}."
+        )
+    params = index_params.get("params", {})
+    missing = [p for p in EMBEDDING_INDEX_TYPES[index_type] if p not in params]
+    if missing:
+        raise ValueError(f"Missing {index_type} index parameters: {missing}.")
+    return {
+        "index_type": index_type,
+        "metric_type": metric_type,
+        "params": params,
+    }
+
+
+def validate_connection_args(connection_args: Optional[dict] = None):
+    if connection_args is None:
+        return {
+            "host": "127.0.0.1",
+            "port": "19530",
+            "user": "",
+            "password": "",
+        }
+
+    connection_args["user"] = connection_args.get("user", "")
+    connection_args["password"] = connection_args.get("password", "")
+    return connection_args
+
+
+class MilvusMetadataStore(MetadataStore):
+    """
+    Metadata store in a Milvus collection, the default metadata store of
+    `VectorDatabaseAgentMilvus`. The pinned pymilvus version (2.2) requires a
+    vector field in every collection, hence the collection holds a fake
+    2-dimensional vector with an index, which is loaded into Milvus memory
+    along with the metadata. The documents of a workspace are stored in a
+    partition of the collection, see `workspace_partition_name()`.
+    """
+
+    def __init__(self, name: str, alias: str):
         """
-        Load embeddings collection from currently active database.
+        Args:
+            name (str): name of the metadata collection
+
+            alias (str): connection alias
         """
-        try:
-            self._col_embeddings = Milvus(
-                embedding_function=self._embedding_func,
-                collection_name=self._embedding_name,
-                connection_args=self._connection_args,
-            )
-        except MilvusException as e:
-            logger.error(
-                f"Failed to load embeddings collection {self._embedding_name}."
-            )
-            raise e
+        self._name = name
+        self._alias = alias
+        self.collection: Optional[Collection] = None
+        self._has_fingerprints = False
+        self._ordered_queries = False
 
-    def _create_embeddings_collection(self) -> None:
+    def connect(self) -> None:
         """
-        Create embedding collection.
-        All fields: "meta_id", "vector"
+        Create or load the metadata collection.
         """
-        try:
-            self._col_embeddings = Milvus(
-                embedding_function=self._embedding_func,
-                collection_name=self._embedding_name,
-                connection_args=self._connection_args,
-            )
-        except MilvusException as e:
-            logger.error(
-                f"Failed to create embeddings collection {self._embedding_name}"
-            )
-            raise e
+        if utility.has_collection(self._name, using=self._alias):
+            self._load_metadata_collection()
+        else:
+            self._create_metadata_collection()
+        self._create_metadata_collection_index()
+        self.collection.load()
+        self._ordered_queries = milvus_server_version(self._alias) >= (2, 3)
+
+    @property
+    def has_fingerprints(self) -> bool:
+        # metadata collections created before fingerprinting have no
+        # "fingerprint" field
+        return self._has_fingerprints
 
     def _load_metadata_collection(self) -> None:
         """
-        Load metadata collection from currently active database.
+        Load the metadata collection.
         """
-        self._col_metadata = Collection(
-            self._metadata_name,
-            using=self.alias,
+        self.collection = Collection(
+            self._name,
+            using=self._alias,
         )
-        self._col_metadata.load()
+        self._has_fingerprints = "fingerprint" in [
+            field.name for field in self.collection.schema.fields
+        ]
+        self.collection.load()
 
     def _create_metadata_collection(self) -> None:
         """
@@ -280,11 +663,12 @@ class VectorDatabaseAgentMilvus:
 
         All fields: "id", "name", "author", "title", "format", "subject",
         "creator", "producer", "creationDate", "modDate", "source", "embedding",
-        "isDeleted".
+        "isDeleted", "fingerprint".
 
         As the vector database requires a vector field, we will create a fake
         vector "embedding". The field "isDeleted" is used to specify if the
-        document is deleted.
+        document is deleted. The field "fingerprint" identifies the content of
+        the document, see `fingerprint_document()`.
         """
         MAX_LENGTH = 10000
         doc_id = FieldSchema(
@@ -329,6 +713,9 @@ class VectorDatabaseAgentMilvus:
             name="isDeleted",
             dtype=DataType.BOOL,
         )
+        doc_fingerprint = FieldSchema(
+            name="fingerprint", dtype=DataType.VARCHAR, max_length=64
+        )
         fields = [
             doc_id,
             doc_name,
@@ -343,23 +730,25 @@ class VectorDatabaseAgentMilvus:
             doc_source,
             embedding,
             isDeleted,
+            doc_fingerprint,
         ]
         schema = CollectionSchema(fields=fields)
         try:
-            self._col_metadata = Collection(
-                name=self._metadata_name, schema=schema, using=self.alias
+            self.collection = Collection(
+                name=self._name, schema=schema, using=self._alias
             )
         except MilvusException as e:
-            logger.error(f"Failed to create collection {self._metadata_name}")
+            logger.error(f"Failed to create collection {self._name}")
             raise e
+        self._has_fingerprints = True
 
     def _create_metadata_collection_index(self) -> None:
         """
-        Create index for metadata collection in currently active database.
+        Create the index of the fake vector of the metadata collection.
         """
         if (
-            not isinstance(self._col_metadata, Collection)
-            or len(self._col_metadata.indexes) > 0
+            not isinstance(self.collection, Collection)
+            or len(self.collection.indexes) > 0
         ):
             return
 
@@ -370,49 +759,723 @@ class VectorDatabaseAgentMilvus:
         }
 
         try:
-            self._col_metadata.create_index(
+            self.collection.create_index(
                 field_name="embedding",
                 index_params=index_params,
-                using=self.alias,
+                using=self._alias,
             )
         except MilvusException as e:
             logger.error(
-                "Failed to create index for meta collection "
-                f"{self._metadata_name}."
+                "Failed to create index for meta collection " f"{self._name}."
             )
             raise e
 
-    def _insert_data(self, documents: list[Document]) -> str:
+    def _partition_names(self, workspace: Optional[str]) -> Optional[list[str]]:
         """
-        Insert documents into the currently active database.
-
-        Args:
-            documents (List[Documents]): documents array, usually from
-                DocumentReader.load_document, DocumentReader.document_from_pdf,
-                DocumentReader.document_from_txt
-
-        Returns:
-            str: document id
+        Partitions to query for a workspace: None for all partitions, an empty
+        list if the workspace has no partition yet.
         """
-        if len(documents) == 0:
+        if workspace is None:
             return None
-        metadata = [documents[0].metadata]
-        aligned_metadata = align_metadata(metadata)
+        name = workspace_partition_name(workspace)
+        return [name] if self.collection.has_partition(name) else []
+
+    def insert(
+        self, metadata: list[dict], workspace: Optional[str] = None
+    ) -> list[str]:
+        aligned_metadata = align_metadata(
+            metadata, with_fingerprint=self._has_fingerprints
+        )
+        partition_name = (
+            ensure_workspace_partition(self.collection, workspace)
+            if workspace is not None
+            else None
+        )
         try:
-            result = self._col_metadata.insert(aligned_metadata)
-            meta_id = str(result.primary_keys[0])
-            self._col_metadata.flush()
+            result = self.collection.insert(
+                aligned_metadata, partition_name=partition_name
+            )
         except MilvusException as e:
             logger.error(f"Failed to insert meta data")
             raise e
-        aligned_docs = align_embeddings(documents, meta_id)
+        return [str(pk) for pk in result.primary_keys]
+
+    def get(
+        self,
+        doc_ids: Optional[list[str]] = None,
+        workspace: Optional[str] = None,
+    ) -> list[dict]:
+        partition_names = self._partition_names(workspace)
+        if partition_names == []:
+            return []
+        try:
+            return self.collection.query(
+                expr=build_metadata_query_expr(doc_ids),
+                output_fields=METADATA_FIELDS,
+                partition_names=partition_names,
+            )
+        except MilvusException as e:
+            logger.error(e)
+            raise e
+
+    def get_page(
+        self,
+        after_id: Optional[str] = None,
+        limit: int = 100,
+        doc_ids: Optional[list[str]] = None,
+        workspace: Optional[str] = None,
+        output_fields: Optional[list[str]] = None,
+    ) -> list[dict]:
+        """
+        Get one page of documents in ascending id order, see
+        `MetadataStore.get_page()`. Pages are selected by the expression
+        `id > after_id`, see `query_ordered_page()`; `limit` must be less
+        than MILVUS_QUERY_MAX_LIMIT.
+        """
+        partition_names = self._partition_names(workspace)
+        if partition_names == []:
+            return []
+        try:
+            return query_ordered_page(
+                self.collection,
+                "id",
+                None if after_id is None else int(after_id),
+                limit,
+                output_fields_with_id(output_fields),
+                partition_names,
+                build_metadata_query_expr(doc_ids),
+                self._ordered_queries,
+            )
+        except MilvusException as e:
+            logger.error(e)
+            raise e
+
+    def find_by_fingerprint(
+        self, fingerprints: list[str], workspace: Optional[str] = None
+    ) -> dict[str, str]:
+        if not self._has_fingerprints or len(fingerprints) == 0:
+            return {}
+        partition_names = self._partition_names(workspace)
+        if partition_names == []:
+            return {}
+        values = ", ".join(f'"{fingerprint}"' for fingerprint in fingerprints)
+        res = self.collection.query(
+            expr=f"fingerprint in [{values}] and isDeleted == false",
+            output_fields=["id", "fingerprint"],
+            partition_names=partition_names,
+        )
+        return {item["fingerprint"]: str(item["id"]) for item in res}
+
+    def delete(
+        self, doc_ids: list[str], workspace: Optional[str] = None
+    ) -> list[str]:
+        partition_names = self._partition_names(workspace)
+        if len(doc_ids) == 0 or partition_names == []:
+            return []
+        expr = f"id in [{', '.join(map(str, doc_ids))}]"
+        res = self.collection.query(
+            expr=expr, output_fields=["id"], partition_names=partition_names
+        )
+        if len(res) == 0:
+            return []
+        deleted = [str(item["id"]) for item in res]
+        self.collection.delete(f"id in [{', '.join(deleted)}]")
+        return deleted
+
+    def flush(self) -> None:
+        self.collection.flush()
+
+    def purge_deleted(
+        self, batch_size: int = 1000, dry_run: bool = False
+    ) -> list[str]:
+        purged = []
+        after_id = None
+        while True:
+            expr = "isDeleted == true"
+            if after_id is not None:
+                expr += f" and id > {after_id}"
+            page = self.collection.query(
+                expr=expr, output_fields=["id"], limit=batch_size
+            )
+            if len(page) == 0:
+                break
+            ids = sorted(item["id"] for item in page)
+            if not dry_run:
+                self.collection.delete(f"id in {ids}")
+            purged.extend(str(id) for id in ids)
+            if len(page) < batch_size:
+                break
+            after_id = ids[-1]
+        return purged
+
+    def compact(self) -> None:
+        compact_collection(self.collection)
+
+
+class VectorDatabaseAgentMilvus:
+    """
+    The VectorDatabaseAgentMilvus class manages vector databases in a connected
+    host database. It manages an embedding collection
+    `_col_embeddings:langchain.vectorstores.Milvus`, which is the main
+    information on the embedded text fragments and the basis for similarity
+    search, and a metadata store, which stores the metadata of the documents of
+    the embedded text fragments. The metadata store defaults to a Milvus
+    collection (`MilvusMetadataStore`); other stores, e.g.
+    `metadata_store.SQLiteMetadataStore`, keep the metadata out of Milvus
+    memory. A typical workflow
+    includes the following operations:
+
+    1. connect to a host using `connect()`
+    2. get all documents in the active database using `get_all_documents()`
+    3. save a number of fragments, usually from a specific document, using
+        `store_embeddings()`
+    4. do similarity search among all fragments of the currently active database
+        using `similarity_search()`
+    5. remove a document from the currently active database using
+        `remove_document()`
+
+    Many documents can be stored or removed at once with
+    `store_embeddings_batch()` and `remove_documents()`, which group the
+    operations into single insert and delete expressions.
+
+    An agent with a `workspace` only sees the documents of that workspace. The
+    fragments of a workspace are stored in a partition of the embedding
+    collection, such that scoped search only visits that partition instead of
+    evaluating an `id in [...]` filter over all fragments.
+
+    With a `chunk_store`, the embedding collection only holds the vectors, the
+    chunk ids (primary keys) and the document ids; the text of the fragments
+    is kept in the chunk store, e.g. a `chunk_store.SQLiteChunkStore`, and
+    fetched for the hits of a search only.
+    """
+
+    def __init__(
+        self,
+        embedding_func: OpenAIEmbeddings,
+        connection_args: Optional[dict] = None,
+        embedding_collection_name: Optional[str] = None,
+        metadata_collection_name: Optional[str] = None,
+        auto_flush: bool = True,
+        index_params: Optional[dict] = None,
+        search_params: Optional[dict] = None,
+        metadata_store: Optional[MetadataStore] = None,
+        workspace: Optional[str] = None,
+        chunk_store: Optional[ChunkStore] = None,
+    ):
+        """
+        Args:
+            embedding_func OpenAIEmbeddings: Function used to embed the text
+
+            connection_args Optional dict: args to connect Vector Database
+
+            embedding_collection_name Optional str: exposed for test
+
+            metadata_collection_name Optional str: exposed for test
+
+            auto_flush bool: flush the collections after each write operation.
+                If False, flushing (which seals the growing segments) is
+                deferred until `commit()` is called; inserted and deleted
+                entities are visible to queries either way.
+
+            index_params Optional dict: ANN index of the embeddings collection,
+                see `validate_index_params()`. Used when the index is built,
+                i.e., when the collection is created or by `build_index()`.
+                Defaults to LangChain's HNSW index.
+
+            search_params Optional dict: default search parameters of the
+                index, e.g. `{"ef": 64}` (HNSW), `{"nprobe": 16}` (IVF) or
+                `{"search_list": 100}` (DiskANN)
+
+            metadata_store Optional MetadataStore: store of the document
+                metadata; defaults to a `MilvusMetadataStore` with the
+                metadata collection name. Connected by `connect()`.
+
+            workspace Optional str: workspace of the agent; documents are
+                stored in, searched in and removed from this workspace only.
+                Workspace names consist of letters, digits and underscores.
+
+            chunk_store Optional ChunkStore: store of the text of the embedded
+                fragments, keeping it out of the embedding collection. The
+                collection must have been created with a chunk store; agents
+                sharing a collection share its chunk store. Connected by
+                `connect()`.
+        """
+        self._embedding_func = embedding_func
+        self._col_embeddings: Optional[Milvus] = None
+        self._metadata_store = metadata_store
+        self._chunk_store = chunk_store
+        if workspace is not None:
+            workspace_partition_name(workspace)
+        self._workspace = workspace
+        self._connection_args = validate_connection_args(connection_args)
+        self._embedding_name = (
+            embedding_collection_name or DOCUMENT_EMBEDDINGS_COLLECTION_NAME
+        )
+        self._metadata_name = (
+            metadata_collection_name or DOCUMENT_METADATA_COLLECTION_NAME
+        )
+        self._auto_flush = auto_flush
+        self._index_params = (
+            validate_index_params(index_params) if index_params else None
+        )
+        self._search_params = search_params
+        # metric of the vector index of the collection, see
+        # `_index_metric_type()`
+        self._metric_type: Optional[str] = None
+        self._pending_flush: set[str] = set()
+        self.alias: Optional[str] = None
+        self._schema_version = EMBEDDINGS_SCHEMA_VERSION
+        # Milvus supports deletion by any expression from version 2.3 on
+        self._delete_by_expression = False
+        # Milvus returns vector fields of search hits from version 2.3 on
+        self._search_outputs_vectors = False
+        # Milvus returns the smallest primary keys of queries with a limit
+        # from version 2.3 on
+        self._ordered_queries = False
+        self._documents_key = (
+            str(self._connection_args["host"]),
+            str(self._connection_args["port"]),
+            self._metadata_name,
+        )
+
+    @property
+    def documents_version(self) -> int:
+        """
+        Incremented whenever documents are stored or removed through any
+        agent of the process with the same server and metadata collection,
+        e.g. to invalidate cached descriptions.
+        """
+        return _documents_versions.get(self._documents_key, 0)
+
+    def _documents_changed(self) -> None:
+        with _documents_versions_lock:
+            _documents_versions[self._documents_key] = (
+                _documents_versions.get(self._documents_key, 0) + 1
+            )
+
+    def connect(self) -> None:
+        """
+        Connect to a host and read two document collections (the default names
+        are `DocumentEmbeddings` and `DocumentMetadata`) in the currently active
+        database (default database name is `default`); if those document
+        collections don't exist, create the two collections.
+        """
+        self._connect(**self._connection_args)
+        self._init_host()
+
+    def _connect(
+        self, host: str, port: str, user: str, password: str, token: str = ""
+    ) -> None:
+        # release the connection of an earlier connect()
+        self.close()
+        self.alias = self._create_connection_alias(
+            host, port, user, password, token
+        )
+
+    def _init_host(self) -> None:
+        """
+        Initialize host. Will read/create document collection inside currently
+        active database.
+        """
+        self._create_collections()
+
+    def _create_connection_alias(
+        self,
+        host: str,
+        port: str,
+        user: str,
+        password: str,
+        token: str = "",
+    ) -> str:
+        """
+        Get a connection to host from the process-wide connection registry,
+        which shares one connection among all agents connected to the same
+        host with the same credentials.
+
+        Args:
+            host (str): host ip address
+            port (str): host port
+
+        Returns:
+            str: connection alias
+        """
+        return connection_registry.acquire(
+            host, port, user, password, token=token
+        )
+
+    def close(self) -> None:
+        """
+        Release the connection of the agent. The connection stays open for
+        reuse by other agents until it is closed via
+        `milvus_connections.connection_registry`.
+        """
+        if self.alias is not None:
+            connection_registry.release(self.alias)
+            self.alias = None
+
+    def _create_collections(self) -> None:
+        """
+        Create or load the embedding collection from the currently active
+        database and connect the metadata store.
+        """
+        if self._chunk_store is not None:
+            self._chunk_store.connect()
+        embedding_exists = utility.has_collection(
+            self._embedding_name, using=self.alias
+        )
+
+        if embedding_exists:
+            self._load_embeddings_collection()
+        else:
+            self._create_embeddings_collection()
+        self._schema_version = embeddings_schema_version(
+            self._col_embeddings.col
+        )
+        if self._schema_version < EMBEDDINGS_SCHEMA_VERSION:
+            logger.warning(
+                f"Embeddings collection {self._embedding_name} has schema "
+                f"version {self._schema_version}; migrate it with "
+                "`biochatter-migrate` for faster filtering and deletion."
+            )
+        self._metric_type = self._index_metric_type()
+        server_version = self._server_version()
+        self._delete_by_expression = server_version >= (2, 3)
+        self._search_outputs_vectors = server_version >= (2, 3)
+        self._ordered_queries = server_version >= (2, 3)
+
+        if self._metadata_store is None:
+            self._metadata_store = MilvusMetadataStore(
+                self._metadata_name, self.alias
+            )
+        self._metadata_store.connect()
+
+    def _server_version(self) -> Tuple[int, int]:
+        """
+        Major and minor version of the Milvus server, e.g. (2, 2).
+        """
+        return milvus_server_version(self.alias)
+
+    def _meta_id_value(self, meta_id: str):
+        """
+        Document id as stored in the `meta_id` field of the embeddings
+        collection, an integer from schema version 2 on.
+        """
+        return int(meta_id) if self._schema_version >= 2 else str(meta_id)
+
+    @property
+    def _col_metadata(self) -> Optional[Collection]:
+        """
+        The metadata collection, if the metadata is stored in Milvus.
+        """
+        return getattr(self._metadata_store, "collection", None)
+
+    def _load_embeddings_collection(self) -> None:
+        """
+        Load embeddings collection from currently active database.
+        """
+        try:
+            self._col_embeddings = Milvus(
+                embedding_function=self._embedding_func,
+                collection_name=self._embedding_name,
+                connection_args=self._connection_args,
+                index_params=self._index_params,
+                search_params=self._milvus_search_params(),
+            )
+        except MilvusException as e:
+            logger.error(
+                f"Failed to load embeddings collection {self._embedding_name}."
+            )
+            raise e
+        col = self._col_embeddings.col
+        if isinstance(col, Collection):
+            has_text = "text" in [field.name for field in col.schema.fields]
+            if has_text == (self._chunk_store is not None):
+                raise ValueError(
+                    f"Embeddings collection {self._embedding_name} was "
+                    f"created {'without' if has_text else 'with'} a chunk "
+                    "store."
+                )
+
+    def _create_embeddings_collection(self) -> None:
+        """
+        Create embedding collection. The collection itself is created on the
+        first insert, when the dimension of the vectors is known, see
+        `_create_embeddings_collection_schema()`.
+        """
+        try:
+            self._col_embeddings = Milvus(
+                embedding_function=self._embedding_func,
+                collection_name=self._embedding_name,
+                connection_args=self._connection_args,
+                index_params=self._index_params,
+                search_params=self._milvus_search_params(),
+            )
+        except MilvusException as e:
+            logger.error(
+                f"Failed to create embeddings collection {self._embedding_name}"
+            )
+            raise e
+
+    def _create_embeddings_collection_schema(self, dim: int) -> None:
+        """
+        Create the embedding collection with the current schema, see
+        `create_embeddings_collection()`. With a chunk store, the collection
+        has no "text" field, and its primary keys are the chunk ids assigned
+        by the chunk store.
+
+        Args:
+            dim (int): dimension of the vectors
+        """
+        col = self._col_embeddings
+        col.col = create_embeddings_collection(
+            self._embedding_name,
+            dim,
+            using=col.alias,
+            with_text=self._chunk_store is None,
+            auto_id=self._chunk_store is None,
+        )
+        # LangChain reads the fields, creates the vector index and loads the
+        # collection
+        col._init()
+        self._schema_version = EMBEDDINGS_SCHEMA_VERSION
+        self._metric_type = self._index_metric_type()
+
+    def _milvus_search_params(
+        self, search_params: Optional[dict] = None
+    ) -> Optional[dict]:
+        """
+        Convert search parameters, e.g. `{"ef": 64}`, to the format of
+        pymilvus, `{"metric_type": "L2", "params": {"ef": 64}}`.
+        """
+        search_params = search_params or self._search_params
+        if search_params is None:
+            return None
+        metric_type = self._metric_type or (self._index_params or {}).get(
+            "metric_type", "L2"
+        )
+        return {"metric_type": metric_type, "params": search_params}
+
+    def _index_metric_type(self) -> Optional[str]:
+        """
+        Metric type of the vector index of the loaded embeddings collection,
+        which may differ from that of the index parameters of the agent, e.g.
+        if another agent created the collection; None without index.
+        """
+        col = self._col_embeddings.col
+        if not isinstance(col, Collection):
+            return None
+        index = find_vector_index(col)
+        return None if index is None else index.params.get("metric_type")
+
+    def build_index(self, index_params: Optional[dict] = None) -> None:
+        """
+        (Re-)build the ANN index of the embeddings collection, replacing an
+        existing index. The collection is released while the index is built
+        and loaded afterwards.
+
+        Args:
+            index_params (Optional[dict]): index parameters, see
+                `validate_index_params()`; defaults to the index parameters
+                of the agent
+        """
+        index_params = index_params or self._index_params
+        if index_params is None:
+            raise ValueError("No index parameters given.")
+        index_params = validate_index_params(index_params)
+        col = self._col_embeddings.col
+        if col is None:
+            raise ValueError(
+                f"Embeddings collection {self._embedding_name} is empty."
+            )
+        try:
+            col.release()
+            # the collection may have further indexes, e.g. on "meta_id", so
+            # the vector index is addressed by name
+            index = find_vector_index(col)
+            if index is not None and col.has_index(index_name=index.index_name):
+                col.drop_index(index_name=index.index_name)
+            col.create_index("vector", index_params=index_params)
+            col.load()
+        except MilvusException as e:
+            logger.error(
+                "Failed to build index for embeddings collection "
+                f"{self._embedding_name}."
+            )
+            raise e
+        self._index_params = index_params
+        self._col_embeddings.index_params = index_params
+        self._metric_type = index_params["metric_type"]
+
+    def _flush(self, *collections: str) -> None:
+        """
+        Flush the given collections ("metadata", "embeddings", or "chunks" for
+        the chunk store) after a write operation, or defer flushing until
+        `commit()` if auto flush is disabled.
+        """
+        self._pending_flush.update(collections)
+        if self._auto_flush:
+            self.commit()
+
+    def commit(self) -> None:
+        """
+        Flush the collections written to since the last flush.
+        """
+        try:
+            if "metadata" in self._pending_flush:
+                self._metadata_store.flush()
+            if self._chunk_store is not None and (
+                "chunks" in self._pending_flush
+                or "embeddings" in self._pending_flush
+            ):
+                self._chunk_store.flush()
+            if "embeddings" in self._pending_flush:
+                self._col_embeddings.col.flush()
+        except MilvusException as e:
+            logger.error("Failed to flush collections.")
+            raise e
+        self._pending_flush.clear()
+
+    def _find_documents_by_fingerprint(
+        self, fingerprints: list[str]
+    ) -> dict[str, str]:
+        """
+        Find non-deleted documents with the given fingerprints.
+
+        Returns:
+            Dict[str, str]: document id by fingerprint, for the fingerprints
+                of stored documents
+        """
+        return self._metadata_store.find_by_fingerprint(
+            fingerprints, self._workspace
+        )
+
+    def _insert_metadata(self, metadata: list[dict]) -> list[str]:
+        self._documents_changed()
+        return self._metadata_store.insert(metadata, self._workspace)
+
+    def _partition_names(self) -> Optional[list[str]]:
+        """
+        Partitions of the embedding collection to search: None for all
+        partitions, an empty list if the workspace has no fragments yet.
+        """
+        if self._workspace is None:
+            return None
+        name = workspace_partition_name(self._workspace)
+        col = self._col_embeddings.col
+        return [name] if col is not None and col.has_partition(name) else []
+
+    def _insert_vectors(
+        self,
+        texts: list[str],
+        vectors: list[list[float]],
+        metadatas: list[dict],
+    ) -> None:
+        """
+        Insert embedded fragments into the embedding collection, in the
+        partition of the workspace if the agent has one. With a chunk store,
+        the texts and the metadata of the fragments (document id and
+        chunk-level metadata, see `align_embeddings()`) are put into the chunk
+        store, and the chunk ids are inserted instead.
+        """
+        col = self._col_embeddings
+        if col.col is None:
+            self._create_embeddings_collection_schema(len(vectors[0]))
+        partition_name = (
+            ensure_workspace_partition(col.col, self._workspace)
+            if self._workspace is not None
+            else None
+        )
+        if self._chunk_store is not None:
+            chunk_ids = self._chunk_store.put(texts, metadatas)
+            data = {"pk": chunk_ids, "vector": vectors}
+        else:
+            data = {"text": texts, "vector": vectors}
+        data["meta_id"] = [
+            self._meta_id_value(metadata["meta_id"]) for metadata in metadatas
+        ]
+        try:
+            # columns in the order of the collection schema
+            col.col.insert(
+                [data[field] for field in col.fields if field in data],
+                partition_name=partition_name,
+            )
+        except MilvusException as e:
+            logger.error(
+                "Failed to insert data to embedding collection "
+                f"{self._embedding_name}."
+            )
+            if self._chunk_store is not None:
+                self._chunk_store.delete(chunk_ids)
+            raise e
+        if self._chunk_store is not None:
+            # inserted fragments are searchable without a flush of the
+            # collection, but the chunk store must commit their texts
+            self._flush("chunks")
+
+    def _accepts_vectors(self) -> bool:
+        """
+        Whether fragments can be inserted with precomputed vectors, which
+        collections of schema version 1 without a chunk store do not allow.
+        """
+        return (
+            self._schema_version >= 2
+            or self._chunk_store is not None
+            or self._col_embeddings.col is None
+        )
+
+    def _insert_embeddings(
+        self,
+        aligned_docs: list[Document],
+        vectors: Optional[list[list[float]]] = None,
+    ) -> None:
+        """
+        Embed and insert fragments, or insert them with precomputed vectors.
+        """
+        if len(aligned_docs) == 0:
+            return
+        if vectors is not None and not self._accepts_vectors():
+            raise ValueError(
+                "Precomputed vectors cannot be inserted into collections of "
+                "schema version 1, see `migration`."
+            )
+        if (
+            vectors is not None
+            or self._workspace is not None
+            or self._chunk_store is not None
+            or self._col_embeddings.col is None
+        ):
+            texts = [doc.page_content for doc in aligned_docs]
+            self._insert_vectors(
+                texts,
+                (
+                    self._embedding_func.embed_documents(texts)
+                    if vectors is None
+                    else vectors
+                ),
+                [doc.metadata for doc in aligned_docs],
+            )
+            return
         try:
             # As we passed collection_name, documents will be added to existed collection
             self._col_embeddings = Milvus.from_documents(
                 embedding=self._embedding_func,
                 collection_name=self._embedding_name,
                 connection_args=self._connection_args,
-                documents=aligned_docs,
+                documents=[
+                    Document(
+                        page_content=doc.page_content,
+                        metadata={
+                            "meta_id": self._meta_id_value(
+                                doc.metadata["meta_id"]
+                            )
+                        },
+                    )
+                    for doc in aligned_docs
+                ],
+                index_params=self._index_params,
+                search_params=self._milvus_search_params(),
+                # collections of schema version 2 have auto ids
+                auto_id=self._schema_version >= 2,
             )
         except MilvusException as e:
             logger.error(
@@ -420,9 +1483,160 @@ class VectorDatabaseAgentMilvus:
                 f"{self._embedding_name}."
             )
             raise e
+
+    def _insert_data(
+        self,
+        documents: list[Document],
+        doc_id: Optional[str] = None,
+        exclude: Optional[set[int]] = None,
+    ) -> str:
+        """
+        Insert documents into the currently active database. If a document
+        with identical content is already stored, nothing is inserted and the
+        id of the stored document is returned. If `doc_id` is given, the
+        documents are a revision of that document, see `_revise_document()`.
+
+        Args:
+            documents (List[Documents]): documents array, usually from
+                DocumentReader.load_document, DocumentReader.document_from_pdf,
+                DocumentReader.document_from_txt
+
+            doc_id (Optional[str]): id of the stored document that the
+                documents revise
+
+            exclude (Optional[set[int]]): positions of chunks that are not
+                stored as fragments, see `store_embeddings()`
+
+        Returns:
+            str: document id
+        """
+        if len(documents) == 0:
+            return None
+        fingerprint = fingerprint_document(documents)
+        existing_id = self._find_documents_by_fingerprint([fingerprint]).get(
+            fingerprint
+        )
+        if existing_id is not None:
+            logger.info(f"Document is already stored with id {existing_id}.")
+            return existing_id
+        metadata = {**documents[0].metadata, "fingerprint": fingerprint}
+        fragments = exclude_chunks(documents, exclude)
+        if doc_id is not None:
+            return self._revise_document(doc_id, fragments, metadata)
+        meta_id = self._insert_metadata([metadata])[0]
+        try:
+            self._insert_embeddings(align_embeddings(fragments, meta_id))
+        except Exception:
+            self._discard_documents([meta_id])
+            raise
+        self._flush("metadata")
+        return meta_id
+
+    def _discard_documents(self, meta_ids: list[str]) -> None:
+        """
+        Remove documents whose fragments could not be stored, e.g. as the
+        embedding failed, with the fragments stored so far. Otherwise, the
+        documents would remain without fragments, and storing them again
+        would return their ids as those of identical stored documents.
+        """
+        try:
+            if self._col_embeddings.col is None:
+                self._metadata_store.delete(meta_ids, self._workspace)
+                self._flush("metadata")
+            else:
+                self.remove_documents(meta_ids)
+        except Exception as e:
+            logger.error(f"Failed to remove incomplete documents {meta_ids}.")
+            logger.error(e)
+
+    def _revise_document(
+        self, doc_id: str, documents: list[Document], metadata: dict
+    ) -> str:
+        """
+        Replace a stored document with a revision, embedding only the chunks
+        whose text is not among the stored chunks of the document. The vectors
+        of unchanged chunks are copied from the stored chunks, stale chunks are
+        deleted.
+
+        As metadata rows cannot be updated in place, the revision is stored
+        under a new document id, which replaces `doc_id`.
+
+        Args:
+            doc_id (str): id of the stored document
+
+            documents (List[Document]): chunks of the revised document
+
+            metadata (dict): metadata of the revised document
+
+        Returns:
+            str: the new document id
+        """
+        # the vectors of unchanged chunks can only be copied into collections
+        # that accept precomputed vectors, otherwise all chunks are embedded
+        stored_vectors = (
+            {
+                fingerprint_text(text): vector
+                for text, vector in self._get_document_fragments(doc_id)
+            }
+            if self._accepts_vectors()
+            else {}
+        )
+        unchanged = [
+            doc
+            for doc in documents
+            if fingerprint_text(doc.page_content) in stored_vectors
+        ]
+        changed = [
+            doc
+            for doc in documents
+            if fingerprint_text(doc.page_content) not in stored_vectors
+        ]
+        meta_id = self._insert_metadata([metadata])[0]
+        try:
+            self._insert_embeddings(
+                align_embeddings(unchanged, meta_id),
+                [
+                    stored_vectors[fingerprint_text(doc.page_content)]
+                    for doc in unchanged
+                ],
+            )
+            self._insert_embeddings(align_embeddings(changed, meta_id))
+        except Exception:
+            # the revised document is kept
+            self._discard_documents([meta_id])
+            raise
+        logger.info(
+            f"Revised document {doc_id} as {meta_id}: embedded "
+            f"{len(changed)} of {len(documents)} chunks."
+        )
+        self.remove_document(doc_id)
         return meta_id
 
-    def store_embeddings(self, documents: list[Document]) -> str:
+    def _get_document_fragments(
+        self, doc_id: str
+    ) -> list[Tuple[str, list[float]]]:
+        """
+        Get the text and vector of the stored fragments of a document.
+        """
+        col = self._col_embeddings.col
+        expr = self._build_embedding_search_expression([{"id": doc_id}])
+        if self._chunk_store is None:
+            stored = col.query(expr=expr, output_fields=["text", "vector"])
+            return [(row["text"], row["vector"]) for row in stored]
+        stored = col.query(expr=expr, output_fields=["pk", "vector"])
+        chunks = self._chunk_store.get([row["pk"] for row in stored])
+        return [
+            (chunks[row["pk"]][0], row["vector"])
+            for row in stored
+            if row["pk"] in chunks
+        ]
+
+    def store_embeddings(
+        self,
+        documents: list[Document],
+        doc_id: Optional[str] = None,
+        exclude: Optional[set[int]] = None,
+    ) -> str:
         """
         Store documents in the currently active database.
 
@@ -431,19 +1645,136 @@ class VectorDatabaseAgentMilvus:
                 DocumentReader.load_document, DocumentReader.document_from_pdf,
                 DocumentReader.document_from_txt
 
+            doc_id (Optional[str]): id of a stored document that the documents
+                revise; only new or changed chunks are embedded
+
+            exclude (Optional[set[int]]): positions of chunks that are not
+                stored as fragments, e.g. near-duplicates of stored chunks;
+                the metadata and fingerprint of the document cover all chunks
+
         Returns:
             str: document id
         """
         if len(documents) == 0:
             return
-        return self._insert_data(documents)
+        return self._insert_data(documents, doc_id, exclude)
+
+    def append_fragments(self, doc_id: str, documents: list[Document]) -> bool:
+        """
+        Embed chunks and add them to the fragments of a stored document, e.g.
+        near-duplicate chunks whose canonical chunk was removed. The metadata
+        of the document is not changed.
+
+        Args:
+            doc_id (str): id of the stored document
+
+            documents (List[Document]): the chunks to add
+
+        Returns:
+            bool: False if the document is not stored
+        """
+        if len(self._metadata_store.get([str(doc_id)], self._workspace)) == 0:
+            return False
+        self._insert_embeddings(align_embeddings(documents, str(doc_id)))
+        return True
+
+    def store_embeddings_batch(
+        self,
+        documents_list: list[list[Document]],
+        vectors_list: Optional[list[list[list[float]]]] = None,
+        exclude_list: Optional[list[Optional[set[int]]]] = None,
+    ) -> list[Optional[str]]:
+        """
+        Store several documents in the currently active database, using one
+        metadata insert, one embedding insert and at most one flush for the
+        whole batch. Documents identical to stored documents, or to earlier
+        documents of the batch, are not stored again.
+
+        Args:
+            documents_list (List[List[Document]]): the chunks of each document
+
+            vectors_list (Optional[List[List[List[float]]]]): precomputed
+                vectors of the chunks of each document, e.g. restored from a
+                snapshot; the embedding function is not called
+
+            exclude_list (Optional[List[Optional[set[int]]]]): for each
+                document, positions of chunks that are not stored as
+                fragments, see `store_embeddings()`
+
+        Returns:
+            List[Optional[str]]: document id of each document, None for
+                documents without chunks
+        """
+        precomputed = vectors_list is not None
+        if vectors_list is None:
+            vectors_list = [None] * len(documents_list)
+        if exclude_list is None:
+            exclude_list = [None] * len(documents_list)
+        fingerprints = [
+            fingerprint_document(documents) if len(documents) > 0 else None
+            for documents in documents_list
+        ]
+        known = self._find_documents_by_fingerprint(
+            [fp for fp in set(fingerprints) if fp is not None]
+        )
+        # fingerprint -> metadata, fragments and vectors of the first
+        # document with it
+        new = {}
+        for fingerprint, documents, vectors, exclude in zip(
+            fingerprints, documents_list, vectors_list, exclude_list
+        ):
+            if fingerprint is not None and fingerprint not in known:
+                new.setdefault(
+                    fingerprint,
+                    (
+                        documents[0].metadata,
+                        exclude_chunks(documents, exclude),
+                        exclude_chunks(vectors, exclude),
+                    ),
+                )
+        if len(new) > 0:
+            meta_ids = self._insert_metadata(
+                [
+                    {**metadata, "fingerprint": fingerprint}
+                    for fingerprint, (metadata, _, _) in new.items()
+                ]
+            )
+            try:
+                self._insert_embeddings(
+                    [
+                        doc
+                        for (_, fragments, _), meta_id in zip(
+                            new.values(), meta_ids
+                        )
+                        for doc in align_embeddings(fragments, meta_id)
+                    ],
+                    (
+                        [
+                            vector
+                            for _, _, vectors in new.values()
+                            for vector in vectors
+                        ]
+                        if precomputed
+                        else None
+                    ),
+                )
+            except Exception:
+                self._discard_documents(meta_ids)
+                raise
+            known.update(zip(new.keys(), meta_ids))
+            self._flush("metadata")
+        return [
+            None if fingerprint is None else known[fingerprint]
+            for fingerprint in fingerprints
+        ]
 
     def _build_embedding_search_expression(
         self, meta_ids: list[dict]
     ) -> Optional[str]:
         """
         Build search expression for embedding collection. The generated
-        expression follows the pattern: "meta_id in [{id1}, {id2}, ...]
+        expression follows the pattern: "meta_id in [{id1}, {id2}, ...]", with
+        quoted ids for collections of schema version 1.
 
         Args:
             meta_ids: the array of metadata id in metadata collection
@@ -453,6 +1784,11 @@ class VectorDatabaseAgentMilvus:
         """
         if len(meta_ids) == 0:
             return "meta_id in []"
+        if self._schema_version >= 2:
+            # ids that are not numbers cannot refer to a document
+            ids = [str(item["id"]) for item in meta_ids]
+            ids = ", ".join(id for id in ids if id.lstrip("-").isdigit())
+            return f"meta_id in [{ids}]"
         built_expr = """meta_id in ["""
         for item in meta_ids:
             id = f'"{item["id"]}",'
@@ -482,7 +1818,7 @@ class VectorDatabaseAgentMilvus:
             metadata: list[dict], id: str
         ) -> Optional[dict]:
             for d in metadata:
-                if str(d["id"]) == id:
+                if str(d["id"]) == str(id):
                     return d
             return None
 
@@ -514,26 +1850,34 @@ class VectorDatabaseAgentMilvus:
         Returns:
             query: str
         """
-        expr = (
-            f"id in {doc_ids} and isDeleted == false"
-            if doc_ids is not None
-            else "isDeleted == false"
-        )
-        return expr.replace('"', "").replace("'", "")
+        return build_metadata_query_expr(doc_ids)
 
     def similarity_search(
-        self, query: str, k: int = 3, doc_ids: Optional[list[str]] = None
+        self,
+        query: str,
+        k: int = 3,
+        doc_ids: Optional[list[str]] = None,
+        search_params: Optional[dict] = None,
+        fetch_k: Optional[int] = None,
+        lambda_mult: float = 0.5,
     ) -> list[Document]:
         """
         Perform similarity search insider the currently active database
         according to the input query.
 
         This method will:
-        1. get all non-deleted meta_id and build to search expression for
-            the currently active embedding collection
-        2. do similarity search in the embedding collection
+        1. do similarity search in the embedding collection, restricted to the
+            partition of the workspace and, if given, to the fragments of
+            doc_ids
+        2. get the metadata of the documents of the results
         3. combine metadata and embeddings
 
+        With `fetch_k`, the results are diversified: `fetch_k` candidates are
+        fetched with their vectors in the same search request, and k of them
+        are selected by maximal marginal relevance (see
+        `maximal_marginal_relevance()`), such that near-identical fragments,
+        e.g. of the same paragraph, do not fill all k results.
+
         Args:
             query (str): query string
 
@@ -542,24 +1886,268 @@ class VectorDatabaseAgentMilvus:
             doc_ids (Optional[list[str]]): the list of document ids, do
                 similarity search across the specified documents
 
+            search_params (Optional[dict]): search parameters for this query,
+                e.g. `{"ef": 128}`; defaults to the search parameters of the
+                agent
+
+            fetch_k (Optional[int]): the number of candidates of diversified
+                search; defaults to None, i.e. the k most similar fragments
+                are returned
+
+            lambda_mult (float): weight of the relevance of the candidates
+                of diversified search to the query between 0 (maximal
+                diversity) and 1 (ranking by relevance only)
+
         Returns:
             List[Document]: search results
         """
-        result_metadata = []
-        expr = VectorDatabaseAgentMilvus._build_meta_col_query_expr_for_all_documents(
-            doc_ids
-        )
-        result_metadata = self._col_metadata.query(
-            expr=expr, output_fields=METADATA_FIELDS
-        )
-        expr = self._build_embedding_search_expression(result_metadata)
+        if fetch_k is not None:
+            query_vector = self._embedding_func.embed_query(query)
+            candidates = self._search_vectors(
+                [query_vector],
+                max(fetch_k, k),
+                doc_ids,
+                search_params,
+                with_vectors=True,
+            )[0]
+            selected = maximal_marginal_relevance(
+                query_vector,
+                [vector for _, _, vector in candidates],
+                k,
+                lambda_mult,
+            )
+            return [candidates[i][0] for i in selected]
+        if self._chunk_store is not None:
+            return [
+                doc
+                for doc, _ in self.similarity_search_with_score(
+                    query, k, doc_ids, search_params
+                )
+            ]
+        partition_names = self._partition_names()
+        if partition_names == []:
+            return []
         result_embedding = self._col_embeddings.similarity_search(
-            query=query, k=k, expr=expr
+            query=query,
+            k=k,
+            expr=self._build_document_scope_expression(doc_ids),
+            param=self._milvus_search_params(search_params),
+            partition_names=partition_names,
         )
         return self._join_embedding_and_metadata_results(
-            result_embedding, result_metadata
+            result_embedding, self._get_result_metadata(result_embedding)
         )
 
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 3,
+        doc_ids: Optional[list[str]] = None,
+        search_params: Optional[dict] = None,
+    ) -> list[Tuple[Document, float]]:
+        """
+        Perform similarity search and return the distance of each result to
+        the query. Lower distances are closer: the squared L2 distance, or one
+        minus the inner product for "IP" indexes, such that results of several
+        stores with the same metric can be merged by distance.
+
+        Args:
+            query (str): query string
+
+            k (int): the number of results to return
+
+            doc_ids (Optional[list[str]]): the list of document ids, do
+                similarity search across the specified documents
+
+            search_params (Optional[dict]): search parameters for this query,
+                e.g. `{"ef": 128}`
+
+        Returns:
+            List[Tuple[Document, float]]: search results and their distances,
+                ordered by distance
+        """
+        return self._search_vectors(
+            [self._embedding_func.embed_query(query)],
+            k,
+            doc_ids,
+            search_params,
+        )[0]
+
+    def similarity_search_batch(
+        self,
+        queries: list[str],
+        k: int = 3,
+        doc_ids: Optional[list[str]] = None,
+        search_params: Optional[dict] = None,
+    ) -> list[list[Document]]:
+        """
+        Perform similarity search for several queries, using one search
+        request with all query vectors and one metadata lookup for the
+        documents of all results. The queries are embedded with
+        `embed_query()`, see `embed_queries()`.
+
+        Args:
+            queries (list[str]): query strings
+
+            k (int): the number of results to return per query
+
+            doc_ids (Optional[list[str]]): the list of document ids, do
+                similarity search across the specified documents
+
+            search_params (Optional[dict]): search parameters, e.g.
+                `{"ef": 128}`; defaults to the search parameters of the agent
+
+        Returns:
+            List[List[Document]]: search results of each query
+        """
+        if len(queries) == 0:
+            return []
+        return [
+            [doc for doc, _ in results]
+            for results in self._search_vectors(
+                embed_queries(self._embedding_func, queries),
+                k,
+                doc_ids,
+                search_params,
+            )
+        ]
+
+    def _search_vectors(
+        self,
+        vectors: list[list[float]],
+        k: int,
+        doc_ids: Optional[list[str]],
+        search_params: Optional[dict],
+        with_vectors: bool = False,
+    ) -> list[list[tuple]]:
+        """
+        Search the embedding collection with one request for all query
+        vectors, and join the hits with the metadata of their documents. With
+        a chunk store, the texts of the hits are fetched from the chunk store.
+
+        Args:
+            with_vectors (bool): whether to return the stored vectors of the
+                hits, which Milvus 2.3 returns with the hits; older servers
+                are queried for them
+
+        Returns:
+            List[List[tuple]]: results and their distances (lower is closer),
+                and with `with_vectors` their vectors, per query vector
+        """
+        col = self._col_embeddings
+        partition_names = self._partition_names()
+        if col.col is None or partition_names == []:
+            return [[] for _ in vectors]
+        output_fields = (
+            ["text", "meta_id"] if self._chunk_store is None else ["meta_id"]
+        )
+        if with_vectors and self._search_outputs_vectors:
+            output_fields.append("vector")
+        try:
+            res = col.col.search(
+                data=vectors,
+                anns_field="vector",
+                param=self._milvus_search_params(search_params)
+                or col.search_params,
+                limit=k,
+                expr=self._build_document_scope_expression(doc_ids),
+                output_fields=output_fields,
+                partition_names=partition_names,
+            )
+        except MilvusException as e:
+            logger.error(
+                "Failed to search embedding collection "
+                f"{self._embedding_name}."
+            )
+            raise e
+        inner_product = (
+            self._milvus_search_params(search_params) or col.search_params or {}
+        ).get("metric_type") == "IP"
+        if self._chunk_store is None:
+            texts = None
+        else:
+            texts = self._chunk_store.get(
+                [hit.id for hits in res for hit in hits]
+            )
+        if with_vectors and not self._search_outputs_vectors:
+            pks = [hit.id for hits in res for hit in hits]
+            hit_vectors = (
+                {
+                    row["pk"]: row["vector"]
+                    for row in col.col.query(
+                        expr=f"pk in {pks}", output_fields=["pk", "vector"]
+                    )
+                }
+                if len(pks) > 0
+                else {}
+            )
+        results_embedding = []
+        for hits in res:
+            docs = []
+            for hit in hits:
+                if texts is None:
+                    text = hit.entity.get("text")
+                elif hit.id in texts:
+                    text = texts[hit.id][0]
+                else:  # discard
+                    logger.error(f"Failed to find chunk {hit.id}")
+                    continue
+                doc = Document(
+                    page_content=text,
+                    metadata={"meta_id": hit.entity.get("meta_id")},
+                )
+                # Milvus returns the similarity for inner products
+                distance = 1 - hit.distance if inner_product else hit.distance
+                if not with_vectors:
+                    docs.append((doc, distance))
+                elif self._search_outputs_vectors:
+                    docs.append((doc, distance, hit.entity.get("vector")))
+                elif hit.id in hit_vectors:
+                    docs.append((doc, distance, hit_vectors[hit.id]))
+            results_embedding.append(docs)
+        result_metadata = self._get_result_metadata(
+            [result[0] for results in results_embedding for result in results]
+        )
+        return [
+            [
+                (joined, *scores)
+                for doc, *scores in results
+                for joined in self._join_embedding_and_metadata_results(
+                    [doc], result_metadata
+                )
+            ]
+            for results in results_embedding
+        ]
+
+    def _build_document_scope_expression(
+        self, doc_ids: Optional[list[str]]
+    ) -> Optional[str]:
+        """
+        Build the search expression restricting the search to the fragments
+        of doc_ids. The fragments of removed documents are deleted, hence no
+        expression is needed without doc_ids.
+        """
+        if doc_ids is None:
+            return None
+        return self._build_embedding_search_expression(
+            [{"id": doc_id} for doc_id in doc_ids]
+        )
+
+    def _get_result_metadata(
+        self, result_embedding: list[Document]
+    ) -> list[dict]:
+        """
+        Get the metadata of the documents of search results.
+        """
+        meta_ids = list(
+            dict.fromkeys(
+                str(doc.metadata["meta_id"]) for doc in result_embedding
+            )
+        )
+        if len(meta_ids) == 0:
+            return []
+        return self._metadata_store.get(meta_ids, self._workspace)
+
     def remove_document(
         self, doc_id: str, doc_ids: Optional[list[str]] = None
     ) -> bool:
@@ -575,33 +2163,234 @@ class VectorDatabaseAgentMilvus:
         Returns:
             bool: True if the document is deleted, False otherwise
         """
-        if not self._col_metadata:
-            return False
-        if doc_ids is not None and (
-            len(doc_ids) == 0 or (len(doc_ids) > 0 and not doc_id in doc_ids)
+        return len(self.remove_documents([doc_id], doc_ids)) > 0
+
+    def remove_documents(
+        self, ids: list[str], doc_ids: Optional[list[str]] = None
+    ) -> list[str]:
+        """
+        Remove several documents, including meta data and embeddings, using a
+        single delete expression per collection and at most one flush.
+
+        Args:
+            ids (list[str]): the documents to be deleted
+
+            doc_ids (Optional[list[str]]): the list of document ids, defines
+                documents scope within which remove operation occurs.
+
+        Returns:
+            list[str]: the ids of the deleted documents
+        """
+        if self._metadata_store is None:
+            return []
+        if doc_ids is not None:
+            scope = set(map(str, doc_ids))
+            ids = [doc_id for doc_id in ids if str(doc_id) in scope]
+        if len(ids) == 0:
+            return []
+        try:
+            removed = self._metadata_store.delete(ids, self._workspace)
+            if len(removed) == 0:
+                return []
+            self._documents_changed()
+
+            col = self._col_embeddings.col
+            expr = self._build_embedding_search_expression(
+                [{"id": meta_id} for meta_id in removed]
+            )
+            if self._delete_by_expression and self._chunk_store is None:
+                col.delete(expr=expr)
+            else:
+                # older Milvus servers only delete by primary key
+                res = col.query(expr, output_fields=["pk"])
+                if len(res) > 0:
+                    pks = [item["pk"] for item in res]
+                    col.delete(expr=f"pk in {pks}")
+                    if self._chunk_store is not None:
+                        self._chunk_store.delete(pks)
+            self._flush("metadata", "embeddings")
+            return removed
+        except MilvusException as e:
+            logger.error(e)
+            raise e
+
+    # maintenance, see `maintenance.run_maintenance()`
+
+    def purge_deleted_documents(
+        self, batch_size: int = 1000, dry_run: bool = False
+    ) -> list[str]:
+        """
+        Permanently remove soft-deleted documents from the metadata store. The
+        embeddings of the removed documents become orphans, see
+        `remove_orphaned_embeddings()`.
+
+        Args:
+            batch_size (int): number of documents removed per operation
+
+            dry_run (bool): only find the documents, do not remove them
+
+        Returns:
+            List[str]: the ids of the (to be) removed documents
+        """
+        purged = self._metadata_store.purge_deleted(batch_size, dry_run)
+        if len(purged) > 0 and not dry_run:
+            self._flush("metadata")
+        return purged
+
+    def iter_fragments(
+        self, doc_ids: Optional[list[str]] = None, batch_size: int = 1000
+    ) -> Iterator[list[dict]]:
+        """
+        Iterate over the embedded fragments of the workspace, `batch_size` at
+        a time, e.g. to export them with `snapshot.export_snapshot()`.
+
+        Args:
+            doc_ids (Optional[list[str]]): the list of document ids, defines
+                the documents whose fragments are returned
+
+            batch_size (int): number of fragments per page
+
+        Returns:
+            Iterator[List[Dict]]: pages of fragments with the fields "doc_id",
+                "text", "vector" and "metadata" (chunk-level metadata, which
+                is kept in the chunk store; empty without chunk store)
+        """
+        col = self._col_embeddings.col
+        partition_names = self._partition_names()
+        if col is None or partition_names == []:
+            return
+        output_fields = ["pk", "vector", "meta_id"] + (
+            ["text"] if self._chunk_store is None else []
+        )
+        for page in iter_collection_pages(
+            col,
+            batch_size,
+            output_fields,
+            partition_names,
+            self._build_document_scope_expression(doc_ids),
+            self._ordered_queries,
         ):
-            return False
+            if self._chunk_store is None:
+                chunks = {item["pk"]: (item["text"], {}) for item in page}
+            else:
+                chunks = self._chunk_store.get([item["pk"] for item in page])
+            yield [
+                {
+                    "doc_id": str(item["meta_id"]),
+                    "text": chunks[item["pk"]][0],
+                    "vector": item["vector"],
+                    "metadata": {
+                        field: value
+                        for field, value in chunks[item["pk"]][1].items()
+                        if field in CHUNK_METADATA_FIELDS
+                    },
+                }
+                for item in page
+                if item["pk"] in chunks
+            ]
+
+    def _iter_embedding_pages(self, batch_size: int) -> Iterator[list[dict]]:
+        """
+        Iterate over the primary keys and document ids of all embedded
+        fragments, `batch_size` at a time, in ascending primary key order.
+        """
+        col = self._col_embeddings.col
+        if col is None:
+            return
+        yield from iter_collection_pages(
+            col, batch_size, ["pk", "meta_id"], ordered=self._ordered_queries
+        )
+
+    def _existing_document_ids(
+        self, meta_ids: set[str], batch_size: int
+    ) -> set[str]:
+        """
+        Select the ids of existing documents among the given ids, in all
+        workspaces.
+        """
+        # ids that are not numbers cannot refer to a document
+        candidates = sorted(m for m in map(str, meta_ids) if m.isdigit())
+        existing = set()
+        for start in range(0, len(candidates), batch_size):
+            batch = candidates[start : start + batch_size]
+            page = self._metadata_store.get_page(
+                doc_ids=batch, limit=len(batch), output_fields=["id"]
+            )
+            existing.update(str(item["id"]) for item in page)
+        return existing
+
+    def remove_orphaned_embeddings(
+        self,
+        batch_size: int = 1000,
+        grace_seconds: float = 0.0,
+        dry_run: bool = False,
+    ) -> Tuple[int, int]:
+        """
+        Remove embedded fragments whose document does not exist, e.g. after a
+        removal that failed between deleting the metadata and the embeddings.
+        Orphans waste ANN search work and memory, and are discarded from
+        search results anyway. The embedding collection is scanned in pages
+        of `batch_size` fragments; the orphans found are checked again after
+        `grace_seconds`, such that fragments of documents whose metadata is
+        not yet visible to the scan (Milvus consistency) are spared.
+
+        Args:
+            batch_size (int): number of fragments per query and delete
+
+            grace_seconds (float): delay before the orphans are checked again
+
+            dry_run (bool): only count the orphans, do not remove them
+
+        Returns:
+            Tuple[int, int]: the number of scanned fragments and of (to be)
+                removed orphans
+        """
+        scanned = 0
+        candidates = {}
+        for page in self._iter_embedding_pages(batch_size):
+            scanned += len(page)
+            existing = self._existing_document_ids(
+                {item["meta_id"] for item in page}, batch_size
+            )
+            for item in page:
+                if str(item["meta_id"]) not in existing:
+                    candidates[item["pk"]] = str(item["meta_id"])
+        if len(candidates) == 0:
+            return scanned, 0
+
+        if grace_seconds > 0:
+            time.sleep(grace_seconds)
+        existing = self._existing_document_ids(
+            set(candidates.values()), batch_size
+        )
+        orphans = [
+            pk for pk, meta_id in candidates.items() if meta_id not in existing
+        ]
+        if dry_run or len(orphans) == 0:
+            return scanned, len(orphans)
         try:
-            expr = f"id in [{doc_id}]"
-            res = self._col_metadata.query(
-                expr=expr, output_fields=METADATA_FIELDS
-            )
-            if len(res) == 0:
-                return False
-            del_res = self._col_metadata.delete(expr)
-            self._col_metadata.flush()
-
-            res = self._col_embeddings.col.query(f'meta_id in ["{doc_id}"]')
-            if len(res) == 0:
-                return True
-            ids = [item["pk"] for item in res]
-            embedding_expr = f"pk in {ids}"
-            del_res = self._col_embeddings.col.delete(expr=embedding_expr)
-            self._col_embeddings.col.flush()
-            return True
+            for start in range(0, len(orphans), batch_size):
+                batch = orphans[start : start + batch_size]
+                self._col_embeddings.col.delete(expr=f"pk in {batch}")
+                if self._chunk_store is not None:
+                    self._chunk_store.delete(batch)
+            self._flush("embeddings")
         except MilvusException as e:
             logger.error(e)
             raise e
+        logger.info(f"Removed {len(orphans)} orphaned embeddings.")
+        return scanned, len(orphans)
+
+    def compact(self) -> None:
+        """
+        Compact the embedding collection, the metadata store and the chunk
+        store, reclaiming the memory and storage of removed entities.
+        """
+        if self._col_embeddings.col is not None:
+            compact_collection(self._col_embeddings.col)
+        self._metadata_store.compact()
+        if self._chunk_store is not None:
+            self._chunk_store.compact()
 
     def get_all_documents(
         self, doc_ids: Optional[list[str]] = None
@@ -618,34 +2407,70 @@ class VectorDatabaseAgentMilvus:
             List[Dict]: the metadata of all non-deleted documents in the form
                 [{{id}, {author}, {source}, ...}]
         """
-        try:
-            expr = VectorDatabaseAgentMilvus._build_meta_col_query_expr_for_all_documents(
-                doc_ids
-            )
-            result_metadata = self._col_metadata.query(
-                expr=expr, output_fields=METADATA_FIELDS
-            )
-            return result_metadata
-        except MilvusException as e:
-            logger.error(e)
-            raise e
+        return self._metadata_store.get(doc_ids, self._workspace)
 
-    def get_description(self, doc_ids: Optional[list[str]] = None):
-        def get_name(meta: dict[str, str]):
-            name_col = ["title", "name", "subject", "source"]
-            for col in name_col:
-                if meta[col] is not None and len(meta[col]) > 0:
-                    return meta[col]
-            return ""
-
-        expr = VectorDatabaseAgentMilvus._build_meta_col_query_expr_for_all_documents(
-            doc_ids
+    def get_documents_page(
+        self,
+        after_id: Optional[str] = None,
+        limit: int = 100,
+        doc_ids: Optional[list[str]] = None,
+        output_fields: Optional[list[str]] = None,
+    ) -> Tuple[list[dict], Optional[str]]:
+        """
+        Get one page of the non-deleted documents, in ascending id order, e.g.
+        to list the documents of a large store page by page.
+
+        Args:
+            after_id (Optional[str]): cursor returned with the previous page;
+                None for the first page
+
+            limit (int): maximum number of documents of the page
+
+            doc_ids (List[str] optional): the list of document ids, defines
+                documents scope within which the operation occurs
+
+            output_fields (Optional[List[str]]): metadata fields to return;
+                "id" is always returned. Defaults to all fields.
+
+        Returns:
+            Tuple[List[Dict], Optional[str]]: the metadata of the documents,
+                and the cursor of the next page, None after the last page
+        """
+        page = self._metadata_store.get_page(
+            after_id, limit, doc_ids, self._workspace, output_fields
         )
-        result = self._col_metadata.query(
-            expr=expr,
-            output_fields=METADATA_FIELDS,
+        cursor = str(page[-1]["id"]) if len(page) == limit else None
+        return page, cursor
+
+    def iter_all_documents(
+        self,
+        doc_ids: Optional[list[str]] = None,
+        output_fields: Optional[list[str]] = None,
+        batch_size: int = 1000,
+    ) -> Iterator[dict]:
+        """
+        Iterate over the non-deleted documents, fetching `batch_size`
+        documents per query, such that memory use and the size of each
+        response are bounded.
+
+        Args:
+            doc_ids (List[str] optional): the list of document ids, defines
+                documents scope within which the operation occurs
+
+            output_fields (Optional[List[str]]): metadata fields to return;
+                "id" is always returned. Defaults to all fields.
+
+            batch_size (int): number of documents per query
+
+        Returns:
+            Iterator[Dict]: the metadata of the documents, in ascending id
+                order
+        """
+        return self._metadata_store.iter_documents(
+            doc_ids, self._workspace, output_fields, batch_size
+        )
+
+    def get_description(self, doc_ids: Optional[list[str]] = None):
+        return build_description(
+            self.iter_all_documents(doc_ids, output_fields=DESCRIPTION_FIELDS)
         )
-        names = list(map(get_name, result))
-        names_set = set(names)
-        desc = f"This vector store contains the following articles: {names_set}"
-        return desc[:MAX_AGENT_DESC_LENGTH]
@@ -0,0 +1,936 @@
+from typing import Optional
+from collections.abc import Iterator
+import os
+import json
+import heapq
+import logging
+import threading
+
+from langchain.schema import Document
+
+import numpy as np
+
+from .vector_file import VectorFile
+from .metadata_store import output_fields_with_id
+from .vectorstore_agent import (
+    METADATA_FIELDS,
+    CHUNK_METADATA_FIELDS,
+    DESCRIPTION_FIELDS,
+    fingerprint_text,
+    build_description,
+    embed_queries,
+    exclude_chunks,
+    fingerprint_document,
+)
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_METADATA_COLLECTION_NAME = "DocumentMetadata1"
+DOCUMENT_EMBEDDINGS_COLLECTION_NAME = "DocumentEmbeddings1"
+
+INDEX_TYPES = ["FLAT", "HNSW"]
+METRIC_TYPES = ["L2", "IP"]
+DEFAULT_HNSW_INDEX_PARAMS = {"M": 16, "efConstruction": 200}
+DEFAULT_HNSW_SEARCH_PARAMS = {"ef": 64}
+
+# below this number of candidate vectors, exact search is used even if an HNSW
+# index is available; brute force is faster and exact for small sets
+HNSW_MIN_CANDIDATES = 5000
+
+
+class VectorDatabaseAgentLocal:
+    """
+    The VectorDatabaseAgentLocal class is an in-process alternative to
+    `VectorDatabaseAgentMilvus` that does not require a vector database server.
+    It keeps the embedded text fragments and the document metadata in process,
+    searches them using exact NumPy vector search or, optionally, an HNSW graph
+    index (requires `hnswlib`), and can persist its state to a directory. The
+    vectors are stored in a memory-mapped, optionally quantised `VectorFile`,
+    such that several processes opening the same directory share one
+    page-cached copy. It exposes the same interface as
+    `VectorDatabaseAgentMilvus`:
+
+    1. connect to (i.e., load or create) the store using `connect()`
+    2. get all documents in the store using `get_all_documents()`
+    3. save a number of fragments, usually from a specific document, using
+        `store_embeddings()`
+    4. do similarity search among all fragments using `similarity_search()`
+    5. remove a document from the store using `remove_document()`
+
+    Many documents can be stored or removed at once with
+    `store_embeddings_batch()` and `remove_documents()`.
+    """
+
+    def __init__(
+        self,
+        embedding_func: object,
+        connection_args: Optional[dict] = None,
+        embedding_collection_name: Optional[str] = None,
+        metadata_collection_name: Optional[str] = None,
+        index_type: str = "FLAT",
+        metric_type: str = "L2",
+        index_params: Optional[dict] = None,
+        search_params: Optional[dict] = None,
+        vector_dtype: str = "float32",
+        auto_flush: bool = True,
+    ):
+        """
+        Args:
+            embedding_func (object): Function used to embed the text, needs to
+                implement `embed_documents` and `embed_query`
+
+            connection_args (Optional[dict]): `{"path": <directory>}` to persist
+                the store in a directory; if no path is given, the store is
+                kept in memory only. `{"read_only": True}` opens an existing
+                store for searching only, e.g. in worker processes sharing the
+                store of a single writing process.
+
+            embedding_collection_name (Optional[str]): name of the embeddings
+                file(s) in the persistence directory
+
+            metadata_collection_name (Optional[str]): name of the metadata file
+                in the persistence directory
+
+            index_type (str): "FLAT" for exact search or "HNSW" for an
+                approximate graph index. Defaults to "FLAT".
+
+            metric_type (str): "L2" or "IP". Defaults to "L2".
+
+            index_params (Optional[dict]): HNSW build parameters, "M" and
+                "efConstruction"
+
+            search_params (Optional[dict]): HNSW search parameters, "ef"
+
+            vector_dtype (str): storage type of the vectors, "float32",
+                "float16" or "int8" (scalar quantisation with per-vector
+                scales). Defaults to "float32".
+
+            auto_flush (bool): rewrite the persisted metadata after each write
+                operation. If False, it is only written by `commit()`; texts
+                and vectors are always appended immediately.
+        """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(
+                f"Invalid index type {index_type}. Choose from {INDEX_TYPES}."
+            )
+        if metric_type not in METRIC_TYPES:
+            raise ValueError(
+                f"Invalid metric type {metric_type}. Choose from "
+                f"{METRIC_TYPES}."
+            )
+        self._embedding_func = embedding_func
+        self._path = (connection_args or {}).get("path")
+        self._read_only = (connection_args or {}).get("read_only", False)
+        self._vector_dtype = vector_dtype
+        self._embedding_name = (
+            embedding_collection_name or DOCUMENT_EMBEDDINGS_COLLECTION_NAME
+        )
+        self._metadata_name = (
+            metadata_collection_name or DOCUMENT_METADATA_COLLECTION_NAME
+        )
+        self._index_type = index_type
+        self._metric_type = metric_type
+        self._index_params = {
+            **DEFAULT_HNSW_INDEX_PARAMS,
+            **(index_params or {}),
+        }
+        self._search_params = {
+            **DEFAULT_HNSW_SEARCH_PARAMS,
+            **(search_params or {}),
+        }
+        self._auto_flush = auto_flush
+        self._pending_flush = False
+        self._lock = threading.RLock()
+        # incremented whenever documents are stored or removed, e.g. to
+        # invalidate cached descriptions
+        self.documents_version = 0
+        self._reset()
+
+    def _reset(self) -> None:
+        self._metadata: dict[int, dict] = {}
+        self._next_id = 1
+        self._texts: list[str] = []
+        self._chunk_metadata: list[dict] = []
+        self._vectors = VectorFile(
+            path=(
+                None
+                if self._path is None
+                else self._file(self._embedding_name, "")
+            ),
+            dtype=self._vector_dtype,
+            read_only=self._read_only,
+        )
+        self._hnsw = None
+
+    def connect(self) -> None:
+        """
+        Load the store from the persistence directory, if one is given and it
+        contains a store; otherwise, start with an empty store.
+        """
+        with self._lock:
+            if self._path is not None:
+                os.makedirs(self._path, exist_ok=True)
+            self._reset()
+            if self._path is not None:
+                self._load()
+            if self._index_type == "HNSW":
+                self._build_hnsw_index()
+
+    # persistence
+
+    def _file(self, name: str, suffix: str) -> str:
+        return os.path.join(self._path, f"{name}{suffix}")
+
+    def _load(self) -> None:
+        meta_file = self._file(self._metadata_name, ".json")
+        chunk_file = self._file(self._embedding_name, ".jsonl")
+        if os.path.exists(meta_file):
+            with open(meta_file, "r") as f:
+                stored = json.load(f)
+            self._next_id = stored["next_id"]
+            self._metadata = {int(k): v for k, v in stored["documents"].items()}
+        if os.path.exists(chunk_file):
+            with open(chunk_file, "r") as f:
+                chunks = [json.loads(line) for line in f]
+            self._texts = [chunk.pop("text") for chunk in chunks]
+            self._chunk_metadata = chunks
+        # an interrupted write can leave texts without vectors or vice versa
+        n_rows = min(len(self._texts), len(self._vectors))
+        self._texts = self._texts[:n_rows]
+        self._chunk_metadata = self._chunk_metadata[:n_rows]
+        # with deferred flushing, vectors can outlive the metadata of their
+        # document; never hand out their ids again
+        if n_rows > 0:
+            self._next_id = max(self._next_id, int(self._meta_ids.max()) + 1)
+        if len(self._vectors) > n_rows:
+            logger.warning(
+                f"Ignoring {len(self._vectors) - n_rows} vectors without text "
+                f"in {self._embedding_name}."
+            )
+
+    def _persist_metadata(self) -> None:
+        """
+        Write the metadata after a write operation, or defer writing until
+        `commit()` if auto flush is disabled.
+        """
+        self._pending_flush = True
+        self.documents_version += 1
+        if self._auto_flush:
+            self.commit()
+
+    def commit(self) -> None:
+        """
+        Write the metadata if it changed since the last write.
+        """
+        with self._lock:
+            if self._path is None or not self._pending_flush:
+                return
+            _write_json(
+                self._file(self._metadata_name, ".json"),
+                {
+                    "next_id": self._next_id,
+                    "documents": {str(k): v for k, v in self._metadata.items()},
+                },
+            )
+            self._pending_flush = False
+
+    def _append_texts(
+        self, texts: list[str], chunk_metadata: list[dict]
+    ) -> None:
+        if self._path is None:
+            return
+        with open(self._file(self._embedding_name, ".jsonl"), "a") as f:
+            for text, meta in zip(texts, chunk_metadata):
+                f.write(json.dumps({"text": text, **meta}) + "\n")
+
+    @property
+    def _meta_ids(self) -> np.ndarray:
+        return self._vectors.meta_ids[: len(self._texts)]
+
+    @property
+    def _alive(self) -> np.ndarray:
+        return self._vectors.alive[: len(self._texts)]
+
+    # index
+
+    def _build_hnsw_index(self) -> None:
+        """
+        Build the HNSW graph over all live vectors. Row numbers of the vectors
+        are used as graph labels.
+        """
+        try:
+            import hnswlib
+        except ImportError:
+            raise ImportError(
+                "The HNSW index of the local vector store requires hnswlib. "
+                "Please install it with `pip install hnswlib`."
+            )
+        if len(self._texts) == 0:
+            self._hnsw = None
+            return
+        space = "l2" if self._metric_type == "L2" else "ip"
+        capacity = max(len(self._texts), 1)
+        index = hnswlib.Index(space=space, dim=self._vectors.dim)
+        index.init_index(
+            max_elements=capacity,
+            M=self._index_params["M"],
+            ef_construction=self._index_params["efConstruction"],
+            allow_replace_deleted=False,
+        )
+        rows = np.flatnonzero(self._alive)
+        if len(rows) > 0:
+            index.add_items(self._vectors.vectors(rows), rows)
+        self._hnsw = index
+
+    def build_index(self) -> None:
+        """
+        (Re-)build the HNSW index over all live vectors, e.g. after many
+        documents were removed. No-op for exact (FLAT) search.
+        """
+        with self._lock:
+            if self._index_type == "HNSW":
+                self._build_hnsw_index()
+
+    def _add_to_hnsw_index(self, rows: np.ndarray) -> None:
+        if self._hnsw is None:
+            self._build_hnsw_index()
+            return
+        needed = self._hnsw.get_current_count() + len(rows)
+        if needed > self._hnsw.get_max_elements():
+            self._hnsw.resize_index(
+                max(needed, 2 * self._hnsw.get_max_elements())
+            )
+        self._hnsw.add_items(self._vectors.vectors(rows), rows)
+
+    # write operations
+
+    def _check_writable(self) -> None:
+        if self._read_only:
+            raise PermissionError(
+                f"The local vector store at {self._path} is opened read-only."
+            )
+
+    def store_embeddings(
+        self,
+        documents: list[Document],
+        doc_id: Optional[str] = None,
+        exclude: Optional[set[int]] = None,
+    ) -> str:
+        """
+        Embed and store documents in the store. If a document with identical
+        content is already stored, nothing is embedded and the id of the
+        stored document is returned.
+
+        Args:
+            documents (List[Documents]): documents array, usually from
+                DocumentReader.load_document, DocumentReader.document_from_pdf,
+                DocumentReader.document_from_txt
+
+            doc_id (Optional[str]): id of a stored document that the documents
+                revise. Only new or changed chunks are embedded, stale chunks
+                are removed, and the document keeps its id.
+
+            exclude (Optional[set[int]]): positions of chunks that are not
+                stored as fragments, e.g. near-duplicates of stored chunks;
+                the metadata and fingerprint of the document cover all chunks
+
+        Returns:
+            str: document id
+        """
+        if len(documents) == 0:
+            return
+        self._check_writable()
+        with self._lock:
+            meta_id, new_documents, registration = self._register_document(
+                documents, doc_id, exclude
+            )
+            self._append_documents(
+                new_documents, [meta_id] * len(new_documents)
+            )
+            self._complete_registrations([registration])
+            self._persist_metadata()
+        return str(meta_id)
+
+    def store_embeddings_batch(
+        self,
+        documents_list: list[list[Document]],
+        vectors_list: Optional[list[list[list[float]]]] = None,
+        exclude_list: Optional[list[Optional[set[int]]]] = None,
+    ) -> list[Optional[str]]:
+        """
+        Store several documents, embedding the chunks of all of them in one
+        call and writing the metadata once.
+
+        Args:
+            documents_list (List[List[Document]]): the chunks of each document
+
+            vectors_list (Optional[List[List[List[float]]]]): precomputed
+                vectors of the chunks of each document, e.g. restored from a
+                snapshot; the embedding function is not called
+
+            exclude_list (Optional[List[Optional[set[int]]]]): for each
+                document, positions of chunks that are not stored as
+                fragments, see `store_embeddings()`
+
+        Returns:
+            List[Optional[str]]: document id of each document, None for
+                documents without chunks
+        """
+        self._check_writable()
+        if exclude_list is None:
+            exclude_list = [None] * len(documents_list)
+        ids = []
+        new_documents = []
+        new_vectors = None if vectors_list is None else []
+        meta_ids = []
+        registrations = []
+        # document id by fingerprint of the documents of the batch
+        pending = {}
+        with self._lock:
+            for position, documents in enumerate(documents_list):
+                if len(documents) == 0:
+                    ids.append(None)
+                    continue
+                exclude = exclude_list[position]
+                meta_id, new, registration = self._register_document(
+                    documents, exclude=exclude, pending=pending
+                )
+                registrations.append(registration)
+                ids.append(str(meta_id))
+                new_documents.extend(new)
+                meta_ids.extend([meta_id] * len(new))
+                # new documents are either stored already or embedded as a
+                # whole
+                if vectors_list is not None and len(new) > 0:
+                    new_vectors.extend(
+                        exclude_chunks(vectors_list[position], exclude)
+                    )
+            self._append_documents(new_documents, meta_ids, new_vectors)
+            self._complete_registrations(registrations)
+            self._persist_metadata()
+        return ids
+
+    def _register_document(
+        self,
+        documents: list[Document],
+        doc_id: Optional[str] = None,
+        exclude: Optional[set[int]] = None,
+        pending: Optional[dict[str, int]] = None,
+    ) -> tuple[int, list[Document], Optional[tuple[dict, np.ndarray]]]:
+        """
+        Prepare the registration of a document: find the chunks that need to
+        be embedded and the stale chunks of the revised document, if any.
+        Chunks at the positions in `exclude` are not stored. Nothing is
+        changed until the registration is completed with
+        `_complete_registrations()` after the chunks are stored, such that a
+        failed embedding leaves no document without fragments behind.
+
+        Args:
+            pending (Optional[Dict[str, int]]): document id by fingerprint of
+                the documents registered in the same batch; updated
+
+        Returns:
+            Tuple[int, List[Document], Optional[Tuple[Dict, np.ndarray]]]:
+                the document id, the chunks that need to be embedded and the
+                registration (metadata and stale rows), None if the document
+                is already stored
+        """
+        fingerprint = fingerprint_document(documents)
+        if pending is not None and fingerprint in pending:
+            return pending[fingerprint], [], None
+        for meta in self._select_documents():
+            if meta.get("fingerprint") == fingerprint:
+                logger.info(f"Document is already stored with id {meta['id']}.")
+                return meta["id"], [], None
+        if doc_id is not None and int(doc_id) in self._metadata:
+            meta_id = int(doc_id)
+            stored_rows = np.flatnonzero(
+                self._alive & (self._meta_ids == meta_id)
+            )
+        else:
+            meta_id = self._next_id
+            self._next_id += 1
+            stored_rows = np.zeros(0, dtype=np.int64)
+        if pending is not None:
+            pending[fingerprint] = meta_id
+
+        # chunks whose text is already stored under this document keep their
+        # rows, all other stored chunks are stale
+        stored_hashes = {
+            fingerprint_text(self._texts[row]): row for row in stored_rows
+        }
+        new_documents = []
+        kept_rows = set()
+        for doc in exclude_chunks(documents, exclude):
+            row = stored_hashes.get(fingerprint_text(doc.page_content))
+            if row is None:
+                new_documents.append(doc)
+            else:
+                kept_rows.add(row)
+        stale_rows = np.array(
+            [row for row in stored_rows if row not in kept_rows],
+            dtype=np.int64,
+        )
+        if len(stored_rows) > 0:
+            logger.info(
+                f"Revised document {meta_id}: embedding {len(new_documents)} "
+                f"of {len(documents)} chunks."
+            )
+
+        meta = {
+            k: documents[0].metadata.get(k, "unknown")
+            for k in METADATA_FIELDS[1:]
+        }
+        meta["id"] = meta_id
+        meta["isDeleted"] = False
+        meta["fingerprint"] = fingerprint
+        return meta_id, new_documents, (meta, stale_rows)
+
+    def _complete_registrations(
+        self, registrations: list[Optional[tuple[dict, np.ndarray]]]
+    ) -> None:
+        """
+        Store the metadata of registered documents and delete the stale
+        chunks of revised documents, once their new chunks are stored.
+        """
+        for registration in registrations:
+            if registration is None:
+                continue
+            meta, stale_rows = registration
+            self._delete_rows(stale_rows)
+            self._metadata[meta["id"]] = meta
+
+    def _append_documents(
+        self,
+        documents: list[Document],
+        meta_ids: list[int],
+        vectors: Optional[list[list[float]]] = None,
+    ) -> None:
+        if len(documents) == 0:
+            return
+        texts = [doc.page_content for doc in documents]
+        vectors = np.asarray(
+            (
+                self._embedding_func.embed_documents(texts)
+                if vectors is None
+                else vectors
+            ),
+            dtype=np.float32,
+        )
+        chunk_metadata = [
+            {
+                k: doc.metadata[k]
+                for k in CHUNK_METADATA_FIELDS
+                if k in doc.metadata
+            }
+            for doc in documents
+        ]
+        self._append_texts(texts, chunk_metadata)
+        rows = self._vectors.append(
+            vectors, np.asarray(meta_ids, dtype=np.int64)
+        )
+        self._texts.extend(texts)
+        self._chunk_metadata.extend(chunk_metadata)
+        if self._index_type == "HNSW":
+            self._add_to_hnsw_index(rows)
+
+    def append_fragments(self, doc_id: str, documents: list[Document]) -> bool:
+        """
+        Embed chunks and add them to the fragments of a stored document, see
+        `VectorDatabaseAgentMilvus.append_fragments()`.
+
+        Returns:
+            bool: False if the document is not stored
+        """
+        self._check_writable()
+        with self._lock:
+            if int(doc_id) not in self._metadata:
+                return False
+            self._append_documents(documents, [int(doc_id)] * len(documents))
+        return True
+
+    def _delete_rows(self, rows: np.ndarray) -> None:
+        self._vectors.delete(rows)
+        if self._hnsw is not None:
+            for row in rows:
+                self._hnsw.mark_deleted(int(row))
+
+    def remove_document(
+        self, doc_id: str, doc_ids: Optional[list[str]] = None
+    ) -> bool:
+        """
+        Remove the document include meta data and its embeddings.
+
+        Args:
+            doc_id (str): the document to be deleted
+
+            doc_ids (Optional[list[str]]): the list of document ids, defines
+                documents scope within which remove operation occurs.
+
+        Returns:
+            bool: True if the document is deleted, False otherwise
+        """
+        return len(self.remove_documents([doc_id], doc_ids)) > 0
+
+    def remove_documents(
+        self, ids: list[str], doc_ids: Optional[list[str]] = None
+    ) -> list[str]:
+        """
+        Remove several documents, including meta data and embeddings, writing
+        the metadata once.
+
+        Args:
+            ids (list[str]): the documents to be deleted
+
+            doc_ids (Optional[list[str]]): the list of document ids, defines
+                documents scope within which remove operation occurs.
+
+        Returns:
+            list[str]: the ids of the deleted documents
+        """
+        if doc_ids is not None:
+            scope = set(map(str, doc_ids))
+            ids = [doc_id for doc_id in ids if str(doc_id) in scope]
+        if len(ids) == 0:
+            return []
+        self._check_writable()
+        with self._lock:
+            meta_ids = [
+                int(doc_id) for doc_id in ids if int(doc_id) in self._metadata
+            ]
+            if len(meta_ids) == 0:
+                return []
+            for meta_id in meta_ids:
+                del self._metadata[meta_id]
+            self._delete_rows(
+                np.flatnonzero(self._alive & np.isin(self._meta_ids, meta_ids))
+            )
+            self._persist_metadata()
+        return [str(meta_id) for meta_id in meta_ids]
+
+    # read operations
+
+    def _select_documents(
+        self, doc_ids: Optional[list[str]] = None
+    ) -> list[dict]:
+        documents = [
+            meta for meta in self._metadata.values() if not meta["isDeleted"]
+        ]
+        if doc_ids is not None:
+            scope = set(map(str, doc_ids))
+            documents = [meta for meta in documents if str(meta["id"]) in scope]
+        return documents
+
+    def _exact_search(
+        self, query: np.ndarray, rows: np.ndarray, k: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Brute-force search of the query vector among the given rows.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: rows and distances of the k nearest
+                neighbours, ordered by distance
+        """
+        return self._vectors.search(query, rows, k, self._metric_type)
+
+    def _hnsw_search(
+        self, query: np.ndarray, allowed: np.ndarray, k: int, ef: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        self._hnsw.set_ef(max(ef, k))
+        mask = allowed
+        try:
+            labels, distances = self._hnsw.knn_query(
+                query, k=k, filter=lambda label: bool(mask[label])
+            )
+        except RuntimeError:
+            # the graph walk found fewer than k allowed neighbours, which
+            # happens with restrictive document filters
+            return self._exact_search(query, np.flatnonzero(allowed), k)
+        return labels[0].astype(np.int64), distances[0]
+
+    def _search_scope(
+        self, doc_ids: Optional[list[str]] = None
+    ) -> tuple[list[dict], np.ndarray]:
+        """
+        Select the documents in scope and the rows of their fragments.
+
+        Returns:
+            Tuple[List[Dict], np.ndarray]: metadata of the documents and mask
+                of the rows that may be returned
+        """
+        documents = self._select_documents(doc_ids)
+        if len(self._texts) == 0 or len(documents) == 0:
+            return documents, np.zeros(len(self._texts), dtype=bool)
+        allowed = self._alive & np.isin(
+            self._meta_ids, [meta["id"] for meta in documents]
+        )
+        return documents, allowed
+
+    def _search_vectors(
+        self,
+        query_vectors: np.ndarray,
+        k: int,
+        allowed: np.ndarray,
+        search_params: Optional[dict] = None,
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        """
+        Search the nearest allowed rows of each query vector.
+
+        Returns:
+            List[Tuple[np.ndarray, np.ndarray]]: rows and distances per query
+        """
+        n_allowed = int(allowed.sum())
+        if n_allowed == 0 or k <= 0:
+            return [
+                (np.zeros(0, dtype=np.int64), np.zeros(0))
+                for _ in query_vectors
+            ]
+        if self._hnsw is not None and n_allowed >= HNSW_MIN_CANDIDATES:
+            ef = {**self._search_params, **(search_params or {})}["ef"]
+            return [
+                self._hnsw_search(query, allowed, min(k, n_allowed), ef)
+                for query in query_vectors
+            ]
+        if len(query_vectors) == 1:
+            return [
+                self._exact_search(query_vectors[0], np.flatnonzero(allowed), k)
+            ]
+        rows, distances = self._vectors.search_batch(
+            query_vectors, np.flatnonzero(allowed), k, self._metric_type
+        )
+        return list(zip(rows, distances))
+
+    def _search(
+        self,
+        query: str,
+        k: int,
+        doc_ids: Optional[list[str]] = None,
+        search_params: Optional[dict] = None,
+    ) -> tuple[list[dict], np.ndarray, np.ndarray]:
+        documents, allowed = self._search_scope(doc_ids)
+        if not allowed.any() or k <= 0:
+            return documents, np.zeros(0, dtype=np.int64), np.zeros(0)
+        query_vector = np.asarray(
+            self._embedding_func.embed_query(query), dtype=np.float32
+        )
+        rows, distances = self._search_vectors(
+            query_vector[None, :], k, allowed, search_params
+        )[0]
+        return documents, rows, distances
+
+    def _documents_from_rows(
+        self, rows: np.ndarray, documents: list[dict]
+    ) -> list[Document]:
+        metadata = {meta["id"]: meta for meta in documents}
+        return [
+            Document(
+                page_content=self._texts[row],
+                metadata={
+                    **metadata[int(self._meta_ids[row])],
+                    **self._chunk_metadata[row],
+                },
+            )
+            for row in rows
+        ]
+
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 3,
+        doc_ids: Optional[list[str]] = None,
+        search_params: Optional[dict] = None,
+    ) -> list[Document]:
+        """
+        Perform similarity search in the store according to the input query.
+
+        Args:
+            query (str): query string
+
+            k (int): the number of results to return
+
+            doc_ids (Optional[list[str]]): the list of document ids, do
+                similarity search across the specified documents
+
+            search_params (Optional[dict]): HNSW search parameters for this
+                query, e.g. `{"ef": 128}`
+
+        Returns:
+            List[Document]: search results
+        """
+        with self._lock:
+            documents, rows, _ = self._search(query, k, doc_ids, search_params)
+            return self._documents_from_rows(rows, documents)
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 3,
+        doc_ids: Optional[list[str]] = None,
+        search_params: Optional[dict] = None,
+    ) -> list[tuple[Document, float]]:
+        """
+        Perform similarity search and return the distance of each result to
+        the query, see `VectorDatabaseAgentMilvus.similarity_search_with_score()`.
+        Lower distances are closer.
+
+        Returns:
+            List[Tuple[Document, float]]: search results and their distances,
+                ordered by distance
+        """
+        with self._lock:
+            documents, rows, distances = self._search(
+                query, k, doc_ids, search_params
+            )
+            return list(
+                zip(
+                    self._documents_from_rows(rows, documents),
+                    map(float, distances),
+                )
+            )
+
+    def similarity_search_batch(
+        self,
+        queries: list[str],
+        k: int = 3,
+        doc_ids: Optional[list[str]] = None,
+        search_params: Optional[dict] = None,
+    ) -> list[list[Document]]:
+        """
+        Perform similarity search for several queries, scanning the vectors
+        once for all queries (exact search). The queries are embedded with
+        `embed_query()`, see `embed_queries()`.
+
+        Args:
+            queries (list[str]): query strings
+
+            k (int): the number of results to return per query
+
+            doc_ids (Optional[list[str]]): the list of document ids, do
+                similarity search across the specified documents
+
+            search_params (Optional[dict]): HNSW search parameters, e.g.
+                `{"ef": 128}`
+
+        Returns:
+            List[List[Document]]: search results of each query
+        """
+        if len(queries) == 0:
+            return []
+        query_vectors = np.asarray(
+            embed_queries(self._embedding_func, queries), dtype=np.float32
+        )
+        with self._lock:
+            documents, allowed = self._search_scope(doc_ids)
+            if not allowed.any() or k <= 0:
+                return [[] for _ in queries]
+            return [
+                self._documents_from_rows(rows, documents)
+                for rows, _ in self._search_vectors(
+                    query_vectors, k, allowed, search_params
+                )
+            ]
+
+    def iter_fragments(
+        self, doc_ids: Optional[list[str]] = None, batch_size: int = 1000
+    ) -> Iterator[list[dict]]:
+        """
+        Iterate over the embedded fragments, `batch_size` at a time, see
+        `VectorDatabaseAgentMilvus.iter_fragments()`.
+        """
+        with self._lock:
+            _, allowed = self._search_scope(doc_ids)
+            rows = np.flatnonzero(allowed)
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start : start + batch_size]
+            with self._lock:
+                vectors = self._vectors.vectors(batch)
+                page = [
+                    {
+                        "doc_id": str(int(self._meta_ids[row])),
+                        "text": self._texts[row],
+                        "vector": vector,
+                        "metadata": dict(self._chunk_metadata[row]),
+                    }
+                    for row, vector in zip(batch, vectors)
+                ]
+            yield page
+
+    def get_all_documents(
+        self, doc_ids: Optional[list[str]] = None
+    ) -> list[dict]:
+        """
+        Get all non-deleted documents from the store.
+
+        Args:
+            doc_ids (List[str] optional): the list of document ids, defines
+                documents scope within which the operation of obtaining all
+                documents occurs
+
+        Returns:
+            List[Dict]: the metadata of all non-deleted documents in the form
+                [{{id}, {author}, {source}, ...}]
+        """
+        with self._lock:
+            return [
+                {k: meta[k] for k in METADATA_FIELDS}
+                for meta in self._select_documents(doc_ids)
+            ]
+
+    def get_documents_page(
+        self,
+        after_id: Optional[str] = None,
+        limit: int = 100,
+        doc_ids: Optional[list[str]] = None,
+        output_fields: Optional[list[str]] = None,
+    ) -> tuple[list[dict], Optional[str]]:
+        """
+        Get one page of the non-deleted documents, in ascending id order, see
+        `VectorDatabaseAgentMilvus.get_documents_page()`.
+        """
+        fields = output_fields_with_id(output_fields)
+        with self._lock:
+            documents = self._select_documents(doc_ids)
+        if after_id is not None:
+            documents = [
+                meta for meta in documents if meta["id"] > int(after_id)
+            ]
+        documents = heapq.nsmallest(
+            limit, documents, key=lambda meta: meta["id"]
+        )
+        page = [{k: meta[k] for k in fields} for meta in documents]
+        cursor = str(page[-1]["id"]) if len(page) == limit else None
+        return page, cursor
+
+    def iter_all_documents(
+        self,
+        doc_ids: Optional[list[str]] = None,
+        output_fields: Optional[list[str]] = None,
+        batch_size: int = 1000,
+    ) -> Iterator[dict]:
+        """
+        Iterate over the non-deleted documents in ascending id order, see
+        `VectorDatabaseAgentMilvus.iter_all_documents()`.
+        """
+        cursor = None
+        while True:
+            page, cursor = self.get_documents_page(
+                cursor, batch_size, doc_ids, output_fields
+            )
+            yield from page
+            if cursor is None:
+                return
+
+    def get_description(self, doc_ids: Optional[list[str]] = None):
+        return build_description(
+            self.iter_all_documents(doc_ids, output_fields=DESCRIPTION_FIELDS)
+        )
+
+
+def _write_json(path: str, data: dict) -> None:
+    """
+    Write json atomically, such that a crash does not leave a truncated file.
+    """
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
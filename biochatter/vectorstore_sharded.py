@@ -0,0 +1,640 @@
+"""
+Sharded vector store: a facade over several vector store agents (shards),
+e.g. `VectorDatabaseAgentMilvus` agents connected to different Milvus nodes,
+with the interface of a single agent. Documents are routed to one shard by a
+hash of the document fingerprint; searches are scattered to all shards in
+parallel and the top-k results of the shards are merged by distance.
+
+Document ids of the facade are composed of the shard number and the id of the
+document in its shard, `"<shard>:<id>"`, since the shards assign document ids
+independently.
+"""
+
+from typing import Tuple, Callable, Optional
+from functools import partial
+from collections.abc import Iterator
+import heapq
+import logging
+import concurrent.futures
+
+from langchain.schema import Document
+
+from .vectorstore_agent import (
+    DESCRIPTION_FIELDS,
+    build_description,
+    fingerprint_document,
+)
+
+logger = logging.getLogger(__name__)
+
+SHARD_SEPARATOR = ":"
+
+
+def shard_document_id(shard: int, doc_id: str) -> str:
+    """
+    Compose the document id of the facade from the shard number and the id of
+    the document in the shard.
+    """
+    return f"{shard}{SHARD_SEPARATOR}{doc_id}"
+
+
+def split_document_id(doc_id: str) -> Optional[Tuple[int, str]]:
+    """
+    Split a document id of the facade into the shard number and the id of the
+    document in the shard.
+
+    Returns:
+        Optional[Tuple[int, str]]: shard number and document id, None if the
+            id is not a document id of the facade
+    """
+    shard, separator, local_id = str(doc_id).partition(SHARD_SEPARATOR)
+    if separator == "" or not shard.isdigit() or local_id == "":
+        return None
+    return int(shard), local_id
+
+
+class VectorDatabaseAgentSharded:
+    """
+    The VectorDatabaseAgentSharded class distributes the documents over
+    several vector store agents (shards) with the interface of
+    `VectorDatabaseAgentMilvus`, and exposes the same interface:
+
+    1. connect all shards using `connect()`
+    2. get all documents of all shards using `get_all_documents()`
+    3. save a number of fragments, usually from a specific document, in the
+        shard of the document using `store_embeddings()`
+    4. do similarity search among the fragments of all shards using
+        `similarity_search()`
+    5. remove a document from its shard using `remove_document()`
+
+    The shard of a document is chosen by a hash of its fingerprint, such that
+    identical documents are stored in the same shard and deduplicated there;
+    a revision of a document (`store_embeddings(documents, doc_id)`) stays in
+    the shard of the revised document. Shards need to implement
+    `similarity_search_with_score()` with comparable distances, i.e. use the
+    same embedding function and metric. With a `timeout`, searches return
+    the results of the shards that responded in time; shards that did not are
+    logged and left out of the results. Write operations and document
+    listings always wait for all shards.
+    """
+
+    def __init__(
+        self,
+        shards: list,
+        timeout: Optional[float] = None,
+        max_workers: Optional[int] = None,
+    ):
+        """
+        Args:
+            shards (list): the vector store agents of the shards, e.g.
+                `VectorDatabaseAgentMilvus` agents with the connection args of
+                the nodes. The order of the shards is part of the document
+                ids and must not change.
+
+            timeout (Optional[float]): seconds to wait for the search results
+                of each shard; None waits for all shards
+
+            max_workers (Optional[int]): number of threads calling the shards;
+                defaults to twice the number of shards, such that shards that
+                timed out do not block the following searches
+        """
+        if len(shards) == 0:
+            raise ValueError("Please provide at least one shard.")
+        self._shards = list(shards)
+        self._timeout = timeout
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers or 2 * len(self._shards),
+            thread_name_prefix="vectorstore-shard",
+        )
+
+    @property
+    def shards(self) -> list:
+        return list(self._shards)
+
+    @property
+    def documents_version(self) -> int:
+        """
+        Incremented whenever documents are stored or removed in a shard, e.g.
+        to invalidate cached descriptions.
+        """
+        return sum(
+            getattr(shard, "documents_version", 0) for shard in self._shards
+        )
+
+    def shard_of(self, documents: list[Document]) -> int:
+        """
+        Get the shard in which new documents are stored.
+
+        Args:
+            documents (List[Document]): the chunks of a document
+
+        Returns:
+            int: the shard number
+        """
+        return int(fingerprint_document(documents)[:16], 16) % len(self._shards)
+
+    def _scatter(
+        self, calls: dict[int, Callable], timeout: Optional[float] = None
+    ) -> dict:
+        """
+        Call the shards in parallel.
+
+        Args:
+            calls (Dict[int, Callable]): the call of each shard
+
+            timeout (Optional[float]): seconds to wait for the shards; the
+                results of shards that did not respond in time are left out
+
+        Returns:
+            Dict: the result of each shard that responded in time
+        """
+        futures = {
+            shard: self._executor.submit(call) for shard, call in calls.items()
+        }
+        _, pending = concurrent.futures.wait(futures.values(), timeout=timeout)
+        results = {}
+        for shard, future in futures.items():
+            if future in pending:
+                future.cancel()
+                logger.warning(
+                    f"Shard {shard} did not respond within {timeout} s, its "
+                    "results are missing."
+                )
+                continue
+            results[shard] = future.result()
+        return results
+
+    def _split_ids(self, doc_ids: list[str]) -> dict[int, list[str]]:
+        """
+        Group document ids of the facade by shard. Ids that are not document
+        ids of the facade cannot refer to a document and are dropped.
+        """
+        ids = {}
+        for doc_id in doc_ids:
+            split = split_document_id(doc_id)
+            if split is None or split[0] >= len(self._shards):
+                continue
+            ids.setdefault(split[0], []).append(split[1])
+        return ids
+
+    def _scopes(
+        self, doc_ids: Optional[list[str]] = None
+    ) -> dict[int, Optional[list[str]]]:
+        """
+        Get the document scope of each shard that has documents in scope.
+        """
+        if doc_ids is None:
+            return {shard: None for shard in range(len(self._shards))}
+        return self._split_ids(doc_ids)
+
+    @staticmethod
+    def _sharded_metadata(shard: int, meta: dict) -> dict:
+        return {**meta, "id": shard_document_id(shard, meta["id"])}
+
+    def connect(self) -> None:
+        """
+        Connect all shards.
+        """
+        self._scatter(
+            {shard: agent.connect for shard, agent in enumerate(self._shards)}
+        )
+
+    def close(self) -> None:
+        """
+        Close the shards that hold connections.
+        """
+        for agent in self._shards:
+            if hasattr(agent, "close"):
+                agent.close()
+
+    def commit(self) -> None:
+        """
+        Commit the deferred write operations of all shards.
+        """
+        self._scatter(
+            {shard: agent.commit for shard, agent in enumerate(self._shards)}
+        )
+
+    def build_index(self) -> None:
+        """
+        (Re)build the vector index of all shards.
+        """
+        self._scatter(
+            {
+                shard: agent.build_index
+                for shard, agent in enumerate(self._shards)
+            }
+        )
+
+    def store_embeddings(
+        self,
+        documents: list[Document],
+        doc_id: Optional[str] = None,
+        exclude: Optional[set[int]] = None,
+    ) -> str:
+        """
+        Store documents in the shard of the document.
+
+        Args:
+            documents (List[Documents]): documents array, usually from
+                DocumentReader.load_document, DocumentReader.document_from_pdf,
+                DocumentReader.document_from_txt
+
+            doc_id (Optional[str]): id of a stored document that the documents
+                revise; the revision is stored in the shard of this document
+
+            exclude (Optional[set[int]]): positions of chunks that are not
+                stored as fragments
+
+        Returns:
+            str: document id
+        """
+        if len(documents) == 0:
+            return
+        if doc_id is None:
+            shard, local_id = self.shard_of(documents), None
+        else:
+            shard, local_id = self._split(doc_id)
+        return shard_document_id(
+            shard,
+            self._shards[shard].store_embeddings(documents, local_id, exclude),
+        )
+
+    def _split(self, doc_id: str) -> Tuple[int, str]:
+        split = split_document_id(doc_id)
+        if split is None or split[0] >= len(self._shards):
+            raise ValueError(f"Invalid document id {doc_id}.")
+        return split
+
+    def append_fragments(self, doc_id: str, documents: list[Document]) -> bool:
+        """
+        Embed chunks and add them to the fragments of a stored document, in
+        the shard of the document.
+
+        Returns:
+            bool: False if the document is not stored
+        """
+        shard, local_id = self._split(doc_id)
+        return self._shards[shard].append_fragments(local_id, documents)
+
+    def store_embeddings_batch(
+        self,
+        documents_list: list[list[Document]],
+        vectors_list: Optional[list[list[list[float]]]] = None,
+        exclude_list: Optional[list[Optional[set[int]]]] = None,
+    ) -> list[Optional[str]]:
+        """
+        Store several documents, with one batch per shard; the shards store
+        their batches in parallel.
+
+        Args:
+            documents_list (List[List[Document]]): the chunks of each document
+
+            vectors_list (Optional[List[List[List[float]]]]): precomputed
+                vectors of the chunks of each document
+
+            exclude_list (Optional[List[Optional[set[int]]]]): for each
+                document, positions of chunks that are not stored as
+                fragments
+
+        Returns:
+            List[Optional[str]]: document id of each document, None for
+                documents without chunks
+        """
+        positions = {}  # shard -> positions of its documents in the batch
+        for position, documents in enumerate(documents_list):
+            if len(documents) > 0:
+                positions.setdefault(self.shard_of(documents), []).append(
+                    position
+                )
+        results = self._scatter(
+            {
+                shard: partial(
+                    self._shards[shard].store_embeddings_batch,
+                    [documents_list[position] for position in shard_positions],
+                    (
+                        None
+                        if vectors_list is None
+                        else [
+                            vectors_list[position]
+                            for position in shard_positions
+                        ]
+                    ),
+                    (
+                        None
+                        if exclude_list is None
+                        else [
+                            exclude_list[position]
+                            for position in shard_positions
+                        ]
+                    ),
+                )
+                for shard, shard_positions in positions.items()
+            }
+        )
+        ids = [None] * len(documents_list)
+        for shard, shard_positions in positions.items():
+            for position, local_id in zip(shard_positions, results[shard]):
+                ids[position] = shard_document_id(shard, local_id)
+        return ids
+
+    def remove_document(
+        self, doc_id: str, doc_ids: Optional[list[str]] = None
+    ) -> bool:
+        """
+        Remove the document include meta data and its embeddings.
+
+        Args:
+            doc_id (str): the document to be deleted
+
+            doc_ids (Optional[list[str]]): the list of document ids, defines
+                documents scope within which remove operation occurs.
+
+        Returns:
+            bool: True if the document is deleted, False otherwise
+        """
+        return len(self.remove_documents([doc_id], doc_ids)) > 0
+
+    def remove_documents(
+        self, ids: list[str], doc_ids: Optional[list[str]] = None
+    ) -> list[str]:
+        """
+        Remove several documents from their shards; the shards remove their
+        documents in parallel.
+
+        Args:
+            ids (list[str]): the documents to be deleted
+
+            doc_ids (Optional[list[str]]): the list of document ids, defines
+                documents scope within which remove operation occurs.
+
+        Returns:
+            list[str]: the ids of the deleted documents
+        """
+        if doc_ids is not None:
+            scope = set(map(str, doc_ids))
+            ids = [doc_id for doc_id in ids if str(doc_id) in scope]
+        results = self._scatter(
+            {
+                shard: partial(self._shards[shard].remove_documents, local_ids)
+                for shard, local_ids in self._split_ids(ids).items()
+            }
+        )
+        return [
+            shard_document_id(shard, local_id)
+            for shard in sorted(results)
+            for local_id in results[shard]
+        ]
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 3,
+        doc_ids: Optional[list[str]] = None,
+        search_params: Optional[dict] = None,
+    ) -> list[Tuple[Document, float]]:
+        """
+        Search the shards in parallel and merge their top-k results by
+        distance.
+
+        Args:
+            query (str): query string
+
+            k (int): the number of results to return
+
+            doc_ids (Optional[list[str]]): the list of document ids, do
+                similarity search across the specified documents; only the
+                shards of these documents are searched
+
+            search_params (Optional[dict]): search parameters for this query,
+                e.g. `{"ef": 128}`
+
+        Returns:
+            List[Tuple[Document, float]]: search results and their distances,
+                ordered by distance
+        """
+        return self._search_batch([query], k, doc_ids, search_params)[0]
+
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 3,
+        doc_ids: Optional[list[str]] = None,
+        search_params: Optional[dict] = None,
+    ) -> list[Document]:
+        """
+        Perform similarity search in all shards according to the input query,
+        see `similarity_search_with_score()`.
+
+        Args:
+            query (str): query string
+
+            k (int): the number of results to return
+
+            doc_ids (Optional[list[str]]): the list of document ids, do
+                similarity search across the specified documents
+
+            search_params (Optional[dict]): search parameters for this query,
+                e.g. `{"ef": 128}`
+
+        Returns:
+            List[Document]: search results
+        """
+        return [
+            doc
+            for doc, _ in self.similarity_search_with_score(
+                query, k, doc_ids, search_params
+            )
+        ]
+
+    def similarity_search_batch(
+        self,
+        queries: list[str],
+        k: int = 3,
+        doc_ids: Optional[list[str]] = None,
+        search_params: Optional[dict] = None,
+    ) -> list[list[Document]]:
+        """
+        Perform similarity search for several queries; each shard searches the
+        queries one after another, the shards in parallel.
+
+        Args:
+            queries (list[str]): query strings
+
+            k (int): the number of results to return per query
+
+            doc_ids (Optional[list[str]]): the list of document ids, do
+                similarity search across the specified documents
+
+            search_params (Optional[dict]): search parameters, e.g.
+                `{"ef": 128}`
+
+        Returns:
+            List[List[Document]]: search results of each query
+        """
+        if len(queries) == 0:
+            return []
+        return [
+            [doc for doc, _ in results]
+            for results in self._search_batch(
+                queries, k, doc_ids, search_params
+            )
+        ]
+
+    def _search_batch(
+        self,
+        queries: list[str],
+        k: int,
+        doc_ids: Optional[list[str]],
+        search_params: Optional[dict],
+    ) -> list[list[Tuple[Document, float]]]:
+        def search(agent, scope: Optional[list[str]]) -> list:
+            return [
+                agent.similarity_search_with_score(
+                    query, k, scope, search_params
+                )
+                for query in queries
+            ]
+
+        results = self._scatter(
+            {
+                shard: partial(search, self._shards[shard], scope)
+                for shard, scope in self._scopes(doc_ids).items()
+            },
+            self._timeout,
+        )
+        return [
+            self._merge(
+                {shard: hits[position] for shard, hits in results.items()}, k
+            )
+            for position in range(len(queries))
+        ]
+
+    def _merge(
+        self, results: dict[int, list[Tuple[Document, float]]], k: int
+    ) -> list[Tuple[Document, float]]:
+        """
+        Merge the results of the shards to the k results of lowest distance,
+        with the document ids of the facade. Ties are broken by shard number
+        and rank in the shard.
+        """
+        top = heapq.nsmallest(
+            k,
+            (
+                (distance, shard, rank, doc)
+                for shard, hits in results.items()
+                for rank, (doc, distance) in enumerate(hits)
+            ),
+            key=lambda hit: hit[:3],
+        )
+        return [
+            (
+                Document(
+                    page_content=doc.page_content,
+                    metadata=self._sharded_metadata(shard, doc.metadata),
+                ),
+                distance,
+            )
+            for distance, shard, _, doc in top
+        ]
+
+    def iter_fragments(
+        self, doc_ids: Optional[list[str]] = None, batch_size: int = 1000
+    ) -> Iterator[list[dict]]:
+        """
+        Iterate over the embedded fragments of all shards, one shard after
+        another, see `VectorDatabaseAgentMilvus.iter_fragments()`.
+        """
+        for shard, scope in sorted(self._scopes(doc_ids).items()):
+            for page in self._shards[shard].iter_fragments(scope, batch_size):
+                yield [
+                    {
+                        **fragment,
+                        "doc_id": shard_document_id(shard, fragment["doc_id"]),
+                    }
+                    for fragment in page
+                ]
+
+    def get_all_documents(
+        self, doc_ids: Optional[list[str]] = None
+    ) -> list[dict]:
+        """
+        Get all non-deleted documents of all shards.
+
+        Args:
+            doc_ids (List[str] optional): the list of document ids, defines
+                documents scope within which the operation of obtaining all
+                documents occurs
+
+        Returns:
+            List[Dict]: the metadata of all non-deleted documents in the form
+                [{{id}, {author}, {source}, ...}]
+        """
+        results = self._scatter(
+            {
+                shard: partial(self._shards[shard].get_all_documents, scope)
+                for shard, scope in self._scopes(doc_ids).items()
+            }
+        )
+        return [
+            self._sharded_metadata(shard, meta)
+            for shard in sorted(results)
+            for meta in results[shard]
+        ]
+
+    def get_documents_page(
+        self,
+        after_id: Optional[str] = None,
+        limit: int = 100,
+        doc_ids: Optional[list[str]] = None,
+        output_fields: Optional[list[str]] = None,
+    ) -> tuple[list[dict], Optional[str]]:
+        """
+        Get one page of the non-deleted documents, ordered by shard and by id
+        within each shard, see `VectorDatabaseAgentMilvus.get_documents_page()`.
+        """
+        if after_id is None:
+            start, after = 0, None
+        else:
+            split = split_document_id(after_id)
+            if split is None:
+                raise ValueError(f"Invalid cursor {after_id}.")
+            start, after = split
+        scopes = self._scopes(doc_ids)
+        page = []
+        for shard in sorted(shard for shard in scopes if shard >= start):
+            items, _ = self._shards[shard].get_documents_page(
+                after if shard == start else None,
+                limit - len(page),
+                scopes[shard],
+                output_fields,
+            )
+            page.extend(self._sharded_metadata(shard, meta) for meta in items)
+            if len(page) == limit:
+                break
+        cursor = page[-1]["id"] if len(page) == limit else None
+        return page, cursor
+
+    def iter_all_documents(
+        self,
+        doc_ids: Optional[list[str]] = None,
+        output_fields: Optional[list[str]] = None,
+        batch_size: int = 1000,
+    ) -> Iterator[dict]:
+        """
+        Iterate over the non-deleted documents of all shards, see
+        `get_documents_page()`.
+        """
+        cursor = None
+        while True:
+            page, cursor = self.get_documents_page(
+                cursor, batch_size, doc_ids, output_fields
+            )
+            yield from page
+            if cursor is None:
+                return
+
+    def get_description(self, doc_ids: Optional[list[str]] = None):
+        return build_description(
+            self.iter_all_documents(doc_ids, output_fields=DESCRIPTION_FIELDS)
+        )
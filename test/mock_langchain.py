@@ -31,10 +31,13 @@ class Milvus(object):
         collection_name: Optional[str] = "default",
         connection_args: Optional[dict[str, Any]] = None,
         documents: Optional[list[Document]] = None,
+        **kwargs: Any,
     ) -> None:
         self.documents: dict[list[Document]] = (
             {} if documents is None else {uuid.uuid4().hex: documents}
         )
+        self.fields = ["pk", "text", "vector", "meta_id"]
+        self.search_params = kwargs.get("search_params")
         self.col = Mock()
         self.col.query = Mock()
         self.col.query.return_value = []
@@ -55,7 +58,7 @@ class Milvus(object):
             self.documents.pop(id)
 
     def similarity_search(
-        self, query: str, k: int, expr: Optional[str] = None
+        self, query: str, k: int, expr: Optional[str] = None, **kwargs: Any
     ) -> list[Document]:
         from random import randint
 
@@ -77,4 +80,35 @@ class Milvus(object):
         embedding: Any,
         **kwargs: Any,
     ):
-        return Milvus(embedding_function=embedding, documents=documents)
+        return Milvus(
+            embedding_function=embedding, documents=documents, **kwargs
+        )
+
+
+class BagOfWordsEmbeddings:
+    """
+    Deterministic embeddings for tests: hashed bag-of-words vectors, such that
+    texts sharing words are close to each other.
+    """
+
+    def __init__(self, dim: int = 64):
+        self.dim = dim
+        self.n_calls = 0
+
+    def _embed(self, text: str) -> list[float]:
+        import hashlib
+
+        vector = [0.0] * self.dim
+        for word in text.lower().split():
+            digest = hashlib.md5(word.encode()).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dim] += 1.0
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.n_calls += 1
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        self.n_calls += 1
+        return self._embed(text)
@@ -10,12 +10,12 @@ def has_collection(name, using: Optional[str] = None):
 
 class CollectionSchema(object):
     def __init__(self, fields: list[FieldSchema]):
-        pass
+        self.fields = fields
 
 
 class CollectionRecord(object):
-    def __init__(self, key: str) -> None:
-        self.primary_keys = [key]
+    def __init__(self, keys: list[str]) -> None:
+        self.primary_keys = keys
 
 
 class Collection(object):
@@ -27,6 +27,7 @@ class Collection(object):
         **kwargs,
     ):
         self.data: dict[str, list] = {}
+        self.schema = schema or CollectionSchema(fields=[])
 
     def query(self, expr: str, **kwargs):
         return [{"id": id} for id in self.data.keys()]
@@ -47,6 +48,15 @@ class Collection(object):
     def load(self):
         pass
 
+    def release(self):
+        pass
+
+    def has_partition(self, partition_name: str) -> bool:
+        return False
+
+    def create_partition(self, partition_name: str):
+        pass
+
     def drop(self):
         pass
 
@@ -55,7 +65,11 @@ class Collection(object):
         return []
 
     def create_index(
-        self, field_name: str, index_params: dict[str, Any], using: str
+        self,
+        field_name: str,
+        index_params: Optional[dict[str, Any]] = None,
+        using: str = "default",
+        **kwargs,
     ):
         pass
 
@@ -66,9 +80,11 @@ class Collection(object):
         timeout: Optional[float] = None,
         **kwargs,
     ):
-        id = uuid.uuid4().hex
-        self.data[id] = data
-        return CollectionRecord(id)
+        # one record per row of the column-based data, with INT64 auto ids
+        ids = [uuid.uuid4().int >> 65 for _ in data[0]]
+        for id in ids:
+            self.data[id] = data
+        return CollectionRecord(ids)
 
 
 class Connections(object):
@@ -82,6 +98,9 @@ class Connections(object):
     ):
         pass
 
+    def disconnect(self, alias: str):
+        pass
+
 
 connections = Connections()
 
@@ -90,6 +109,9 @@ class Utility:
     def has_collection(self, name: str, using: Optional[str] = None):
         return True
 
+    def get_server_version(self, using: Optional[str] = None):
+        return "v2.2.8"
+
 
 utility = Utility()
 
@@ -253,3 +253,17 @@ def test_agent_selector_vectorstore():
         "What is reported in the literature about the BRAF V600E mutation?"
     )
     assert result.answer == "vectorstore"
+
+
+def test_agent_selector_reuse():
+    agent_selector = create_agent_selector(str(RagAgentModeEnum.KG))
+    db_agent = agent_selector.rag_agents[0]
+    # descriptions are obtained per question, not at construction
+    db_agent.get_description.assert_not_called()
+    agent_selector.execute("How many nodes do we have in our graph?")
+    graph = agent_selector._graph
+    result = agent_selector.execute("How many edges do we have?")
+    assert result.answer == "kg"
+    assert agent_selector._graph is graph
+    # the logs of the previous question are discarded
+    assert agent_selector.get_logs().count("Final Generated Response") == 1
@@ -0,0 +1,92 @@
+from unittest.mock import patch
+import os
+import sqlite3
+
+import pytest
+
+from biochatter.chunk_store import SQLiteChunkStore
+from biochatter.metadata_store import SQLITE_MAX_IN_VALUES
+
+
+@pytest.mark.parametrize("compression", ["zstd", "zlib", "none"])
+def test_sqlite_chunk_store(compression):
+    store = SQLiteChunkStore(compression=compression, page_size=100)
+    store.connect()
+    texts = [f"chunk {i} " * 10 for i in range(5)]
+    ids = store.put(texts, [{"meta_id": str(i)} for i in range(5)])
+    assert ids == [1, 2, 3, 4, 5]
+    # 60 to 70 characters per chunk, one chunk per page
+    pages = store._connection.execute("SELECT COUNT(*) FROM chunks_pages")
+    assert pages.fetchone()[0] == 5
+
+    chunks = store.get([ids[4], ids[0], 999])
+    assert chunks == {
+        ids[0]: (texts[0], {"meta_id": "0"}),
+        ids[4]: (texts[4], {"meta_id": "4"}),
+    }
+    assert store.put([]) == []
+    assert store.get([]) == {}
+
+
+def test_sqlite_chunk_store_pages():
+    store = SQLiteChunkStore(page_size=1000)
+    store.connect()
+    ids = store.put([f"chunk {i}" for i in range(10)])
+    assert store.get(ids[3:4]) == {ids[3]: ("chunk 3", {})}
+
+    def count_pages():
+        pages = store._connection.execute("SELECT COUNT(*) FROM chunks_pages")
+        return pages.fetchone()[0]
+
+    assert count_pages() == 1
+    assert store.delete(ids[:5] + [999]) == 5
+    # the page is kept for the remaining chunks
+    assert count_pages() == 1
+    assert list(store.get(ids)) == ids[5:]
+    assert store.delete(ids[5:]) == 5
+    assert count_pages() == 0
+    assert store.delete([]) == 0
+    store.compact()
+
+
+def test_sqlite_chunk_store_many_ids():
+    # more ids than host parameters of one query, on small pages
+    store = SQLiteChunkStore(page_size=100)
+    store.connect()
+    store._connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+    n = 2 * SQLITE_MAX_IN_VALUES + 10
+    ids = store.put([f"chunk {i}" for i in range(n)])
+    chunks = store.get(ids)
+    assert len(chunks) == n
+    assert chunks[ids[-1]] == (f"chunk {n - 1}", {})
+    assert store.delete(ids) == n
+    assert store.get(ids) == {}
+    pages = store._connection.execute("SELECT COUNT(*) FROM chunks_pages")
+    assert pages.fetchone()[0] == 0
+
+
+def test_sqlite_chunk_store_persistence(tmp_path):
+    path = os.path.join(tmp_path, "store", "chunks.db")
+    store = SQLiteChunkStore(path, compression="zlib")
+    store.connect()
+    ids = store.put(["first", "second"])
+    store.flush()
+
+    # pages are read with the compression they were written with
+    store = SQLiteChunkStore(path, compression="zstd")
+    store.connect()
+    ids += store.put(["third"])
+    assert [text for text, _ in store.get(ids).values()] == [
+        "first",
+        "second",
+        "third",
+    ]
+
+
+def test_sqlite_chunk_store_compression():
+    with pytest.raises(ValueError):
+        SQLiteChunkStore(compression="lz4")
+    with patch.dict("sys.modules", {"zstandard": None}):
+        with pytest.raises(ImportError):
+            SQLiteChunkStore()
+        SQLiteChunkStore(compression="zlib")
@@ -0,0 +1,196 @@
+import pytest
+
+from biochatter.dedup import (
+    MinHash,
+    NearDuplicateIndex,
+    shingles,
+    lsh_bands,
+)
+from biochatter.vectorstore import DocumentEmbedder
+from biochatter.vectorstore_agent import fingerprint_text
+from biochatter.vectorstore_local import VectorDatabaseAgentLocal
+from .mock_langchain import Document, BagOfWordsEmbeddings
+
+LICENCE = (
+    "This article is licensed under a Creative Commons Attribution 4.0 "
+    "International License, which permits use, sharing, adaptation, "
+    "distribution and reproduction in any medium or format, as long as you "
+    "give appropriate credit to the original authors and the source."
+)
+
+
+def chunk(text: str, source: str = "test/paper.pdf") -> Document:
+    return Document(page_content=text, metadata={"source": source})
+
+
+def paper(i: int, licence: str = LICENCE) -> list[Document]:
+    return [
+        chunk(
+            f"Paper {i} studies the regulation of gene {i} in tissue {i} "
+            f"and reports {i} novel variants of the receptor {i}.",
+            f"test/{i}.pdf",
+        ),
+        chunk(licence, f"test/{i}.pdf"),
+    ]
+
+
+def test_shingles_and_bands():
+    assert shingles("A b c d") == {"a b c", "b c d"}
+    assert shingles("a  B") == {"a b"}
+    assert shingles(" ") == set()
+    bands, rows = lsh_bands(0.9, 128)
+    assert bands * rows <= 128
+    assert 1 - (1 - 0.9**rows) ** bands >= 0.99
+    assert lsh_bands(1.0, 128) == (1, 128)
+
+    minhash = MinHash(num_perm=64)
+    assert minhash.signature("") is None
+    signature = minhash.signature(LICENCE)
+    assert signature.shape == (64,)
+    assert (signature == MinHash(num_perm=64).signature(LICENCE)).all()
+
+
+def connected(**kwargs) -> NearDuplicateIndex:
+    index = NearDuplicateIndex(**kwargs)
+    index.connect()
+    return index
+
+
+def test_filter():
+    index = connected(threshold=0.8)
+    assert index.filter(paper(1)) == {}
+    index.add("1", paper(1))
+    assert len(index) == 2
+
+    # the licence with a changed word is a near-duplicate
+    licence = LICENCE.replace("original", "first")
+    assert index.filter(paper(2, licence)) == {1: fingerprint_text(LICENCE)}
+    assert index.find(licence)[:2] == ("1", fingerprint_text(LICENCE))
+    assert index.find(licence)[2] >= 0.8
+    assert index.find(paper(3)[0].page_content) is None
+
+    # the canonical chunks of a revised document are not considered
+    assert index.filter(paper(1), doc_id="1") == {}
+
+    second = paper(2, licence)
+    index.add("2", second[:1], [(second[1], fingerprint_text(LICENCE))])
+    assert index.links("2") == {
+        fingerprint_text(licence): fingerprint_text(LICENCE)
+    }
+    # the chunks linked to the canonical chunks of a removed document
+    orphans = index.remove("1")
+    assert [(doc.page_content, doc.metadata) for doc in orphans["2"]] == [
+        (licence, {"source": "test/2.pdf"})
+    ]
+    assert index.links("2") == {}
+    assert len(index) == 1
+    assert index.find(licence) is None
+    assert index.document_of(fingerprint_text(LICENCE)) is None
+
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(threshold=0)
+
+
+def test_filter_batch():
+    index = connected()
+    documents = paper(1)
+    documents.append(chunk(LICENCE))
+    filtered = index.filter_batch([documents, paper(2), []])
+    # repeated within the document and across the batch
+    assert filtered == [
+        {2: fingerprint_text(LICENCE)},
+        {1: fingerprint_text(LICENCE)},
+        {},
+    ]
+    assert len(index) == 0
+
+
+def test_links_persistence(tmp_path):
+    path = str(tmp_path / "links.db")
+    index = connected(path=path)
+    index.add("1", paper(1))
+    index.add("2", paper(2)[:1], [(paper(2)[1], fingerprint_text(LICENCE))])
+    # chunks of a document stored again are not linked to its own chunks
+    index.add("1", [], [(paper(1)[1], fingerprint_text(LICENCE))])
+    index.close()
+
+    index = connected(path=path)
+    assert index.links("2") == {
+        fingerprint_text(LICENCE): fingerprint_text(LICENCE)
+    }
+    assert index.links("1") == {}
+    # the canonical chunk is no longer indexed
+    index.add("1", paper(1)[:1])
+    assert index.pop_orphaned_links([fingerprint_text("other")]) == {}
+    orphans = index.pop_orphaned_links()
+    assert [doc.page_content for doc in orphans["2"]] == [LICENCE]
+    assert index.links("2") == {}
+
+
+def test_document_embedder(tmp_path):
+    embedder = DocumentEmbedder(
+        vector_db_vendor="local",
+        embeddings=BagOfWordsEmbeddings(),
+        connection_args={"path": str(tmp_path)},
+        near_duplicates=NearDuplicateIndex(threshold=0.8),
+    )
+    embedder.connect()
+    host = embedder.database_host
+    index = embedder.near_duplicates
+
+    def licence_documents() -> list[int]:
+        results = host.similarity_search("Creative Commons licence", k=10)
+        return [
+            doc.metadata["id"] for doc in results if doc.page_content == LICENCE
+        ]
+
+    first = embedder._store_embeddings(paper(1))
+    second = embedder._store_embeddings(paper(2))
+    # the licence is embedded once
+    assert len(host._texts) == 3
+    assert licence_documents() == [int(first)]
+    assert index.links(second) == {
+        fingerprint_text(LICENCE): fingerprint_text(LICENCE)
+    }
+
+    # a document of near-duplicate chunks only is stored without fragments
+    only = embedder._store_embeddings([chunk(LICENCE, "test/only.pdf")])
+    assert only not in [first, second]
+    assert len(host._texts) == 3
+    assert host.get_all_documents()[-1]["source"] == "test/only.pdf"
+    # storing a document again changes nothing
+    assert embedder._store_embeddings(paper(1)) == first
+    ids = embedder.save_chunks_batch([paper(3), paper(4), paper(1), []])
+    assert ids[2] == first
+    assert ids[3] is None
+    assert len(host._texts) == 5
+    assert len(host.get_all_documents()) == 5
+
+    # the linked licence chunks are embedded for one of the documents when
+    # the document of the canonical chunk is removed
+    assert embedder.remove_document(first)
+    canonical = index.document_of(fingerprint_text(LICENCE))
+    assert canonical in [second, only, ids[0], ids[1]]
+    assert licence_documents() == [int(canonical)]
+    assert embedder.remove_document(canonical)
+    assert len(licence_documents()) == 1
+    assert licence_documents()[0] != int(canonical)
+
+    # a revision replaces the canonical chunks of the document
+    revised = embedder._store_embeddings(
+        [chunk("a revised chunk of the third paper"), chunk(LICENCE)],
+        doc_id=ids[0],
+    )
+    assert revised == ids[0]
+    assert index.find(paper(3)[0].page_content) is None
+    assert index.find("a revised chunk of the third paper")[0] == revised
+
+
+def test_add_fragments():
+    store = VectorDatabaseAgentLocal(embedding_func=BagOfWordsEmbeddings())
+    store.connect()
+    ids = store.store_embeddings_batch([paper(1), paper(2)])
+    index = connected()
+    assert index.add_fragments(store, batch_size=3) == 4
+    assert len(index) == 3
+    assert index.find(LICENCE)[0] == ids[0]
@@ -0,0 +1,237 @@
+from unittest.mock import MagicMock
+import time
+import threading
+
+from langchain.schema import Document
+import pytest
+
+import numpy as np
+
+from biochatter.embeddings import (
+    DynamicBatcher,
+    LocalEmbeddings,
+    CoalescingEmbeddings,
+)
+from biochatter.vectorstore import DocumentEmbedder, LocalDocumentEmbedder
+
+VOCABULARY = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + [
+    "gene",
+    "protein",
+    "cell",
+    "ribosome",
+    "translation",
+    "the",
+    "of",
+    "a",
+]
+
+
+@pytest.fixture(scope="module")
+def model_dir(tmp_path_factory):
+    """
+    Tiny randomly initialised BERT model, saved like a hub model.
+    """
+    torch = pytest.importorskip("torch")
+    from transformers import BertConfig, BertModel, BertTokenizer
+
+    path = tmp_path_factory.mktemp("model")
+    with open(path / "vocab.txt", "w") as f:
+        f.write("\n".join(VOCABULARY))
+    BertTokenizer(str(path / "vocab.txt")).save_pretrained(str(path))
+    torch.manual_seed(0)
+    config = BertConfig(
+        vocab_size=len(VOCABULARY),
+        hidden_size=16,
+        num_hidden_layers=1,
+        num_attention_heads=2,
+        intermediate_size=32,
+    )
+    BertModel(config).save_pretrained(str(path))
+    return str(path)
+
+
+def test_dynamic_batcher_coalesces_concurrent_requests():
+    batches = []
+
+    def embed_batch(texts):
+        batches.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    batcher = DynamicBatcher(embed_batch, max_batch_size=8, max_latency_ms=200)
+    futures = [batcher.submit(["x" * i]) for i in range(1, 6)]
+    assert [f.result() for f in futures] == [[[float(i)]] for i in range(1, 6)]
+    assert len(batches) == 1
+    batcher.close()
+
+
+def test_dynamic_batcher_splits_large_requests():
+    embed_batch = MagicMock(side_effect=lambda texts: [[0.0]] * len(texts))
+    batcher = DynamicBatcher(embed_batch, max_batch_size=4, max_latency_ms=0)
+    assert len(batcher.embed(["a"] * 10)) == 10
+    assert [len(c.args[0]) for c in embed_batch.call_args_list] == [4, 4, 2]
+    assert batcher.embed([]) == []
+    batcher.close()
+    with pytest.raises(RuntimeError):
+        batcher.submit(["a"])
+
+
+def test_dynamic_batcher_latency_bound():
+    batcher = DynamicBatcher(
+        lambda texts: [[0.0]] * len(texts), max_batch_size=64, max_latency_ms=20
+    )
+    start = time.monotonic()
+    batcher.embed(["a"])
+    assert time.monotonic() - start < 1.0
+    batcher.close()
+
+
+def test_dynamic_batcher_propagates_errors():
+    def embed_batch(texts):
+        raise ValueError("model failed")
+
+    batcher = DynamicBatcher(embed_batch)
+    with pytest.raises(ValueError, match="model failed"):
+        batcher.embed(["a"])
+    batcher.close()
+
+
+def test_local_embeddings(model_dir):
+    embeddings = LocalEmbeddings(model_dir, max_latency_ms=50)
+    texts = ["gene", "the ribosome of a cell", "protein translation"]
+    vectors = embeddings.embed_documents(texts)
+    assert np.array(vectors).shape == (3, 16)
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0, atol=1e-5)
+    # batching, padding and sorting do not change the embedding of a text
+    for text, vector in zip(texts, vectors):
+        assert np.allclose(embeddings.embed_query(text), vector, atol=1e-5)
+
+    # concurrent queries are answered from shared batches
+    results = {}
+
+    def query(text):
+        results[text] = embeddings.embed_query(text)
+
+    threads = [threading.Thread(target=query, args=(t,)) for t in texts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for text, vector in zip(texts, vectors):
+        assert np.allclose(results[text], vector, atol=1e-5)
+    embeddings.close()
+
+
+def test_local_embeddings_quantized(model_dir):
+    embeddings = LocalEmbeddings(model_dir, quantize=True, pooling="cls")
+    vectors = embeddings.embed_documents(["gene", "protein"])
+    assert np.array(vectors).shape == (2, 16)
+    embeddings.close()
+
+
+def test_local_embeddings_invalid_arguments():
+    with pytest.raises(ValueError):
+        LocalEmbeddings(backend="tensorflow")
+    with pytest.raises(ValueError):
+        LocalEmbeddings(pooling="max")
+
+
+def test_local_document_embedder(model_dir):
+    rag_agent = LocalDocumentEmbedder(
+        model=model_dir, vector_db_vendor="local", connection_args={}
+    )
+    rag_agent.connect()
+    doc_id = rag_agent.save_document(
+        [
+            Document(
+                page_content="the ribosome of a cell",
+                metadata={"source": "test"},
+            )
+        ]
+    )
+    results = rag_agent.database_host.similarity_search("ribosome", k=1)
+    assert str(results[0].metadata["id"]) == doc_id
+    rag_agent.embeddings.close()
+
+
+class SlowEmbeddings:
+    """
+    Remote embedding service stand-in that counts requests.
+    """
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.requests = []
+
+    def embed_documents(self, texts):
+        self.requests.append(list(texts))
+        time.sleep(self.delay)
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def run_concurrently(func, args):
+    results = [None] * len(args)
+
+    def run(i):
+        results[i] = func(args[i])
+
+    threads = [
+        threading.Thread(target=run, args=(i,)) for i in range(len(args))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_coalescing_embeddings_batches_queries():
+    remote = SlowEmbeddings()
+    embeddings = CoalescingEmbeddings(remote, max_latency_ms=100)
+    texts = ["a", "bb", "ccc", "bb", "dddd"]
+    results = run_concurrently(embeddings.embed_query, texts)
+    assert results == [[float(len(text))] for text in texts]
+    # one request, and the duplicate query was only embedded once
+    assert len(remote.requests) == 1
+    assert sorted(remote.requests[0]) == ["a", "bb", "ccc", "dddd"]
+    embeddings.close()
+
+
+def test_coalescing_embeddings_singleflight_without_batching():
+    remote = SlowEmbeddings(delay=0.2)
+    embeddings = CoalescingEmbeddings(remote, batch_queries=False)
+    results = run_concurrently(embeddings.embed_query, ["a"] * 5 + ["bb"])
+    assert results == [[1.0]] * 5 + [[2.0]]
+    assert sorted(remote.requests) == [["a"], ["bb"]]
+    # completed queries are not cached
+    embeddings.embed_query("a")
+    assert len(remote.requests) == 3
+
+
+def test_coalescing_embeddings_errors_and_documents():
+    remote = MagicMock()
+    remote.embed_documents.side_effect = ConnectionError("service down")
+    embeddings = CoalescingEmbeddings(remote, max_latency_ms=0)
+    with pytest.raises(ConnectionError):
+        embeddings.embed_query("a")
+
+    remote.embed_documents.side_effect = lambda texts: [[1.0]] * len(texts)
+    assert embeddings.embed_query("a") == [1.0]
+    assert embeddings.embed_documents(["x", "y", "x"]) == [[1.0]] * 3
+    remote.embed_documents.assert_called_with(["x", "y"])
+    embeddings.close()
+
+
+def test_document_embedder_coalesce_queries():
+    remote = SlowEmbeddings()
+    rag_agent = DocumentEmbedder(
+        embeddings=remote,
+        vector_db_vendor="local",
+        connection_args={},
+        coalesce_queries=True,
+    )
+    assert isinstance(rag_agent.embeddings, CoalescingEmbeddings)
+    assert rag_agent.database_host._embedding_func is rag_agent.embeddings
+    rag_agent.embeddings.close()
@@ -0,0 +1,61 @@
+import pytest
+
+from biochatter.index_tuning import (
+    format_sweep,
+    sweep_search_params,
+    select_search_params,
+)
+from biochatter.vectorstore_local import VectorDatabaseAgentLocal
+from .mock_langchain import Document, BagOfWordsEmbeddings
+
+WORDS = [
+    "protein",
+    "gene",
+    "pathway",
+    "cell",
+    "disease",
+    "drug",
+    "target",
+    "variant",
+    "tissue",
+    "expression",
+]
+
+
+@pytest.fixture
+def hnsw_store(monkeypatch):
+    monkeypatch.setattr("biochatter.vectorstore_local.HNSW_MIN_CANDIDATES", 0)
+    store = VectorDatabaseAgentLocal(
+        embedding_func=BagOfWordsEmbeddings(dim=32),
+        index_type="HNSW",
+        index_params={"M": 4, "efConstruction": 8},
+    )
+    store.connect()
+    docs = [
+        Document(
+            page_content=" ".join(
+                WORDS[(i * j + j) % len(WORDS)] for j in range(1, 6)
+            )
+            + f" fragment{i}",
+            metadata={"title": f"doc {i // 10}"},
+        )
+        for i in range(200)
+    ]
+    store.store_embeddings_batch([docs[i : i + 10] for i in range(0, 200, 10)])
+    return store
+
+
+def test_sweep_search_params(hnsw_store):
+    queries = ["protein pathway", "drug target disease", "gene expression"]
+    results = sweep_search_params(
+        hnsw_store, queries, [{"ef": 1}, {"ef": 200}], k=5
+    )
+    assert [r["search_params"] for r in results] == [{"ef": 1}, {"ef": 200}]
+    assert results[1]["recall"] == 1.0
+    assert all(r["mean_latency_ms"] > 0 for r in results)
+    assert select_search_params(results, min_recall=1.0) in [
+        {"ef": 1},
+        {"ef": 200},
+    ]
+    assert select_search_params(results, min_recall=1.1) is None
+    assert "recall" in format_sweep(results)
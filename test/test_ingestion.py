@@ -0,0 +1,159 @@
+import json
+import shutil
+
+import pytest
+
+from biochatter.ingestion import BulkIngestor, find_documents, main
+from biochatter.vectorstore import DocumentEmbedder
+from .mock_langchain import BagOfWordsEmbeddings
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    docs = tmp_path / "docs"
+    (docs / "sub").mkdir(parents=True)
+    shutil.copy("test/bc_summary.pdf", docs / "bc_summary.pdf")
+    shutil.copy("test/bc_summary.txt", docs / "sub" / "bc_summary.txt")
+    (docs / "broken.pdf").write_bytes(b"not a pdf")
+    (docs / "notes.md").write_text("ignored")
+    return docs
+
+
+@pytest.fixture
+def embedder(tmp_path):
+    embedder = DocumentEmbedder(
+        vector_db_vendor="local",
+        embeddings=BagOfWordsEmbeddings(),
+        connection_args={"path": str(tmp_path / "store")},
+        chunk_size=500,
+    )
+    embedder.connect()
+    return embedder
+
+
+def test_find_documents(corpus):
+    files = find_documents(str(corpus))
+    assert [f.split("/")[-1] for f in files] == [
+        "bc_summary.pdf",
+        "broken.pdf",
+        "bc_summary.txt",
+    ]
+    assert len(find_documents(str(corpus), recursive=False)) == 2
+
+
+@pytest.mark.parametrize("n_workers", [0, 1])
+def test_ingest_directory(corpus, embedder, tmp_path, n_workers):
+    checkpoint = str(tmp_path / "checkpoint.json")
+    ingestor = BulkIngestor(
+        embedder, n_workers=n_workers, batch_size=10, checkpoint_path=checkpoint
+    )
+    report = ingestor.ingest_directory(str(corpus))
+    assert len(report.ingested) == 2
+    assert list(report.failed) == [str(corpus / "broken.pdf")]
+    assert report.n_chunks > 2
+    assert len(embedder.get_all_documents()) == 2
+
+    with open(checkpoint) as f:
+        stored = json.load(f)
+    assert len(stored["done"]) == 2
+    assert len(stored["failed"]) == 1
+
+    # resume: completed files are skipped, failed ones retried
+    ingestor = BulkIngestor(
+        embedder, n_workers=n_workers, checkpoint_path=checkpoint
+    )
+    report = ingestor.ingest_directory(str(corpus))
+    assert len(report.skipped) == 2
+    assert len(report.ingested) == 0
+    assert len(report.failed) == 1
+    assert len(embedder.get_all_documents()) == 2
+
+
+def test_failed_batch_is_retried_by_file(corpus, tmp_path):
+    embeddings = BagOfWordsEmbeddings()
+    embedder = DocumentEmbedder(
+        vector_db_vendor="local",
+        embeddings=embeddings,
+        connection_args={"path": str(tmp_path / "store")},
+        chunk_size=500,
+    )
+    embedder.connect()
+    embed_documents = embeddings.embed_documents
+    calls = []
+
+    def fail_once(texts):
+        calls.append(texts)
+        if len(calls) == 1:
+            raise RuntimeError("embedding service unavailable")
+        return embed_documents(texts)
+
+    embeddings.embed_documents = fail_once
+    ingestor = BulkIngestor(
+        embedder,
+        n_workers=0,
+        batch_size=10000,
+        checkpoint_path=str(tmp_path / "checkpoint.json"),
+    )
+    report = ingestor.ingest_directory(str(corpus))
+    # one batch, then one retry per file
+    assert len(calls) == 3
+    assert len(report.ingested) == 2
+    host = embedder.database_host
+    for doc_id in report.ingested.values():
+        assert len(next(host.iter_fragments([doc_id]))) > 0
+    assert len(embedder.get_all_documents()) == 2
+
+
+def test_file_without_fragments_is_not_done(corpus, embedder, monkeypatch):
+    monkeypatch.setattr(
+        embedder.database_host, "iter_fragments", lambda doc_ids, n: iter([])
+    )
+    report = BulkIngestor(embedder, n_workers=0).ingest_directory(str(corpus))
+    assert report.ingested == {}
+    assert len(report.failed) == 3
+    assert (
+        "No fragments stored" in report.failed[str(corpus / "bc_summary.pdf")]
+    )
+
+
+def test_cli(corpus, tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(
+        "biochatter.vectorstore.OpenAIEmbeddings",
+        lambda **kwargs: BagOfWordsEmbeddings(),
+    )
+    main(
+        [
+            str(corpus),
+            "--vector-db-vendor",
+            "local",
+            "--store-path",
+            str(tmp_path / "cli_store"),
+            "--workers",
+            "0",
+        ]
+    )
+    output = capsys.readouterr().out
+    assert "ingested=2" in output
+    assert "failed: " in output
+
+    # the near-duplicate index is filled from the existing store
+    main(
+        [
+            str(corpus),
+            "--vector-db-vendor",
+            "local",
+            "--store-path",
+            str(tmp_path / "cli_store"),
+            "--workers",
+            "0",
+            "--near-duplicate-threshold",
+            "0.9",
+            "--near-duplicate-db",
+            str(tmp_path / "links.db"),
+        ]
+    )
+    assert "ingested=2" in capsys.readouterr().out
+
+    with pytest.raises(SystemExit):
+        main([str(corpus), "--vector-db-vendor", "local"])
+    assert "requires --store-path" in capsys.readouterr().err
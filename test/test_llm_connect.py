@@ -119,6 +119,14 @@ def test_openai_catches_authentication_error(mock_openai):
     assert not success
 
 
+def test_ragagent_selector_is_reused():
+    convo = GptConversation(model_name="gpt-4o", prompts={})
+    agents = [MagicMock(mode="kg"), MagicMock(mode="vectorstore")]
+    selector = convo._get_ragagent_selector(agents)
+    assert convo._get_ragagent_selector(list(agents)) is selector
+    assert convo._get_ragagent_selector(agents[:1]) is not selector
+
+
 def test_azure_raises_request_error():
     convo = AzureGptConversation(
         model_name="gpt-35-turbo",
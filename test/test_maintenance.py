@@ -0,0 +1,119 @@
+from unittest.mock import Mock, patch
+import time
+
+import pytest
+
+from biochatter.maintenance import MaintenanceTask, run_maintenance, main
+from biochatter.metadata_store import SQLiteMetadataStore
+from biochatter.vectorstore_agent import VectorDatabaseAgentMilvus
+from .mock_langchain import BagOfWordsEmbeddings
+from .test_vectorstore_agent import (
+    mock_milvus,
+    mocked_dcn_pdf_splitted_texts,
+    mocked_bc_summary_pdf_splitted_texts,
+)
+
+
+@pytest.fixture
+def agent():
+    with mock_milvus():
+        agent = VectorDatabaseAgentMilvus(
+            embedding_func=BagOfWordsEmbeddings(),
+            metadata_store=SQLiteMetadataStore(),
+        )
+        agent.connect()
+        ids = [
+            agent.store_embeddings(docs)
+            for docs in [
+                mocked_dcn_pdf_splitted_texts,
+                mocked_bc_summary_pdf_splitted_texts,
+            ]
+        ]
+        # embedding collection with a fragment of each document, a fragment
+        # of a removed document and a fragment with a broken document id
+        col = agent._col_embeddings.col
+        col.query.side_effect = lambda expr, **kwargs: (
+            [
+                {"pk": "d", "meta_id": "999"},
+                {"pk": "a", "meta_id": ids[0]},
+                {"pk": "b", "meta_id": ids[1]},
+                {"pk": "c", "meta_id": "x"},
+            ]
+            if expr == 'pk > ""'
+            else []
+        )
+        yield agent, ids
+
+
+def test_remove_orphaned_embeddings(agent):
+    agent, ids = agent
+    col = agent._col_embeddings.col
+    assert agent.remove_orphaned_embeddings(dry_run=True) == (4, 2)
+    col.delete.assert_not_called()
+
+    assert agent.remove_orphaned_embeddings(batch_size=4) == (4, 2)
+    col.delete.assert_called_once_with(expr="pk in ['c', 'd']")
+    # the scan continued after the full first page
+    assert col.query.call_args.kwargs["expr"] == 'pk > "d"'
+
+
+def test_run_maintenance(agent):
+    agent, ids = agent
+    store = agent._metadata_store
+    store._connection.execute(
+        "UPDATE documents SET isDeleted = 1 WHERE id = ?", [int(ids[1])]
+    )
+    col = agent._col_embeddings.col
+
+    report = run_maintenance(agent, dry_run=True)
+    assert report.purged_documents == [ids[1]]
+    # the fragment of the soft-deleted document counts as orphan
+    assert report.orphaned_embeddings == 3
+    assert not report.compacted
+    assert len(store.purge_deleted(dry_run=True)) == 1
+
+    report = run_maintenance(agent)
+    assert report.purged_documents == [ids[1]]
+    assert (report.scanned_embeddings, report.orphaned_embeddings) == (4, 3)
+    assert report.compacted
+    col.delete.assert_called_once_with(expr="pk in ['b', 'c', 'd']")
+    col.compact.assert_called_once()
+    col.wait_for_compaction_completed.assert_called_once()
+    assert store.purge_deleted() == []
+    assert [str(doc["id"]) for doc in agent.get_all_documents()] == ids[:1]
+
+
+def test_maintenance_task():
+    agent = Mock()
+    agent.purge_deleted_documents.return_value = []
+    agent.remove_orphaned_embeddings.side_effect = [
+        ConnectionError("server down"),
+        (10, 0),
+        (10, 0),
+    ]
+    task = MaintenanceTask(agent, interval=0.01, dry_run=True)
+    task.start()
+    for _ in range(100):
+        if task.last_report is not None:
+            break
+        time.sleep(0.01)
+    task.stop()
+    assert task.last_report.scanned_embeddings == 10
+    agent.compact.assert_not_called()
+    _, kwargs = agent.remove_orphaned_embeddings.call_args
+    assert kwargs["dry_run"]
+
+
+def test_main(capsys):
+    with mock_milvus(), patch(
+        "biochatter.maintenance.run_maintenance", return_value="report"
+    ) as run:
+        main(["--dry-run", "--batch-size", "100"])
+    _, kwargs = run.call_args
+    assert kwargs == {
+        "batch_size": 100,
+        "grace_seconds": 10.0,
+        "dry_run": True,
+        "compact": True,
+    }
+    assert "report" in capsys.readouterr().out
@@ -0,0 +1,110 @@
+import sqlite3
+
+import pytest
+
+from biochatter.metadata_store import (
+    METADATA_FIELDS,
+    SQLITE_MAX_IN_VALUES,
+    SQLiteMetadataStore,
+)
+
+
+def test_sqlite_metadata_store(tmp_path):
+    path = str(tmp_path / "metadata.db")
+    store = SQLiteMetadataStore(path)
+    store.connect()
+    assert store.has_fingerprints
+    ids = store.insert(
+        [
+            {"title": "BioCypher", "source": "bc.pdf", "fingerprint": "a"},
+            {"title": "DCN", "source": "dcn.pdf"},
+        ]
+    )
+    assert len(ids) == 2
+
+    docs = store.get()
+    assert [str(doc["id"]) for doc in docs] == ids
+    assert list(docs[0].keys()) == METADATA_FIELDS
+    assert docs[0]["title"] == "BioCypher"
+    assert docs[1]["author"] == "unknown"
+    assert [doc["title"] for doc in store.get([ids[1]])] == ["DCN"]
+    assert store.find_by_fingerprint(["a", "b"]) == {"a": ids[0]}
+
+    assert store.delete([ids[0], "12345"]) == [ids[0]]
+    assert store.delete([ids[0]]) == []
+    assert store.find_by_fingerprint(["a"]) == {}
+    store.flush()
+
+    # reopen
+    store = SQLiteMetadataStore(path)
+    store.connect()
+    assert [str(doc["id"]) for doc in store.get()] == [ids[1]]
+    # ids are not reused
+    assert int(store.insert([{"title": "new"}])[0]) > int(ids[1])
+
+
+def test_sqlite_metadata_store_workspaces():
+    store = SQLiteMetadataStore()
+    store.connect()
+    a = store.insert([{"title": "A", "fingerprint": "f"}], workspace="a")
+    b = store.insert([{"title": "B", "fingerprint": "f"}], workspace="b")
+    assert [doc["title"] for doc in store.get()] == ["A", "B"]
+    assert [doc["title"] for doc in store.get(workspace="b")] == ["B"]
+    assert store.get(a, workspace="b") == []
+    assert store.find_by_fingerprint(["f"], workspace="a") == {"f": a[0]}
+    assert store.delete(a, workspace="b") == []
+    assert store.delete(a + b, workspace="b") == b
+
+
+def test_sqlite_metadata_store_pages():
+    store = SQLiteMetadataStore()
+    store.connect()
+    ids = store.insert([{"title": f"doc {i}"} for i in range(5)])
+    store.insert([{"title": "other"}], workspace="b")
+    store.delete([ids[1]])
+
+    page = store.get_page(limit=2, output_fields=["title"])
+    assert page == [
+        {"id": int(ids[0]), "title": "doc 0"},
+        {"id": int(ids[2]), "title": "doc 2"},
+    ]
+    page = store.get_page(after_id=ids[2], limit=2, doc_ids=ids)
+    assert [str(doc["id"]) for doc in page] == [ids[3], ids[4]]
+    assert list(page[0].keys()) == METADATA_FIELDS
+    assert store.get_page(after_id=ids[4], limit=2, doc_ids=ids) == []
+
+    titles = [doc["title"] for doc in store.iter_documents(batch_size=2)]
+    assert titles == ["doc 0", "doc 2", "doc 3", "doc 4", "other"]
+    assert [
+        doc["title"]
+        for doc in store.iter_documents(workspace="b", batch_size=1)
+    ] == ["other"]
+
+    with pytest.raises(ValueError):
+        store.get_page(output_fields=["title", "embedding"])
+
+
+def test_sqlite_metadata_store_many_ids():
+    store = SQLiteMetadataStore()
+    store.connect()
+    # the limit of host parameters of older SQLite versions
+    store._connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+    n = 2 * SQLITE_MAX_IN_VALUES + 10
+    ids = store.insert(
+        [{"title": f"doc {i}", "fingerprint": f"f{i}"} for i in range(n)]
+    )
+    # more ids than host parameters in one query
+    scope = ids[::-1] + [str(n + 100)]
+    assert [str(doc["id"]) for doc in store.get(scope)] == ids
+    assert len(store.find_by_fingerprint([f"f{i}" for i in range(n)])) == n
+    page = store.get_page(after_id=ids[1], limit=n, doc_ids=scope)
+    assert [str(doc["id"]) for doc in page] == ids[2:]
+    page = store.get_page(after_id=ids[1], limit=SQLITE_MAX_IN_VALUES + 1)
+    assert [str(doc["id"]) for doc in page] == ids[2 : SQLITE_MAX_IN_VALUES + 3]
+    assert store.delete(scope) == ids
+    assert store.get() == []
+
+    ids = store.insert([{"title": f"doc {i}"} for i in range(n)])
+    store._connection.execute("UPDATE documents SET isDeleted = 1")
+    assert store.purge_deleted(batch_size=n) == ids
+    assert store.purge_deleted() == []
@@ -0,0 +1,116 @@
+from unittest.mock import Mock, patch
+
+from pymilvus import DataType, FieldSchema
+from pymilvus import CollectionSchema as MilvusCollectionSchema
+import pytest
+
+from biochatter.migration import main, migrate_embeddings_collection
+from biochatter.vectorstore_agent import (
+    DOCUMENT_EMBEDDINGS_COLLECTION_NAME,
+    embeddings_schema_version,
+)
+from .mock_pymilvus import Collection
+from .test_vectorstore_agent import mock_milvus
+
+
+def v1_collection(rows: list[dict]) -> Collection:
+    """
+    Embeddings collection created by LangChain: VARCHAR primary keys and
+    document ids.
+    """
+    schema = MilvusCollectionSchema(
+        fields=[
+            FieldSchema("meta_id", DataType.VARCHAR, max_length=65_535),
+            FieldSchema("text", DataType.VARCHAR, max_length=65_535),
+            FieldSchema(
+                "pk", DataType.VARCHAR, is_primary=True, max_length=65_535
+            ),
+            FieldSchema("vector", DataType.FLOAT_VECTOR, dim=2),
+        ]
+    )
+    source = Collection("embeddings", schema=schema)
+    source.partitions = [Mock()]
+    source.partitions[0].name = "_default"
+
+    def query(expr, output_fields, partition_names, limit):
+        # the fragments of the range in reverse order, as Milvus 2.2 does
+        # not return the smallest primary keys first
+        bounds = expr.split('"')
+        upper = bounds[3] if len(bounds) > 3 else "~"
+        selected = [row for row in rows if bounds[1] < row["pk"] <= upper]
+        return selected[::-1][:limit]
+
+    source.query = Mock(side_effect=query)
+    return source
+
+
+def test_migrate_embeddings_collection():
+    rows = [
+        {"pk": f"pk{i}", "text": f"text {i}", "vector": [i, 0], "meta_id": m}
+        for i, m in enumerate(["1", "1", "x", "2", "3"])
+    ]
+    source = v1_collection(rows)
+    with mock_milvus(), patch(
+        "biochatter.migration.Collection", side_effect=[source, Mock()]
+    ), patch("biochatter.migration.utility") as utility, patch.object(
+        Collection, "insert", autospec=True
+    ) as insert:
+        utility.has_collection.return_value = False
+        assert embeddings_schema_version(source) == 1
+        assert migrate_embeddings_collection("embeddings", batch_size=2) == (
+            4,
+            1,
+        )
+
+    # pages of two fragments, without the fragment of an invalid document id;
+    # the primary keys are assigned by Milvus
+    target, (texts, vectors, meta_ids) = insert.call_args_list[0].args
+    assert [field.name for field in target.schema.fields] == [
+        "pk",
+        "text",
+        "vector",
+        "meta_id",
+    ]
+    assert target.schema.fields[3].dtype == DataType.INT64
+    assert texts == ["text 0", "text 1"]
+    assert meta_ids == [1, 1]
+    assert insert.call_args_list[1].args[1][2] == [2]
+    assert insert.call_count == 3
+    utility.rename_collection.assert_any_call(
+        "embeddings", "embeddings_v1_backup", using="default"
+    )
+    utility.rename_collection.assert_any_call(
+        "embeddings_v2", "embeddings", using="default"
+    )
+    utility.drop_collection.assert_not_called()
+
+
+def test_migrate_embeddings_collection_checks():
+    source = v1_collection([])
+    with mock_milvus(), patch(
+        "biochatter.migration.Collection", return_value=source
+    ), patch("biochatter.migration.utility") as utility:
+        utility.has_collection.return_value = True
+        with pytest.raises(ValueError):
+            migrate_embeddings_collection("embeddings")
+
+        utility.has_collection.return_value = False
+        assert migrate_embeddings_collection(
+            "embeddings", keep_backup=False
+        ) == (0, 0)
+        utility.drop_collection.assert_called_once_with(
+            "embeddings_v1_backup", using="default"
+        )
+
+
+def test_main(capsys):
+    with mock_milvus(), patch(
+        "biochatter.migration.migrate_embeddings_collection",
+        return_value=(10, 0),
+    ) as migrate:
+        main(["--drop-backup", "--batch-size", "100"])
+    args, kwargs = migrate.call_args
+    assert args == (DOCUMENT_EMBEDDINGS_COLLECTION_NAME,)
+    assert kwargs["batch_size"] == 100
+    assert not kwargs["keep_backup"]
+    assert "Copied 10 fragments" in capsys.readouterr().out
@@ -0,0 +1,64 @@
+from unittest.mock import Mock, patch
+
+import pytest
+
+from biochatter.milvus_connections import MilvusConnectionRegistry
+
+
+@pytest.fixture
+def connections():
+    with patch("biochatter.milvus_connections.connections") as connections:
+        yield connections
+
+
+def test_connections_are_shared(connections):
+    registry = MilvusConnectionRegistry()
+    alias = registry.acquire("127.0.0.1", "19530")
+    assert registry.acquire("127.0.0.1", 19530) == alias
+    assert connections.connect.call_count == 1
+    assert registry.ref_count(alias) == 2
+
+    other = registry.acquire("127.0.0.1", "19530", user="root")
+    assert other != alias
+    assert connections.connect.call_count == 2
+
+    registry.release(alias)
+    registry.release(alias)
+    registry.release(other)
+    assert registry.ref_count(alias) == 0
+    # released connections stay open for reuse
+    assert registry.acquire("127.0.0.1", "19530") == alias
+    assert connections.connect.call_count == 2
+
+    assert registry.close_idle() == [other]
+    connections.disconnect.assert_called_once_with(other)
+    registry.close_all()
+    assert registry.ref_count(alias) == 0
+    assert registry.acquire("127.0.0.1", "19530") != alias
+
+
+def test_connections_by_credentials(connections):
+    registry = MilvusConnectionRegistry()
+    alias = registry.acquire("127.0.0.1", "19530", "root", "old")
+    # other passwords or tokens of the same user get their own connection
+    assert registry.acquire("127.0.0.1", "19530", "root", "new") != alias
+    token = registry.acquire("127.0.0.1", "19530", "root", "old", token="t")
+    assert token != alias
+    assert registry.acquire("127.0.0.1", "19530", "root", "old") == alias
+    assert connections.connect.call_count == 3
+    assert connections.connect.call_args.kwargs["token"] == "t"
+    # the credentials are not kept in the keys
+    assert all("old" not in key for key in registry._connections)
+
+
+def test_idle_connections_are_checked(connections):
+    registry = MilvusConnectionRegistry(health_check_interval=0)
+    alias = registry.acquire("127.0.0.1", "19530")
+    with patch(
+        "biochatter.milvus_connections.utility.get_server_version",
+        Mock(side_effect=Exception("channel closed")),
+    ):
+        assert registry.acquire("127.0.0.1", "19530") == alias
+    connections.disconnect.assert_called_once_with(alias)
+    assert connections.connect.call_count == 2
+    assert registry.ref_count(alias) == 2
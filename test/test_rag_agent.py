@@ -4,7 +4,11 @@ import json
 
 import pytest
 
-from biochatter.rag_agent import RagAgent, RagAgentModeEnum
+from biochatter.rag_agent import (
+    RagAgent,
+    RagAgentModeEnum,
+    select_relevant_results,
+)
 from biochatter.llm_connect import GptConversation
 from biochatter.vectorstore_agent import Document
 
@@ -133,6 +137,85 @@ def test_rag_agent_vectorstore_mode():
         )
 
 
+def test_rag_agent_relevance_threshold():
+    assert select_relevant_results(
+        [("a", 0.1), ("b", 0.15), ("c", 0.6), ("d", 0.65)], distance_gap=0.2
+    ) == [("a", 0.1), ("b", 0.15)]
+    assert select_relevant_results(
+        [("a", 0.1), ("b", 0.15), ("c", 0.6)], max_distance=0.12
+    ) == [("a", 0.1)]
+    assert select_relevant_results([("a", 0.1), ("b", 0.15)]) == [
+        ("a", 0.1),
+        ("b", 0.15),
+    ]
+
+    with patch(
+        "biochatter.vectorstore_agent.VectorDatabaseAgentMilvus"
+    ) as MockVectorDatabaseAgentMilvus:
+        mock_agent = MockVectorDatabaseAgentMilvus.return_value
+        mock_agent.similarity_search_with_score.return_value = [
+            (Document(page_content=f"result{i}", metadata={}), distance)
+            for i, distance in enumerate([0.2, 0.25, 0.7])
+        ]
+        agent = RagAgent(
+            use_prompt=True,
+            mode=RagAgentModeEnum.VectorStore,
+            connection_args={"host": "xxx", "port": "xxx"},
+            embedding_func=MagicMock(),
+            n_results=3,
+            max_distance=0.5,
+            distance_gap=0.3,
+        )
+        result = agent.generate_responses("test question")
+        assert [text for text, _ in result] == ["result0", "result1"]
+        mock_agent.similarity_search_with_score.assert_called_once_with(
+            "test question", 3, doc_ids=None
+        )
+        mock_agent.similarity_search.assert_not_called()
+
+        # out-of-domain question
+        agent.max_distance = 0.1
+        assert agent.generate_responses("test question") == []
+        assert agent.last_response == []
+
+
+def test_rag_agent_description_cache():
+    with (
+        patch(
+            "biochatter.vectorstore_agent.VectorDatabaseAgentMilvus"
+        ) as MockVectorDatabaseAgentMilvus,
+        patch("biochatter.rag_agent.time.monotonic") as monotonic,
+    ):
+        monotonic.return_value = 0.0
+        mock_agent = MockVectorDatabaseAgentMilvus.return_value
+        mock_agent.documents_version = 0
+        mock_agent.get_description.return_value = "3 documents"
+        agent = RagAgent(
+            mode=RagAgentModeEnum.VectorStore,
+            connection_args={"host": "xxx", "port": "xxx"},
+            embedding_func=MagicMock(),
+            description_ttl=60,
+        )
+        assert agent.get_description() == "3 documents"
+        assert agent.get_description() == "3 documents"
+        assert mock_agent.get_description.call_count == 1
+
+        # documents stored through the agent
+        mock_agent.documents_version = 1
+        mock_agent.get_description.return_value = "4 documents"
+        assert agent.get_description() == "4 documents"
+        assert mock_agent.get_description.call_count == 2
+
+        # expired
+        monotonic.return_value = 61.0
+        agent.get_description()
+        assert mock_agent.get_description.call_count == 3
+
+        agent.invalidate_description()
+        agent.get_description()
+        assert mock_agent.get_description.call_count == 4
+
+
 def test_rag_agent_invalid_mode():
     with pytest.raises(ValueError) as excinfo:
         RagAgent(
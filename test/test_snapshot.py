@@ -0,0 +1,148 @@
+from unittest.mock import patch
+import os
+
+import pytest
+
+from biochatter.snapshot import main, export_snapshot, import_snapshot
+from biochatter.vectorstore_local import VectorDatabaseAgentLocal
+from biochatter.vectorstore_sharded import VectorDatabaseAgentSharded
+from .mock_langchain import Document, BagOfWordsEmbeddings
+
+pytest.importorskip("pyarrow")
+
+
+def document(i: int) -> list[Document]:
+    return [
+        Document(
+            page_content=f"fragment {part} of document {i} about topic {i % 3}",
+            metadata={
+                "title": f"Document {i}",
+                "source": f"test/{i}.pdf",
+                "page_start": part + 1,
+                "page_end": part + 1,
+            },
+        )
+        for part in range(3)
+    ]
+
+
+def local_store(**kwargs) -> VectorDatabaseAgentLocal:
+    store = VectorDatabaseAgentLocal(
+        embedding_func=BagOfWordsEmbeddings(), **kwargs
+    )
+    store.connect()
+    return store
+
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+def test_export_and_import(tmp_path, format):
+    source = local_store()
+    ids = source.store_embeddings_batch([document(i) for i in range(7)])
+    path = os.path.join(tmp_path, "snapshot")
+    assert export_snapshot(source, path, format=format, batch_size=3) == (
+        7,
+        21,
+    )
+
+    target = local_store(connection_args={"path": str(tmp_path / "target")})
+    restored = import_snapshot(target, path, batch_size=2)
+    # the vectors are restored, nothing is embedded
+    assert target._embedding_func.n_calls == 0
+    assert sorted(restored) == sorted(ids)
+    assert [doc["title"] for doc in target.get_all_documents()] == [
+        doc["title"] for doc in source.get_all_documents()
+    ]
+
+    query = "document 4 about topic 1"
+    expected = source.similarity_search_with_score(query, k=5)
+    results = target.similarity_search_with_score(query, k=5)
+    assert [
+        (doc.page_content, doc.metadata["page_start"]) for doc, _ in results
+    ] == [(doc.page_content, doc.metadata["page_start"]) for doc, _ in expected]
+    assert [score for _, score in results] == pytest.approx(
+        [score for _, score in expected]
+    )
+
+    # identical documents are not restored twice
+    assert import_snapshot(target, path) == restored
+    assert len(target.get_all_documents()) == 7
+    assert len(target._texts) == 21
+
+
+def test_export_scope(tmp_path):
+    source = local_store()
+    ids = source.store_embeddings_batch([document(i) for i in range(5)])
+    source.remove_document(ids[0])
+    path = str(tmp_path)
+    assert export_snapshot(source, path, doc_ids=ids[:3]) == (2, 6)
+    restored = import_snapshot(local_store(), path)
+    assert sorted(restored) == ids[1:3]
+
+    # an empty store, exported in another format, replaces the snapshot
+    assert export_snapshot(local_store(), path, format="arrow") == (0, 0)
+    assert sorted(os.listdir(path)) == ["documents.arrow", "fragments.arrow"]
+    assert import_snapshot(local_store(), path) == {}
+
+    with pytest.raises(ValueError):
+        export_snapshot(source, path, format="csv")
+    with pytest.raises(FileNotFoundError):
+        import_snapshot(source, str(tmp_path / "missing"))
+
+
+def test_documents_without_fragments(tmp_path, capsys):
+    source = local_store()
+    ids = source.store_embeddings_batch(
+        [document(0), document(1)], exclude_list=[None, {0, 1, 2}]
+    )
+    assert export_snapshot(source, str(tmp_path)) == (2, 3)
+    restored = import_snapshot(local_store(), str(tmp_path))
+    assert restored[ids[1]] is None
+    assert restored[ids[0]] is not None
+
+    with patch("biochatter.snapshot.VectorDatabaseAgentMilvus"), patch(
+        "biochatter.snapshot.import_snapshot", return_value=restored
+    ):
+        main(["import", str(tmp_path)])
+    output = capsys.readouterr().out
+    assert "Restored 1 documents" in output
+    assert f"Not restored (no fragments): {ids[1]}" in output
+
+
+def test_sharded_snapshot(tmp_path):
+    source = VectorDatabaseAgentSharded([local_store(), local_store()])
+    source.store_embeddings_batch([document(i) for i in range(6)])
+    assert export_snapshot(source, str(tmp_path)) == (6, 18)
+    target = VectorDatabaseAgentSharded([local_store() for _ in range(3)])
+    restored = import_snapshot(target, str(tmp_path))
+    assert len(restored) == 6
+    assert sorted(
+        doc.page_content for doc in target.similarity_search("topic", k=18)
+    ) == sorted(
+        doc.page_content for doc in source.similarity_search("topic", k=18)
+    )
+
+
+def test_missing_pyarrow(tmp_path):
+    with patch.dict("sys.modules", {"pyarrow": None}):
+        with pytest.raises(ImportError):
+            export_snapshot(local_store(), str(tmp_path))
+
+
+def test_main(capsys):
+    with patch("biochatter.snapshot.VectorDatabaseAgentMilvus") as agent, patch(
+        "biochatter.snapshot.export_snapshot", return_value=(3, 12)
+    ) as export:
+        main(["export", "snapshots/main", "--format", "arrow"])
+    assert export.call_args.args == (agent.return_value, "snapshots/main")
+    assert export.call_args.kwargs["format"] == "arrow"
+    assert agent.call_args.kwargs["embedding_func"] is None
+    agent.return_value.close.assert_called_once()
+    assert "Exported 3 documents" in capsys.readouterr().out
+
+    with patch("biochatter.snapshot.VectorDatabaseAgentMilvus") as agent, patch(
+        "biochatter.snapshot.import_snapshot", return_value={"1": "5"}
+    ) as restore:
+        main(["import", "snapshots/main", "--workspace", "team_a"])
+    assert agent.call_args.kwargs["workspace"] == "team_a"
+    assert restore.call_args.kwargs["batch_size"] == 100
+    assert "Restored 1 documents" in capsys.readouterr().out
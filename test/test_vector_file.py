@@ -0,0 +1,102 @@
+import pytest
+
+import numpy as np
+
+from biochatter.vector_file import VectorFile
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    return rng.normal(size=(200, 32)).astype(np.float32)
+
+
+@pytest.mark.parametrize(
+    "dtype,tolerance", [("float32", 0), ("float16", 1e-3), ("int8", 2e-2)]
+)
+def test_append_and_dequantise(tmp_path, vectors, dtype, tolerance):
+    vf = VectorFile(path=str(tmp_path / "vectors"), dtype=dtype)
+    rows = vf.append(vectors[:150], np.full(150, 1))
+    assert rows.tolist() == list(range(150))
+    rows = vf.append(vectors[150:], np.full(50, 2))
+    assert rows[0] == 150
+    assert len(vf) == 200
+    assert vf.meta_ids.tolist() == [1] * 150 + [2] * 50
+    assert vf.nbytes == 200 * 32 * np.dtype(dtype).itemsize
+    assert np.abs(vf.vectors() - vectors).max() <= tolerance
+
+    reopened = VectorFile(path=str(tmp_path / "vectors"))
+    assert reopened.dtype == dtype
+    assert np.array_equal(reopened.vectors(), vf.vectors())
+
+
+def test_int8_range_of_later_batches(tmp_path, vectors):
+    vf = VectorFile(path=str(tmp_path / "vectors"), dtype="int8")
+    vf.append(vectors[:100], np.zeros(100))
+    # values far beyond the range of the first batch are not clipped
+    larger = 100 * vectors[100:]
+    vf.append(larger, np.ones(100))
+    reopened = VectorFile(path=str(tmp_path / "vectors"), read_only=True)
+    for stored in [vf.vectors(), reopened.vectors()]:
+        assert np.allclose(stored[:100], vectors[:100], atol=2e-2)
+        assert np.allclose(stored[100:], larger, rtol=0, atol=2)
+    assert np.allclose(vf.vectors(np.arange(100, 200)), larger, rtol=0, atol=2)
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16", "int8"])
+def test_search(tmp_path, vectors, dtype):
+    vf = VectorFile(path=str(tmp_path / "vectors"), dtype=dtype)
+    vf.append(vectors, np.zeros(len(vectors)))
+    rows, distances = vf.search(vectors[17], np.arange(len(vectors)), k=5)
+    assert rows[0] == 17
+    assert len(rows) == 5
+    assert np.all(np.diff(distances) >= 0)
+
+    rows, _ = vf.search(vectors[17], np.arange(20, 40), k=3)
+    assert all(20 <= row < 40 for row in rows)
+
+
+@pytest.mark.parametrize("metric_type", ["L2", "IP"])
+def test_search_batch(vectors, metric_type):
+    vf = VectorFile()
+    vf.append(vectors, np.zeros(len(vectors)))
+    candidates = np.arange(10, 190)
+    rows, distances = vf.search_batch(
+        vectors[[17, 42, 99]], candidates, k=4, metric_type=metric_type
+    )
+    assert rows.shape == distances.shape == (3, 4)
+    for query, query_rows, query_distances in zip(
+        [17, 42, 99], rows, distances
+    ):
+        expected_rows, expected_distances = vf.search(
+            vectors[query], candidates, k=4, metric_type=metric_type
+        )
+        assert query_rows.tolist() == expected_rows.tolist()
+        assert np.allclose(query_distances, expected_distances, atol=1e-3)
+
+
+def test_tombstones_are_shared(tmp_path, vectors):
+    writer = VectorFile(path=str(tmp_path / "vectors"))
+    writer.append(vectors[:10], np.arange(10))
+    reader = VectorFile(path=str(tmp_path / "vectors"), read_only=True)
+    assert reader.alive.all()
+
+    writer.delete(np.array([3, 4]))
+    writer.append(vectors[10:12], np.arange(2))
+    assert not reader.alive[3]
+    assert len(reader) == 10
+    reader.refresh()
+    assert len(reader) == 12
+    assert reader.alive.sum() == 10
+
+    with pytest.raises(PermissionError):
+        reader.delete(np.array([0]))
+
+
+def test_in_memory(vectors):
+    vf = VectorFile(dtype="int8")
+    vf.append(vectors, np.zeros(len(vectors)))
+    vf.delete(np.array([0]))
+    assert vf.alive.sum() == len(vectors) - 1
+    with pytest.raises(ValueError):
+        vf.append(np.zeros((1, 3)), np.zeros(1))
@@ -1,7 +1,9 @@
 from unittest.mock import MagicMock, patch
 import os
+import re
 
 from xinference.client import Client
+import pytest
 
 from biochatter.vectorstore import (
     Document,
@@ -10,6 +12,7 @@ from biochatter.vectorstore import (
     OllamaDocumentEmbedder,
     XinferenceDocumentEmbedder,
 )
+from biochatter.text_splitter import TokenTextSplitter
 
 print(os.getcwd())
 
@@ -263,6 +266,50 @@ def test_byte_pdf():
     assert "numerous attempts at standardising KGs" in doc[0].page_content
 
 
+@pytest.mark.parametrize("n_workers", [0, 2])
+def test_iter_pdf_pages(n_workers):
+    pdf_path = "test/bc_summary.pdf"
+    reader = DocumentReader()
+    full_text = reader.load_document(pdf_path)[0].page_content
+
+    pages = list(reader.iter_pdf_pages(pdf_path, n_workers=n_workers))
+    assert len(pages) == 8
+    assert [p.metadata["page_start"] for p in pages] == list(range(1, 9))
+    assert all(p.metadata["total_pages"] == 8 for p in pages)
+    assert all(p.metadata["source"] == pdf_path for p in pages)
+    assert "".join(p.page_content for p in pages) == full_text
+
+    with open(pdf_path, "rb") as f:
+        windows = list(
+            reader.iter_pdf_pages(
+                f.read(), pages_per_document=3, n_workers=n_workers
+            )
+        )
+    assert [
+        (w.metadata["page_start"], w.metadata["page_end"]) for w in windows
+    ] == [(1, 3), (4, 6), (7, 8)]
+    assert windows[0].metadata["source"] == "pdf"
+
+
+def test_iter_pdf_pages_in_flight():
+    reader = DocumentReader()
+    with patch("biochatter.vectorstore.ProcessPoolExecutor") as executor:
+        pool = executor.return_value.__enter__.return_value
+        pool.submit.side_effect = lambda func, start, end: MagicMock(
+            result=MagicMock(return_value=[f"page {start}"])
+        )
+        pages = reader.iter_pdf_pages("test/bc_summary.pdf", n_workers=2)
+        next(pages)
+        # the pdf is passed once per worker, not per window
+        assert executor.call_args.kwargs["initargs"] == ("test/bc_summary.pdf",)
+        assert pool.submit.call_count == 2
+        next(pages)
+        assert pool.submit.call_count == 3
+        assert [page.page_content for page in pages] == [
+            f"page {i}" for i in range(2, 8)
+        ]
+
+
 CHUNK_SIZE = 100
 CHUNK_OVERLAP = 10
 
@@ -300,22 +347,32 @@ def test_split_by_characters(mock_textsplitter, mock_host, mock_embeddings):
         rag_agent, "test/bc_summary.txt", len(splitted_docs)
     )
 
+
+def whitespace_offsets(text: str) -> list[tuple[int, int]]:
+    return [(m.start(), m.end()) for m in re.finditer(r"\s*\S+", text)]
+
+
+@patch("biochatter.vectorstore.OpenAIEmbeddings")
+@patch("biochatter.vectorstore.VectorDatabaseAgentMilvus")
+@patch("biochatter.vectorstore.token_offsets_func")
+def test_split_by_tokens(mock_offsets_func, mock_host, mock_embeddings):
+    mock_offsets_func.return_value = whitespace_offsets
+    reader = DocumentReader()
+    text = reader.load_document("test/bc_summary.txt")[0].page_content
+
     # tiktoken
     rag_agent = DocumentEmbedder(
         split_by_characters=False,
         chunk_size=CHUNK_SIZE,
         chunk_overlap=CHUNK_OVERLAP,
     )
-    check_document_splitter(
-        rag_agent, "test/bc_summary.pdf", len(splitted_docs)
-    )
-    mock_textsplitter.from_tiktoken_encoder.assert_called_once()
-    check_document_splitter(rag_agent, "test/dcn.pdf", len(splitted_docs))
-    assert mock_textsplitter.from_tiktoken_encoder.call_count == 2
-    check_document_splitter(
-        rag_agent, "test/bc_summary.txt", len(splitted_docs)
+    splitted = rag_agent._split_document(reader.load_document("test/dcn.pdf"))
+    mock_offsets_func.assert_called_once_with("text-embedding-ada-002")
+    assert len(splitted) > 1
+    assert all(
+        len(whitespace_offsets(doc.page_content)) <= CHUNK_SIZE
+        for doc in splitted
     )
-    assert mock_textsplitter.from_tiktoken_encoder.call_count == 3
 
     # huggingface tokenizer
     rag_agent = DocumentEmbedder(
@@ -324,13 +381,37 @@ def test_split_by_characters(mock_textsplitter, mock_host, mock_embeddings):
         chunk_size=CHUNK_SIZE,
         chunk_overlap=CHUNK_OVERLAP,
     )
-    check_document_splitter(
-        rag_agent, "test/bc_summary.pdf", len(splitted_docs)
+    splitted = rag_agent._split_document(
+        [Document(page_content=text, metadata={})]
     )
-    mock_textsplitter.from_huggingface_tokenizer.assert_called_once()
-    check_document_splitter(rag_agent, "test/dcn.pdf", len(splitted_docs))
-    assert mock_textsplitter.from_huggingface_tokenizer.call_count == 2
-    check_document_splitter(
-        rag_agent, "test/bc_summary.txt", len(splitted_docs)
+    mock_offsets_func.assert_called_with("bigscience/bloom")
+    # consecutive chunks overlap
+    words = [doc.page_content.split() for doc in splitted]
+    assert all(
+        prev[-CHUNK_OVERLAP:] == next[:CHUNK_OVERLAP]
+        for prev, next in zip(words, words[1:])
+    )
+
+
+def test_token_text_splitter():
+    splitter = TokenTextSplitter(
+        whitespace_offsets,
+        separators=["\n", " "],
+        chunk_size=4,
+        chunk_overlap=1,
+    )
+    assert splitter.split_text("a b c\nd e f g h i\nj k l m n") == [
+        "a b c",
+        "c\nd e f",
+        "f g h i",
+        "i\nj k l",
+        "l m n",
+    ]
+    splitter = TokenTextSplitter(
+        whitespace_offsets, chunk_size=4, chunk_overlap=0
     )
-    assert mock_textsplitter.from_huggingface_tokenizer.call_count == 3
+    assert splitter.split_text("a b c d e f g h i j") == [
+        "a b c d",
+        "e f g h",
+        "i j",
+    ]
@@ -2,16 +2,32 @@
 This test needs OPENAI_API_KEY in the environment and a local milvus server.
 """
 
-from unittest.mock import patch
+from contextlib import ExitStack, contextmanager
+from unittest.mock import Mock, PropertyMock, patch
 import os
 import uuid
 
 import pytest
 
+import numpy as np
+
 # from langchain.schema import Document
 # from pymilvus import utility, Collection, connections
 # from langchain.embeddings import OpenAIEmbeddings
-from biochatter.vectorstore_agent import VectorDatabaseAgentMilvus
+from biochatter.chunk_store import SQLiteChunkStore
+from biochatter.metadata_store import SQLiteMetadataStore
+from biochatter.constants import MAX_AGENT_DESC_LENGTH
+from biochatter.vectorstore_agent import (
+    META_ID_INDEX_NAME,
+    MILVUS_QUERY_MAX_LIMIT,
+    MilvusMetadataStore,
+    VectorDatabaseAgentMilvus,
+    build_description,
+    query_ordered_page,
+    fingerprint_document,
+    validate_index_params,
+    maximal_marginal_relevance,
+)
 from .mock_pymilvus import (
     DataType,
     Collection,
@@ -20,7 +36,12 @@ from .mock_pymilvus import (
     utility,
     connections,
 )
-from .mock_langchain import Milvus, Document, OpenAIEmbeddings
+from .mock_langchain import (
+    Milvus,
+    Document,
+    OpenAIEmbeddings,
+    BagOfWordsEmbeddings,
+)
 
 # setup milvus connection
 if os.getenv("DEVCONTAINER"):
@@ -134,33 +155,42 @@ mocked_bc_summary_txt_splitted_texts = [
 ]
 
 
-@pytest.fixture
-def dbHost():
-    with (
-        patch(
-            "biochatter.vectorstore_agent.OpenAIEmbeddings", OpenAIEmbeddings
-        ),
-        patch("biochatter.vectorstore_agent.Document", Document),
-        patch("biochatter.vectorstore_agent.Milvus", Milvus),
-        patch("biochatter.vectorstore_agent.connections", connections),
-        patch("biochatter.vectorstore_agent.utility", utility),
-        patch("biochatter.vectorstore_agent.Collection", Collection),
-        patch("biochatter.vectorstore_agent.DataType", DataType),
-        patch("biochatter.vectorstore_agent.FieldSchema", FieldSchema),
-        patch(
-            "biochatter.vectorstore_agent.CollectionSchema", CollectionSchema
-        ),
-    ):
+@contextmanager
+def mock_milvus():
+    with ExitStack() as stack:
+        for name, mock in [
+            ("vectorstore_agent.OpenAIEmbeddings", OpenAIEmbeddings),
+            ("vectorstore_agent.Document", Document),
+            ("vectorstore_agent.Milvus", Milvus),
+            ("vectorstore_agent.utility", utility),
+            ("vectorstore_agent.Collection", Collection),
+            ("vectorstore_agent.DataType", DataType),
+            ("vectorstore_agent.FieldSchema", FieldSchema),
+            ("vectorstore_agent.CollectionSchema", CollectionSchema),
+            ("milvus_connections.connections", connections),
+            ("milvus_connections.utility", utility),
+        ]:
+            stack.enter_context(patch(f"biochatter.{name}", mock))
+        yield
+
+
+@pytest.fixture(params=["milvus", "sqlite"])
+def dbHost(request):
+    with mock_milvus():
         # create dbHost
         dbHost = VectorDatabaseAgentMilvus(
             embedding_func=OpenAIEmbeddings(),
             connection_args={"host": _HOST, "port": _PORT},
             embedding_collection_name=EMBEDDING_NAME,
             metadata_collection_name=METADATA_NAME,
+            metadata_store=(
+                SQLiteMetadataStore() if request.param == "sqlite" else None
+            ),
         )
         dbHost.connect()
         assert dbHost._col_embeddings is not None
-        assert dbHost._col_metadata is not None
+        if request.param == "milvus":
+            assert dbHost._col_metadata is not None
 
         # save embeddings
         doc_id = dbHost.store_embeddings(mocked_dcn_pdf_splitted_texts)
@@ -200,6 +230,759 @@ def test_remove_document(dbHost):
     assert (cnt - 1) == len(dbHost.get_all_documents())
 
 
+def test_similarity_search_batch(dbHost):
+    doc_ids = [str(doc["id"]) for doc in dbHost.get_all_documents()]
+
+    def hit(text, meta_id):
+        return Mock(entity={"text": text, "meta_id": meta_id})
+
+    col = dbHost._col_embeddings.col
+    col.search.return_value = [
+        [hit("first", doc_ids[0]), hit("second", doc_ids[1])],
+        [hit("third", "999999")],
+    ]
+    dbHost._embedding_func = BagOfWordsEmbeddings()
+    with patch.object(
+        dbHost._embedding_func,
+        "embed_query",
+        wraps=dbHost._embedding_func.embed_query,
+    ) as embed_query:
+        results = dbHost.similarity_search_batch(["a", "b"], k=2)
+    assert [call.args for call in embed_query.call_args_list] == [
+        ("a",),
+        ("b",),
+    ]
+    _, kwargs = col.search.call_args
+    assert len(kwargs["data"]) == 2
+    assert kwargs["limit"] == 2
+    assert [[doc.page_content for doc in docs] for docs in results] == [
+        ["first", "second"],
+        [],
+    ]
+    assert str(results[0][0].metadata["id"]) == doc_ids[0]
+    assert dbHost.similarity_search_batch([], k=2) == []
+
+
+def test_similarity_search_with_score(dbHost):
+    doc_ids = [str(doc["id"]) for doc in dbHost.get_all_documents()]
+    col = dbHost._col_embeddings.col
+    col.search.return_value = [
+        [
+            Mock(entity={"text": "first", "meta_id": doc_ids[0]}, distance=0.9),
+            Mock(entity={"text": "second", "meta_id": "999999"}, distance=0.5),
+        ]
+    ]
+    dbHost._embedding_func = BagOfWordsEmbeddings()
+    results = dbHost.similarity_search_with_score("a", k=2)
+    assert [(doc.page_content, score) for doc, score in results] == [
+        ("first", 0.9)
+    ]
+
+    # inner products are converted to distances
+    dbHost._index_params = {"metric_type": "IP"}
+    results = dbHost.similarity_search_with_score(
+        "a", k=2, search_params={"ef": 64}
+    )
+    assert results[0][1] == pytest.approx(0.1)
+
+
+def test_diversified_search(dbHost):
+    doc_ids = [str(doc["id"]) for doc in dbHost.get_all_documents()]
+    vectors = {
+        "first": [1.0, 0.32, 0.0],
+        "first again": [1.0, 0.3, 0.0],
+        "second": [0.3, 1.0, 0.0],
+        "unrelated": [0.0, 0.0, 1.0],
+    }
+    hits = [
+        Mock(
+            id=i,
+            entity={"text": text, "meta_id": doc_ids[0], "vector": vector},
+            distance=float(i),
+        )
+        for i, (text, vector) in enumerate(vectors.items())
+    ]
+    col = dbHost._col_embeddings.col
+    col.search.return_value = [hits]
+    col.query.return_value = [
+        {"pk": hit.id, "vector": hit.entity["vector"]} for hit in hits
+    ]
+    dbHost._embedding_func = Mock()
+    dbHost._embedding_func.embed_query.return_value = [1.0, 0.6, 0.0]
+
+    results = dbHost.similarity_search("a", k=2, fetch_k=4)
+    assert [doc.page_content for doc in results] == ["first", "second"]
+    _, kwargs = col.search.call_args
+    assert kwargs["limit"] == 4
+    # Milvus 2.2 does not return vectors with the hits
+    assert "vector" not in kwargs["output_fields"]
+    col.query.assert_called_once()
+
+    dbHost._search_outputs_vectors = True
+    col.query.reset_mock()
+    results = dbHost.similarity_search("a", k=2, fetch_k=4, lambda_mult=1.0)
+    assert [doc.page_content for doc in results] == ["first", "first again"]
+    _, kwargs = col.search.call_args
+    assert "vector" in kwargs["output_fields"]
+    col.query.assert_not_called()
+    assert dbHost._embedding_func.embed_query.call_count == 2
+
+    with pytest.raises(ValueError):
+        dbHost.similarity_search("a", k=2, fetch_k=4, lambda_mult=2)
+
+
+def test_maximal_marginal_relevance():
+    query = [1, 0.6, 0]
+    vectors = [[1, 0.32, 0], [1, 0.3, 0], [0.3, 1, 0], [0, 0, 1]]
+    assert maximal_marginal_relevance(query, vectors, 3) == [0, 2, 3]
+    assert maximal_marginal_relevance(query, vectors, 2, 1.0) == [0, 1]
+    assert maximal_marginal_relevance(query, vectors, 9) == [0, 2, 3, 1]
+    assert maximal_marginal_relevance(query, vectors, 0) == []
+    assert maximal_marginal_relevance(query, [], 3) == []
+
+    # the vectors of the caller are not normalised in place
+    query = np.array(query, dtype=np.float32)
+    vectors = np.array(vectors, dtype=np.float32)
+    expected_query, expected_vectors = query.copy(), vectors.copy()
+    assert maximal_marginal_relevance(query, vectors, 3) == [0, 2, 3]
+    assert np.array_equal(query, expected_query)
+    assert np.array_equal(vectors, expected_vectors)
+
+
+def test_batch_operations(dbHost):
+    ids = dbHost.store_embeddings_batch(
+        [mocked_dcn_pdf_splitted_texts, [], mocked_dcn_pdf_splitted_texts]
+    )
+    assert ids[0] is not None
+    assert ids[1] is None
+    assert ids[2] == ids[0]
+    cnt = len(dbHost.get_all_documents())
+    removed = dbHost.remove_documents([ids[0]], doc_ids=[])
+    assert removed == []
+    removed = dbHost.remove_documents([ids[0]])
+    assert len(removed) > 0
+    assert (cnt - 1) == len(dbHost.get_all_documents())
+
+
+def test_index_params(dbHost):
+    # besides the vector index, the collection has an index on meta_id
+    col = dbHost._col_embeddings.col
+    col.indexes = [
+        Mock(field_name="meta_id", index_name=META_ID_INDEX_NAME),
+        Mock(field_name="vector", index_name="_default_idx_101"),
+    ]
+    dbHost.build_index(
+        {"index_type": "IVF_PQ", "params": {"nlist": 128, "m": 8}}
+    )
+    assert dbHost._index_params["metric_type"] == "L2"
+    col.has_index.assert_called_once_with(index_name="_default_idx_101")
+    col.drop_index.assert_called_once_with(index_name="_default_idx_101")
+    dbHost._col_embeddings.col.create_index.assert_called_once_with(
+        "vector", index_params=dbHost._index_params
+    )
+    dbHost._col_embeddings.col.load.assert_called_once()
+    assert dbHost._milvus_search_params({"nprobe": 16}) == {
+        "metric_type": "L2",
+        "params": {"nprobe": 16},
+    }
+
+    # the metric of the index of the collection, not that of the agent
+    dbHost.build_index(
+        {
+            "index_type": "HNSW",
+            "metric_type": "IP",
+            "params": {"M": 8, "efConstruction": 64},
+        }
+    )
+    assert dbHost._milvus_search_params({"ef": 16})["metric_type"] == "IP"
+
+    with pytest.raises(ValueError):
+        validate_index_params({"index_type": "IVF_PQ", "params": {"m": 8}})
+    with pytest.raises(ValueError):
+        validate_index_params({"index_type": "ANNOY"})
+
+
+def test_index_metric_type():
+    index = Mock(field_name="vector", params={"metric_type": "IP"})
+    with mock_milvus(), patch.object(
+        Collection, "indexes", new_callable=PropertyMock, return_value=[index]
+    ):
+        col = Collection(
+            "embeddings",
+            CollectionSchema(
+                [
+                    FieldSchema("text", DataType.VARCHAR),
+                    FieldSchema("meta_id", DataType.INT64),
+                ]
+            ),
+        )
+        with patch(
+            "biochatter.vectorstore_agent.Milvus", return_value=Mock(col=col)
+        ):
+            agent = VectorDatabaseAgentMilvus(
+                embedding_func=BagOfWordsEmbeddings(),
+                metadata_store=SQLiteMetadataStore(),
+                search_params={"ef": 64},
+            )
+            agent.connect()
+        assert agent._milvus_search_params() == {
+            "metric_type": "IP",
+            "params": {"ef": 64},
+        }
+
+
+def test_workspaces():
+    store = SQLiteMetadataStore()
+    with mock_milvus():
+        agents = {}
+        for workspace in ["project_a", "project_b"]:
+            agents[workspace] = VectorDatabaseAgentMilvus(
+                embedding_func=BagOfWordsEmbeddings(),
+                connection_args={"host": _HOST, "port": _PORT},
+                embedding_collection_name=EMBEDDING_NAME,
+                metadata_collection_name=METADATA_NAME,
+                metadata_store=store,
+                workspace=workspace,
+            )
+            agents[workspace].connect()
+        a, b = agents["project_a"], agents["project_b"]
+        # agents connected to the same server share one connection
+        assert a.alias == b.alias
+
+        doc_id = a.store_embeddings(mocked_dcn_pdf_splitted_texts)
+        _, kwargs = a._col_embeddings.col.insert.call_args
+        assert kwargs["partition_name"] == "workspace_project_a"
+        assert [doc["id"] for doc in a.get_all_documents()] == [int(doc_id)]
+        assert b.get_all_documents() == []
+        # identical documents are stored once per workspace
+        assert b.store_embeddings(mocked_dcn_pdf_splitted_texts) != doc_id
+        assert a.store_embeddings(mocked_dcn_pdf_splitted_texts) == doc_id
+        assert b.remove_documents([doc_id]) == []
+        assert len(a.get_all_documents()) == 1
+
+        with patch.object(
+            a._col_embeddings, "similarity_search", return_value=[]
+        ) as search:
+            a.similarity_search("Deep Counterfactual Networks", k=3)
+        _, kwargs = search.call_args
+        assert kwargs["partition_names"] == ["workspace_project_a"]
+        assert kwargs["expr"] is None
+
+    with pytest.raises(ValueError):
+        VectorDatabaseAgentMilvus(
+            embedding_func=BagOfWordsEmbeddings(), workspace="project a"
+        )
+
+
+def test_documents_pages():
+    with mock_milvus():
+        agent = VectorDatabaseAgentMilvus(
+            embedding_func=BagOfWordsEmbeddings(),
+            connection_args={"host": _HOST, "port": _PORT},
+            metadata_store=SQLiteMetadataStore(),
+        )
+        agent.connect()
+        ids = [
+            agent.store_embeddings(docs)
+            for docs in [
+                mocked_dcn_pdf_splitted_texts,
+                mocked_bc_summary_pdf_splitted_texts,
+            ]
+        ]
+        page, cursor = agent.get_documents_page(limit=1)
+        assert [str(doc["id"]) for doc in page] == ids[:1]
+        assert cursor == ids[0]
+        page, cursor = agent.get_documents_page(
+            cursor, limit=2, output_fields=["source"]
+        )
+        assert [str(doc["id"]) for doc in page] == ids[1:]
+        assert set(page[0].keys()) == {"id", "source"}
+        assert cursor is None
+        assert [
+            str(doc["id"]) for doc in agent.iter_all_documents(batch_size=1)
+        ] == ids
+        assert agent.get_description().startswith("This vector store contains")
+
+
+def test_milvus_metadata_store_pages():
+    store = MilvusMetadataStore("metadata", "alias")
+    store.collection = Mock()
+    store.collection.query.return_value = [{"id": 7}, {"id": 5}]
+    assert store.get_page("3", limit=2, output_fields=["title"]) == [
+        {"id": 5},
+        {"id": 7},
+    ]
+    store.collection.query.assert_called_once_with(
+        expr="(isDeleted == false) and id > 3",
+        output_fields=["id", "title"],
+        partition_names=None,
+        limit=3,
+    )
+    with pytest.raises(ValueError):
+        store.get_page(limit=MILVUS_QUERY_MAX_LIMIT)
+
+
+def test_query_ordered_page():
+    ids = [9, 2, 7, 4, 1, 8, 3]
+
+    def query(expr, output_fields, partition_names, limit):
+        # any matching entities, as returned by Milvus 2.2
+        selected = [{"id": i} for i in ids if eval(expr, {"id": i})]
+        return selected[:limit]
+
+    col = Mock()
+    col.query.side_effect = query
+    page = query_ordered_page(col, "id", 1, 3, ["id"], expr="id != 4")
+    assert page == [{"id": 2}, {"id": 3}, {"id": 7}]
+    assert (
+        col.query.call_args.kwargs["expr"] == "(id != 4) and id > 1 and id <= 7"
+    )
+    assert query_ordered_page(col, "id", 7, 3, ["id"]) == [{"id": 8}, {"id": 9}]
+
+    # servers from version 2.3 on return the smallest primary keys
+    col.query.reset_mock()
+    col.query.side_effect = lambda expr, limit, **kwargs: [
+        {"id": i} for i in sorted(ids) if i > 1
+    ][:limit]
+    assert query_ordered_page(col, "id", 1, 3, ["id"], ordered=True) == [
+        {"id": 2},
+        {"id": 3},
+        {"id": 4},
+    ]
+    col.query.assert_called_once()
+
+
+def test_build_description_stops_early():
+    def metadata():
+        for i in range(100000):
+            yield {"title": f"article {i}", "name": "", "subject": ""}
+        raise AssertionError("all documents were read")
+
+    desc = build_description(metadata())
+    assert desc.startswith("This vector store contains the following")
+    assert len(desc) == MAX_AGENT_DESC_LENGTH
+
+
+def test_documents_version_shared():
+    with mock_milvus():
+        agents = [
+            VectorDatabaseAgentMilvus(
+                embedding_func=BagOfWordsEmbeddings(),
+                connection_args={"host": _HOST, "port": _PORT},
+                metadata_collection_name=name,
+                metadata_store=SQLiteMetadataStore(),
+            )
+            for name in ["VersionMetadata", "VersionMetadata", "Other"]
+        ]
+        for agent in agents:
+            agent.connect()
+        versions = [agent.documents_version for agent in agents]
+        doc_id = agents[0].store_embeddings(mocked_dcn_pdf_splitted_texts)
+        assert agents[1].documents_version > versions[1]
+        assert agents[2].documents_version == versions[2]
+        version = agents[1].documents_version
+        agents[0].remove_document(doc_id)
+        assert agents[1].documents_version > version
+
+
+def test_chunk_store():
+    chunk_store = SQLiteChunkStore()
+    with mock_milvus():
+        agent = VectorDatabaseAgentMilvus(
+            embedding_func=BagOfWordsEmbeddings(),
+            connection_args={"host": _HOST, "port": _PORT},
+            metadata_store=SQLiteMetadataStore(),
+            chunk_store=chunk_store,
+        )
+        agent.connect()
+        doc_id = agent.store_embeddings(mocked_dcn_pdf_splitted_texts)
+        col = agent._col_embeddings.col
+        # chunk ids, vectors and document ids, but no text
+        pks, vectors, meta_ids = col.insert.call_args.args[0]
+        assert pks == [1, 2]
+        assert meta_ids == [int(doc_id), int(doc_id)]
+        assert chunk_store.get(pks)[2] == (
+            mocked_dcn_pdf_splitted_texts[1].page_content,
+            {"meta_id": doc_id},
+        )
+
+        col.search.return_value = [
+            [
+                Mock(id=2, entity={"meta_id": doc_id}),
+                Mock(id=99, entity={"meta_id": doc_id}),
+            ]
+        ]
+        results = agent.similarity_search("Deep Counterfactual Networks", k=2)
+        _, kwargs = col.search.call_args
+        assert kwargs["output_fields"] == ["meta_id"]
+        assert [doc.page_content for doc in results] == [
+            mocked_dcn_pdf_splitted_texts[1].page_content
+        ]
+        assert results[0].metadata["title"] == (
+            "Deep Counterfactual Networks with Propensity-Dropout"
+        )
+
+        # revision: the unchanged chunk is copied from the chunk store
+        col.query.return_value = [
+            {"pk": pk, "vector": vector} for pk, vector in zip(pks, vectors)
+        ]
+        revised = [
+            mocked_dcn_pdf_splitted_texts[0],
+            Document(page_content="a new chunk", metadata={}),
+        ]
+        with patch.object(
+            agent._embedding_func,
+            "embed_documents",
+            wraps=agent._embedding_func.embed_documents,
+        ) as embed:
+            new_id = agent.store_embeddings(revised, doc_id=doc_id)
+        embed.assert_called_once_with(["a new chunk"])
+        # the chunks of the replaced document are removed
+        assert list(chunk_store.get([1, 2, 3, 4])) == [3, 4]
+        assert chunk_store.get([3])[3][1] == {"meta_id": new_id}
+
+
+def test_failed_embedding_is_rolled_back():
+    chunk_store = SQLiteChunkStore()
+    with mock_milvus():
+        agent = VectorDatabaseAgentMilvus(
+            embedding_func=BagOfWordsEmbeddings(),
+            connection_args={"host": _HOST, "port": _PORT},
+            metadata_store=SQLiteMetadataStore(),
+            chunk_store=chunk_store,
+        )
+        agent.connect()
+        embed = patch.object(
+            agent._embedding_func,
+            "embed_documents",
+            side_effect=RuntimeError("embedding service unavailable"),
+        )
+        # before the embeddings collection exists
+        with embed, pytest.raises(RuntimeError):
+            agent.store_embeddings(mocked_dcn_pdf_splitted_texts)
+        assert agent.get_all_documents() == []
+
+        # the retry stores the fragments instead of returning a stale id
+        doc_id = agent.store_embeddings(mocked_dcn_pdf_splitted_texts)
+        col = agent._col_embeddings.col
+        pks = col.insert.call_args.args[0][0]
+        assert len(chunk_store.get(pks)) == 2
+
+        # with the embeddings collection, and in batches
+        col.query.return_value = []
+        with embed, pytest.raises(RuntimeError):
+            agent.store_embeddings(mocked_bc_summary_pdf_splitted_texts)
+        with embed, pytest.raises(RuntimeError):
+            agent.store_embeddings_batch([mocked_bc_summary_txt_splitted_texts])
+        assert [str(doc["id"]) for doc in agent.get_all_documents()] == [doc_id]
+        ids = agent.store_embeddings_batch(
+            [
+                mocked_bc_summary_pdf_splitted_texts,
+                mocked_bc_summary_txt_splitted_texts,
+            ]
+        )
+        assert doc_id not in ids
+        assert len(agent.get_all_documents()) == 3
+
+
+def test_chunk_store_persistence(tmp_path):
+    path = str(tmp_path / "chunks.db")
+    for auto_flush in [True, False]:
+        with mock_milvus():
+            agent = VectorDatabaseAgentMilvus(
+                embedding_func=BagOfWordsEmbeddings(),
+                connection_args={"host": _HOST, "port": _PORT},
+                metadata_store=SQLiteMetadataStore(),
+                chunk_store=SQLiteChunkStore(path),
+                auto_flush=auto_flush,
+            )
+            agent.connect()
+            agent.store_embeddings(mocked_dcn_pdf_splitted_texts)
+            agent.store_embeddings_batch([mocked_bc_summary_pdf_splitted_texts])
+            agent.commit()
+            pks = [
+                pk
+                for call in agent._col_embeddings.col.insert.call_args_list
+                for pk in call.args[0][0]
+            ]
+
+        # the texts are committed, i.e. readable from another connection
+        reopened = SQLiteChunkStore(path)
+        reopened.connect()
+        assert [text for text, _ in reopened.get(pks).values()] == [
+            doc.page_content
+            for doc in mocked_dcn_pdf_splitted_texts
+            + mocked_bc_summary_pdf_splitted_texts
+        ]
+
+
+def test_exclude_and_append_fragments():
+    chunk_store = SQLiteChunkStore()
+    with mock_milvus():
+        agent = VectorDatabaseAgentMilvus(
+            embedding_func=BagOfWordsEmbeddings(),
+            connection_args={"host": _HOST, "port": _PORT},
+            metadata_store=SQLiteMetadataStore(),
+            chunk_store=chunk_store,
+        )
+        agent.connect()
+        col = agent._col_embeddings.col
+        doc_id = agent.store_embeddings(
+            mocked_dcn_pdf_splitted_texts, exclude={0}
+        )
+        # the excluded chunk is not a fragment of the stored document
+        pks, _, meta_ids = col.insert.call_args.args[0]
+        assert meta_ids == [int(doc_id)]
+        assert [text for text, _ in chunk_store.get(pks).values()] == [
+            mocked_dcn_pdf_splitted_texts[1].page_content
+        ]
+        assert str(agent.get_all_documents()[0]["id"]) == doc_id
+
+        assert agent.append_fragments(doc_id, mocked_dcn_pdf_splitted_texts[:1])
+        pks, _, meta_ids = col.insert.call_args.args[0]
+        assert meta_ids == [int(doc_id)]
+        assert [text for text, _ in chunk_store.get(pks).values()] == [
+            mocked_dcn_pdf_splitted_texts[0].page_content
+        ]
+        assert not agent.append_fragments("99", mocked_dcn_pdf_splitted_texts)
+
+
+def test_precomputed_vectors():
+    chunk_store = SQLiteChunkStore()
+    with mock_milvus():
+        agent = VectorDatabaseAgentMilvus(
+            embedding_func=BagOfWordsEmbeddings(),
+            connection_args={"host": _HOST, "port": _PORT},
+            metadata_store=SQLiteMetadataStore(),
+            chunk_store=chunk_store,
+        )
+        agent.connect()
+        vectors = [[0.1, 0.2], [0.3, 0.4]]
+        doc_id = agent.store_embeddings_batch(
+            [mocked_dcn_pdf_splitted_texts], [vectors]
+        )[0]
+        assert agent._embedding_func.n_calls == 0
+        col = agent._col_embeddings.col
+        pks, inserted, _ = col.insert.call_args.args[0]
+        assert inserted == vectors
+
+        pages = [
+            [
+                {"pk": pk, "vector": vector, "meta_id": int(doc_id)}
+                for pk, vector in zip(pks, vectors)
+            ]
+        ]
+        with patch(
+            "biochatter.vectorstore_agent.iter_collection_pages",
+            return_value=iter(pages),
+        ) as iter_pages:
+            fragments = list(agent.iter_fragments([doc_id], batch_size=10))
+        assert iter_pages.call_args.args[1:] == (
+            10,
+            ["pk", "vector", "meta_id"],
+            None,
+            f"meta_id in [{doc_id}]",
+            False,
+        )
+        assert fragments == [
+            [
+                {
+                    "doc_id": doc_id,
+                    "text": doc.page_content,
+                    "vector": vector,
+                    "metadata": {},
+                }
+                for doc, vector in zip(mocked_dcn_pdf_splitted_texts, vectors)
+            ]
+        ]
+
+
+def test_chunk_metadata_export():
+    chunk_store = SQLiteChunkStore()
+    with mock_milvus():
+        agent = VectorDatabaseAgentMilvus(
+            embedding_func=BagOfWordsEmbeddings(),
+            connection_args={"host": _HOST, "port": _PORT},
+            metadata_store=SQLiteMetadataStore(),
+            chunk_store=chunk_store,
+        )
+        agent.connect()
+        documents = [
+            Document(
+                page_content=f"chunk on page {page}",
+                metadata={"source": "test.pdf", "page_start": page},
+            )
+            for page in [1, 2]
+        ]
+        doc_id = agent.store_embeddings(documents)
+        pks, vectors, _ = agent._col_embeddings.col.insert.call_args.args[0]
+        # the chunk store keeps the chunk-level metadata
+        assert chunk_store.get(pks)[pks[1]][1] == {
+            "meta_id": doc_id,
+            "page_start": 2,
+        }
+        page = [
+            {"pk": pk, "vector": vector, "meta_id": int(doc_id)}
+            for pk, vector in zip(pks, vectors)
+        ]
+        with patch(
+            "biochatter.vectorstore_agent.iter_collection_pages",
+            return_value=iter([page]),
+        ):
+            (fragments,) = agent.iter_fragments()
+        assert [fragment["metadata"] for fragment in fragments] == [
+            {"page_start": 1},
+            {"page_start": 2},
+        ]
+
+
+def test_chunk_store_collection():
+    with mock_milvus():
+        agent = VectorDatabaseAgentMilvus(
+            embedding_func=BagOfWordsEmbeddings(),
+            metadata_store=SQLiteMetadataStore(),
+            chunk_store=SQLiteChunkStore(),
+        )
+        agent.connect()
+        wrapper = agent._col_embeddings
+        wrapper.col = None
+        wrapper.alias = "alias"
+        wrapper._init = Mock()
+        agent.store_embeddings(mocked_dcn_pdf_splitted_texts)
+        fields = wrapper.col.schema.fields
+        assert [field.name for field in fields] == ["pk", "vector", "meta_id"]
+        assert fields[0].dtype == DataType.INT64
+        assert not fields[0].auto_id
+        wrapper._init.assert_called_once_with()
+
+        # a collection with texts cannot be used with a chunk store
+        col = Collection(
+            "embeddings",
+            CollectionSchema(
+                [FieldSchema(name, DataType.VARCHAR) for name in wrapper.fields]
+            ),
+        )
+        with patch(
+            "biochatter.vectorstore_agent.Milvus", return_value=Mock(col=col)
+        ):
+            with pytest.raises(ValueError):
+                agent.connect()
+
+
+def test_schema_versions():
+    with mock_milvus(), patch.object(
+        utility, "get_server_version", return_value="v2.3.3"
+    ):
+        agent = VectorDatabaseAgentMilvus(
+            embedding_func=BagOfWordsEmbeddings(),
+            metadata_store=SQLiteMetadataStore(),
+        )
+        agent.connect()
+        wrapper = agent._col_embeddings
+        wrapper.col = None
+        wrapper.alias = "alias"
+        wrapper._init = Mock()
+        with patch.object(Collection, "create_index", autospec=True) as index:
+            doc_id = agent.store_embeddings(mocked_dcn_pdf_splitted_texts)
+        fields = wrapper.col.schema.fields
+        assert [field.name for field in fields] == [
+            "pk",
+            "text",
+            "vector",
+            "meta_id",
+        ]
+        assert fields[0].auto_id
+        assert fields[3].dtype == DataType.INT64
+        index.assert_called_once_with(
+            wrapper.col, "meta_id", index_name=META_ID_INDEX_NAME
+        )
+        assert (
+            agent._build_embedding_search_expression(
+                [{"id": doc_id}, {"id": "x"}]
+            )
+            == f"meta_id in [{doc_id}]"
+        )
+
+        # Milvus 2.3 deletes by document id directly
+        wrapper.col = Mock()
+        assert agent.remove_documents([doc_id]) == [doc_id]
+        wrapper.col.delete.assert_called_once_with(
+            expr=f"meta_id in [{doc_id}]"
+        )
+        wrapper.col.query.assert_not_called()
+
+        # collections with VARCHAR document ids keep working
+        col = Collection(
+            "embeddings",
+            CollectionSchema(
+                [
+                    FieldSchema(name, DataType.VARCHAR)
+                    for name in ["pk", "text", "meta_id"]
+                ]
+            ),
+        )
+        with patch(
+            "biochatter.vectorstore_agent.Milvus", return_value=Mock(col=col)
+        ):
+            agent.connect()
+        assert agent._schema_version == 1
+        assert (
+            agent._build_embedding_search_expression([{"id": "1"}, {"id": "2"}])
+            == 'meta_id in ["1","2"]'
+        )
+
+        # revisions embed all chunks, as vectors cannot be copied
+        revised = [
+            mocked_dcn_pdf_splitted_texts[0],
+            Document(page_content="a new chunk", metadata={}),
+        ]
+        with patch.object(agent, "_get_document_fragments") as fragments:
+            agent.store_embeddings(revised, doc_id=doc_id)
+        fragments.assert_not_called()
+        (inserted,) = agent._col_embeddings.documents.values()
+        assert [doc.page_content for doc in inserted] == [
+            doc.page_content for doc in revised
+        ]
+
+
+def test_remove_documents_by_primary_key():
+    with mock_milvus():
+        agent = VectorDatabaseAgentMilvus(
+            embedding_func=BagOfWordsEmbeddings(),
+            metadata_store=SQLiteMetadataStore(),
+        )
+        agent.connect()
+        doc_id = agent.store_embeddings(mocked_dcn_pdf_splitted_texts)
+        col = agent._col_embeddings.col
+        col.query.return_value = [{"pk": 11}, {"pk": 12}]
+        assert agent.remove_documents([doc_id], doc_ids=["99"]) == []
+        # the scope may hold ids of another type
+        assert agent.remove_documents([doc_id], doc_ids=[int(doc_id)]) == [
+            doc_id
+        ]
+        col.query.assert_called_once_with(
+            f"meta_id in [{doc_id}]", output_fields=["pk"]
+        )
+        col.delete.assert_called_once_with(expr="pk in [11, 12]")
+
+
+def test_fingerprint_document():
+    fingerprint = fingerprint_document(mocked_dcn_pdf_splitted_texts)
+    assert len(fingerprint) == 64
+    assert fingerprint == fingerprint_document(
+        [
+            Document(page_content=doc.page_content, metadata={})
+            for doc in mocked_dcn_pdf_splitted_texts
+        ]
+    )
+    assert fingerprint != fingerprint_document(
+        mocked_dcn_pdf_splitted_texts[:1]
+    )
+    assert fingerprint != fingerprint_document(
+        mocked_dcn_pdf_splitted_texts[::-1]
+    )
+
+
 def test_build_meta_col_query_expr_for_all_documents():
     data = [
         [[], "id in [] and isDeleted == false"],
@@ -0,0 +1,294 @@
+import pytest
+
+from biochatter.vectorstore import DocumentReader, DocumentEmbedder
+from biochatter.vectorstore_local import VectorDatabaseAgentLocal
+from .mock_langchain import Document, BagOfWordsEmbeddings
+
+dcn_docs = [
+    Document(
+        page_content="Deep Counterfactual Networks with Propensity-Dropout",
+        metadata={
+            "title": "Deep Counterfactual Networks with Propensity-Dropout",
+            "source": "test/dcn.pdf",
+        },
+    ),
+    Document(
+        page_content="individualized treatment effects of an intervention",
+        metadata={
+            "title": "Deep Counterfactual Networks with Propensity-Dropout",
+            "source": "test/dcn.pdf",
+        },
+    ),
+]
+bc_docs = [
+    Document(
+        page_content="Democratising knowledge representation with BioCypher",
+        metadata={"title": "BioCypher", "source": "test/bc_summary.pdf"},
+    ),
+    Document(
+        page_content="knowledge graphs are becoming the dominant form",
+        metadata={"title": "BioCypher", "source": "test/bc_summary.pdf"},
+    ),
+]
+
+
+@pytest.fixture(params=["FLAT", "HNSW"])
+def local_store(request, tmp_path, monkeypatch):
+    # use the graph index even for the tiny test corpus
+    monkeypatch.setattr("biochatter.vectorstore_local.HNSW_MIN_CANDIDATES", 0)
+    store = VectorDatabaseAgentLocal(
+        embedding_func=BagOfWordsEmbeddings(),
+        connection_args={"path": str(tmp_path)},
+        index_type=request.param,
+    )
+    store.connect()
+    return store
+
+
+def test_store_and_search(local_store):
+    dcn_id = local_store.store_embeddings(dcn_docs)
+    bc_id = local_store.store_embeddings(bc_docs)
+    assert dcn_id != bc_id
+
+    results = local_store.similarity_search("BioCypher knowledge", k=2)
+    assert len(results) == 2
+    assert all(r.metadata["title"] == "BioCypher" for r in results)
+    assert results[0].metadata["id"] == int(bc_id)
+
+    results = local_store.similarity_search(
+        "BioCypher knowledge", k=2, doc_ids=[dcn_id]
+    )
+    assert all(r.metadata["source"] == "test/dcn.pdf" for r in results)
+
+
+def test_similarity_search_batch(local_store):
+    dcn_id = local_store.store_embeddings(dcn_docs)
+    local_store.store_embeddings(bc_docs)
+    queries = ["BioCypher knowledge", "treatment effects", "networks"]
+    n_calls = local_store._embedding_func.n_calls
+    results = local_store.similarity_search_batch(queries, k=2)
+    # one embed_query() call per query
+    assert local_store._embedding_func.n_calls == n_calls + len(queries)
+    assert len(results) == len(queries)
+    for query, found in zip(queries, results):
+        expected = local_store.similarity_search(query, k=2)
+        assert [doc.page_content for doc in found] == [
+            doc.page_content for doc in expected
+        ]
+        assert [doc.metadata for doc in found] == [
+            doc.metadata for doc in expected
+        ]
+
+    results = local_store.similarity_search_batch(
+        queries, k=4, doc_ids=[dcn_id]
+    )
+    assert all(
+        doc.metadata["source"] == "test/dcn.pdf"
+        for found in results
+        for doc in found
+    )
+    assert local_store.similarity_search_batch([], k=2) == []
+
+
+def test_remove_document(local_store):
+    dcn_id = local_store.store_embeddings(dcn_docs)
+    bc_id = local_store.store_embeddings(bc_docs)
+    assert len(local_store.get_all_documents()) == 2
+
+    assert not local_store.remove_document(dcn_id, doc_ids=[bc_id])
+    assert local_store.remove_document(dcn_id)
+    assert not local_store.remove_document(dcn_id)
+
+    docs = local_store.get_all_documents()
+    assert [doc["id"] for doc in docs] == [int(bc_id)]
+    results = local_store.similarity_search("Counterfactual Networks", k=4)
+    assert len(results) == 2
+    assert all(r.metadata["title"] == "BioCypher" for r in results)
+
+
+def test_persistence(tmp_path):
+    store = VectorDatabaseAgentLocal(
+        embedding_func=BagOfWordsEmbeddings(),
+        connection_args={"path": str(tmp_path)},
+    )
+    store.connect()
+    dcn_id = store.store_embeddings(dcn_docs)
+    store.store_embeddings(bc_docs)
+    store.remove_document(dcn_id)
+
+    reopened = VectorDatabaseAgentLocal(
+        embedding_func=BagOfWordsEmbeddings(),
+        connection_args={"path": str(tmp_path)},
+    )
+    reopened.connect()
+    assert len(reopened.get_all_documents()) == 1
+    assert "BioCypher" in reopened.get_description()
+    new_id = reopened.store_embeddings(dcn_docs)
+    assert int(new_id) > int(dcn_id)
+
+
+def test_document_embedder_local_vendor(tmp_path):
+    embedder = DocumentEmbedder(
+        vector_db_vendor="local",
+        embeddings=BagOfWordsEmbeddings(),
+        connection_args={"path": str(tmp_path)},
+    )
+    embedder.connect()
+    doc_id = embedder.save_document(bc_docs)
+    assert embedder.get_all_documents()[0]["id"] == int(doc_id)
+    embedder.remove_document(doc_id)
+    assert embedder.get_all_documents() == []
+
+
+def test_quantised_store_shared_by_reader(tmp_path):
+    writer = VectorDatabaseAgentLocal(
+        embedding_func=BagOfWordsEmbeddings(),
+        connection_args={"path": str(tmp_path)},
+        vector_dtype="int8",
+    )
+    writer.connect()
+    writer.store_embeddings(dcn_docs)
+    bc_id = writer.store_embeddings(bc_docs)
+
+    reader = VectorDatabaseAgentLocal(
+        embedding_func=BagOfWordsEmbeddings(),
+        connection_args={"path": str(tmp_path), "read_only": True},
+    )
+    reader.connect()
+    results = reader.similarity_search("BioCypher knowledge", k=1)
+    assert results[0].metadata["id"] == int(bc_id)
+    with pytest.raises(PermissionError):
+        reader.remove_document(bc_id)
+
+
+def test_page_provenance(local_store):
+    pages = DocumentReader().iter_pdf_pages("test/bc_summary.pdf")
+    embedder = DocumentEmbedder(
+        vector_db_vendor="local",
+        embeddings=BagOfWordsEmbeddings(),
+        chunk_size=500,
+    )
+    chunks = embedder._split_document(pages)
+    local_store.store_embeddings(chunks)
+
+    results = local_store.similarity_search("BioCypher knowledge graph", k=3)
+    assert all(1 <= r.metadata["page_start"] <= 8 for r in results)
+    assert all(r.metadata["source"] == "test/bc_summary.pdf" for r in results)
+
+
+def test_fingerprinting(local_store):
+    embeddings = local_store._embedding_func
+    doc_id = local_store.store_embeddings(dcn_docs)
+    n_calls = embeddings.n_calls
+
+    # identical upload
+    assert local_store.store_embeddings(dcn_docs) == doc_id
+    assert embeddings.n_calls == n_calls
+    assert len(local_store.get_all_documents()) == 1
+
+    # revision: one unchanged, one changed chunk
+    revised = [
+        dcn_docs[0],
+        Document(
+            page_content="estimating treatment effects from observational data",
+            metadata=dcn_docs[1].metadata,
+        ),
+    ]
+    assert local_store.store_embeddings(revised, doc_id=doc_id) == doc_id
+    assert embeddings.n_calls == n_calls + 1
+    results = local_store.similarity_search("treatment effects", k=4)
+    assert sorted(r.page_content for r in results) == sorted(
+        doc.page_content for doc in revised
+    )
+    assert local_store.store_embeddings(revised) == doc_id
+
+
+def test_failed_embedding_is_rolled_back(local_store, monkeypatch):
+    embeddings = local_store._embedding_func
+    doc_id = local_store.store_embeddings(dcn_docs)
+
+    def fail(texts):
+        raise RuntimeError("embedding service unavailable")
+
+    monkeypatch.setattr(embeddings, "embed_documents", fail)
+    with pytest.raises(RuntimeError):
+        local_store.store_embeddings(bc_docs)
+    with pytest.raises(RuntimeError):
+        local_store.store_embeddings_batch([bc_docs])
+    revised = [dcn_docs[0], bc_docs[1]]
+    with pytest.raises(RuntimeError):
+        local_store.store_embeddings(revised, doc_id=doc_id)
+    assert [str(doc["id"]) for doc in local_store.get_all_documents()] == [
+        doc_id
+    ]
+    assert len(local_store.similarity_search("treatment", k=4)) == 2
+
+    # the retry stores the fragments instead of returning a stale id
+    monkeypatch.undo()
+    bc_id = local_store.store_embeddings(bc_docs)
+    assert bc_id != doc_id
+    results = local_store.similarity_search("BioCypher", k=4)
+    assert any(r.page_content == bc_docs[0].page_content for r in results)
+    assert local_store.store_embeddings(revised, doc_id=doc_id) == doc_id
+
+
+def test_batch_operations(tmp_path):
+    embeddings = BagOfWordsEmbeddings()
+    store = VectorDatabaseAgentLocal(
+        embedding_func=embeddings,
+        connection_args={"path": str(tmp_path)},
+        auto_flush=False,
+    )
+    store.connect()
+    ids = store.store_embeddings_batch([dcn_docs, [], bc_docs, dcn_docs])
+    assert embeddings.n_calls == 1
+    assert ids[1] is None
+    assert ids[3] == ids[0]
+    assert len(store.get_all_documents()) == 2
+
+    # nothing is written before commit
+    reopened = VectorDatabaseAgentLocal(
+        embedding_func=embeddings, connection_args={"path": str(tmp_path)}
+    )
+    reopened.connect()
+    assert reopened.get_all_documents() == []
+    store.commit()
+    reopened.connect()
+    assert len(reopened.get_all_documents()) == 2
+
+    assert store.remove_documents([ids[0], ids[2], "999"]) == [ids[0], ids[2]]
+    assert store.similarity_search("BioCypher", k=2) == []
+    assert store.remove_documents([ids[0]]) == []
+
+
+def test_document_embedder_index_params(monkeypatch):
+    monkeypatch.setattr("biochatter.vectorstore_local.HNSW_MIN_CANDIDATES", 0)
+    embedder = DocumentEmbedder(
+        vector_db_vendor="local",
+        embeddings=BagOfWordsEmbeddings(),
+        index_params={"index_type": "HNSW", "params": {"M": 8}},
+        search_params={"ef": 32},
+    )
+    embedder.connect()
+    embedder.database_host.store_embeddings(bc_docs)
+    embedder.build_index()
+    host = embedder.database_host
+    assert host._hnsw is not None
+    assert host._index_params["M"] == 8
+    results = host.similarity_search("BioCypher", k=1, search_params={"ef": 4})
+    assert results[0].metadata["title"] == "BioCypher"
+
+
+def test_documents_pages(local_store):
+    ids = [local_store.store_embeddings(docs) for docs in [dcn_docs, bc_docs]]
+    page, cursor = local_store.get_documents_page(
+        limit=1, output_fields=["title"]
+    )
+    assert page == [{"id": int(ids[0]), "title": dcn_docs[0].metadata["title"]}]
+    page, cursor = local_store.get_documents_page(cursor, limit=1)
+    assert [str(doc["id"]) for doc in page] == [ids[1]]
+    assert local_store.get_documents_page(cursor, limit=1) == ([], None)
+    assert [
+        str(doc["id"]) for doc in local_store.iter_all_documents(batch_size=1)
+    ] == ids
+    assert "BioCypher" in local_store.get_description([ids[1]])
@@ -0,0 +1,191 @@
+import time
+import logging
+
+import pytest
+
+from biochatter.vectorstore_local import VectorDatabaseAgentLocal
+from biochatter.vectorstore_sharded import (
+    VectorDatabaseAgentSharded,
+    split_document_id,
+    shard_document_id,
+)
+from .mock_langchain import Document, BagOfWordsEmbeddings
+
+WORDS = (
+    "gene protein pathway cell tissue disease drug target variant expression "
+    "receptor kinase enzyme membrane signal"
+).split()
+
+
+def document(i: int) -> list[Document]:
+    return [
+        Document(
+            page_content=" ".join(WORDS[(i + j) % len(WORDS)] for j in range(3))
+            + f" chunk {part} of document {i}",
+            metadata={"title": f"Document {i}", "source": f"test/{i}.pdf"},
+        )
+        for part in range(2)
+    ]
+
+
+def local_store() -> VectorDatabaseAgentLocal:
+    store = VectorDatabaseAgentLocal(embedding_func=BagOfWordsEmbeddings())
+    store.connect()
+    return store
+
+
+@pytest.fixture
+def sharded():
+    store = VectorDatabaseAgentSharded([local_store() for _ in range(3)])
+    store.connect()
+    return store
+
+
+class SlowStore:
+    """
+    Shard that responds after a delay, standing in for an overloaded node.
+    """
+
+    def __init__(self, store, delay: float):
+        self._store = store
+        self._delay = delay
+
+    def __getattr__(self, name):
+        return getattr(self._store, name)
+
+    def similarity_search_with_score(self, *args, **kwargs):
+        time.sleep(self._delay)
+        return self._store.similarity_search_with_score(*args, **kwargs)
+
+
+def test_document_ids():
+    assert shard_document_id(2, "15") == "2:15"
+    assert split_document_id("2:15") == (2, "15")
+    assert split_document_id("15") is None
+    assert split_document_id("x:15") is None
+    with pytest.raises(ValueError):
+        VectorDatabaseAgentSharded([])
+
+
+def test_routing(sharded):
+    ids = [sharded.store_embeddings(document(i)) for i in range(30)]
+    shards = [split_document_id(doc_id)[0] for doc_id in ids]
+    assert shards == [sharded.shard_of(document(i)) for i in range(30)]
+    assert set(shards) == {0, 1, 2}
+    # identical documents are deduplicated in their shard
+    assert sharded.store_embeddings(document(0)) == ids[0]
+    assert sharded.store_embeddings([]) is None
+
+    batch_ids = sharded.store_embeddings_batch(
+        [document(30), [], document(1), document(31)]
+    )
+    assert batch_ids[1] is None
+    assert batch_ids[2] == ids[1]
+    assert len(sharded.get_all_documents()) == 32
+
+
+def test_search_matches_single_store(sharded):
+    single = local_store()
+    for i in range(30):
+        sharded.store_embeddings(document(i))
+        single.store_embeddings(document(i))
+
+    for query in ["gene protein pathway", "kinase enzyme", "chunk 1 of"]:
+        expected = single.similarity_search_with_score(query, k=5)
+        results = sharded.similarity_search_with_score(query, k=5)
+        assert [score for _, score in results] == pytest.approx(
+            [score for _, score in expected]
+        )
+        # distances are sorted and the documents carry sharded ids
+        assert all(split_document_id(doc.metadata["id"]) for doc, _ in results)
+
+    queries = ["gene protein pathway", "kinase enzyme"]
+    batch = sharded.similarity_search_batch(queries, k=4)
+    assert [[doc.page_content for doc in docs] for docs in batch] == [
+        [doc.page_content for doc in sharded.similarity_search(query, k=4)]
+        for query in queries
+    ]
+    assert sharded.similarity_search_batch([]) == []
+
+
+def test_search_scope_and_removal(sharded):
+    ids = [sharded.store_embeddings(document(i)) for i in range(10)]
+    results = sharded.similarity_search("gene", k=10, doc_ids=ids[:2])
+    assert {doc.metadata["id"] for doc in results} == set(ids[:2])
+    assert sharded.similarity_search("gene", doc_ids=["invalid"]) == []
+
+    assert sharded.remove_documents([ids[0], "invalid"], doc_ids=ids[1:]) == []
+    assert sharded.remove_document(ids[0])
+    assert not sharded.remove_document(ids[0])
+    removed = sharded.remove_documents(ids[1:4])
+    assert sorted(removed) == sorted(ids[1:4])
+    assert {doc["id"] for doc in sharded.get_all_documents()} == set(ids[4:])
+    assert all(
+        doc.metadata["id"] in ids[4:]
+        for doc in sharded.similarity_search("gene", k=20)
+    )
+
+
+def test_revision_stays_in_shard(sharded):
+    doc_id = sharded.store_embeddings(document(0))
+    revised = document(0)[:1] + document(1)[1:]
+    assert sharded.store_embeddings(revised, doc_id) == doc_id
+    with pytest.raises(ValueError):
+        sharded.store_embeddings(revised, "7")
+
+
+def test_append_fragments(sharded):
+    doc_id = sharded.store_embeddings(document(0), exclude={1})
+    shard, _ = split_document_id(doc_id)
+    assert len(sharded.similarity_search("chunk", k=10)) == 1
+    assert sharded.append_fragments(doc_id, document(0)[1:])
+    results = sharded.similarity_search("chunk", k=10)
+    assert [doc.metadata["id"] for doc in results] == [doc_id, doc_id]
+    assert not sharded.append_fragments(f"{shard}:99", document(1))
+    with pytest.raises(ValueError):
+        sharded.append_fragments("99", document(1))
+
+
+def test_documents_pages(sharded):
+    ids = [sharded.store_embeddings(document(i)) for i in range(12)]
+    documents = list(sharded.iter_all_documents(batch_size=5))
+    assert sorted(doc["id"] for doc in documents) == sorted(ids)
+    # ordered by shard and by id within each shard
+    assert [split_document_id(doc["id"]) for doc in documents] == sorted(
+        (split_document_id(doc_id) for doc_id in ids),
+        key=lambda split: (split[0], int(split[1])),
+    )
+    page, cursor = sharded.get_documents_page(limit=5, output_fields=["title"])
+    assert set(page[0]) == {"id", "title"}
+    assert cursor == page[-1]["id"]
+    page, cursor = sharded.get_documents_page(limit=5, doc_ids=ids[:3])
+    assert len(page) == 3
+    assert cursor is None
+    with pytest.raises(ValueError):
+        sharded.get_documents_page("7")
+
+    assert "Document 3" in sharded.get_description(ids[3:4])
+    version = sharded.documents_version
+    sharded.remove_document(ids[0])
+    assert sharded.documents_version > version
+
+
+def test_timeout_returns_partial_results(caplog):
+    fast = [local_store(), local_store()]
+    slow = SlowStore(local_store(), delay=1.0)
+    sharded = VectorDatabaseAgentSharded(fast + [slow], timeout=0.2)
+    sharded.connect()
+    ids = [sharded.store_embeddings(document(i)) for i in range(15)]
+    reachable = [doc_id for doc_id in ids if not doc_id.startswith("2:")]
+
+    with caplog.at_level(logging.WARNING):
+        results = sharded.similarity_search("gene protein", k=30)
+    assert "Shard 2 did not respond" in caplog.text
+    assert sorted(doc.metadata["id"] for doc in results) == sorted(
+        doc_id for doc_id in reachable for _ in range(2)
+    )
+
+    # without a timeout, the slow shard is waited for
+    sharded = VectorDatabaseAgentSharded(fast + [slow])
+    results = sharded.similarity_search("gene protein", k=30)
+    assert len(results) == 2 * len(ids)